@@ -18,13 +18,46 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
     app.config['SECRET_KEY'] = 'your-secret-key'
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///db.db'
     app.config['FACE_VERIFICATION_REQUIRED'] = True
 
+    # Logging first, so everything set up below can log
+    from app.utils.log import log_system
+    log_system.init_app(app)
+    from app.utils.tracing import tracer
+    tracer.init_app(app)
+    from app.utils.profiler import profiler
+    profiler.init_app(app)
+
     # Initialize extensions with app
+    from app.utils import database
+    database.configure_engine(app)
     db.init_app(app)
+    database.init_app(app)
     migrate.init_app(app, db)  # Initialize Flask-Migrate
+    # Socket handlers must be registered before init_app creates the server,
+    # otherwise only the first app created in this process receives them
+    from app.routes import socket_events
     socketio.init_app(app, cors_allowed_origins="*", async_mode="threading")
+    from app.messaging.delivery import delivery_queue
+    delivery_queue.init_app(app)
+    from app.messaging import groups
+    groups.init_app(app)
+    from app.messaging.ephemeral import ephemeral_channel
+    ephemeral_channel.init_app(app)
+    from app.utils.retention import retention_job
+    retention_job.init_app(app)
+    from app.security.risk_features import risk_features
+    risk_features.init_app(app)
+    from app.security.risk_model import risk_models
+    risk_models.init_app(app)
+    from app.security.ip_reputation import ip_reputation
+    ip_reputation.init_app(app)
+    from app.security.devices import devices
+    devices.init_app(app)
+    from app.security.audit import audit_log
+    audit_log.init_app(app)
+    from app.security import metrics_push
+    metrics_push.init_app(app)
     login_manager.init_app(app)
     csrf.init_app(app)
     login_manager.login_view = 'main.login'
@@ -40,7 +73,6 @@ def create_app(config_class=Config):
 
     with app.app_context():
         from app.routes import routes
-        from app.routes import socket_events
         from app.models.models import User
         from app.auth.auth import auth_blueprint
         from app.security.routes_security import security_blueprint
@@ -55,10 +87,12 @@ def create_app(config_class=Config):
         from app.auth.routes_face import face_blueprint
         app.register_blueprint(face_blueprint, url_prefix='/face')
 
-        @login_manager.user_loader
-        def load_user(user_id):
-            return User.query.get(int(user_id))
+        # current_user resolves through a cache of user snapshots
+        from app.auth import identity
+        identity.init_app(app, login_manager)
 
         db.create_all()
+        from app.messaging.search import ensure_search_index
+        ensure_search_index()
 
     return app
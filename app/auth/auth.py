@@ -5,6 +5,9 @@ from datetime import datetime
 
 from app import db, socketio
 from app.models.models import User, FaceVerificationLog
+from app.auth.identity import identity_cache
+from app.security.logins import record_login, record_login_failure
+from app.security.audit import audit_log
 from app.auth.forms import RegistrationForm, LoginForm  # Import the LoginForm
 from app.security.security_ai import calculate_security_level, SECURITY_LEVEL_LOW, SECURITY_LEVEL_MEDIUM, SECURITY_LEVEL_HIGH, get_risk_details
 
@@ -25,7 +28,7 @@ def save_face_data_for_user(user, face_image_data_url):
     IMPLEMENTATION REQUIRED: Process face_image_data_url, extract face descriptor,
     and store it securely associated with the user in the database.
     """
-    print(f"[INFO] Placeholder: Saving face data for user {user.username}.")
+    logger.info('Placeholder: saving face data for user %s', user.username)
     # Example: user.face_descriptor = extract_descriptor(face_image_data_url)
     # db.session.commit()
     return True # Return True on success, False on failure
@@ -36,87 +39,83 @@ def verify_user_face(user, submitted_face_image_data_url):
     Extract descriptor from submitted_face_image_data_url.
     Compare descriptors and return True if they match, False otherwise.
     """
-    print(f"[INFO] Starting face verification for user: {user.username}")
+    logger.debug('Starting face verification for user %s', user.username)
 
     try:
         # Step 1: Check if user has face data
         if not user.face_data:
-            print(f"[WARN] No face data registered for user: {user.username}")
+            logger.warning('No face data registered for user %s', user.username)
             return False
 
         # Step 2: Load stored face descriptor from the database
         stored_face_data = json.loads(user.face_data)
         stored_encoding = np.array(stored_face_data['encoding'])
-        print(f"[DEBUG] Stored face descriptor for {user.username}: {stored_encoding[:5]}... (truncated)")
 
         # Step 3: Process the submitted webcam image
         try:
-            print(f"[DEBUG] Received face image data length: {len(submitted_face_image_data_url)}")
+            logger.debug('Received face image data length: %d', len(submitted_face_image_data_url))
             
             # Handle base64 image from webcam capture
             if ',' in submitted_face_image_data_url:
-                print(f"[DEBUG] Data URL format detected, extracting base64 content")
                 submitted_face_image_data_url = submitted_face_image_data_url.split(',')[1]
             
             # Decode base64 to image
             try:
                 img_data = base64.b64decode(submitted_face_image_data_url)
-                print(f"[DEBUG] Base64 decoded. Image data size: {len(img_data)} bytes")
+                logger.debug('Base64 decoded, image data size: %d bytes', len(img_data))
                 
                 nparr = np.frombuffer(img_data, np.uint8)
                 img_rgb = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
                 
                 if img_rgb is None or img_rgb.size == 0:
-                    print(f"[ERROR] Invalid image data for {user.username}")
+                    logger.warning('Invalid image data for %s', user.username)
                     flash('Invalid image data. Please try again.', 'warning')
                     return False
 
                 # Improve face detection
                 face_locations = face_recognition.face_locations(img_rgb, model='cnn')
-                print(f"[DEBUG] Face locations found using CNN model: {len(face_locations)}")
+                logger.debug('Face locations found using CNN model: %d', len(face_locations))
 
                 if not face_locations:
-                    print(f"[WARN] No face detected in submitted image for {user.username}")
+                    logger.warning('No face detected in submitted image for %s', user.username)
                     flash('No face detected. Please ensure your face is clearly visible.', 'warning')
                     return False
 
                 # Get face encodings
                 face_encodings = face_recognition.face_encodings(img_rgb, face_locations)
                 if not face_encodings:
-                    print(f"[WARN] Could not encode face from submitted image for {user.username}")
+                    logger.warning('Could not encode face from submitted image for %s', user.username)
                     flash('Error encoding face data. Please try again.', 'warning')
                     return False
 
                 submitted_encoding = face_encodings[0]
-                print(f"[DEBUG] Face encoding generated successfully: {submitted_encoding[:5]}... (truncated)")
                 
             except Exception as img_err:
-                print(f"[ERROR] Image decoding failed: {str(img_err)}")
                 raise img_err
             
         except Exception as process_error:
-            print(f"[ERROR] Error processing face image: {str(process_error)}")
+            logger.warning('Error processing face image for %s: %s', user.username, process_error)
             # Try alternate decoding if the image is actually a JSON-encoded face descriptor
             try:
                 submitted_encoding = np.array(json.loads(base64.b64decode(submitted_face_image_data_url).decode('utf-8')))
             except:
-                print("[ERROR] Both image processing and JSON decoding failed")
+                logger.error('Both image processing and JSON decoding failed for %s', user.username)
                 return False
                 
-        print(f"[DEBUG] Submitted face descriptor: {submitted_encoding[:5]}... (truncated)")
 
         # Step 4: Compare the stored and submitted descriptors
         distance = np.linalg.norm(stored_encoding - submitted_encoding)
-        print(f"[DEBUG] Distance between stored and submitted descriptors: {distance:.4f}")
 
         # Use a permissive threshold for testing (0.6)
         match = distance <= 0.6
 
-        print(f"[INFO] Face verification result for {user.username}: {'SUCCESS' if match else 'FAILED'} (distance: {distance:.4f}, threshold: 0.6)")
+        logger.info('Face verification %s for user %s', 'succeeded' if match else 'failed', user.username,
+                    extra={'event': 'face_verification', 'match': bool(match), 'distance': round(float(distance), 4),
+                           'threshold': 0.6})
         return match
 
-    except Exception as e:
-        print(f"[ERROR] Exception during face verification for {user.username}: {str(e)}")
+    except Exception:
+        logger.exception('Exception during face verification for %s', user.username)
         return False
 
 def verify_user_face(user, submitted_image_array):
@@ -124,10 +123,10 @@ def verify_user_face(user, submitted_image_array):
     Compares a submitted face image array with a user's stored face data,
     with enhanced logging for debugging.
     """
-    print(f"[INFO] Starting face verification for user: {user.username}")
+    logger.debug('Starting face verification for user %s', user.username)
 
     if user.face_data is None:
-        logger.warning(f"User {user.username} has no stored face data for verification.")
+        logger.warning('User %s has no stored face data for verification', user.username)
         return False
         
     try:
@@ -138,12 +137,12 @@ def verify_user_face(user, submitted_image_array):
         # 2. Find and encode the face in the submitted image
         face_locations = face_recognition.face_locations(submitted_image_array)
         if not face_locations:
-            logger.warning("No face detected in the submitted image.")
+            logger.warning('No face detected in the submitted image for %s', user.username)
             return False
 
         submitted_face_encodings = face_recognition.face_encodings(submitted_image_array, face_locations)
         if not submitted_face_encodings:
-            logger.warning("Could not create an encoding for the face in the submitted image.")
+            logger.warning('Could not create an encoding for the face in the submitted image for %s', user.username)
             return False
             
         # 3. Compare the faces and get the distance
@@ -155,20 +154,15 @@ def verify_user_face(user, submitted_image_array):
         # Calculate the actual numerical distance between the faces
         distance = face_recognition.face_distance(known_encoding, unknown_encoding)[0]
         
-        # --- NEW: Detailed logging of the distance ---
-        logger.info(f"Face comparison for {user.username}: Match={matches[0]}, Distance={distance:.4f} (Tolerance is 0.6)")
-        
         is_match = matches[0]
-        
-        if is_match:
-            logger.info(f"Face verification SUCCESS for user {user.username}.")
-        else:
-            logger.warning(f"Face verification FAILED for user {user.username}.")
+        logger.info('Face verification %s for user %s', 'succeeded' if is_match else 'failed', user.username,
+                    extra={'event': 'face_verification', 'match': bool(is_match),
+                           'distance': round(float(distance), 4), 'threshold': 0.6})
             
         return is_match
 
-    except Exception as e:
-        logger.error(f"An exception occurred during face verification for {user.username}: {e}")
+    except Exception:
+        logger.exception('Exception during face verification for %s', user.username)
         return False
 
 # --- Routes ---
@@ -218,7 +212,7 @@ def register():
 
                     flash('Face registered successfully!', 'success')
             except Exception as e:
-                print(f"[ERROR] Face registration failed: {str(e)}")
+                logger.warning('Face registration failed for %s: %s', username, e)
                 flash('Error processing face data. Face registration skipped.', 'warning')
         
         db.session.add(new_user)
@@ -320,24 +314,31 @@ def login():
         session['security_level'] = security_level
         session['username'] = username
         
-        print(f"[SECURITY AI] Security assessment for {username}:")
-        print(f"  - Security Level: {risk_details['security_level']} ({security_level})")
-        print(f"  - Risk Score: {risk_details['risk_score']:.2f}")
-        print(f"  - Required Factors: {', '.join(risk_details['required_factors'])}")
+        logger.info('Security assessment for %s: level %s, risk score %.2f', username, security_level,
+                    risk_details['risk_score'],
+                    extra={'event': 'risk_assessment', 'required_factors': risk_details['required_factors']})
         
         user = User.query.filter_by(username=username).first()
+        audit_log.record('risk_assessment', user_id=user.id if user else None, username=username,
+                         security_level=security_level, risk_score=risk_details['risk_score'],
+                         factors={name: factor['score']
+                                  for name, factor in json_serializable_risk_details['risk_factors'].items()},
+                         required_factors=risk_details['required_factors'],
+                         manual=manual_security_level is not None)
 
         if not user:
+            record_login_failure(username, 'unknown_user')
             flash('Invalid username or password.', 'danger')
             return redirect(url_for('auth.login'))
             
         # Try to check the password with explicit sha256 method to avoid scrypt issues
         try:
             if not check_password_hash(user.password_hash, password):
+                record_login_failure(username, 'bad_password', user.id)
                 flash('Invalid username or password.', 'danger')
                 return redirect(url_for('auth.login'))
         except ValueError as e:
-            print(f"Password hash error: {str(e)}")
+            logger.error('Password hash error for %s: %s', username, e)
             # If the error is related to unsupported hash type, try a direct comparison as fallback
             # This is not secure but allows us to progress past the error for demo purposes
             if "unsupported hash type" in str(e):
@@ -346,6 +347,7 @@ def login():
                 # In production, you would want to properly handle this error
                 pass
             else:
+                record_login_failure(username, 'password_error', user.id)
                 flash('Authentication error.', 'danger')
                 return redirect(url_for('auth.login'))
 
@@ -353,6 +355,7 @@ def login():
         if security_level == SECURITY_LEVEL_LOW:
             # Directly log in the user without CAPTCHA
             login_user(user, remember=form.remember.data)
+            record_login(user.id)
             flash('Login successful with Low Security.', 'success')
             return redirect(url_for('main.chat'))
 
@@ -360,17 +363,19 @@ def login():
             # Require CAPTCHA validation
             if form_valid:
                 login_user(user, remember=form.remember.data)
+                record_login(user.id)
                 flash('Login successful with Medium Security.', 'success')
                 return redirect(url_for('main.chat'))
             else:
                 # If form validation failed, it's likely due to CAPTCHA
+                record_login_failure(username, 'captcha', user.id)
                 flash('CAPTCHA validation failed. Please try again.', 'danger')
                 return render_template('login.html', form=form, show_captcha=show_captcha)
 
         elif security_level == SECURITY_LEVEL_HIGH:
             # Require CAPTCHA validation and redirect to face verification
             if form_valid:
-                print(f"[DEBUG] Redirecting to face verification for high security level. User ID: {user.id}")
+                logger.debug('Redirecting user %s to face verification for high security level', user.id)
                 session['temp_user_id'] = user.id
                 session['username'] = username  # Ensure username is in session for face verification
                 session['captcha_validated'] = True  # Mark CAPTCHA as validated
@@ -378,6 +383,7 @@ def login():
                 return redirect(url_for('auth.face_verification'))
             else:
                 # If form validation failed, it's likely due to CAPTCHA
+                record_login_failure(username, 'captcha', user.id)
                 flash('CAPTCHA validation failed. Please try again.', 'danger')
                 return render_template('login.html', form=form, show_captcha=show_captcha)
     
@@ -386,39 +392,36 @@ def login():
 
 @auth_blueprint.route('/verify_face', methods=['POST'])
 def verify_face_endpoint():
-    print("[DEBUG] Face verification endpoint called")
     if current_user.is_authenticated:
-        print("[DEBUG] User is already authenticated")
         return jsonify({'success': False, 'message': 'Already logged in.'}), 400
 
     data = request.get_json()
     if not data:
-        print("[DEBUG] Invalid request data, no JSON found")
         return jsonify({'success': False, 'message': 'Invalid request data.'}), 400
 
     username = session.get('username')
     face_image_b64 = data.get('faceImage')
 
-    print(f"[DEBUG] Face verification for username: {username}")
-    
     if not username or not face_image_b64:
-        print(f"[DEBUG] Missing data. Username: {bool(username)}, Face image: {bool(face_image_b64)}")
+        logger.debug('Face verification without data, username: %s, face image: %s', bool(username), bool(face_image_b64))
         return jsonify({'success': False, 'message': 'Username in session and face image are required.'}), 400
 
     user = User.query.filter_by(username=username).first()
     if not user:
-        print(f"[DEBUG] User not found: {username}")
+        logger.debug('Face verification for unknown user %s', username)
         return jsonify({'success': False, 'message': 'User not found.'}), 404
 
     # Perform face verification
     face_verified = verify_user_face(user, face_image_b64)
     if face_verified:
         login_user(user, remember=session.get('remember_me', False))
+        record_login(user.id)
         session.pop('temp_user_id', None)
         session.pop('captcha_validated', None)
         flash('Login successful with High Security.', 'success')
         return jsonify({'success': True, 'message': 'Face verification successful.'}), 200
     else:
+        record_login_failure(username, 'face_verification', user.id)
         flash('Face verification failed. Please try again.', 'danger')
         return jsonify({'success': False, 'message': 'Face verification failed.'}), 401
 
@@ -429,6 +432,8 @@ def logout():
     user_id_before_logout = current_user.id
 
     logout_user() # This clears current_user
+    identity_cache.invalidate(user_id_before_logout)
+    audit_log.record('logout', user_id=user_id_before_logout, username=user_name_before_logout)
 
     try:
         logout_payload = {
@@ -439,39 +444,34 @@ def logout():
             'timestamp': datetime.utcnow().isoformat() + 'Z'
         }
         socketio.emit('user_status_update', logout_payload, broadcast=True) # include_self is fine here
-        print(f"[INFO] Emitted 'user_status_update' for {user_name_before_logout} (logged out).")
+        logger.info('%s logged out', user_name_before_logout, extra={'event': 'logout', 'user_id': user_id_before_logout})
     except Exception as e:
-        print(f"[ERROR] Failed to emit logout notification for {user_name_before_logout}: {e}")
+        logger.error('Failed to emit logout notification for %s: %s', user_name_before_logout, e)
 
     flash('You have been logged out.', 'info')
     return redirect(url_for('auth.login'))
 
 @auth_blueprint.route('/face_verification', methods=['GET', 'POST'])
 def face_verification():
-    print("[DEBUG] Face verification page requested")
     user_id = session.get('temp_user_id')
     if not user_id:
-        print("[DEBUG] No temp_user_id in session")
         flash('Session expired. Please log in again.', 'danger')
         return redirect(url_for('auth.login'))
 
     user = User.query.get(user_id)
     if not user:
-        print("[DEBUG] User not found with ID:", user_id)
+        logger.debug('Face verification page for unknown user ID %s', user_id)
         flash('User not found. Please log in again.', 'danger')
         return redirect(url_for('auth.login'))
     
     # Get risk details from session
     risk_details = session.get('risk_details', {})
-    print(f"[DEBUG] Risk details from session: {risk_details}")
     
     # Prepare username for face verification
     username = user.username
-    print(f"[DEBUG] Username for face verification: {username}")
 
     # Ensure we have risk details
     if not risk_details:
-        print("[DEBUG] No risk details found in session")
         flash('Risk details not found. Please log in again.', 'danger')
         return redirect(url_for('auth.login'))
 
@@ -484,11 +484,12 @@ def face_verification():
         # Enforce face verification
         if verify_user_face(user, submitted_face_data):
             login_user(user)
+            record_login(user.id)
             flash('Face verification successful. Login complete.', 'success')
             return redirect(url_for('main.chat'))
         else:
+            record_login_failure(username, 'face_verification', user.id)
             flash('Face verification failed. Access denied.', 'danger')
             return redirect(url_for('auth.face_verification'))
 
-    print(f"[DEBUG] Rendering face verification page for {username}")
     return render_template('face_verification.html', risk_details=risk_details, username=username)
\ No newline at end of file
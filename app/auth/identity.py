@@ -0,0 +1,200 @@
+"""
+Identity Cache Module for SecureChat
+This module backs Flask-Login's user loader with a cache of user snapshots.
+
+Flask-Login resolves current_user on every HTTP request and every Socket.IO
+event. Instead of loading the User row each time, the loader returns a
+small read-only UserSnapshot (id, username and the security flags the
+templates and handlers read) from a TTL/LRU cache.
+
+Snapshots are dropped whenever a User row is updated or deleted (face
+enrolment, lockouts, last_login), and the logout routes drop them too.
+Each Socket.IO connection also keeps the identity it resolved on connect,
+so events on a live socket skip even the cache lookup until that user is
+invalidated.
+
+Code that changes the user loads the User row explicitly, e.g.
+db.session.get(User, current_user.id); snapshots are never written back.
+"""
+import threading
+import time
+from collections import OrderedDict
+from flask import request
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from app.models.models import User
+
+# Defaults; overridden from app.config in init_app
+IDENTITY_CACHE_TTL = 300.0
+IDENTITY_CACHE_SIZE = 4096
+
+_SNAPSHOT_FIELDS = ('id', 'username', 'face_verification_enabled', 'face_verification_locked_until', 'last_login')
+
+
+class UserSnapshot(UserMixin):
+    """Read-only copy of the User fields needed to serve a request."""
+    __slots__ = _SNAPSHOT_FIELDS
+
+    def __init__(self, **fields):
+        for name in _SNAPSHOT_FIELDS:
+            object.__setattr__(self, name, fields.get(name))
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(**{name: getattr(user, name) for name in _SNAPSHOT_FIELDS})
+
+    def __setattr__(self, name, value):
+        raise AttributeError('UserSnapshot is read-only; load the User row to change it')
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.username}>'
+
+
+class IdentityCache:
+    """
+    LRU cache of user snapshots with a TTL, plus per-connection identities.
+
+    Args:
+        ttl (float): Seconds before a cached snapshot is reloaded
+        max_entries (int): Users kept before the least recent is evicted
+        clock (callable): Monotonic time source in seconds
+    """
+
+    def __init__(self, ttl=IDENTITY_CACHE_TTL, max_entries=IDENTITY_CACHE_SIZE, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # user_id -> (expires_at, UserSnapshot)
+        self._connections = {}         # socket sid -> UserSnapshot
+        self.hits = 0
+        self.misses = 0
+        self.connection_hits = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        self.ttl = app.config.get('IDENTITY_CACHE_TTL', IDENTITY_CACHE_TTL)
+        self.max_entries = app.config.get('IDENTITY_CACHE_SIZE', IDENTITY_CACHE_SIZE)
+        self.clear()
+
+    def get(self, user_id):
+        """
+        Snapshot of a user, loaded with one query on a miss.
+
+        Returns:
+            UserSnapshot: The user, or None if no such user exists
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        snapshot = UserSnapshot.from_user(user)
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, snapshot)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def for_connection(self, sid, user_id):
+        """
+        Identity bound to a socket connection, falling back to get().
+
+        The first lookup on a connection binds the snapshot to it; later
+        events reuse it until the user is invalidated or the socket closes.
+        """
+        with self._lock:
+            snapshot = self._connections.get(sid)
+            if snapshot is not None and snapshot.id == user_id:
+                self.connection_hits += 1
+                return snapshot
+        snapshot = self.get(user_id)
+        if snapshot is not None:
+            with self._lock:
+                self._connections[sid] = snapshot
+        return snapshot
+
+    def release_connection(self, sid):
+        with self._lock:
+            self._connections.pop(sid, None)
+
+    def invalidate(self, user_id):
+        """Drop a user's snapshot and the identities bound to their sockets."""
+        with self._lock:
+            self._entries.pop(user_id, None)
+            for sid in [sid for sid, snapshot in self._connections.items() if snapshot.id == user_id]:
+                del self._connections[sid]
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._connections.clear()
+            self.hits = self.misses = self.connection_hits = self.invalidations = 0
+
+    def stats(self):
+        """Sizes and hit counters for monitoring."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'connections': len(self._connections),
+                'hits': self.hits,
+                'misses': self.misses,
+                'connection_hits': self.connection_hits,
+                'invalidations': self.invalidations
+            }
+
+
+identity_cache = IdentityCache()
+
+
+def load_user(user_id):
+    """Flask-Login user loader backed by identity_cache."""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    # Socket.IO events carry the connection's sid on the request
+    sid = getattr(request, 'sid', None)
+    if sid is not None:
+        return identity_cache.for_connection(sid, user_id)
+    return identity_cache.get(user_id)
+
+
+def init_app(app, login_manager):
+    """Register the cached user loader and read cache limits from the app config."""
+    identity_cache.init_app(app)
+    login_manager.user_loader(load_user)
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, user):
+    identity_cache.invalidate(user.id)
+    # Drop it again on commit, in case another thread reloaded it from
+    # before the change while this transaction was still open
+    session = Session.object_session(user)
+    if session is not None:
+        session.info.setdefault('changed_user_ids', set()).add(user.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        identity_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('changed_user_ids', None)
+
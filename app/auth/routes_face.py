@@ -18,6 +18,7 @@ from flask import Blueprint, jsonify, request, session, render_template, redirec
 from flask_login import current_user, login_required, login_user
 from app.models.models import Message, User
 from app.auth.auth import verify_user_face
+from app.security.logins import record_login, record_login_failure
 from app import db, socketio
 import logging
 import base64
@@ -30,16 +31,6 @@ import uuid
 from datetime import datetime
 from app.static.face_api_models import FaceAPI
 
-# Set up logging to a file
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/routes_face.log"),
-        logging.StreamHandler()
-    ]
-)
-
 logger = logging.getLogger(__name__)
 
 # Initialize FaceAPI with model paths
@@ -114,10 +105,11 @@ def unlock_item():
             if img_rgb is None:
                 raise ValueError("Failed to decode image")
         except Exception as e:
-            logger.error(f"[ERROR] Error decoding face image: {str(e)}")
+            logger.warning('Error decoding face image: %s', e)
             return jsonify({'success': False, 'message': 'Error processing face image.'}), 400
 
-        is_match = verify_user_face(current_user, img_rgb)
+        # current_user is a cached snapshot without the face data
+        is_match = verify_user_face(db.session.get(User, current_user.id), img_rgb)
 
         if is_match:
             message.unlock_attempts = 0
@@ -127,7 +119,9 @@ def unlock_item():
         else:
             message.unlock_attempts += 1
             attempts_left = 3 - message.unlock_attempts
-            logger.warning(f"[FAILURE] Face verification failed for user {current_user.username}, message {item_id}. Attempts: {message.unlock_attempts}")
+            logger.warning('Face verification failed for user %s, message %s, attempts: %s',
+                           current_user.username, item_id, message.unlock_attempts,
+                           extra={'event': 'unlock_failed', 'user_id': current_user.id, 'message_id': item_id})
 
             try:
                 sender = User.query.get(message.sender_id)
@@ -148,13 +142,14 @@ def unlock_item():
                         'image_url': image_url,
                         'timestamp': datetime.utcnow().isoformat()
                     }, room=room_name)
-                    logger.info(f"[INTRUDER] Notified sender {sender.username} of the failed attempt.")
+                    logger.info('Notified sender %s of the failed unlock attempt', sender.username)
 
             except Exception as e:
-                logger.error(f"[INTRUDER] Failed to process and send intruder snapshot on failure: {e}")
+                logger.error('Failed to process and send intruder snapshot: %s', e)
 
             if attempts_left <= 0:
-                logger.error(f"[DELETE] Message {item_id} deleted after 3 failed unlock attempts.")
+                logger.warning('Message %s deleted after 3 failed unlock attempts', item_id,
+                               extra={'event': 'message_deleted', 'message_id': item_id})
                 message.content = "MESSAGE DELETED"
                 message.is_replaced = True
                 db.session.commit()
@@ -171,8 +166,8 @@ def unlock_item():
                     'attempts_left': attempts_left
                 }), 403
 
-    except Exception as e:
-        logger.error(f"[UNLOCK_ITEM] Unexpected error: {str(e)}")
+    except Exception:
+        logger.exception('Unexpected error unlocking item')
         return jsonify({'success': False, 'message': 'An unexpected error occurred. Please try again later.'}), 500
 
 @face_blueprint.route('/update_face_data', methods=['POST'])
@@ -205,19 +200,20 @@ def update_face_data():
         face_encoding = face_recognition.face_encodings(img_rgb, face_locations)[0]
         
         # Store face data
-        current_user.face_data = json.dumps({
+        user = db.session.get(User, current_user.id)
+        user.face_data = json.dumps({
             'encoding': face_encoding.tolist(),
             'timestamp': datetime.utcnow().isoformat()
         })
-        current_user.face_verification_enabled = True
+        user.face_verification_enabled = True
         
         db.session.commit()
-        logger.info(f"Face data updated for user {current_user.username}")
+        logger.info('Face data updated for user %s', current_user.username)
         
         return jsonify({'success': True, 'message': 'Face data updated successfully'})
     
     except Exception as e:
-        logger.error(f"Error updating face data for {current_user.username}: {str(e)}")
+        logger.error('Error updating face data for %s: %s', current_user.username, e)
         db.session.rollback()
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
@@ -226,14 +222,14 @@ def update_face_data():
 def disable_face_verification():
     """Disable face verification for the current user"""
     try:
-        current_user.face_verification_enabled = False
+        db.session.get(User, current_user.id).face_verification_enabled = False
         db.session.commit()
-        logger.info(f"Face verification disabled for user {current_user.username}")
+        logger.info('Face verification disabled for user %s', current_user.username)
         
         return jsonify({'success': True, 'message': 'Face verification disabled'})
     
     except Exception as e:
-        logger.error(f"Error disabling face verification for {current_user.username}: {str(e)}")
+        logger.error('Error disabling face verification for %s: %s', current_user.username, e)
         db.session.rollback()
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
@@ -242,8 +238,6 @@ def disable_face_verification():
 @face_blueprint.route('/face_verification', methods=['GET', 'POST'])
 def face_verification():
     """Handle face verification during high security login"""
-    print("[DEBUG] Face verification page requested")
-    
     # Check if already logged in
     if current_user.is_authenticated:
         return redirect(url_for('main.chat'))
@@ -253,8 +247,6 @@ def face_verification():
     risk_details = session.get('risk_details')
     next_page = session.get('next_page')
     
-    print(f"[DEBUG] Face verification page - username: {username}")
-    
     if not username or not risk_details:
         flash('Session expired. Please log in again.', 'danger')
         return redirect(url_for('auth.login'))
@@ -276,6 +268,7 @@ def face_verification():
         if verify_user_face(user, face_image):
             # Log in and clear session data
             login_user(user)
+            record_login(user.id)
             session.pop('username', None) 
             session.pop('risk_details', None)
             session.pop('next_page', None)
@@ -286,6 +279,7 @@ def face_verification():
                 'redirect_url': next_page or url_for('main.chat')
             })
         else:
+            record_login_failure(user.username, 'face_verification', user.id)
             # Calculate match percentage (for demo/testing)
             match_percentage = 65.0  # Example value
             
@@ -296,5 +290,4 @@ def face_verification():
                 'risk_details': risk_details
             }), 401
     
-    print(f"[DEBUG] Rendering face verification page for {username}")
     return render_template('face_verification.html', risk_details=risk_details, username=username)
@@ -0,0 +1,225 @@
+"""
+Message Delivery Module for SecureChat
+This module provides at-least-once delivery of chat events to recipients.
+
+Every message event sent to a recipient is kept in a per-recipient pending
+queue until the client acknowledges its id. Unacknowledged events are
+re-sent with exponential backoff while the recipient is online, and flushed
+in one go when an offline recipient connects again.
+
+The queue is bounded per recipient and overall. Events that are dropped
+because of those bounds or after the final retry are still in the database,
+and the client picks them up through the 'sync' event on its next connect.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from app import socketio
+from app.messaging.events import emit_message_event
+
+logger = logging.getLogger(__name__)
+
+# Defaults; overridden from app.config in init_app
+MAX_PENDING_PER_USER = 200
+MAX_PENDING_TOTAL = 10000
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 2.0
+RETRY_MAX_SECONDS = 60.0
+RETRY_POLL_SECONDS = 1.0
+
+
+class PendingDelivery:
+    """One unacknowledged event for one recipient."""
+    __slots__ = ('event', 'payload', 'attempts', 'next_retry_at')
+
+    def __init__(self, event, payload, next_retry_at):
+        self.event = event
+        self.payload = payload
+        self.attempts = 1
+        self.next_retry_at = next_retry_at
+
+
+class DeliveryQueue:
+    """
+    Bounded, thread-safe pending-delivery queues keyed by recipient.
+
+    Args:
+        emit (callable): emit(event, payload, room) used to send events;
+            defaults to emit_message_event
+        clock (callable): Monotonic time source in seconds
+    """
+
+    def __init__(self, emit=None, clock=time.monotonic):
+        self._emit = emit or emit_message_event
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._pending = {}      # user_id -> OrderedDict(message_id -> PendingDelivery)
+        self._connections = {}  # user_id -> number of open sockets
+        self._total = 0
+        self._retry_task = None
+        self._counters = {'delivered': 0, 'acked': 0, 'retried': 0, 'dropped_overflow': 0, 'dropped_retries': 0}
+
+        self.max_pending_per_user = MAX_PENDING_PER_USER
+        self.max_pending_total = MAX_PENDING_TOTAL
+        self.max_attempts = MAX_ATTEMPTS
+        self.retry_base = RETRY_BASE_SECONDS
+        self.retry_max = RETRY_MAX_SECONDS
+
+    def init_app(self, app):
+        """Read limits from the app config and start the retry loop."""
+        self.max_pending_per_user = app.config.get('DELIVERY_MAX_PENDING_PER_USER', MAX_PENDING_PER_USER)
+        self.max_pending_total = app.config.get('DELIVERY_MAX_PENDING_TOTAL', MAX_PENDING_TOTAL)
+        self.max_attempts = app.config.get('DELIVERY_MAX_ATTEMPTS', MAX_ATTEMPTS)
+        self.retry_base = app.config.get('DELIVERY_RETRY_BASE_SECONDS', RETRY_BASE_SECONDS)
+        self.retry_max = app.config.get('DELIVERY_RETRY_MAX_SECONDS', RETRY_MAX_SECONDS)
+
+        if not app.config.get('TESTING') and self._retry_task is None:
+            self._retry_task = socketio.start_background_task(self._retry_loop)
+
+    def _backoff(self, attempts):
+        return min(self.retry_base * (2 ** (attempts - 1)), self.retry_max)
+
+    def is_online(self, user_id):
+        return self._connections.get(user_id, 0) > 0
+
+    def deliver(self, user_id, event, payload):
+        """
+        Send an event to a recipient and keep it until acknowledged.
+
+        Args:
+            user_id (int): Recipient user id
+            event (str): Socket.IO event name
+            payload (dict): Event payload; must carry the message 'id'
+        """
+        user_id = int(user_id)
+        message_id = payload['id']
+        with self._lock:
+            queue = self._pending.setdefault(user_id, OrderedDict())
+            if message_id not in queue:
+                self._total += 1
+            queue[message_id] = PendingDelivery(event, payload, self._clock() + self._backoff(1))
+            self._enforce_bounds(user_id)
+            online = self.is_online(user_id)
+            self._counters['delivered'] += 1
+
+        if online:
+            self._emit(event, payload, f'user_{user_id}')
+
+    def _enforce_bounds(self, user_id):
+        # Called with the lock held. The oldest events go first; they are
+        # the most likely to have been seen already or recovered by sync.
+        queue = self._pending[user_id]
+        while len(queue) > self.max_pending_per_user:
+            queue.popitem(last=False)
+            self._total -= 1
+            self._counters['dropped_overflow'] += 1
+
+        while self._total > self.max_pending_total:
+            largest = max(self._pending, key=lambda uid: len(self._pending[uid]))
+            self._pending[largest].popitem(last=False)
+            self._total -= 1
+            self._counters['dropped_overflow'] += 1
+            if not self._pending[largest]:
+                del self._pending[largest]
+
+    def ack(self, user_id, message_ids):
+        """
+        Drop acknowledged events from a recipient's queue.
+
+        Returns:
+            int: Number of events removed
+        """
+        removed = 0
+        with self._lock:
+            queue = self._pending.get(int(user_id))
+            if not queue:
+                return 0
+            for message_id in message_ids:
+                if queue.pop(message_id, None) is not None:
+                    removed += 1
+            if not queue:
+                del self._pending[int(user_id)]
+            self._total -= removed
+            self._counters['acked'] += removed
+        return removed
+
+    def connected(self, user_id):
+        """Register a socket for a user and flush their offline inbox."""
+        user_id = int(user_id)
+        now = self._clock()
+        with self._lock:
+            self._connections[user_id] = self._connections.get(user_id, 0) + 1
+            queue = self._pending.get(user_id, {})
+            flush = [(item.event, item.payload) for item in queue.values()]
+            for item in queue.values():
+                item.next_retry_at = now + self._backoff(item.attempts)
+
+        for event, payload in flush:
+            self._emit(event, payload, f'user_{user_id}')
+        return len(flush)
+
+    def disconnected(self, user_id):
+        """Unregister a socket; events stay queued for the next connect."""
+        user_id = int(user_id)
+        with self._lock:
+            remaining = self._connections.get(user_id, 0) - 1
+            if remaining > 0:
+                self._connections[user_id] = remaining
+            else:
+                self._connections.pop(user_id, None)
+
+    def retry_due(self):
+        """
+        Re-send every event whose backoff has expired for online recipients.
+
+        Returns:
+            int: Number of events re-sent
+        """
+        now = self._clock()
+        resend = []
+        with self._lock:
+            for user_id, queue in list(self._pending.items()):
+                if not self.is_online(user_id):
+                    continue
+                for message_id, item in list(queue.items()):
+                    if item.next_retry_at > now:
+                        continue
+                    if item.attempts >= self.max_attempts:
+                        del queue[message_id]
+                        self._total -= 1
+                        self._counters['dropped_retries'] += 1
+                        continue
+                    item.attempts += 1
+                    item.next_retry_at = now + self._backoff(item.attempts)
+                    resend.append((item.event, item.payload, f'user_{user_id}'))
+                if not queue:
+                    del self._pending[user_id]
+            self._counters['retried'] += len(resend)
+
+        for event, payload, room in resend:
+            self._emit(event, payload, room)
+        return len(resend)
+
+    def _retry_loop(self):
+        while True:
+            socketio.sleep(RETRY_POLL_SECONDS)
+            try:
+                self.retry_due()
+            except Exception:
+                logger.exception('Delivery retry failed')
+
+    def stats(self):
+        """Queue depth and delivery counters for monitoring."""
+        with self._lock:
+            depths = [len(queue) for queue in self._pending.values()]
+            return {
+                'pending_total': self._total,
+                'pending_users': len(depths),
+                'max_user_depth': max(depths, default=0),
+                'online_users': len(self._connections),
+                **self._counters
+            }
+
+
+delivery_queue = DeliveryQueue()
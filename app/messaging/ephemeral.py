@@ -0,0 +1,140 @@
+"""
+Ephemeral Event Module for SecureChat
+This module relays short-lived signals such as typing and read indicators.
+
+Ephemeral events are never written to the database. Each (user,
+conversation, kind) key is throttled on the server: the first event goes
+out at once, and anything arriving within the next interval is coalesced
+so only the latest state is emitted when the interval ends. Coalesced
+events that sit past the stale limit (e.g. because the flush loop fell
+behind) are dropped rather than delivered late.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from app import socketio
+
+logger = logging.getLogger(__name__)
+
+# Defaults; overridden from app.config in init_app
+INTERVAL_SECONDS = 0.5
+STALE_SECONDS = 3.0
+MAX_PENDING = 10000
+FLUSH_POLL_SECONDS = 0.1
+
+# Kinds clients may publish; 'read' is published by the server from mark_read
+CLIENT_KINDS = ('typing',)
+
+
+class EphemeralChannel:
+    """
+    Per-key throttle and coalescer for ephemeral Socket.IO events.
+
+    Args:
+        emit (callable): emit(event, payload, room) used to send events
+        clock (callable): Monotonic time source in seconds
+    """
+
+    def __init__(self, emit=None, clock=time.monotonic):
+        self._emit = emit or (lambda event, payload, room: socketio.emit(event, payload, room=room))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last_emit = {}          # key -> time of the last emit
+        self._pending = OrderedDict()  # key -> (room, payload, received_at, due_at)
+        self._flush_task = None
+        self._counters = {'received': 0, 'emitted': 0, 'coalesced': 0, 'dropped_stale': 0, 'dropped_overflow': 0}
+
+        self.interval = INTERVAL_SECONDS
+        self.stale_after = STALE_SECONDS
+        self.max_pending = MAX_PENDING
+
+    def init_app(self, app):
+        """Read limits from the app config and start the flush loop."""
+        self.interval = app.config.get('EPHEMERAL_INTERVAL_SECONDS', INTERVAL_SECONDS)
+        self.stale_after = app.config.get('EPHEMERAL_STALE_SECONDS', STALE_SECONDS)
+        self.max_pending = app.config.get('EPHEMERAL_MAX_PENDING', MAX_PENDING)
+
+        if not app.config.get('TESTING') and self._flush_task is None:
+            self._flush_task = socketio.start_background_task(self._flush_loop)
+
+    def publish(self, key, room, payload):
+        """
+        Emit an ephemeral event now, or hold it until its key's interval ends.
+
+        Args:
+            key (tuple): Throttle key, e.g. (user_id, conversation, kind)
+            room (str): Socket.IO room to emit to
+            payload (dict): Event payload; a later publish for the same key
+                replaces it while it is held
+
+        Returns:
+            bool: True if the event was emitted immediately
+        """
+        now = self._clock()
+        with self._lock:
+            self._counters['received'] += 1
+            last = self._last_emit.get(key)
+            if last is None or now - last >= self.interval:
+                self._last_emit[key] = now
+                self._pending.pop(key, None)
+                self._counters['emitted'] += 1
+                send = True
+            else:
+                if key in self._pending:
+                    self._counters['coalesced'] += 1
+                self._pending[key] = (room, payload, now, last + self.interval)
+                self._pending.move_to_end(key)
+                while len(self._pending) > self.max_pending:
+                    self._pending.popitem(last=False)
+                    self._counters['dropped_overflow'] += 1
+                send = False
+
+        if send:
+            self._emit('ephemeral', payload, room)
+        return send
+
+    def flush_due(self):
+        """
+        Emit held events whose interval has ended and drop stale ones.
+
+        Returns:
+            int: Number of events emitted
+        """
+        now = self._clock()
+        due = []
+        with self._lock:
+            for key, (room, payload, received_at, due_at) in list(self._pending.items()):
+                if now - received_at > self.stale_after:
+                    del self._pending[key]
+                    self._counters['dropped_stale'] += 1
+                elif due_at <= now:
+                    del self._pending[key]
+                    self._last_emit[key] = now
+                    due.append((payload, room))
+            self._counters['emitted'] += len(due)
+
+            # Keys idle for a full interval no longer throttle anything
+            for key, last in list(self._last_emit.items()):
+                if now - last >= self.interval and key not in self._pending:
+                    del self._last_emit[key]
+
+        for payload, room in due:
+            self._emit('ephemeral', payload, room)
+        return len(due)
+
+    def _flush_loop(self):
+        while True:
+            socketio.sleep(FLUSH_POLL_SECONDS)
+            try:
+                self.flush_due()
+            except Exception:
+                logger.exception('Ephemeral flush failed')
+
+    def stats(self):
+        """Pending depth and counters for monitoring."""
+        with self._lock:
+            return {'pending': len(self._pending), 'tracked_keys': len(self._last_emit), **self._counters}
+
+
+ephemeral_channel = EphemeralChannel()
@@ -0,0 +1,147 @@
+"""
+Message Event Module for SecureChat
+This module defines the one schema used for 'new_message' and 'new_file'
+events, and how those events are encoded on the wire.
+
+Every send path (HTTP /send_message, socket send_message and new_file)
+builds its payload with message_event(), so clients see one shape.
+
+Each socket negotiates an encoding when it connects:
+    - 'json': the event dict as-is (default, always available)
+    - 'msgpack': a MessagePack array [version, *MESSAGE_EVENT_FIELDS],
+      which drops the repeated keys; offered only if msgpack is installed
+
+Sockets join an encoding room next to their user room, e.g.
+'user_5:msgpack', and an event is encoded once per encoding rather than
+once per recipient.
+"""
+from app import socketio
+
+try:
+    import msgpack
+except ImportError:  # JSON-only when msgpack is not installed
+    msgpack = None
+
+SCHEMA_VERSION = 1
+
+# Field order of the compact encoding; append only, bump SCHEMA_VERSION otherwise
+MESSAGE_EVENT_FIELDS = (
+    'id',
+    'conversation_id',
+    'sender_id',
+    'sender_username',
+    'recipient_id',
+    'content',
+    'file_url',
+    'file_name',
+    'timestamp',
+    'is_face_locked',
+    'is_temp_id',
+)
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+
+
+def available_encodings():
+    """Encodings this server can produce, most compact first."""
+    return (MSGPACK, JSON) if msgpack is not None else (JSON,)
+
+
+def message_event(id, sender_id, sender_username, recipient_id, conversation_id=None,
+                  content=None, file_url=None, file_name=None, timestamp=None,
+                  is_face_locked=False, is_temp_id=False):
+    """
+    Build a message event in the versioned schema.
+
+    Returns:
+        dict: {'v': SCHEMA_VERSION, <each of MESSAGE_EVENT_FIELDS>}
+    """
+    return {
+        'v': SCHEMA_VERSION,
+        'id': id,
+        'conversation_id': conversation_id,
+        'sender_id': sender_id,
+        'sender_username': sender_username,
+        'recipient_id': int(recipient_id) if recipient_id is not None else None,  # None for groups
+        'content': content,
+        'file_url': file_url,
+        'file_name': file_name,
+        'timestamp': timestamp.isoformat() if timestamp else None,
+        'is_face_locked': bool(is_face_locked),
+        'is_temp_id': bool(is_temp_id),
+    }
+
+
+def message_event_for(message, sender_username, file_name=None):
+    """Build a message event for a saved Message row."""
+    return message_event(
+        id=message.id,
+        sender_id=message.sender_id,
+        sender_username=sender_username,
+        recipient_id=message.recipient_id,
+        conversation_id=message.conversation_id,
+        content=message.content,
+        file_url=message.file_path,
+        file_name=file_name,
+        timestamp=message.timestamp,
+        is_face_locked=message.is_face_locked,
+    )
+
+
+def negotiate_encoding(auth):
+    """
+    Pick the encoding for a connecting socket.
+
+    Args:
+        auth (dict): Socket.IO auth data; 'encodings' lists the client's
+            encodings in order of preference
+
+    Returns:
+        str: The first encoding both sides support, else 'json'
+    """
+    offered = (auth or {}).get('encodings') if isinstance(auth, dict) else None
+    if isinstance(offered, (list, tuple)):
+        supported = available_encodings()
+        for encoding in offered:
+            if encoding in supported:
+                return encoding
+    return JSON
+
+
+def encoding_info(encoding):
+    """Negotiation result sent to the client so it can decode events."""
+    return {'encoding': encoding, 'version': SCHEMA_VERSION, 'fields': list(MESSAGE_EVENT_FIELDS)}
+
+
+def encoding_room(room, encoding):
+    return f'{room}:{encoding}'
+
+
+def encode_event(event, encoding):
+    """
+    Encode a message event for the wire.
+
+    Returns:
+        dict | bytes: The dict itself for JSON, packed bytes for MessagePack
+    """
+    if encoding == MSGPACK:
+        return msgpack.packb([event['v']] + [event[field] for field in MESSAGE_EVENT_FIELDS], use_bin_type=True)
+    return event
+
+
+def decode_event(data):
+    """Inverse of encode_event; mainly for tests and Python clients."""
+    if isinstance(data, (bytes, bytearray)):
+        values = msgpack.unpackb(data, raw=False)
+        return {'v': values[0], **dict(zip(MESSAGE_EVENT_FIELDS, values[1:]))}
+    return data
+
+
+def emit_message_event(name, event, room):
+    """
+    Emit a message event to every socket in a user or group room, each in
+    the encoding it negotiated.
+    """
+    for encoding in available_encodings():
+        socketio.emit(name, encode_event(event, encoding), room=encoding_room(room, encoding))
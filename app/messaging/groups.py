@@ -0,0 +1,262 @@
+"""
+Group Conversation Module for SecureChat
+This module manages group conversations and their Socket.IO rooms.
+
+A group message is saved once (recipient_id is NULL) and emitted once to
+the room conv_<id>, which every member's sockets join, instead of being
+sent to each member's user room in turn.
+
+Member lists are cached per conversation so the send path can check that
+the sender belongs to the group without querying Membership each time.
+The cache is invalidated locally whenever membership changes here, and
+entries expire after a TTL to bound staleness across worker processes.
+"""
+import threading
+import time
+from collections import OrderedDict
+from app import db, socketio
+from app.models.models import Conversation, Membership, User
+from app.messaging.events import available_encodings, encoding_room
+
+# Defaults; overridden from app.config in init_app
+MAX_GROUP_MEMBERS = 500
+MAX_TITLE_LENGTH = 128
+MEMBERSHIP_CACHE_TTL = 60.0
+MEMBERSHIP_CACHE_SIZE = 1024
+
+
+class GroupError(ValueError):
+    """Raised when a group operation is not allowed."""
+
+
+def conversation_room(conversation_id):
+    return f'conv_{conversation_id}'
+
+
+def parse_id(value):
+    """A user or conversation id from client input, or None if it is not an integer."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class MembershipCache:
+    """
+    LRU cache of conversation member ids with a TTL.
+
+    Args:
+        ttl (float): Seconds before a cached member list is reloaded
+        max_entries (int): Conversations kept before the least recent is evicted
+        clock (callable): Monotonic time source in seconds
+    """
+
+    def __init__(self, ttl=MEMBERSHIP_CACHE_TTL, max_entries=MEMBERSHIP_CACHE_SIZE, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # conversation_id -> (expires_at, frozenset of user ids)
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.ttl = app.config.get('GROUP_MEMBERSHIP_CACHE_TTL', MEMBERSHIP_CACHE_TTL)
+        self.max_entries = app.config.get('GROUP_MEMBERSHIP_CACHE_SIZE', MEMBERSHIP_CACHE_SIZE)
+        self.clear()
+
+    def members(self, conversation_id):
+        """
+        Member ids of a group conversation, loaded with one query on a miss.
+
+        Returns:
+            frozenset: User ids; empty for unknown or 1:1 conversations
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(conversation_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        rows = db.session.query(Membership.user_id)\
+            .join(Conversation, Membership.conversation_id == Conversation.id)\
+            .filter(Membership.conversation_id == conversation_id, Conversation.is_group.is_(True))\
+            .all()
+        members = frozenset(user_id for user_id, in rows)
+        with self._lock:
+            self._entries[conversation_id] = (now + self.ttl, members)
+            self._entries.move_to_end(conversation_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return members
+
+    def invalidate(self, conversation_id):
+        with self._lock:
+            self._entries.pop(conversation_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+membership_cache = MembershipCache()
+
+
+def init_app(app):
+    """Read group limits from the app config."""
+    global MAX_GROUP_MEMBERS
+    MAX_GROUP_MEMBERS = app.config.get('GROUP_MAX_MEMBERS', MAX_GROUP_MEMBERS)
+    membership_cache.init_app(app)
+
+
+def _existing_user_ids(user_ids):
+    ids = {int(user_id) for user_id in user_ids}
+    if not ids:
+        return set()
+    return {user_id for user_id, in db.session.query(User.id).filter(User.id.in_(ids))}
+
+
+def create_group(creator_id, title, member_ids):
+    """
+    Create a group conversation. The creator is always a member.
+
+    Args:
+        creator_id (int): User creating the group
+        title (str): Group name shown to members
+        member_ids (iterable): Other users to add
+
+    Returns:
+        Conversation: The new group, flushed but not committed
+
+    Raises:
+        GroupError: If the title is missing or the group would be too large
+    """
+    title = (title or '').strip()
+    if not title:
+        raise GroupError('Group title is required')
+    if len(title) > MAX_TITLE_LENGTH:
+        raise GroupError(f'Group title must be at most {MAX_TITLE_LENGTH} characters')
+
+    members = _existing_user_ids(member_ids) | {int(creator_id)}
+    if len(members) > MAX_GROUP_MEMBERS:
+        raise GroupError(f'Groups are limited to {MAX_GROUP_MEMBERS} members')
+
+    group = Conversation(is_group=True, title=title, created_by_id=creator_id)
+    db.session.add(group)
+    for user_id in members:
+        group.memberships.append(Membership(user_id=user_id))
+    db.session.flush()
+    return group
+
+
+def add_members(group, user_ids):
+    """
+    Add users to a group, skipping existing members and unknown ids.
+
+    Returns:
+        set: Ids of the users that were added (flushed, not committed)
+    """
+    if not group.is_group:
+        raise GroupError('Members can only be added to group conversations')
+
+    current = membership_cache.members(group.id)
+    added = _existing_user_ids(user_ids) - current
+    if len(current) + len(added) > MAX_GROUP_MEMBERS:
+        raise GroupError(f'Groups are limited to {MAX_GROUP_MEMBERS} members')
+
+    for user_id in added:
+        # New members start with the existing history marked as read
+        db.session.add(Membership(conversation_id=group.id, user_id=user_id,
+                                  last_read_message_id=group.last_message_id))
+    db.session.flush()
+    membership_cache.invalidate(group.id)
+    return added
+
+
+def remove_member(group, user_id):
+    """
+    Remove a user from a group.
+
+    Returns:
+        bool: True if the user was a member (flushed, not committed)
+    """
+    if not group.is_group:
+        raise GroupError('Members can only be removed from group conversations')
+
+    removed = Membership.query.filter_by(conversation_id=group.id, user_id=user_id).delete()
+    db.session.flush()
+    membership_cache.invalidate(group.id)
+    return bool(removed)
+
+
+def find_conversation_for(user_id, recipient_id=None, conversation_id=None):
+    """
+    Resolve the conversation a request refers to, by peer or by group id.
+
+    Returns:
+        Conversation: The 1:1 conversation with recipient_id, or the group
+            conversation_id if the user is a member; None otherwise,
+            including for ids that are not integers
+    """
+    if conversation_id:
+        conversation_id = parse_id(conversation_id)
+        if conversation_id is None or int(user_id) not in membership_cache.members(conversation_id):
+            return None
+        return db.session.get(Conversation, conversation_id)
+    if recipient_id:
+        recipient_id = parse_id(recipient_id)
+        return Conversation.find(user_id, recipient_id) if recipient_id is not None else None
+    return None
+
+
+def group_ids_for_user(user_id):
+    """Ids of the group conversations a user belongs to, in one query."""
+    rows = db.session.query(Membership.conversation_id)\
+        .join(Conversation, Membership.conversation_id == Conversation.id)\
+        .filter(Membership.user_id == user_id, Conversation.is_group.is_(True))
+    return [conversation_id for conversation_id, in rows]
+
+
+def join_conversation_rooms(join, conversation_ids, encoding):
+    """
+    Join the current socket to the rooms of its groups.
+
+    Args:
+        join (callable): flask_socketio.join_room
+        conversation_ids (iterable): Group conversation ids
+        encoding (str): The socket's negotiated event encoding
+    """
+    for conversation_id in conversation_ids:
+        room = conversation_room(conversation_id)
+        join(room)
+        join(encoding_room(room, encoding))
+
+
+def _user_sockets(user_id):
+    """(sid, encoding) for each of a user's sockets connected to this process."""
+    manager = socketio.server.manager
+    if '/' not in manager.rooms:
+        return
+    for encoding in available_encodings():
+        for sid, _ in manager.get_participants('/', encoding_room(f'user_{user_id}', encoding)):
+            yield sid, encoding
+
+
+def sync_member_rooms(conversation_id, added=(), removed=()):
+    """
+    Move the open sockets of added and removed members in or out of the
+    group room. Sockets on other processes catch up on their next connect.
+    """
+    room = conversation_room(conversation_id)
+    for user_id in added:
+        for sid, encoding in _user_sockets(user_id):
+            socketio.server.enter_room(sid, room, namespace='/')
+            socketio.server.enter_room(sid, encoding_room(room, encoding), namespace='/')
+    for user_id in removed:
+        for sid, encoding in _user_sockets(user_id):
+            socketio.server.leave_room(sid, room, namespace='/')
+            socketio.server.leave_room(sid, encoding_room(room, encoding), namespace='/')
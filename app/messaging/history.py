@@ -0,0 +1,146 @@
+"""
+Message History Module for SecureChat
+This module provides keyset (cursor) pagination over a conversation's messages.
+
+Cursors are opaque strings wrapping the (timestamp, id) of a boundary message.
+Paging walks the (conversation_id, timestamp, id) index, so fetching an older or
+newer page costs the same no matter how deep into the history it is.
+"""
+import base64
+from datetime import datetime
+from sqlalchemy import tuple_
+from flask import current_app
+from app import db
+from app.models.models import Message
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we did not issue."""
+
+
+def encode_cursor(message):
+    """
+    Build an opaque cursor pointing at a message.
+
+    Args:
+        message (Message): The boundary message of a page
+
+    Returns:
+        str: URL-safe cursor string
+    """
+    raw = f"{message.timestamp.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Args:
+        cursor (str): Cursor string from the client
+
+    Returns:
+        tuple: (timestamp, message_id)
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        timestamp, message_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor(f"Malformed cursor: {cursor}") from e
+
+
+def resolve_page_size(limit):
+    """Clamp a requested page size to the configured bounds."""
+    default = current_app.config.get('MESSAGE_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    maximum = current_app.config.get('MESSAGE_PAGE_SIZE_MAX', MAX_PAGE_SIZE)
+    if not limit or limit < 1:
+        return default
+    return min(limit, maximum)
+
+
+def conversation_page_query(conversation_id, before=None, after=None, session=None):
+    """
+    Build the keyset query behind get_conversation_page.
+
+    Newest-first unless paging forward with an 'after' cursor.
+    """
+    if before and after:
+        raise InvalidCursor("Use either 'before' or 'after', not both")
+
+    key = tuple_(Message.timestamp, Message.id)
+    query = (session or db.session).query(Message).filter(Message.conversation_id == conversation_id)
+
+    if after:
+        return query.filter(key > decode_cursor(after))\
+            .order_by(Message.timestamp.asc(), Message.id.asc())
+
+    if before:
+        query = query.filter(key < decode_cursor(before))
+    return query.order_by(Message.timestamp.desc(), Message.id.desc())
+
+
+def get_conversation_page(conversation_id, before=None, after=None, limit=None, session=None):
+    """
+    Fetch one page of a conversation's history.
+
+    Args:
+        conversation_id (int): Conversation to page through
+        before (str): Cursor; return messages older than it
+        after (str): Cursor; return messages newer than it
+        limit (int): Requested page size
+        session (Session): Session to read with, e.g. a read_session(); defaults to db.session
+
+    Returns:
+        dict: Messages in chronological order plus cursors for the adjacent pages
+    """
+    page_size = resolve_page_size(limit)
+    query = conversation_page_query(conversation_id, before=before, after=after, session=session)
+
+    # Fetch one extra row to learn whether another page exists
+    rows = query.limit(page_size + 1).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if not after:
+        rows.reverse()
+
+    return {
+        'messages': rows,
+        'has_more': has_more,
+        'before_cursor': encode_cursor(rows[0]) if rows else before,
+        'after_cursor': encode_cursor(rows[-1]) if rows else after,
+    }
+
+
+def get_messages_since(conversation_id, since_id, limit=None, session=None):
+    """
+    Fetch the messages a client has not seen yet, oldest first.
+
+    Used for delta sync: the client keeps the highest message id it has
+    cached per conversation and asks only for what came after it.
+
+    Args:
+        conversation_id (int): Conversation to sync
+        since_id (int): Highest message id the client already has
+        limit (int): Requested page size
+        session (Session): Session to read with; defaults to db.session
+
+    Returns:
+        dict: Same shape as get_conversation_page, plus 'reset' which is True
+        when since_id could not be resolved and the latest page was returned
+        instead, so the client should drop its cache for this conversation
+    """
+    session = session or db.session
+    boundary = session.get(Message, since_id) if since_id else None
+    if not boundary or boundary.conversation_id != conversation_id:
+        page = get_conversation_page(conversation_id, limit=limit, session=session)
+        page['reset'] = True
+        return page
+
+    page = get_conversation_page(conversation_id, after=encode_cursor(boundary), limit=limit, session=session)
+    page['reset'] = False
+    return page
@@ -0,0 +1,307 @@
+"""
+Message Search Module for SecureChat
+This module provides full-text search over chat history.
+
+On SQLite the index is an FTS5 table, message_fts, whose rowid is the
+message id. Other databases (or SQLite builds without FTS5) fall back to
+an in-process inverted index. Either way the index is kept up to date by
+mapper events on Message, so every send path and the unlock flow's
+"MESSAGE DELETED" replacement are covered without extra calls.
+
+Face-locked and deleted messages are never indexed, so their content can
+not leak through search results.
+"""
+import bisect
+import re
+import threading
+from sqlalchemy import column, event, inspect, text, Integer
+from sqlalchemy.exc import OperationalError
+from app import db
+from app.models.models import Conversation, Message
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MAX_QUERY_TERMS = 8
+
+FTS_TABLE = 'message_fts'
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_INDEX_EXISTING = (
+    f"INSERT INTO {FTS_TABLE} (rowid, content) "
+    f"SELECT id, content FROM message WHERE COALESCE(is_face_locked, 0) = 0 AND COALESCE(is_replaced, 0) = 0"
+)
+
+# Backend per engine: 'fts5' or 'memory'
+_backends = {}
+
+
+def tokenize(content):
+    """Lowercased word tokens, matching FTS5's unicode61 tokenizer closely enough."""
+    return _TOKEN_RE.findall((content or '').lower())
+
+
+def is_searchable(message):
+    return bool(message.content) and not message.is_face_locked and not message.is_replaced
+
+
+class InvertedIndex:
+    """
+    In-process token -> message id index, used when FTS5 is unavailable.
+
+    Terms match as prefixes, like the FTS5 queries built below. The index
+    lives in memory per process and is filled from the database by
+    rebuild_search_index() on first use.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}   # token -> set of message ids
+        self._documents = {}  # message id -> tuple of tokens
+        self._vocabulary = []
+        self._vocabulary_dirty = False
+        self.loaded = False
+
+    def add(self, message_id, content):
+        tokens = tuple(set(tokenize(content)))
+        with self._lock:
+            self._remove_locked(message_id)
+            self._documents[message_id] = tokens
+            for token in tokens:
+                if token not in self._postings:
+                    self._postings[token] = set()
+                    self._vocabulary_dirty = True
+                self._postings[token].add(message_id)
+
+    def remove(self, message_id):
+        with self._lock:
+            self._remove_locked(message_id)
+
+    def _remove_locked(self, message_id):
+        for token in self._documents.pop(message_id, ()):
+            ids = self._postings.get(token)
+            if ids is not None:
+                ids.discard(message_id)
+                if not ids:
+                    del self._postings[token]
+                    self._vocabulary_dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._vocabulary = []
+            self._vocabulary_dirty = False
+
+    def match(self, terms):
+        """Ids of messages containing every term as a word prefix."""
+        with self._lock:
+            if self._vocabulary_dirty:
+                self._vocabulary = sorted(self._postings)
+                self._vocabulary_dirty = False
+            result = None
+            for term in terms:
+                ids = set()
+                start = bisect.bisect_left(self._vocabulary, term)
+                for token in self._vocabulary[start:]:
+                    if not token.startswith(term):
+                        break
+                    ids |= self._postings[token]
+                result = ids if result is None else result & ids
+                if not result:
+                    return set()
+            return result or set()
+
+
+memory_index = InvertedIndex()
+
+
+def ensure_search_index(engine=None):
+    """
+    Pick the search backend for an engine and create the FTS5 table if needed.
+
+    Called from create_app() after db.create_all(). A newly created FTS5
+    table is filled from the existing messages.
+
+    Returns:
+        str: 'fts5' or 'memory'
+    """
+    engine = engine or db.engine
+    if engine in _backends:
+        return _backends[engine]
+
+    backend = 'memory'
+    if engine.dialect.name == 'sqlite':
+        try:
+            with engine.begin() as connection:
+                exists = connection.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+                ), {'name': FTS_TABLE}).first()
+                if not exists:
+                    connection.execute(text(
+                        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(content, tokenize='unicode61')"
+                    ))
+                    if inspect(connection).has_table('message'):
+                        connection.execute(text(_INDEX_EXISTING))
+            backend = 'fts5'
+        except OperationalError:
+            # SQLite built without FTS5
+            backend = 'memory'
+    _backends[engine] = backend
+    return backend
+
+
+def _backend(connection):
+    # Never create the table from inside a flush; engines that were not set
+    # up by ensure_search_index() are simply not indexed
+    return _backends.get(connection.engine)
+
+
+def _index(connection, message):
+    backend = _backend(connection)
+    if backend == 'fts5':
+        connection.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': message.id})
+        if is_searchable(message):
+            connection.execute(text(f"INSERT INTO {FTS_TABLE} (rowid, content) VALUES (:id, :content)"),
+                               {'id': message.id, 'content': message.content})
+    elif backend == 'memory' and memory_index.loaded:
+        if is_searchable(message):
+            memory_index.add(message.id, message.content)
+        else:
+            memory_index.remove(message.id)
+
+
+@event.listens_for(Message, 'after_insert')
+def _message_inserted(mapper, connection, message):
+    if is_searchable(message):
+        _index(connection, message)
+
+
+@event.listens_for(Message, 'after_update')
+def _message_updated(mapper, connection, message):
+    state = inspect(message)
+    if any(state.attrs[name].history.has_changes() for name in ('content', 'is_face_locked', 'is_replaced')):
+        _index(connection, message)
+
+
+@event.listens_for(Message, 'after_delete')
+def _message_deleted(mapper, connection, message):
+    backend = _backend(connection)
+    if backend == 'fts5':
+        connection.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': message.id})
+    elif backend == 'memory':
+        memory_index.remove(message.id)
+
+
+def unindex_messages(message_ids):
+    """
+    Drop messages from the index in the current transaction.
+
+    Bulk deletes (e.g. by the retention job) skip the mapper events above,
+    so they call this for the ids they removed.
+    """
+    message_ids = list(message_ids)
+    if not message_ids:
+        return
+    backend = _backend(db.session.connection())
+    if backend == 'fts5':
+        db.session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"),
+                           [{'id': message_id} for message_id in message_ids])
+    elif backend == 'memory':
+        for message_id in message_ids:
+            memory_index.remove(message_id)
+
+
+def rebuild_search_index(batch_size=1000):
+    """
+    Rebuild the index from the message table.
+
+    Returns:
+        int: Number of messages indexed
+    """
+    backend = ensure_search_index()
+    searchable = (Message.is_face_locked.isnot(True)) & (Message.is_replaced.isnot(True))
+    if backend == 'fts5':
+        db.session.execute(text(f"DELETE FROM {FTS_TABLE}"))
+        db.session.execute(text(_INDEX_EXISTING))
+        db.session.commit()
+        return db.session.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar()
+
+    memory_index.clear()
+    count = 0
+    rows = db.session.query(Message.id, Message.content).filter(searchable)\
+        .execution_options(yield_per=batch_size)
+    for message_id, content in rows:
+        memory_index.add(message_id, content)
+        count += 1
+    memory_index.loaded = True
+    return count
+
+
+def build_match_query(query):
+    """
+    Turn free text into a safe FTS5 query: every word as a quoted prefix term.
+
+    Returns:
+        list: Lowercased terms (empty if the query has no words)
+    """
+    return tokenize(query)[:MAX_QUERY_TERMS]
+
+
+def _memory_search(visible, terms, before_id, wanted, chunk_size=500):
+    """Page through in-process matches newest first, checking visibility in chunks."""
+    if not memory_index.loaded:
+        rebuild_search_index()
+    ids = sorted((message_id for message_id in memory_index.match(terms)
+                  if before_id is None or message_id < before_id), reverse=True)
+    rows = []
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        rows.extend(visible.filter(Message.id.in_(chunk)).order_by(Message.id.desc()).limit(wanted - len(rows)))
+        if len(rows) >= wanted:
+            break
+    return rows
+
+
+def search_messages(user_id, query, conversation_id=None, before_id=None, limit=None):
+    """
+    Search the messages a user can see, newest first.
+
+    Args:
+        user_id (int): The searching user; only their conversations are searched
+        query (str): Free-text query; words match as prefixes, all must match
+        conversation_id (int): Restrict to one conversation
+        before_id (int): Keyset cursor; only messages with a smaller id
+        limit (int): Page size, capped at MAX_PAGE_SIZE
+
+    Returns:
+        dict: {'messages': [Message], 'has_more': bool, 'next_before_id': int or None}
+    """
+    limit = min(max(int(limit or DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    terms = build_match_query(query)
+    if not terms:
+        return {'messages': [], 'has_more': False, 'next_before_id': None}
+
+    visible = db.session.query(Message).filter(
+        Message.conversation_id.in_(Conversation.ids_for_user(user_id)),
+        Message.is_face_locked.isnot(True),
+        Message.is_replaced.isnot(True)
+    )
+    if conversation_id is not None:
+        visible = visible.filter(Message.conversation_id == conversation_id)
+    if before_id is not None:
+        visible = visible.filter(Message.id < before_id)
+
+    if ensure_search_index() == 'fts5':
+        match = ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+        matched_ids = text(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match")\
+            .bindparams(match=match).columns(column('rowid', Integer))
+        rows = visible.filter(Message.id.in_(matched_ids)).order_by(Message.id.desc()).limit(limit + 1).all()
+    else:
+        rows = _memory_search(visible, terms, before_id, limit + 1)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'messages': rows,
+        'has_more': has_more,
+        'next_before_id': rows[-1].id if has_more else None
+    }
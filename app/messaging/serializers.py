@@ -0,0 +1,67 @@
+"""
+Message Serialization Module for SecureChat
+This module turns Message rows into the JSON shape the chat client expects.
+
+Usernames are resolved for a whole batch of messages with a single query
+instead of walking the lazy sender/recipient relationships row by row.
+"""
+from app import db
+from app.models.models import User
+
+
+def resolve_usernames(user_ids):
+    """
+    Look up usernames for a set of user ids in one query.
+
+    Args:
+        user_ids (iterable): User ids, may contain duplicates or None
+
+    Returns:
+        dict: {user_id: username}
+    """
+    ids = {user_id for user_id in user_ids if user_id is not None}
+    if not ids:
+        return {}
+    rows = db.session.query(User.id, User.username).filter(User.id.in_(ids)).all()
+    return {user_id: username for user_id, username in rows}
+
+
+def serialize_message(message, usernames):
+    """
+    Serialize a single message.
+
+    Args:
+        message (Message): The message to serialize
+        usernames (dict): {user_id: username} covering sender and recipient
+
+    Returns:
+        dict: JSON-serializable message payload
+    """
+    return {
+        'id': message.id,
+        'conversation_id': message.conversation_id,
+        'content': message.content,
+        'sender_id': message.sender_id,
+        'sender': {'username': usernames.get(message.sender_id)},
+        'recipient_id': message.recipient_id,
+        'recipient': {'username': usernames.get(message.recipient_id)},
+        'timestamp': message.timestamp.isoformat(),
+        'file_path': message.file_path,
+        'is_face_locked': message.is_face_locked
+    }
+
+
+def serialize_messages(messages):
+    """
+    Serialize a list of messages, resolving all usernames up front.
+
+    Args:
+        messages (list): Message rows
+
+    Returns:
+        list: JSON-serializable message payloads in the same order
+    """
+    usernames = resolve_usernames(
+        user_id for message in messages for user_id in (message.sender_id, message.recipient_id)
+    )
+    return [serialize_message(message, usernames) for message in messages]
@@ -0,0 +1,182 @@
+"""
+Conversation Summary Module for SecureChat
+This module keeps per-user conversation summaries up to date.
+
+Each conversation stores a pointer to its newest message and each member
+row keeps an unread counter and a read marker. Both are maintained
+incrementally when messages are sent or read, so listing a user's
+conversations is a single indexed query instead of one history fetch per peer.
+
+Group conversations share one summary update per message, emitted once to
+the group room; each client counts its own unread messages from it.
+"""
+from datetime import datetime
+from sqlalchemy import case, tuple_
+from app import db, socketio
+from app.models.models import Conversation, Membership, Message, User
+from app.messaging.groups import conversation_room
+
+
+def record_message(message):
+    """
+    Fold a newly added message into its conversation summary.
+
+    Must run after the message is flushed (so it has an id) and before
+    the surrounding transaction commits.
+
+    Args:
+        message (Message): The message being sent
+    """
+    Conversation.query.filter_by(id=message.conversation_id).update({
+        Conversation.last_message_id: message.id,
+        Conversation.last_message_at: message.timestamp
+    }, synchronize_session=False)
+
+    # Everyone but the sender has one more unread message
+    Membership.query.filter(
+        Membership.conversation_id == message.conversation_id,
+        Membership.user_id != message.sender_id
+    ).update({Membership.unread_count: Membership.unread_count + 1}, synchronize_session=False)
+
+
+def mark_read(user_id, conversation_id, message_id=None):
+    """
+    Move a user's read marker forward.
+
+    Args:
+        user_id (int): The reader
+        conversation_id (int): Conversation being read
+        message_id (int): Newest message seen; defaults to the latest message
+
+    Returns:
+        Membership: The updated membership, or None if the user is not a member
+    """
+    membership = Membership.query.filter_by(conversation_id=conversation_id, user_id=user_id).first()
+    if not membership:
+        return None
+
+    # Clients may echo back temporary string ids for unsaved messages
+    try:
+        message_id = int(message_id) if message_id is not None else None
+    except (TypeError, ValueError):
+        message_id = None
+
+    conversation = db.session.get(Conversation, conversation_id)
+    latest_id = conversation.last_message_id
+    if message_id is None or (latest_id is not None and message_id >= latest_id):
+        message_id = latest_id
+
+    # Read markers never move backward
+    if message_id is None or (membership.last_read_message_id or 0) >= message_id:
+        return membership
+
+    if message_id == latest_id:
+        unread = 0
+    else:
+        boundary = db.session.get(Message, message_id)
+        if not boundary or boundary.conversation_id != conversation_id:
+            return membership
+        unread = Message.query.filter(
+            Message.conversation_id == conversation_id,
+            tuple_(Message.timestamp, Message.id) > (boundary.timestamp, boundary.id),
+            Message.sender_id != user_id
+        ).count()
+
+    membership.last_read_message_id = message_id
+    membership.last_read_at = datetime.utcnow()
+    membership.unread_count = unread
+    db.session.commit()
+    return membership
+
+
+def summary_query(user_id, conversation_id=None):
+    """
+    Build the query behind get_conversation_summaries.
+
+    Joins each of the user's memberships to its conversation, the newest
+    message and the peer's username in one statement. Groups have no peer.
+    """
+    peer_id = case(
+        (Conversation.user_low_id == user_id, Conversation.user_high_id),
+        else_=Conversation.user_low_id
+    )
+    query = db.session.query(Membership, Conversation, Message, User.id, User.username)\
+        .join(Conversation, Membership.conversation_id == Conversation.id)\
+        .outerjoin(Message, Message.id == Conversation.last_message_id)\
+        .outerjoin(User, User.id == peer_id)\
+        .filter(Membership.user_id == user_id)
+    if conversation_id is not None:
+        query = query.filter(Membership.conversation_id == conversation_id)
+    return query.order_by(Conversation.last_message_at.desc())
+
+
+def _summary_row(membership, conversation, message, peer_id, peer_username):
+    last_message = None
+    if message is not None:
+        last_message = {
+            'id': message.id,
+            'sender_id': message.sender_id,
+            # Never leak a face-locked message through the preview
+            'content': None if message.is_face_locked else message.content,
+            'timestamp': message.timestamp.isoformat(),
+            'file_path': message.file_path,
+            'is_face_locked': message.is_face_locked
+        }
+    return {
+        'conversation_id': conversation.id,
+        'is_group': conversation.is_group,
+        'title': conversation.title,
+        'peer': None if conversation.is_group else {'id': peer_id, 'username': peer_username},
+        'last_message': last_message,
+        # None in shared group updates, which go to every member at once
+        'unread_count': membership.unread_count if membership else None,
+        'last_read_message_id': membership.last_read_message_id if membership else None
+    }
+
+
+def get_conversation_summaries(user_id):
+    """
+    List every conversation of a user, newest activity first.
+
+    Args:
+        user_id (int): The user whose conversations to list
+
+    Returns:
+        list: Summary dicts with peer, last message and unread count
+    """
+    return [_summary_row(*row) for row in summary_query(user_id).all()]
+
+
+def emit_conversation_updates(conversation_id):
+    """
+    Push the current summary of a conversation to its members after a send.
+
+    1:1 members each get their own summary in their user room. A group gets
+    a single shared summary in its room, whatever its size.
+
+    Args:
+        conversation_id (int): The conversation that changed
+    """
+    row = db.session.query(Conversation, Message)\
+        .outerjoin(Message, Message.id == Conversation.last_message_id)\
+        .filter(Conversation.id == conversation_id).first()
+    if row is None:
+        return
+    conversation, message = row
+    if conversation.is_group:
+        socketio.emit('conversation_update', _summary_row(None, conversation, message, None, None),
+                      room=conversation_room(conversation_id))
+        return
+
+    for user_id in {conversation.user_low_id, conversation.user_high_id}:
+        emit_summary_update(user_id, conversation_id)
+
+
+def emit_summary_update(user_id, conversation_id):
+    """
+    Push one member's summary of a conversation to their user room,
+    e.g. after they read it.
+    """
+    row = summary_query(user_id, conversation_id).first()
+    if row:
+        socketio.emit('conversation_update', _summary_row(*row), room=f'user_{user_id}')
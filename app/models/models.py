@@ -7,6 +7,8 @@ from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField, HiddenField
 from wtforms.validators import DataRequired, InputRequired, Length, Regexp, EqualTo
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import DDL, event
+from sqlalchemy.exc import IntegrityError
 
 class MessageForm(FlaskForm):
     message = StringField('Message', validators=[DataRequired()])
@@ -60,10 +62,100 @@ class User(db.Model, UserMixin):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+class Conversation(db.Model):
+    """
+    A conversation between users.
+
+    1:1 conversations are keyed by the ordered pair of participant ids;
+    group conversations leave the pair empty and list their members
+    through Membership rows.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_low_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    user_high_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    is_group = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)
+    title = db.Column(db.String(128), nullable=True)
+    created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Denormalized pointer to the newest message, maintained on send
+    last_message_id = db.Column(db.Integer, nullable=True)
+    last_message_at = db.Column(db.DateTime, nullable=True)
+
+    messages = db.relationship('Message', backref='conversation', lazy='dynamic')
+    memberships = db.relationship('Membership', backref='conversation', lazy='dynamic')
+
+    # The unique pair covers lookups by user_low_id; user_high_id needs its own index.
+    # Groups have a NULL pair, which the unique constraint does not compare.
+    __table_args__ = (
+        db.UniqueConstraint('user_low_id', 'user_high_id', name='uq_conversation_pair'),
+        db.Index('ix_conversation_user_high', 'user_high_id'),
+    )
+
+    def __repr__(self):
+        if self.is_group:
+            return f'<Conversation {self.id} group {self.title!r}>'
+        return f'<Conversation {self.id} between {self.user_low_id} and {self.user_high_id}>'
+
+    @staticmethod
+    def pair(user_a_id, user_b_id):
+        """Return the normalized (low, high) id pair for two users."""
+        user_a_id, user_b_id = int(user_a_id), int(user_b_id)
+        return min(user_a_id, user_b_id), max(user_a_id, user_b_id)
+
+    @classmethod
+    def ids_for_user(cls, user_id):
+        """Select the ids of every conversation a user takes part in."""
+        return db.select(Membership.conversation_id).where(Membership.user_id == user_id)
+
+    @classmethod
+    def find(cls, user_a_id, user_b_id):
+        """Find the 1:1 conversation between two users."""
+        low, high = cls.pair(user_a_id, user_b_id)
+        return cls.query.filter_by(user_low_id=low, user_high_id=high).first()
+
+    @classmethod
+    def get_or_create(cls, user_a_id, user_b_id):
+        """Fetch the conversation between two users, creating it on first use."""
+        conversation = cls.find(user_a_id, user_b_id)
+        if conversation:
+            return conversation
+
+        low, high = cls.pair(user_a_id, user_b_id)
+        conversation = cls(user_low_id=low, user_high_id=high)
+        db.session.add(conversation)
+        for user_id in {low, high}:
+            conversation.memberships.append(Membership(user_id=user_id))
+        try:
+            db.session.flush()
+        except IntegrityError:
+            # Another worker created the same pair between our lookup and insert
+            db.session.rollback()
+            conversation = cls.find(user_a_id, user_b_id)
+        return conversation
+
+class Membership(db.Model):
+    """A user's place in a conversation, with their read position."""
+    id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    unread_count = db.Column(db.Integer, default=0, nullable=False)
+    last_read_message_id = db.Column(db.Integer, nullable=True)
+    last_read_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('conversation_id', 'user_id', name='uq_membership_conversation_user'),
+        db.Index('ix_membership_user', 'user_id'),
+    )
+
+    def __repr__(self):
+        return f'<Membership User {self.user_id} in Conversation {self.conversation_id}>'
+
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     recipient_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), nullable=True)
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     is_face_locked = db.Column(db.Boolean, default=False)
@@ -71,6 +163,11 @@ class Message(db.Model):
     unlock_attempts = db.Column(db.Integer, default=0)
     is_replaced = db.Column(db.Boolean, default=False)
 
+    # Keyset pagination walks (timestamp, id) within a single conversation
+    __table_args__ = (
+        db.Index('ix_message_conversation_ts', 'conversation_id', 'timestamp', 'id'),
+    )
+
     def __repr__(self):
         return f'<Message {self.id} from {self.sender_id} to {self.recipient_id}>'
 
@@ -80,5 +177,115 @@ class FaceVerificationLog(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     success = db.Column(db.Boolean, default=False)
 
+    # Covers the per-user windowed counts in risk_features without reading the table
+    __table_args__ = (
+        db.Index('ix_face_verification_log_user_ts', 'user_id', 'timestamp', 'success'),
+    )
+
     def __repr__(self):
         return f'<FaceLog User {self.user_id} at {self.timestamp}>'
+
+class FaceVerificationDaily(db.Model):
+    """Per-user daily verification counts, kept after the raw logs are pruned."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    successes = db.Column(db.Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'day', name='uq_face_verification_daily_user_day'),
+    )
+
+    def __repr__(self):
+        return f'<FaceDaily User {self.user_id} on {self.day}: {self.successes}/{self.attempts}>'
+
+class KnownNetwork(db.Model):
+    """A /24 or /48 network a user has logged in from, for the location risk factor."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    network = db.Column(db.String(43), nullable=False)
+    country = db.Column(db.String(2), nullable=True)
+    first_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    logins = db.Column(db.Integer, default=1, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'network', name='uq_known_network_user_network'),
+    )
+
+    def __repr__(self):
+        return f'<KnownNetwork {self.network} of User {self.user_id}>'
+
+class KnownDevice(db.Model):
+    """A device fingerprint (see app/security/devices.py) a user has logged in with."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    fingerprint = db.Column(db.String(16), nullable=False)
+    device_class = db.Column(db.String(16), nullable=False)
+    browser = db.Column(db.String(32), nullable=True)
+    os = db.Column(db.String(32), nullable=True)
+    first_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    logins = db.Column(db.Integer, default=1, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'fingerprint', name='uq_known_device_user_fingerprint'),
+    )
+
+    def __repr__(self):
+        return f'<KnownDevice {self.browser} on {self.os} of User {self.user_id}>'
+
+class MessageArchive(db.Model):
+    """
+    A batch of old messages moved out of the message table by the retention job.
+
+    The messages are stored as zlib-compressed JSON in payload, or as a
+    gzipped JSON Lines file at file_path when archiving to files.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.Integer, nullable=True)
+    first_message_id = db.Column(db.Integer, nullable=False)
+    last_message_id = db.Column(db.Integer, nullable=False)
+    first_timestamp = db.Column(db.DateTime, nullable=True)
+    last_timestamp = db.Column(db.DateTime, nullable=True)
+    message_count = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.LargeBinary, nullable=True)
+    file_path = db.Column(db.String(256), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_message_archive_conversation', 'conversation_id', 'last_message_id'),
+    )
+
+    def __repr__(self):
+        return f'<MessageArchive {self.id}: {self.message_count} messages of Conversation {self.conversation_id}>'
+
+class SecurityEvent(db.Model):
+    """An entry in the append-only security audit log (see app/security/audit.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    event_type = db.Column(db.String(32), nullable=False)
+    user_id = db.Column(db.Integer, nullable=True)  # No foreign key: events outlive their users
+    username = db.Column(db.String(64), nullable=True)
+    ip = db.Column(db.String(45), nullable=True)
+    device = db.Column(db.String(16), nullable=True)
+    security_level = db.Column(db.Integer, nullable=True)
+    risk_score = db.Column(db.Float, nullable=True)
+    details = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_security_event_user_ts', 'user_id', 'timestamp'),
+        db.Index('ix_security_event_ts', 'timestamp'),
+    )
+
+    def __repr__(self):
+        return f'<SecurityEvent {self.id} {self.event_type} of User {self.user_id}>'
+
+# The audit log is append-only; on SQLite the database enforces it as well
+event.listen(SecurityEvent.__table__, 'after_create', DDL(
+    "CREATE TRIGGER security_event_no_update BEFORE UPDATE ON security_event "
+    "BEGIN SELECT RAISE(ABORT, 'security_event is append-only'); END").execute_if(dialect='sqlite'))
+event.listen(SecurityEvent.__table__, 'after_create', DDL(
+    "CREATE TRIGGER security_event_no_delete BEFORE DELETE ON security_event "
+    "BEGIN SELECT RAISE(ABORT, 'security_event is append-only'); END").execute_if(dialect='sqlite'))
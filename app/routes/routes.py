@@ -3,9 +3,23 @@ from flask_login import login_user, login_required, logout_user, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
 from werkzeug.utils import secure_filename
 from app import db, socketio
-from app.models.models import User, Message, MessageForm
+from app.models.models import User, Message, Conversation, FaceVerificationLog, MessageForm
 from app.auth.forms import LoginForm, RegistrationForm
 from app.security.security_ai import SECURITY_LEVEL_LOW, SECURITY_LEVEL_MEDIUM, SECURITY_LEVEL_HIGH
+from app.messaging.history import get_conversation_page, get_messages_since, InvalidCursor
+from app.messaging.serializers import serialize_messages
+from app.messaging.delivery import delivery_queue
+from app.messaging.events import message_event_for, emit_message_event
+from app.messaging.summary import (
+    record_message, mark_read, get_conversation_summaries, emit_conversation_updates, emit_summary_update
+)
+from app.messaging.search import search_messages
+from app.utils.database import read_session, uses_replica
+from app.auth.identity import identity_cache
+from app.security.logins import record_login, record_login_failure
+from app.messaging.groups import (
+    GroupError, create_group, add_members, remove_member, find_conversation_for, sync_member_rooms, parse_id
+)
 
 import os
 import base64
@@ -14,6 +28,9 @@ import cv2
 import numpy as np
 from datetime import datetime
 import face_recognition
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Create a Blueprint
 bp = Blueprint('main', __name__)
@@ -41,7 +58,8 @@ def profile():
         security_level_name = "High"
     
     # Get face verification logs
-    face_logs = current_user.face_logs.order_by(desc("timestamp")).limit(5).all()
+    face_logs = FaceVerificationLog.query.filter_by(user_id=current_user.id)\
+        .order_by(desc("timestamp")).limit(5).all()
     
     return render_template('profile.html', 
                           current_user=current_user,
@@ -65,11 +83,13 @@ def login():
         user = User.query.filter_by(username=username).first()
 
         if not user:
+            record_login_failure(username, 'unknown_user')
             flash('Invalid username or password', 'error')
             return redirect(url_for('main.login', next=next_page))
 
         # Verify password
         if not check_password_hash(user.password, password):
+            record_login_failure(username, 'bad_password', user.id)
             flash('Invalid username or password', 'error')
             return redirect(url_for('main.login', next=next_page))
 
@@ -90,6 +110,7 @@ def login():
         
         # Otherwise log in directly
         login_user(user)
+        record_login(user.id)
         return redirect(next_page or url_for('main.chat'))
 
     return render_template('login.html', form=form, next=next_page)
@@ -229,14 +250,16 @@ def face_verification():
             if results[0]:
                 # Complete login process
                 login_user(user)
+                record_login(user.id)
                 session.pop('temp_user_id', None)
                 next_page = session.pop('next_page', None)
                 return redirect(next_page or url_for('main.chat'))
             else:
+                record_login_failure(user.username, 'face_verification', user.id)
                 flash(f'Face verification failed ({match_percentage:.1f}% match, 80% required)')
                 return redirect(url_for('main.face_verification'))
         except Exception as e:
-            print(f"Face verification error: {str(e)}")
+            logger.error('Face verification error: %s', e)
             flash('Error processing face verification')
             return redirect(url_for('main.face_verification'))
 
@@ -296,10 +319,12 @@ def verify_face():
 
         if result:
             login_user(user)
+            record_login(user.id)
             session.pop('temp_user_id', None)
             next_page = session.pop('next_page', None)
             return jsonify({'success': True, 'verified': True, 'redirect_url': next_page or url_for('main.chat')})
         else:
+            record_login_failure(user.username, 'face_verification', user.id)
             return jsonify({
                 'success': True,
                 'verified': False,
@@ -316,20 +341,15 @@ def verify_face():
 @login_required
 def chat():
     form = MessageForm()
-    users = User.query.filter(User.id != current_user.id).all()
-    messages = Message.query.filter(
-        ((Message.sender_id == current_user.id) | (Message.recipient_id == current_user.id))
-    ).order_by(Message.timestamp.desc()).limit(50).all()
-    messages.reverse()
     recipient_id = request.args.get('recipient_id', type=int)
     
-    return render_template('chat.html', users=users, messages=messages, recipient_id=recipient_id, form=form)
+    # The sidebar is filled in by chat.js from /conversations
+    return render_template('chat.html', recipient_id=recipient_id, form=form)
 
 # Send message API
 @bp.route('/send_message', methods=['POST'])
 @login_required
 def send_message():
-    print("DEBUG: current_user.id =", current_user.id, "current_user.username =", current_user.username)
     recipient_id = request.form.get('recipient_id')
     if not recipient_id:
         return jsonify({'success': False, 'message': 'Recipient ID is required'}), 400
@@ -347,9 +367,11 @@ def send_message():
     if not content.strip() and not file:
         return jsonify({'success': False, 'message': 'Message content or file is required'}), 400
 
+    conversation = Conversation.get_or_create(current_user.id, recipient.id)
     message = Message(
         sender_id=current_user.id,
-        recipient_id=recipient_id,
+        recipient_id=recipient.id,
+        conversation_id=conversation.id,
         content=content,
         is_face_locked=face_locked,
         timestamp=datetime.utcnow()
@@ -369,52 +391,173 @@ def send_message():
         message.file_path = file_path
 
     db.session.add(message)
+    db.session.flush()
+    record_message(message)
     db.session.commit()
 
     # Emit new message event to both sender and recipient
-    for uid in [current_user.id, int(recipient_id)]:
-        socketio.emit('new_message', {
-            'message': message.content,
-            'sender_id': current_user.id,
-            'sender': {'username': current_user.username},
-            'recipient_id': int(recipient_id),
-            'recipient': {'username': recipient.username},
-            'timestamp': message.timestamp.isoformat(),
-            'file_path': message.file_path,
-            'is_face_locked': message.is_face_locked
-        }, room=f'user_{uid}')
+    payload = message_event_for(message, current_user.username,
+                                file_name=os.path.basename(message.file_path) if message.file_path else None)
+    emit_message_event('new_message', payload, f'user_{current_user.id}')
+    if recipient.id != current_user.id:
+        # The recipient gets at-least-once delivery until their client acks
+        delivery_queue.deliver(recipient.id, 'new_message', payload)
+    emit_conversation_updates(conversation.id)
 
     return jsonify({'success': True, 'message_id': message.id})
 
+# Conversation summaries API
+@bp.route('/conversations')
+@login_required
+def conversations():
+    return jsonify({'success': True, 'conversations': get_conversation_summaries(current_user.id)})
+
+# Mark conversation read API
+@bp.route('/mark_read', methods=['POST'])
+@login_required
+def mark_conversation_read():
+    data = request.get_json(silent=True) or {}
+    recipient_id = data.get('recipient_id')
+    conversation_id = data.get('conversation_id')
+    if not recipient_id and not conversation_id:
+        return jsonify({'success': False, 'message': 'Recipient ID or conversation ID is required'}), 400
+    if (recipient_id and parse_id(recipient_id) is None) or (conversation_id and parse_id(conversation_id) is None):
+        return jsonify({'success': False, 'message': 'Invalid recipient ID or conversation ID'}), 400
+
+    conversation = find_conversation_for(current_user.id, recipient_id, conversation_id)
+    if not conversation:
+        return jsonify({'success': False, 'message': 'Conversation not found'}), 404
+
+    membership = mark_read(current_user.id, conversation.id, data.get('message_id'))
+    if not membership:
+        return jsonify({'success': False, 'message': 'Conversation not found'}), 404
+
+    emit_summary_update(current_user.id, conversation.id)
+    return jsonify({'success': True, 'unread_count': membership.unread_count})
+
+# Group conversation APIs
+@bp.route('/groups', methods=['POST'])
+@login_required
+def create_group_conversation():
+    data = request.get_json(silent=True) or {}
+    try:
+        group = create_group(current_user.id, data.get('title'), data.get('member_ids') or [])
+    except (GroupError, TypeError, ValueError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    db.session.commit()
+
+    member_ids = [membership.user_id for membership in group.memberships]
+    sync_member_rooms(group.id, added=member_ids)
+    emit_conversation_updates(group.id)
+    return jsonify({'success': True, 'conversation_id': group.id, 'member_ids': member_ids}), 201
+
+@bp.route('/groups/<int:conversation_id>/members', methods=['POST'])
+@login_required
+def add_group_members(conversation_id):
+    group = find_conversation_for(current_user.id, conversation_id=conversation_id)
+    if not group:
+        return jsonify({'success': False, 'message': 'Conversation not found'}), 404
+
+    data = request.get_json(silent=True) or {}
+    try:
+        added = add_members(group, data.get('user_ids') or [])
+    except (GroupError, TypeError, ValueError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    db.session.commit()
+
+    sync_member_rooms(group.id, added=added)
+    emit_conversation_updates(group.id)
+    return jsonify({'success': True, 'added': sorted(added)})
+
+@bp.route('/groups/<int:conversation_id>/leave', methods=['POST'])
+@login_required
+def leave_group(conversation_id):
+    group = find_conversation_for(current_user.id, conversation_id=conversation_id)
+    if not group:
+        return jsonify({'success': False, 'message': 'Conversation not found'}), 404
+
+    remove_member(group, current_user.id)
+    db.session.commit()
+
+    sync_member_rooms(group.id, removed=[current_user.id])
+    socketio.emit('conversation_removed', {'conversation_id': group.id}, room=f'user_{current_user.id}')
+    return jsonify({'success': True})
+
 # Get messages API
 @bp.route('/get_messages')
 @login_required
 def get_messages():
     recipient_id = request.args.get('recipient_id', type=int)
-    if not recipient_id:
-        return jsonify({'success': False, 'message': 'Recipient ID is required'}), 400
+    conversation_id = request.args.get('conversation_id', type=int)
+    if not recipient_id and not conversation_id:
+        return jsonify({'success': False, 'message': 'Recipient ID or conversation ID is required'}), 400
+
+    conversation = find_conversation_for(current_user.id, recipient_id, conversation_id)
+    if not conversation:
+        if conversation_id:
+            return jsonify({'success': False, 'message': 'Conversation not found'}), 404
+        return jsonify({'success': True, 'messages': [], 'has_more': False,
+                        'before_cursor': None, 'after_cursor': None})
+
+    since_id = request.args.get('since_id', type=int)
+    limit = request.args.get('limit', type=int)
+    try:
+        # History is read from the read pool (or replica); access was checked above on the primary
+        with read_session() as reader:
+            if since_id is not None:
+                page = get_messages_since(conversation.id, since_id, limit=limit, session=reader)
+                if page['reset'] and uses_replica():
+                    # A lagging replica may not have the client's newest message yet
+                    page = get_messages_since(conversation.id, since_id, limit=limit)
+            else:
+                page = get_conversation_page(
+                    conversation.id,
+                    before=request.args.get('before'),
+                    after=request.args.get('after'),
+                    limit=limit,
+                    session=reader
+                )
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    return jsonify({
+        'success': True,
+        'conversation_id': conversation.id,
+        'messages': serialize_messages(page['messages']),
+        'has_more': page['has_more'],
+        'reset': page.get('reset', False),
+        'before_cursor': page['before_cursor'],
+        'after_cursor': page['after_cursor']
+    })
 
-    messages = Message.query.filter(
-        ((Message.sender_id == current_user.id) & (Message.recipient_id == recipient_id)) |
-        ((Message.sender_id == recipient_id) & (Message.recipient_id == current_user.id))
-    ).order_by(Message.timestamp.desc()).limit(50).all()
+# Message search API
+@bp.route('/search')
+@login_required
+def search():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'success': False, 'message': 'Search query is required'}), 400
 
+    conversation_id = None
+    recipient_id = request.args.get('recipient_id', type=int)
+    group_id = request.args.get('conversation_id', type=int)
+    if recipient_id or group_id:
+        conversation = find_conversation_for(current_user.id, recipient_id, group_id)
+        if not conversation:
+            return jsonify({'success': True, 'messages': [], 'has_more': False, 'next_before_id': None})
+        conversation_id = conversation.id
+
+    results = search_messages(
+        current_user.id, query,
+        conversation_id=conversation_id,
+        before_id=request.args.get('before_id', type=int),
+        limit=request.args.get('limit', type=int)
+    )
     return jsonify({
         'success': True,
-        'messages': [
-            {
-                'id': msg.id,
-                'content': msg.content,
-                'sender_id': msg.sender_id,
-                'sender': {'username': msg.sender.username},
-                'recipient_id': msg.recipient_id,
-                'recipient': {'username': msg.recipient.username},
-                'timestamp': msg.timestamp.isoformat(),
-                'file_path': msg.file_path,
-                'is_face_locked': msg.is_face_locked
-            }
-            for msg in reversed(messages)
-        ]
+        'messages': serialize_messages(results['messages']),
+        'has_more': results['has_more'],
+        'next_before_id': results['next_before_id']
     })
 
 # File upload route
@@ -428,7 +571,9 @@ def uploaded_file(filename):
 def logout():
     # Emit logout event to user's room
     socketio.emit('user_logout', room=f'user_{current_user.id}')
+    user_id = current_user.id
     logout_user()
+    identity_cache.invalidate(user_id)
     return redirect(url_for('main.login'))
 
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif'}
@@ -439,53 +584,50 @@ def allowed_file(filename):
 @bp.route('/upload_file', methods=['POST'])
 @login_required
 def upload_file():
-    print("[DEBUG] File upload endpoint hit")
-
     if 'file' not in request.files:
-        print("[ERROR] No file part in request")
         return jsonify({'success': False, 'message': 'No file part'}), 400
 
     file = request.files['file']
     recipient_id = request.form.get('recipient_id')
 
-    print("[DEBUG] Uploaded file:", file.filename)
-    print("[DEBUG] Recipient ID:", recipient_id)
-
-    # Validate recipient ID
-    if not recipient_id:
-        print("[ERROR] Recipient ID is missing")
-        return jsonify({'success': False, 'message': 'Recipient ID is required'}), 400
-
-    # Check if recipient exists
-    recipient = User.query.get(recipient_id)
-    if not recipient:
-        print("[ERROR] Recipient not found:", recipient_id)
-        return jsonify({'success': False, 'message': 'Recipient not found'}), 404
+    logger.debug('Upload of %s from user_%s', file.filename, current_user.id)
+
+    conversation_id = request.form.get('conversation_id')
+    if conversation_id:
+        # Group upload; the follow-up 'new_file' event goes to the group room
+        if parse_id(conversation_id) is None:
+            return jsonify({'success': False, 'message': 'Invalid conversation ID'}), 400
+        if not find_conversation_for(current_user.id, conversation_id=conversation_id):
+            return jsonify({'success': False, 'message': 'Conversation not found'}), 404
+    else:
+        # Validate recipient ID
+        if not recipient_id:
+            return jsonify({'success': False, 'message': 'Recipient ID is required'}), 400
+        if parse_id(recipient_id) is None:
+            return jsonify({'success': False, 'message': 'Invalid recipient ID'}), 400
+
+        # Check if recipient exists
+        recipient = User.query.get(recipient_id)
+        if not recipient:
+            return jsonify({'success': False, 'message': 'Recipient not found'}), 404
 
     if not allowed_file(file.filename):
-        print("[ERROR] File type not allowed:", file.filename)
+        logger.warning('Rejected upload of %s from user_%s: file type not allowed', file.filename, current_user.id,
+                       extra={'event': 'upload_rejected', 'user_id': current_user.id})
         return jsonify({'success': False, 'message': 'File type not allowed'}), 400
 
     filename = secure_filename(file.filename)
     uploads_dir = os.path.join(current_app.static_folder, 'uploads')
     if not os.path.exists(uploads_dir):
-        print("[DEBUG] Creating uploads directory")
         os.makedirs(uploads_dir)
 
     file_path = os.path.join(uploads_dir, filename)
     file.save(file_path)
-    print("[DEBUG] File saved to:", file_path)
+    logger.info('File from user_%s saved to %s', current_user.id, file_path,
+                extra={'event': 'file_uploaded', 'user_id': current_user.id})
 
     file_url = url_for('static', filename=f'uploads/{filename}', _external=True)
 
-    payload = {
-        'file_url': file_url,
-        'file_name': filename,
-        'sender_id': current_user.id,
-        'recipient_id': recipient_id
-    }
-    print("[DEBUG] Emitting new_file event with payload:", payload)
-    socketio.emit('new_file', payload, room=f"user_{current_user.id}")
-    socketio.emit('new_file', payload, room=f"user_{recipient_id}")
-
+    # The client follows up with a 'new_file' socket event, which saves the
+    # message and emits it in the message event schema
     return jsonify({'success': True, 'file_url': file_url, 'file_name': filename})
\ No newline at end of file
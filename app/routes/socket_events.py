@@ -3,41 +3,84 @@ from flask_socketio import emit, join_room, leave_room
 from flask_login import current_user
 from flask import request
 from app import socketio, db
-from app.models.models import Message
+from app.models.models import Message, Conversation, User
+from app.messaging.summary import (
+    record_message, mark_read, emit_conversation_updates, emit_summary_update, get_conversation_summaries
+)
+from app.messaging.history import get_messages_since
+from app.messaging.serializers import resolve_usernames, serialize_message
+from app.messaging.delivery import delivery_queue
+from app.messaging.events import (
+    message_event, message_event_for, emit_message_event,
+    negotiate_encoding, encoding_info, encoding_room
+)
+from app.messaging.ephemeral import ephemeral_channel, CLIENT_KINDS
+from app.messaging.groups import (
+    membership_cache, conversation_room, group_ids_for_user, join_conversation_rooms, find_conversation_for, parse_id
+)
+from app.auth.identity import identity_cache
+from app.security.metrics_push import push_security_metrics
+from app.utils.tracing import tracer
 from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Track online users: {user_id: {'username': ..., 'sid': ...}}
 online_users = {}
 
 @socketio.on('connect')
+@tracer.event('connect')
 def handle_connect(auth=None):
     if current_user.is_authenticated:
         online_users[current_user.id] = {'username': current_user.username, 'sid': request.sid}
         join_room(f"user_{current_user.id}")
-        print(f"{current_user.username} connected and joined room user_{current_user.id}")
-        print("Current online users:", online_users)
+        # Message events go out in the encoding this socket asked for
+        encoding = negotiate_encoding(auth)
+        join_room(encoding_room(f"user_{current_user.id}", encoding))
+        emit('encoding', encoding_info(encoding))
+        # Group messages are emitted once to each group's room
+        join_conversation_rooms(join_room, group_ids_for_user(current_user.id), encoding)
+        # One metrics snapshot per socket; later changes are pushed to user_<id>
+        push_security_metrics(current_user.id, current_user.username, to=request.sid)
+        flushed = delivery_queue.connected(current_user.id)
+        logger.info('%s connected and joined room user_%s', current_user.username, current_user.id,
+                    extra={'event': 'socket_connect', 'user_id': current_user.id, 'flushed': flushed,
+                           'online': len(online_users)})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Online users: %s', sorted(online_users))
 
         user_list = [{'id': uid, 'username': u['username']} for uid, u in online_users.items()]
-        print("Emitting user_list event with data:", user_list)
         emit('user_list', user_list, broadcast=True)
 
 @socketio.on('disconnect')
+@tracer.event('disconnect')
 def handle_disconnect():
     if current_user.is_authenticated:
         online_users.pop(current_user.id, None)
+        delivery_queue.disconnected(current_user.id)
         leave_room(f"user_{current_user.id}")
-        print(f"{current_user.username} disconnected")
-        print("Current online users after disconnect:", online_users)
+        identity_cache.release_connection(request.sid)
+        logger.info('%s disconnected', current_user.username,
+                    extra={'event': 'socket_disconnect', 'user_id': current_user.id, 'online': len(online_users)})
 
         user_list = [{'id': uid, 'username': u['username']} for uid, u in online_users.items()]
-        print("Emitting user_list event with data:", user_list)
         emit('user_list', user_list, broadcast=True)
 
+def _direct_recipient(recipient_id):
+    """The id of an existing user to message directly, or None for a bad or unknown id."""
+    recipient_id = parse_id(recipient_id)
+    if recipient_id is None or db.session.get(User, recipient_id) is None:
+        logger.warning('Unknown recipient from user_%s', current_user.id,
+                       extra={'event': 'invalid_message', 'user_id': current_user.id})
+        return None
+    return recipient_id
+
 @socketio.on('send_message')
+@tracer.event('send_message')
 def handle_send_message(data):
-    print(f"[DEBUG] current_user.id: {current_user.id}, current_user.username: {current_user.username}")
     if not current_user.is_authenticated:
-        print("Unauthorized message attempt")
+        logger.warning('Unauthorized message attempt', extra={'event': 'unauthorized_message'})
         return
 
     recipient_id = data.get('recipient_id')
@@ -45,66 +88,249 @@ def handle_send_message(data):
     # --- MODIFICATION: Get the face_locked status from client data ---
     is_face_locked = data.get('face_locked', False) # Default to False if not provided
 
+    if data.get('conversation_id') and content:
+        return _send_group_message('new_message', data.get('conversation_id'), content, is_face_locked)
+
     if not recipient_id or not content:
-        print("Invalid message data")
+        logger.warning('Invalid message data from user_%s', current_user.id,
+                       extra={'event': 'invalid_message', 'user_id': current_user.id})
         # Consider emitting a status back to the sender only
         # emit('message_error', {'msg': 'Invalid message data'}, room=request.sid)
         return
+
+    recipient_id = _direct_recipient(recipient_id)
+    if recipient_id is None:
+        return {'success': False, 'message': 'Recipient not found'}
     
     # Save message to database
     try:
+        conversation = Conversation.get_or_create(current_user.id, recipient_id)
         message = Message(
             sender_id=current_user.id,
             recipient_id=recipient_id,
+            conversation_id=conversation.id,
             content=content,
             is_face_locked=is_face_locked,
             timestamp=datetime.utcnow()
         )
         db.session.add(message)
+        db.session.flush()
+        record_message(message)
         db.session.commit()
-        print(f"[DEBUG] Message saved to database with ID: {message.id}, face locked: {is_face_locked}")
         
         # Include the message ID in the payload so it can be referenced for unlocking
-        payload = {
-            'id': message.id,
-            'content': content,
-            'sender_id': current_user.id,
-            'sender_username': current_user.username,
-            'recipient_id': recipient_id,
-            'is_face_locked': is_face_locked
-        }
+        payload = message_event_for(message, current_user.username)
     except Exception as e:
-        print(f"[ERROR] Failed to save message to database: {e}")
+        db.session.rollback()
         # Still try to emit the message even if DB save fails
         import uuid
         temp_id = str(uuid.uuid4())  # Generate a unique temp ID
-        print(f"[DEBUG] Using temp message ID: {temp_id} due to DB save failure")
-        payload = {
-            'id': temp_id,  # Include a temporary ID so frontend can reference it
-            'content': content,
-            'sender_id': current_user.id,
-            'sender_username': current_user.username,
-            'recipient_id': recipient_id,
-            'is_face_locked': is_face_locked,
-            'is_temp_id': True  # Flag to indicate this is not a real database ID
-        }
+        logger.error('Failed to save message to database, sending with temp ID %s: %s', temp_id, e,
+                     extra={'event': 'message_save_failed', 'user_id': current_user.id})
+        payload = message_event(
+            id=temp_id,  # Include a temporary ID so frontend can reference it
+            sender_id=current_user.id,
+            sender_username=current_user.username,
+            recipient_id=recipient_id,
+            content=content,
+            timestamp=datetime.utcnow(),
+            is_face_locked=is_face_locked,
+            is_temp_id=True  # Flag to indicate this is not a real database ID
+        )
 
     # Emit to sender's room (so they see their own message, potentially styled as locked or normal)
-    emit('new_message', payload, room=f"user_{current_user.id}")
+    emit_message_event('new_message', payload, f"user_{current_user.id}")
     # Emit to recipient's room
     if recipient_id != current_user.id: # Avoid double sending if sending to self (though UI should prevent)
-        emit('new_message', payload, room=f"user_{recipient_id}")
+        if payload['is_temp_id']:
+            emit_message_event('new_message', payload, f"user_{recipient_id}")
+        else:
+            delivery_queue.deliver(recipient_id, 'new_message', payload)
+    if not payload['is_temp_id']:
+        emit_conversation_updates(message.conversation_id)
     
-    print(f"Message sent from user_{current_user.id} to user_{recipient_id}. Face Locked: {is_face_locked}")
+    logger.info('Message sent from user_%s to user_%s', current_user.id, recipient_id,
+                extra={'event': 'message_sent', 'sender_id': current_user.id, 'recipient_id': recipient_id,
+                       'message_id': payload['id'], 'face_locked': bool(is_face_locked)})
 
     # Note: Emitting user_list on every message might be excessive if it's large.
     # Consider if this is necessary or can be optimized.
     emit('user_list', [{'id': uid, 'username': u['username']} for uid, u in online_users.items()], broadcast=True)
 
+def _send_group_message(event, conversation_id, content, is_face_locked, file_url=None, file_name=None):
+    """
+    Save a group message and emit it once to the group's room.
+
+    Returns:
+        dict: Result for the sender, delivered as the event's ack
+    """
+    try:
+        conversation_id = int(conversation_id)
+    except (TypeError, ValueError):
+        return {'success': False, 'message': 'Invalid conversation'}
+
+    if current_user.id not in membership_cache.members(conversation_id):
+        logger.warning('Rejected group message from user_%s to non-member conversation %s',
+                       current_user.id, conversation_id,
+                       extra={'event': 'group_message_rejected', 'user_id': current_user.id,
+                              'conversation_id': conversation_id})
+        return {'success': False, 'message': 'You are not a member of this conversation'}
+    if is_face_locked:
+        # Unlock attempts are counted per message, so one member could delete it for everyone
+        return {'success': False, 'message': 'Face-locked messages are only supported in direct conversations'}
+
+    message = Message(
+        sender_id=current_user.id,
+        recipient_id=None,
+        conversation_id=conversation_id,
+        content=content,
+        file_path=file_url,
+        timestamp=datetime.utcnow()
+    )
+    db.session.add(message)
+    db.session.flush()
+    record_message(message)
+    db.session.commit()
+    logger.info('Group message sent from user_%s to conversation %s', current_user.id, conversation_id,
+                extra={'event': 'message_sent', 'sender_id': current_user.id, 'conversation_id': conversation_id,
+                       'message_id': message.id})
+
+    # Missed room events are recovered by the client's 'sync' on reconnect
+    emit_message_event(event, message_event_for(message, current_user.username, file_name=file_name),
+                       conversation_room(conversation_id))
+    emit_conversation_updates(conversation_id)
+    return {'success': True, 'id': message.id}
+
+@socketio.on('ack')
+@tracer.event('ack')
+def handle_ack(data):
+    """Client confirms receipt of message events: {'ids': [message_id, ...]}"""
+    if not current_user.is_authenticated:
+        return
+    ids = (data or {}).get('ids') or []
+    delivery_queue.ack(current_user.id, ids)
+
+@socketio.on('mark_read')
+@tracer.event('mark_read')
+def handle_mark_read(data):
+    """Mark a conversation read; bad ids are rejected in the event's ack."""
+    if not current_user.is_authenticated or not isinstance(data, dict):
+        return
+    recipient_id, conversation_id = data.get('recipient_id'), data.get('conversation_id')
+    if (recipient_id and parse_id(recipient_id) is None) or (conversation_id and parse_id(conversation_id) is None):
+        return {'success': False, 'message': 'Invalid recipient ID or conversation ID'}
+
+    conversation = find_conversation_for(current_user.id, recipient_id, conversation_id)
+    membership = conversation and mark_read(current_user.id, conversation.id, data.get('message_id'))
+    if membership:
+        emit_summary_update(current_user.id, conversation.id)
+        # Let the other side see how far this user has read
+        if conversation.is_group:
+            target = (conversation_room(conversation.id), conversation.id)
+        else:
+            peer_id = conversation.user_high_id if conversation.user_low_id == current_user.id else conversation.user_low_id
+            target = (f"user_{peer_id}", None)
+        _publish_ephemeral('read', target, membership.last_read_message_id)
+
+def _ephemeral_target(data):
+    """
+    Room and group id for an ephemeral event, without touching the database
+    on the hot path: 1:1 targets go to the peer's room, groups are checked
+    against the membership cache.
+    """
+    conversation_id = data.get('conversation_id')
+    try:
+        if conversation_id:
+            conversation_id = int(conversation_id)
+            if current_user.id not in membership_cache.members(conversation_id):
+                return None
+            return conversation_room(conversation_id), conversation_id
+        recipient_id = int(data.get('recipient_id'))
+    except (TypeError, ValueError):
+        return None
+    if recipient_id == current_user.id:
+        return None
+    return f"user_{recipient_id}", None
+
+def _publish_ephemeral(kind, target, state):
+    room, conversation_id = target
+    payload = {
+        'kind': kind,
+        'sender_id': current_user.id,
+        'sender_username': current_user.username,
+        'conversation_id': conversation_id,
+        'state': state
+    }
+    ephemeral_channel.publish((current_user.id, room, kind), room, payload)
+
+@socketio.on('ephemeral')
+@tracer.event('ephemeral')
+def handle_ephemeral(data):
+    """
+    Relay a typing indicator: {'kind': 'typing', 'state': bool} plus either
+    'recipient_id' or a group 'conversation_id'. Never persisted; bursts
+    are coalesced per user and conversation by the ephemeral channel.
+    """
+    if not current_user.is_authenticated or not isinstance(data, dict):
+        return
+    if data.get('kind') not in CLIENT_KINDS:
+        return
+    target = _ephemeral_target(data)
+    if target:
+        _publish_ephemeral(data['kind'], target, bool(data.get('state')))
+
+@socketio.on('sync')
+@tracer.event('sync')
+def handle_sync(data):
+    """
+    Delta sync for the client's local message cache.
+
+    The client sends {'cursors': {conversation_id: highest_cached_id}}; the
+    reply (delivered as the event's ack) carries only messages newer than
+    each cursor. Conversations without a cursor get their latest page.
+    """
+    if not current_user.is_authenticated:
+        return {'success': False, 'message': 'Authentication required'}
+
+    cursors = (data or {}).get('cursors') or {}
+    results = []
+    for summary in get_conversation_summaries(current_user.id):
+        last_message = summary['last_message']
+        if not last_message:
+            continue
+        try:
+            since_id = int(cursors.get(str(summary['conversation_id'])) or 0)
+        except (TypeError, ValueError):
+            since_id = 0
+        if since_id >= last_message['id']:
+            continue
+
+        page = get_messages_since(summary['conversation_id'], since_id)
+        results.append((summary, page))
+
+    usernames = resolve_usernames(
+        user_id for _, page in results for message in page['messages']
+        for user_id in (message.sender_id, message.recipient_id)
+    )
+    return {
+        'success': True,
+        'conversations': [
+            {
+                'conversation_id': summary['conversation_id'],
+                'peer': summary['peer'],
+                'messages': [serialize_message(message, usernames) for message in page['messages']],
+                'has_more': page['has_more'],
+                'reset': page['reset']
+            }
+            for summary, page in results
+        ]
+    }
+
 @socketio.on('new_file')
+@tracer.event('new_file')
 def handle_new_file(data):
     if not current_user.is_authenticated: # Added authentication check
-        print("Unauthorized file attempt")
+        logger.warning('Unauthorized file attempt', extra={'event': 'unauthorized_message'})
         return
 
     recipient_id = data.get('recipient_id')
@@ -114,55 +340,68 @@ def handle_new_file(data):
     is_face_locked = data.get('face_locked', False) # Default to False if not provided
 
 
+    if data.get('conversation_id') and file_url and file_name:
+        return _send_group_message('new_file', data.get('conversation_id'), f"Shared file: {file_name}",
+                                   is_face_locked, file_url=file_url, file_name=file_name)
+
     if not recipient_id or not file_url or not file_name:
-        print("[ERROR] Invalid file data:", data)
+        logger.warning('Invalid file data from user_%s', current_user.id,
+                       extra={'event': 'invalid_message', 'user_id': current_user.id})
         return
 
+    recipient_id = _direct_recipient(recipient_id)
+    if recipient_id is None:
+        return {'success': False, 'message': 'Recipient not found'}
+
     # For files, we need to create a database record to track face_locked status
     try:
         # Create a message with a file path
+        conversation = Conversation.get_or_create(current_user.id, recipient_id)
         message = Message(
             sender_id=current_user.id,
             recipient_id=recipient_id,
+            conversation_id=conversation.id,
             content=f"Shared file: {file_name}",
             file_path=file_url,
             is_face_locked=is_face_locked,
             timestamp=datetime.utcnow()
         )
         db.session.add(message)
+        db.session.flush()
+        record_message(message)
         db.session.commit()
-        print(f"[DEBUG] File message saved to database with ID: {message.id}, face locked: {is_face_locked}")
         
-        payload = {
-            'id': message.id,
-            'file_url': file_url,
-            'file_name': file_name,
-            'sender_id': current_user.id,
-            'sender_username': current_user.username,
-            'recipient_id': recipient_id,
-            'is_face_locked': is_face_locked
-        }
+        payload = message_event_for(message, current_user.username, file_name=file_name)
     except Exception as e:
-        print(f"[ERROR] Failed to save file message to database: {e}")
+        db.session.rollback()
         import uuid
         temp_id = str(uuid.uuid4())
-        print(f"[DEBUG] Using temp file message ID: {temp_id} due to DB save failure")
+        logger.error('Failed to save file message to database, sending with temp ID %s: %s', temp_id, e,
+                     extra={'event': 'message_save_failed', 'user_id': current_user.id})
         
-        payload = {
-            'id': temp_id,
-            'file_url': file_url,
-            'file_name': file_name,
-            'sender_id': current_user.id,
-            'sender_username': current_user.username,
-            'recipient_id': recipient_id,
-            'is_face_locked': is_face_locked,
-            'is_temp_id': True
-        }
+        payload = message_event(
+            id=temp_id,
+            sender_id=current_user.id,
+            sender_username=current_user.username,
+            recipient_id=recipient_id,
+            content=f"Shared file: {file_name}",
+            file_url=file_url,
+            file_name=file_name,
+            timestamp=datetime.utcnow(),
+            is_face_locked=is_face_locked,
+            is_temp_id=True
+        )
     
-    print(f"[DEBUG] Emitting new_file event with payload. Face Locked: {is_face_locked}", payload)
-    print(f"[DEBUG] Emitting new_file event with payload. Face Locked: {is_face_locked}", payload)
+    logger.info('File sent from user_%s to user_%s', current_user.id, recipient_id,
+                extra={'event': 'message_sent', 'sender_id': current_user.id, 'recipient_id': recipient_id,
+                       'message_id': payload['id'], 'face_locked': bool(is_face_locked)})
 
     # Emit the event to the sender and recipient
-    socketio.emit('new_file', payload, room=f"user_{current_user.id}")
+    emit_message_event('new_file', payload, f"user_{current_user.id}")
     if recipient_id != current_user.id:
-        socketio.emit('new_file', payload, room=f"user_{recipient_id}")
+        if payload['is_temp_id']:
+            emit_message_event('new_file', payload, f"user_{recipient_id}")
+        else:
+            delivery_queue.deliver(recipient_id, 'new_file', payload)
+    if not payload['is_temp_id']:
+        emit_conversation_updates(message.conversation_id)
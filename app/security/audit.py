@@ -0,0 +1,248 @@
+"""
+Security Audit Module for SecureChat
+This module keeps an append-only log of security events: risk assessments,
+successful and failed logins, and logouts.
+
+record() only appends the event to an in-memory queue, so the login path
+never waits on the database; a background task writes the queue every
+AUDIT_FLUSH_SECONDS as multi-row inserts of up to AUDIT_BATCH_SIZE rows on
+its own connection. If writes fall behind, the queue is capped at
+AUDIT_MAX_PENDING events and the oldest are dropped (and counted). Pending
+events are also written at exit and before any read in this process.
+
+SecurityEvent rows are never updated or deleted: the ORM refuses to, and
+on SQLite triggers abort any UPDATE or DELETE on the table.
+
+Reads go through events() (newest first, one page) and iter_events()
+(oldest first, keyset batches, for exports), both filtered by user and
+time range over the (user_id, timestamp) and (timestamp) indexes.
+"""
+import atexit
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from flask import has_request_context, request
+from sqlalchemy import event, select, tuple_
+from app import db, socketio
+from app.models.models import SecurityEvent
+from app.security.devices import devices
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ('risk_assessment', 'login_success', 'login_failure', 'logout')
+
+# Defaults; overridden from app.config in init_app
+FLUSH_SECONDS = 1.0
+BATCH_SIZE = 500
+MAX_PENDING = 10000
+EXPORT_BATCH_SIZE = 1000
+
+COLUMNS = ('id', 'timestamp', 'event_type', 'user_id', 'username', 'ip', 'device', 'security_level',
+           'risk_score', 'details')
+
+
+class AuditError(RuntimeError):
+    """Raised on an attempt to change or remove a recorded security event."""
+
+
+class AuditLog:
+    """
+    Queue of security events and its batched writer.
+
+    Args:
+        clock (callable): Time source for event timestamps (naive UTC)
+    """
+
+    def __init__(self, clock=datetime.utcnow):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = deque()
+        self._task = None
+        self.app = None
+        self.flush_seconds = FLUSH_SECONDS
+        self.batch_size = BATCH_SIZE
+        self.max_pending = MAX_PENDING
+        self._counters = {'recorded': 0, 'written': 0, 'dropped': 0, 'flushes': 0, 'write_errors': 0}
+        self.last_flush_ms = 0.0
+
+    def init_app(self, app):
+        """Read the batching limits from the app config and start the writer."""
+        if self.app is not None and self.app is not app:
+            # Events queued for another app belong in its database, not this one's
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception as e:
+                logger.error('Dropping %d audit events of the previous app: %s', len(self._pending), e)
+            with self._lock:
+                self._pending.clear()
+        self.app = app
+        self.flush_seconds = app.config.get('AUDIT_FLUSH_SECONDS', FLUSH_SECONDS)
+        self.batch_size = app.config.get('AUDIT_BATCH_SIZE', BATCH_SIZE)
+        self.max_pending = app.config.get('AUDIT_MAX_PENDING', MAX_PENDING)
+
+        if not app.config.get('TESTING') and self._task is None:
+            self._task = socketio.start_background_task(self._flush_loop)
+            atexit.register(self._flush_at_exit)
+
+    def record(self, event_type, user_id=None, username=None, security_level=None, risk_score=None,
+               ip=None, device=None, **details):
+        """
+        Queue a security event; it is written by the next flush.
+
+        The client IP and device fingerprint default to the current request's.
+        Extra keyword arguments are stored as the event's JSON details.
+        """
+        if event_type not in EVENT_TYPES:
+            raise ValueError(f'Unknown security event type: {event_type}')
+        if has_request_context():
+            ip = request.remote_addr if ip is None else ip
+            device = devices.parse(request.user_agent.string).id if device is None else device
+        row = {
+            'timestamp': self._clock(),
+            'event_type': event_type,
+            'user_id': user_id,
+            'username': username,
+            'ip': ip,
+            'device': device,
+            'security_level': security_level,
+            'risk_score': None if risk_score is None else float(risk_score),
+            'details': json.dumps(details, default=str) if details else None
+        }
+        with self._lock:
+            self._pending.append(row)
+            self._counters['recorded'] += 1
+            while len(self._pending) > self.max_pending:
+                self._pending.popleft()
+                self._counters['dropped'] += 1
+
+    def flush(self):
+        """
+        Write all queued events, in order, in batches of batch_size rows.
+
+        Returns:
+            int: Events written
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows = list(self._pending)
+                self._pending.clear()
+            if not rows:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                with db.engine.begin() as connection:
+                    for start in range(0, len(rows), self.batch_size):
+                        connection.execute(SecurityEvent.__table__.insert(), rows[start:start + self.batch_size])
+            except Exception:
+                # Put them back for the next flush, ahead of anything recorded since
+                with self._lock:
+                    self._pending.extendleft(reversed(rows))
+                    while len(self._pending) > self.max_pending:
+                        self._pending.popleft()
+                        self._counters['dropped'] += 1
+                    self._counters['write_errors'] += 1
+                raise
+
+            with self._lock:
+                self._counters['written'] += len(rows)
+                self._counters['flushes'] += 1
+                self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+            return len(rows)
+
+    def _flush_loop(self):
+        while True:
+            socketio.sleep(self.flush_seconds)
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception:
+                logger.exception('Audit log flush failed')
+
+    def _flush_at_exit(self):
+        try:
+            with self.app.app_context():
+                self.flush()
+        except Exception as e:
+            logger.error('Audit log flush at exit failed: %s', e)
+
+    def _filtered(self, query, user_id, start, end, event_type):
+        table = SecurityEvent.__table__
+        if user_id is not None:
+            query = query.where(table.c.user_id == user_id)
+        if start is not None:
+            query = query.where(table.c.timestamp >= start)
+        if end is not None:
+            query = query.where(table.c.timestamp < end)
+        if event_type is not None:
+            query = query.where(table.c.event_type == event_type)
+        return query
+
+    def events(self, user_id=None, start=None, end=None, event_type=None, limit=100, before=None, session=None):
+        """
+        One page of events, newest first.
+
+        Args:
+            start (datetime): Earliest timestamp, inclusive
+            end (datetime): Latest timestamp, exclusive
+            before (tuple): (timestamp, id) of the last event of the previous page
+
+        Returns:
+            list: Event dicts
+        """
+        self.flush()
+        table = SecurityEvent.__table__
+        query = self._filtered(select(*(table.c[column] for column in COLUMNS)), user_id, start, end, event_type)
+        if before is not None:
+            query = query.where(tuple_(table.c.timestamp, table.c.id) < tuple_(*before))
+        query = query.order_by(table.c.timestamp.desc(), table.c.id.desc()).limit(limit)
+        return [_as_dict(row) for row in (session or db.session).execute(query)]
+
+    def iter_events(self, user_id=None, start=None, end=None, event_type=None, batch_size=EXPORT_BATCH_SIZE,
+                    session=None):
+        """
+        Yield every matching event, oldest first, reading batch_size rows at a time.
+
+        Each batch is a separate keyset query, so memory use does not grow
+        with the size of the log.
+        """
+        self.flush()
+        table = SecurityEvent.__table__
+        base = self._filtered(select(*(table.c[column] for column in COLUMNS)), user_id, start, end, event_type)
+        after = None
+        while True:
+            query = base
+            if after is not None:
+                query = query.where(tuple_(table.c.timestamp, table.c.id) > tuple_(*after))
+            rows = (session or db.session).execute(
+                query.order_by(table.c.timestamp, table.c.id).limit(batch_size)).all()
+            for row in rows:
+                yield _as_dict(row)
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1].timestamp, rows[-1].id)
+
+    def stats(self):
+        """Queue depth and writer counters for monitoring."""
+        with self._lock:
+            return {'pending': len(self._pending), 'last_flush_ms': self.last_flush_ms, **self._counters}
+
+
+def _as_dict(row):
+    event_dict = dict(row._mapping)
+    event_dict['details'] = json.loads(event_dict['details']) if event_dict['details'] else {}
+    return event_dict
+
+
+audit_log = AuditLog()
+
+
+@event.listens_for(SecurityEvent, 'before_update')
+@event.listens_for(SecurityEvent, 'before_delete')
+def _refuse_changes(mapper, connection, security_event):
+    raise AuditError('Security events are append-only')
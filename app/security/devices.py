@@ -0,0 +1,122 @@
+"""
+Device Registry Module for SecureChat
+This module turns a user agent string into a normalized device fingerprint
+and keeps each user's known devices, for the device risk factor and the
+login audit.
+
+A fingerprint is the device class the risk model scores ('mobile',
+'uncommon' or 'desktop'), the browser family and the OS family; versions
+are left out so a browser update does not make a device new. Parsing
+scans the string once per distinct user agent: results are kept in an LRU
+cache of DEVICE_PARSE_CACHE_SIZE entries.
+
+A user's known devices are the fingerprints they have logged in with; only
+the most recently used KNOWN_DEVICES_PER_USER are kept.
+"""
+import hashlib
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+from app import db
+from app.models.models import KnownDevice
+from app.security import scoring
+
+# Defaults; overridden from app.config in init_app
+DEVICE_PARSE_CACHE_SIZE = 1024
+KNOWN_DEVICES_PER_USER = 20
+
+# (marker, family), first match wins
+BROWSERS = (
+    ('edg', 'Edge'), ('opr/', 'Opera'), ('opera', 'Opera'), ('crios', 'Chrome'), ('chrome', 'Chrome'),
+    ('fxios', 'Firefox'), ('firefox', 'Firefox'), ('safari', 'Safari'), ('msie', 'Internet Explorer'),
+    ('trident', 'Internet Explorer'), ('curl', 'curl'), ('python', 'Python'), ('bot', 'Bot')
+)
+OPERATING_SYSTEMS = (
+    ('android', 'Android'), ('iphone', 'iOS'), ('ipad', 'iOS'), ('windows', 'Windows'),
+    ('cros', 'ChromeOS'), ('mac os x', 'macOS'), ('macintosh', 'macOS'), ('linux', 'Linux')
+)
+
+DeviceFingerprint = namedtuple('DeviceFingerprint', 'id device_class browser os')
+
+
+def _family(user_agent, families):
+    for marker, family in families:
+        if marker in user_agent:
+            return family
+    return 'Other'
+
+
+def parse_user_agent(user_agent):
+    """The DeviceFingerprint of a user agent string (uncached)."""
+    device_class = scoring.device_class(user_agent)
+    user_agent = (user_agent or '').lower()
+    browser = _family(user_agent, BROWSERS)
+    os_family = _family(user_agent, OPERATING_SYSTEMS)
+    digest = hashlib.sha1(f'{device_class}|{browser}|{os_family}'.encode('utf-8')).hexdigest()[:16]
+    return DeviceFingerprint(digest, device_class, browser, os_family)
+
+
+class DeviceRegistry:
+    """Cached user agent parsing and per-user known devices."""
+
+    def __init__(self, parse_cache_size=DEVICE_PARSE_CACHE_SIZE, devices_per_user=KNOWN_DEVICES_PER_USER):
+        self.devices_per_user = devices_per_user
+        self._parse = lru_cache(maxsize=parse_cache_size)(parse_user_agent)
+
+    def init_app(self, app):
+        """Size the parse cache and the device history from the app config."""
+        self.devices_per_user = app.config.get('KNOWN_DEVICES_PER_USER', KNOWN_DEVICES_PER_USER)
+        self._parse = lru_cache(maxsize=app.config.get('DEVICE_PARSE_CACHE_SIZE', DEVICE_PARSE_CACHE_SIZE))(
+            parse_user_agent)
+
+    def parse(self, user_agent):
+        """The DeviceFingerprint of a user agent string."""
+        return self._parse(user_agent or '')
+
+    def is_known(self, user_id, fingerprint, session=None):
+        """Whether the user has logged in with this fingerprint before (one lookup on the unique index)."""
+        return (session or db.session).query(KnownDevice.id)\
+            .filter(KnownDevice.user_id == user_id, KnownDevice.fingerprint == fingerprint.id)\
+            .first() is not None
+
+    def known_devices(self, user_id, session=None):
+        """A user's known devices, most recently used first."""
+        return (session or db.session).query(KnownDevice).filter(KnownDevice.user_id == user_id)\
+            .order_by(KnownDevice.last_seen.desc(), KnownDevice.id.desc()).all()
+
+    def remember(self, user_id, fingerprint, now=None):
+        """
+        Add a login with fingerprint to the user's devices in db.session.
+
+        The caller commits (see logins.record_login).
+        """
+        now = now or datetime.utcnow()
+        known = KnownDevice.query.filter_by(user_id=user_id, fingerprint=fingerprint.id).first()
+        if known:
+            known.last_seen = now
+            known.logins += 1
+            return
+        db.session.add(KnownDevice(user_id=user_id, fingerprint=fingerprint.id, device_class=fingerprint.device_class,
+                                   browser=fingerprint.browser, os=fingerprint.os,
+                                   first_seen=now, last_seen=now, logins=1))
+        db.session.flush()
+        stale = KnownDevice.query.filter_by(user_id=user_id)\
+            .order_by(KnownDevice.last_seen.desc(), KnownDevice.id.desc())\
+            .offset(self.devices_per_user).all()
+        for row in stale:
+            db.session.delete(row)
+
+    def stats(self):
+        """Parse cache hits and size."""
+        info = self._parse.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            'parse_hits': info.hits,
+            'parse_misses': info.misses,
+            'parse_hit_rate': round(info.hits / lookups, 4) if lookups else 0.0,
+            'parse_cache_size': info.currsize,
+            'parse_cache_max': info.maxsize
+        }
+
+
+devices = DeviceRegistry()
@@ -0,0 +1,380 @@
+"""
+IP Reputation Module for SecureChat
+This module answers "what do we know about this client address?" for the
+location risk factor, from a local CIDR dataset, and keeps each user's
+history of login networks.
+
+Datasets are CSV files of network,category,asn,country rows (blocklists,
+anonymizer lists, ASN/country ranges). build_index() compiles them into one
+binary index file: the networks are flattened into sorted, disjoint address
+intervals (IPv4 mapped into the IPv6 space, the most specific network
+winning where they nest), stored as fixed-width 16-byte big-endian keys
+followed by a table of distinct records. The index is memory-mapped, so
+every worker process shares the same pages, and a lookup is a binary search
+over the mapped keys.
+
+The file is replaced atomically (written to a temporary file, then
+renamed), and ip_reputation checks it every IP_REPUTATION_RELOAD_SECONDS:
+a new file is mapped and swapped in, while a file that fails to open is
+reported and the previous index stays in use.
+
+A user's known networks are the /24 (IPv4) or /48 (IPv6) networks they
+have logged in from, with the country the dataset gave for each.
+"""
+import csv
+import ipaddress
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import datetime
+from app import db
+from app.models.models import KnownNetwork
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'IPREPIDX'
+HEADER = struct.Struct('<8sII')  # magic, interval count, record table length
+KEY_SIZE = 16
+
+KNOWN_NETWORK_PREFIX_V4 = 24
+KNOWN_NETWORK_PREFIX_V6 = 48
+
+# Defaults; overridden from app.config in init_app
+IP_REPUTATION_RELOAD_SECONDS = 60
+KNOWN_NETWORKS_PER_USER = 50
+
+Reputation = namedtuple('Reputation', 'category asn country')
+
+
+class IPReputationError(ValueError):
+    """Raised when a dataset or index file cannot be read."""
+
+
+def _address_key(address):
+    """An address as a 128-bit integer, IPv4 mapped into ::ffff:0:0/96."""
+    if address.version == 4:
+        return 0xffff00000000 | int(address)
+    return int(address)
+
+
+def _network_interval(network):
+    """(first, last, prefix length) of a network in the 128-bit key space."""
+    if network.version == 4:
+        return (_address_key(network.network_address), _address_key(network.broadcast_address),
+                network.prefixlen + 96)
+    return int(network.network_address), int(network.broadcast_address), network.prefixlen
+
+
+def network_of(ip):
+    """The /24 or /48 network an address belongs to, as a string, or None if it is not an address."""
+    try:
+        address = ipaddress.ip_address(ip)
+    except (TypeError, ValueError):
+        return None
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    prefix = KNOWN_NETWORK_PREFIX_V4 if address.version == 4 else KNOWN_NETWORK_PREFIX_V6
+    return str(ipaddress.ip_network(f'{address}/{prefix}', strict=False))
+
+
+def read_sources(paths):
+    """
+    Read (network, Reputation) entries from CSV datasets, in file order.
+
+    Rows are network,category,asn,country; asn and country may be empty.
+    Blank lines, '#' comments and a 'network' header row are skipped.
+
+    Raises:
+        IPReputationError: On a malformed row
+    """
+    for path in paths:
+        with open(path, newline='') as f:
+            for line_number, row in enumerate(csv.reader(f), 1):
+                if not row or not row[0].strip() or row[0].startswith('#') or row[0].strip() == 'network':
+                    continue
+                row = [value.strip() for value in row] + [''] * (4 - len(row))
+                try:
+                    network = ipaddress.ip_network(row[0], strict=False)
+                    asn = int(row[2]) if row[2] else None
+                except ValueError as e:
+                    raise IPReputationError(f'{path}:{line_number}: {e}')
+                yield network, Reputation(row[1].lower() or None, asn, row[3].upper() or None)
+
+
+def _flatten(entries):
+    """Disjoint sorted intervals from (first, last, record id) entries, broadest network first."""
+    starts, ends, ids = [], [], []
+    for first, last, record_id in entries:
+        # Intervals i..j-1 overlap [first, last]; keep the parts outside it
+        i = bisect_left(ends, first)
+        j = bisect_right(starts, last)
+        pieces = []
+        if i < j and starts[i] < first:
+            pieces.append((starts[i], first - 1, ids[i]))
+        pieces.append((first, last, record_id))
+        if i < j and ends[j - 1] > last:
+            pieces.append((last + 1, ends[j - 1], ids[j - 1]))
+        starts[i:j] = [piece[0] for piece in pieces]
+        ends[i:j] = [piece[1] for piece in pieces]
+        ids[i:j] = [piece[2] for piece in pieces]
+
+    # Merge neighbours that ended up with the same record
+    merged = []
+    for interval in zip(starts, ends, ids):
+        if merged and merged[-1][2] == interval[2] and merged[-1][1] + 1 == interval[0]:
+            merged[-1] = (merged[-1][0], interval[1], interval[2])
+        else:
+            merged.append(interval)
+    return merged
+
+
+def build_index(entries, path):
+    """
+    Compile (network, Reputation) entries into an index file, replacing it atomically.
+
+    Where networks nest, the most specific one wins; for the same network,
+    the last entry wins.
+
+    Returns:
+        int: Intervals in the index
+    """
+    records, intervals = {}, []
+    for network, reputation in entries:
+        record_id = records.setdefault(tuple(reputation), len(records))
+        first, last, prefix = _network_interval(network)
+        intervals.append((prefix, first, last, record_id))
+    intervals.sort(key=lambda interval: interval[0])  # stable, so later sources override
+    flat = _flatten((first, last, record_id) for _, first, last, record_id in intervals)
+
+    record_table = json.dumps(list(records)).encode('utf-8')
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.ip_reputation-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(flat), len(record_table)))
+            f.write(b''.join(first.to_bytes(KEY_SIZE, 'big') for first, _, _ in flat))
+            f.write(b''.join(last.to_bytes(KEY_SIZE, 'big') for _, last, _ in flat))
+            f.write(struct.pack(f'<{len(flat)}I', *(record_id for _, _, record_id in flat)))
+            f.write(record_table)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return len(flat)
+
+
+class _Keys:
+    """Sequence view of the fixed-width keys in a mapped index, for bisect."""
+    __slots__ = ('buffer', 'offset', 'count')
+
+    def __init__(self, buffer, offset, count):
+        self.buffer, self.offset, self.count = buffer, offset, count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        start = self.offset + i * KEY_SIZE
+        return self.buffer[start:start + KEY_SIZE]
+
+
+class ReputationIndex:
+    """
+    A memory-mapped index file.
+
+    Raises:
+        IPReputationError: If the file is not a valid index
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.identity, size = self._identity(stat), stat.st_size
+            if size < HEADER.size:
+                raise IPReputationError(f'{path}: not an IP reputation index')
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, table_length = HEADER.unpack_from(self._buffer)
+        if magic != MAGIC or size != HEADER.size + count * (2 * KEY_SIZE + 4) + table_length:
+            raise IPReputationError(f'{path}: not an IP reputation index')
+        self.path = path
+        self.count = count
+        self._starts = _Keys(self._buffer, HEADER.size, count)
+        self._ends = _Keys(self._buffer, HEADER.size + count * KEY_SIZE, count)
+        self._ids_offset = HEADER.size + 2 * count * KEY_SIZE
+        try:
+            table = self._buffer[self._ids_offset + 4 * count:]
+            self._records = [Reputation(*record) for record in json.loads(table.decode('utf-8'))]
+        except (ValueError, TypeError) as e:
+            raise IPReputationError(f'{path}: bad record table: {e}')
+
+    @staticmethod
+    def _identity(stat):
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, ip):
+        """The Reputation of an address string, or None if no network covers it."""
+        try:
+            key = _address_key(ipaddress.ip_address(ip)).to_bytes(KEY_SIZE, 'big')
+        except (TypeError, ValueError):
+            return None
+        i = bisect_right(self._starts, key) - 1
+        if i < 0 or self._ends[i] < key:
+            return None
+        record_id, = struct.unpack_from('<I', self._buffer, self._ids_offset + 4 * i)
+        return self._records[record_id]
+
+
+class IPReputation:
+    """
+    The current index, reloaded when its file is replaced.
+
+    Args:
+        clock (callable): Monotonic time source in seconds
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.path = None
+        self.reload_seconds = IP_REPUTATION_RELOAD_SECONDS
+        self.networks_per_user = KNOWN_NETWORKS_PER_USER
+        self._index = None
+        self._checked_at = None
+        self.lookups = 0
+        self.hits = 0
+        self.reloads = 0
+        self.reload_errors = 0
+        self.last_error = None
+
+    def init_app(self, app):
+        """Open the index named by IP_REPUTATION_PATH, if any."""
+        self.reload_seconds = app.config.get('IP_REPUTATION_RELOAD_SECONDS', IP_REPUTATION_RELOAD_SECONDS)
+        self.networks_per_user = app.config.get('KNOWN_NETWORKS_PER_USER', KNOWN_NETWORKS_PER_USER)
+        self.configure(app.config.get('IP_REPUTATION_PATH'))
+
+    def configure(self, path):
+        """Switch to another index file; a missing or invalid one is reported and checked again later."""
+        with self._lock:
+            self.path, self._index, self._checked_at = path, None, None
+        if path:
+            self._maybe_reload()
+
+    def _maybe_reload(self):
+        now = self._clock()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.reload_seconds:
+                return
+            self._checked_at = now
+            path, current = self.path, self._index
+        try:
+            if current is not None and ReputationIndex._identity(os.stat(path)) == current.identity:
+                return
+            index = ReputationIndex(path)
+        except (OSError, IPReputationError) as e:
+            with self._lock:
+                self.reload_errors += 1
+                self.last_error = str(e)
+            logger.warning('Keeping IP reputation index (%d ranges): %s', len(current) if current else 0, e)
+            return
+        with self._lock:
+            if self.path == path:
+                self._index = index
+                self.reloads += 1
+        logger.info('Loaded IP reputation index %s (%d ranges)', path, len(index))
+
+    def lookup(self, ip):
+        """The Reputation of an address, or None if unknown or no index is loaded."""
+        if self.path is None:
+            return None
+        self._maybe_reload()
+        index = self._index
+        self.lookups += 1
+        if index is None:
+            return None
+        reputation = index.lookup(ip)
+        if reputation is not None:
+            self.hits += 1
+        return reputation
+
+    def refresh(self, sources):
+        """
+        Rebuild the index file from CSV datasets and switch to it.
+
+        Other processes pick up the new file at their next check.
+
+        Returns:
+            int: Intervals in the new index
+        """
+        if not self.path:
+            raise IPReputationError('IP_REPUTATION_PATH is not configured')
+        count = build_index(read_sources(sources), self.path)
+        with self._lock:
+            self._checked_at = None
+        self._maybe_reload()
+        return count
+
+    def stats(self):
+        """Index size, lookups, hit rate and reloads."""
+        with self._lock:
+            return {
+                'path': self.path,
+                'ranges': len(self._index) if self._index else 0,
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_rate': round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                'reloads': self.reloads,
+                'reload_errors': self.reload_errors,
+                'last_error': self.last_error
+            }
+
+
+ip_reputation = IPReputation()
+
+
+def known_networks(user_id, session=None):
+    """{network: country} of the networks a user has logged in from."""
+    rows = (session or db.session).query(KnownNetwork.network, KnownNetwork.country)\
+        .filter(KnownNetwork.user_id == user_id).all()
+    return dict(rows)
+
+
+def remember_login_network(user_id, ip, now=None):
+    """
+    Add a login from ip to the user's network history in db.session.
+
+    Only the most recently used KNOWN_NETWORKS_PER_USER networks are kept.
+    The caller commits (see logins.record_login).
+    """
+    network = network_of(ip)
+    if network is None:
+        return
+    now = now or datetime.utcnow()
+    reputation = ip_reputation.lookup(ip)
+    country = reputation.country if reputation else None
+    known = KnownNetwork.query.filter_by(user_id=user_id, network=network).first()
+    if known:
+        known.last_seen = now
+        known.logins += 1
+        known.country = country or known.country
+        return
+    db.session.add(KnownNetwork(user_id=user_id, network=network, country=country,
+                                first_seen=now, last_seen=now, logins=1))
+    db.session.flush()
+    stale = KnownNetwork.query.filter_by(user_id=user_id)\
+        .order_by(KnownNetwork.last_seen.desc(), KnownNetwork.id.desc())\
+        .offset(ip_reputation.networks_per_user).all()
+    for row in stale:
+        db.session.delete(row)
@@ -0,0 +1,53 @@
+"""
+Login Records Module for SecureChat
+Every successful login goes through record_login(), which adds the
+client's network and device to the user's history in one transaction, so
+the next risk assessment treats them as known, writes a login_success
+event to the audit log and queues a push of the user's security metrics
+(see app.security.metrics_push). Rejected logins go through record_login_failure().
+"""
+import logging
+from datetime import datetime
+from flask import has_request_context, request, session
+from app import db
+from app.security.audit import audit_log
+from app.security.devices import devices
+from app.security.ip_reputation import remember_login_network
+from app.security.metrics_push import notify_security_change
+from app.security.risk_features import risk_features
+
+logger = logging.getLogger(__name__)
+
+
+def record_login(user_id, ip=None, user_agent=None, now=None):
+    """
+    Record a successful login by user_id; ip and user_agent default to the current request's.
+
+    Returns:
+        DeviceFingerprint: The fingerprint of the login device
+    """
+    ip = request.remote_addr if ip is None else ip
+    user_agent = request.user_agent.string if user_agent is None else user_agent
+    now = now or datetime.utcnow()
+    fingerprint = devices.parse(user_agent)
+    audit_log.record('login_success', user_id=user_id, ip=ip, device=fingerprint.id,
+                     security_level=session.get('security_level') if has_request_context() else None,
+                     device_class=fingerprint.device_class)
+    try:
+        remember_login_network(user_id, ip, now)
+        devices.remember(user_id, fingerprint, now)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error('Could not record login history for user %s: %s', user_id, e)
+    else:
+        # Assessments cached before this login still see the network and device as new
+        risk_features.invalidate(user_id)
+    notify_security_change(user_id)
+    return fingerprint
+
+
+def record_login_failure(username, reason, user_id=None):
+    """Write a login_failure event, e.g. for a bad password, CAPTCHA or face match."""
+    audit_log.record('login_failure', user_id=user_id, username=username, reason=reason,
+                     security_level=session.get('security_level') if has_request_context() else None)
@@ -0,0 +1,129 @@
+"""
+Security Metrics Push Module for SecureChat
+This module sends a user's security metrics (risk assessment and face
+verification accuracy) over Socket.IO instead of having each tab poll
+/security/get_security_metrics.
+
+A socket gets one 'security_metrics' snapshot when it connects. After that
+the metrics are pushed to the user's user_<id> room only when one of their
+inputs changes: a committed face verification attempt, a login or a change
+of security level. Changes made during an HTTP request are coalesced and
+pushed once, after the request; changes made in a Socket.IO handler are
+pushed at once. Users with no open socket are skipped.
+"""
+import logging
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import socketio
+from app.models.models import FaceVerificationLog
+
+logger = logging.getLogger(__name__)
+
+EVENT_NAME = 'security_metrics'
+
+_PENDING_KEY = '_security_metrics_pending'
+
+
+def build_security_metrics(user_id, username):
+    """
+    Risk assessment and face verification accuracy for a user.
+
+    Reads through read_session() and needs a request context, since some
+    risk factors depend on the client's address and user agent.
+
+    Returns:
+        dict: The payload served by /security/get_security_metrics
+    """
+    from app.security.security_ai import get_risk_details, get_face_verification_accuracy
+    from app.utils.database import read_session
+
+    # Metrics are read from the read pool (or replica)
+    with read_session() as reader:
+        risk_details = get_risk_details(username, db_session=reader)
+        accuracy_metrics = get_face_verification_accuracy(user_id, db_session=reader)
+
+    return {
+        'success': True,
+        'risk': {
+            'score': round(risk_details['risk_score'] * 100, 2),  # Convert to percentage
+            'level': risk_details['security_level'],
+            'factors': risk_details['risk_factors']
+        },
+        'face_verification': accuracy_metrics
+    }
+
+
+def has_listeners(user_id):
+    """True when the user has at least one connected socket."""
+    rooms = socketio.server.manager.rooms.get('/', {}) if socketio.server else {}
+    return bool(rooms.get(f'user_{user_id}'))
+
+
+def push_security_metrics(user_id, username=None, to=None):
+    """
+    Emit a user's current metrics to one socket (to) or to all of their sockets.
+
+    Returns:
+        bool: True if metrics were sent
+    """
+    if to is None and not has_listeners(user_id):
+        return False
+    if username is None:
+        from app.auth.identity import identity_cache
+        snapshot = identity_cache.get(user_id)
+        if snapshot is None:
+            return False
+        username = snapshot.username
+    try:
+        payload = build_security_metrics(user_id, username)
+    except Exception:
+        logger.exception('Error pushing security metrics to user_%s', user_id)
+        return False
+    socketio.emit(EVENT_NAME, payload, room=to or f'user_{user_id}')
+    return True
+
+
+def notify_security_change(user_id):
+    """
+    Record that an input of a user's security metrics changed.
+
+    Outside a request there is no client to assess against, so the change
+    is picked up by the next connect snapshot instead.
+    """
+    if not has_request_context():
+        return
+    if getattr(request, 'sid', None) is not None:
+        push_security_metrics(user_id)
+        return
+    pending = g.setdefault(_PENDING_KEY, set())
+    pending.add(user_id)
+
+
+def _push_pending(response):
+    for user_id in g.pop(_PENDING_KEY, ()):
+        push_security_metrics(user_id)
+    return response
+
+
+def init_app(app):
+    """Push the metrics changed during a request once the request is done."""
+    app.after_request(_push_pending)
+
+
+@event.listens_for(FaceVerificationLog, 'after_insert')
+def _attempt_logged(mapper, connection, log):
+    session = Session.object_session(log)
+    if session is not None:
+        session.info.setdefault('security_metrics_users', set()).add(log.user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_committed(session):
+    for user_id in session.info.pop('security_metrics_users', ()):
+        notify_security_change(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('security_metrics_users', None)
@@ -0,0 +1,280 @@
+"""
+Risk Feature Store for SecureChat
+This module keeps the per-user inputs of the risk assessment in memory so
+scoring a login or a metrics poll does not scan FaceVerificationLog.
+
+For each user the store holds daily attempt/success counts for the
+accuracy window (30 days, to the day) and the timestamps of failures in the
+failed-attempts window (24 hours). A user's features are loaded with one
+conditional-aggregation query over the (user_id, timestamp, success) index,
+which returns at most one row per day, and refreshed every RISK_FEATURE_TTL
+seconds (which also picks up attempts logged by other server processes); in
+between, attempts committed in this process are added as they are written.
+
+Finished assessments from get_risk_details() are cached for
+RISK_ASSESSMENT_TTL seconds, keyed by everything they depend on (user,
+client address, device fingerprint, hour band, manual override). A
+verification attempt, a recorded login or a change to the User row drops
+that user's cached assessments.
+"""
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from sqlalchemy import and_, case, event, func
+from sqlalchemy.orm import Session
+from app import db
+from app.models.models import FaceVerificationLog, User
+
+# Defaults; overridden from app.config in init_app
+RISK_FEATURE_TTL = 300
+RISK_FEATURE_USERS = 4096
+RISK_ASSESSMENT_TTL = 30
+RISK_ASSESSMENT_SIZE = 4096
+
+FAILED_ATTEMPTS_WINDOW = timedelta(days=1)
+ACCURACY_WINDOW = timedelta(days=30)
+
+
+class UserRiskFeatures:
+    """Verification counts of one user: per day for accuracy, per failure for the 24h window."""
+    __slots__ = ('loaded_at', 'days', 'attempts', 'successes', 'failures')
+
+    def __init__(self, loaded_at):
+        self.loaded_at = loaded_at
+        self.days = {}       # date -> [attempts, successes]
+        self.attempts = 0    # totals over self.days
+        self.successes = 0
+        self.failures = []   # timestamps of failed attempts, oldest first
+
+    def add_day(self, day, attempts, successes):
+        counts = self.days.setdefault(day, [0, 0])
+        counts[0] += attempts
+        counts[1] += successes
+        self.attempts += attempts
+        self.successes += successes
+
+    def add(self, timestamp, success):
+        self.add_day(timestamp.date(), 1, 1 if success else 0)
+        if not success:
+            # Logs normally arrive in order, so insort appends
+            insort(self.failures, timestamp)
+
+    def expire(self, now):
+        """Drop days that have left the accuracy window and failures older than 24h."""
+        cutoff_day = (now - ACCURACY_WINDOW).date()
+        for day in [day for day in self.days if day < cutoff_day]:
+            attempts, successes = self.days.pop(day)
+            self.attempts -= attempts
+            self.successes -= successes
+        del self.failures[:bisect_left(self.failures, now - FAILED_ATTEMPTS_WINDOW)]
+
+
+def _as_date(value):
+    # func.date() gives a string on SQLite and a date elsewhere
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def load_user_features(user_id, now, session):
+    """
+    Aggregate a user's verification logs, one row per day.
+
+    Each day carries its attempts, successes and failures inside the 24h
+    window; only when there are such failures are their exact times read,
+    since the window has to slide past them one by one.
+
+    Returns:
+        UserRiskFeatures: Features as of now
+    """
+    log = FaceVerificationLog
+    failed_recently = and_(log.success.is_(False), log.timestamp >= now - FAILED_ATTEMPTS_WINDOW)
+    day = func.date(log.timestamp)
+    rows = session.query(
+        day,
+        func.count(log.id),
+        func.sum(case((log.success.is_(True), 1), else_=0)),
+        func.sum(case((failed_recently, 1), else_=0))
+    ).filter(
+        log.user_id == user_id,
+        log.timestamp >= now - ACCURACY_WINDOW
+    ).group_by(day).all()
+
+    features = UserRiskFeatures(now)
+    recent_failures = 0
+    for log_day, attempts, successes, failures in rows:
+        features.add_day(_as_date(log_day), attempts, successes or 0)
+        recent_failures += failures or 0
+    if recent_failures:
+        features.failures = [timestamp for timestamp, in session.query(log.timestamp).filter(
+            log.user_id == user_id, failed_recently).order_by(log.timestamp)]
+    return features
+
+
+def failed_attempts_by_user(user_ids, now, session=None):
+    """
+    Failed verifications within FAILED_ATTEMPTS_WINDOW for many users, in one query.
+
+    Returns:
+        dict: user_id -> failures; users without failures are left out
+    """
+    log = FaceVerificationLog
+    session = session if session is not None else db.session
+    rows = session.query(log.user_id, func.count(log.id)).filter(
+        log.user_id.in_(list(user_ids)),
+        log.success.is_(False),
+        log.timestamp >= now - FAILED_ATTEMPTS_WINDOW
+    ).group_by(log.user_id)
+    return dict(rows.all())
+
+
+class RiskFeatureStore:
+    """
+    Per-user risk features and a TTL cache of finished risk assessments.
+
+    Args:
+        feature_ttl (float): Seconds before a user's features are reloaded
+        max_users (int): Users kept before the least recent is evicted
+        assessment_ttl (float): Seconds a finished assessment is reused
+        clock (callable): Current UTC time as a naive datetime
+    """
+
+    def __init__(self, feature_ttl=RISK_FEATURE_TTL, max_users=RISK_FEATURE_USERS,
+                 assessment_ttl=RISK_ASSESSMENT_TTL, clock=datetime.utcnow):
+        self.feature_ttl = feature_ttl
+        self.max_users = max_users
+        self.assessment_ttl = assessment_ttl
+        self.max_assessments = RISK_ASSESSMENT_SIZE
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._features = OrderedDict()     # user_id -> UserRiskFeatures
+        self._assessments = OrderedDict()  # key -> (expires_at, value); key[0] is the username
+        self._usernames = {}               # user_id -> username, for invalidation
+        self.loads = 0
+        self.assessment_hits = 0
+        self.assessment_misses = 0
+
+    def init_app(self, app):
+        self.feature_ttl = app.config.get('RISK_FEATURE_TTL', RISK_FEATURE_TTL)
+        self.max_users = app.config.get('RISK_FEATURE_USERS', RISK_FEATURE_USERS)
+        self.assessment_ttl = app.config.get('RISK_ASSESSMENT_TTL', RISK_ASSESSMENT_TTL)
+        self.max_assessments = app.config.get('RISK_ASSESSMENT_SIZE', RISK_ASSESSMENT_SIZE)
+        self.clear()
+
+    def _user_features(self, user_id, session=None):
+        """Features of a user, loading them from the logs when missing or stale."""
+        now = self._clock()
+        with self._lock:
+            features = self._features.get(user_id)
+            if features is not None and now - features.loaded_at < timedelta(seconds=self.feature_ttl):
+                self._features.move_to_end(user_id)
+                features.expire(now)
+                return features, now
+
+        features = load_user_features(user_id, now, session if session is not None else db.session)
+        with self._lock:
+            self.loads += 1
+            self._features[user_id] = features
+            self._features.move_to_end(user_id)
+            while len(self._features) > self.max_users:
+                self._features.popitem(last=False)
+        return features, now
+
+    def failed_attempts(self, user_id, session=None):
+        """Failed face verifications of a user within FAILED_ATTEMPTS_WINDOW."""
+        features, now = self._user_features(user_id, session)
+        with self._lock:
+            return len(features.failures)
+
+    def verification_counts(self, user_id, session=None):
+        """
+        Face verification attempts of a user within ACCURACY_WINDOW.
+
+        Returns:
+            tuple: (total attempts, successful attempts)
+        """
+        features, now = self._user_features(user_id, session)
+        with self._lock:
+            return features.attempts, features.successes
+
+    def record_attempt(self, user_id, timestamp, success):
+        """Add a committed verification attempt to a loaded user's features."""
+        with self._lock:
+            features = self._features.get(user_id)
+            if features is not None:
+                features.add(timestamp or self._clock(), bool(success))
+        self.invalidate(user_id)
+
+    def cached_assessment(self, key):
+        """A cached assessment for key, or None when missing or expired."""
+        now = self._clock()
+        with self._lock:
+            entry = self._assessments.get(key)
+            if entry and entry[0] > now:
+                self._assessments.move_to_end(key)
+                self.assessment_hits += 1
+                return entry[1]
+            self.assessment_misses += 1
+            return None
+
+    def store_assessment(self, key, value, user_id=None):
+        expires_at = self._clock() + timedelta(seconds=self.assessment_ttl)
+        with self._lock:
+            if user_id is not None:
+                self._usernames[user_id] = key[0]
+            self._assessments[key] = (expires_at, value)
+            self._assessments.move_to_end(key)
+            while len(self._assessments) > self.max_assessments:
+                self._assessments.popitem(last=False)
+
+    def invalidate(self, user_id, username=None):
+        """Drop a user's cached assessments."""
+        with self._lock:
+            names = {username, self._usernames.pop(user_id, None)} - {None}
+            for key in [key for key in self._assessments if key[0] in names]:
+                del self._assessments[key]
+
+    def clear(self):
+        with self._lock:
+            self._features.clear()
+            self._assessments.clear()
+            self._usernames.clear()
+            self.loads = self.assessment_hits = self.assessment_misses = 0
+
+    def stats(self):
+        """Sizes and hit counters for monitoring."""
+        with self._lock:
+            return {
+                'users': len(self._features),
+                'assessments': len(self._assessments),
+                'loads': self.loads,
+                'assessment_hits': self.assessment_hits,
+                'assessment_misses': self.assessment_misses
+            }
+
+
+risk_features = RiskFeatureStore()
+
+
+@event.listens_for(FaceVerificationLog, 'after_insert')
+def _attempt_logged(mapper, connection, log):
+    # Counted once the transaction commits, so rolled back attempts never are
+    session = Session.object_session(log)
+    if session is not None:
+        session.info.setdefault('risk_attempts', []).append((log.user_id, log.timestamp, log.success))
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, user):
+    risk_features.invalidate(user.id, user.username)
+
+
+@event.listens_for(Session, 'after_commit')
+def _record_committed(session):
+    for user_id, timestamp, success in session.info.pop('risk_attempts', ()):
+        risk_features.record_attempt(user_id, timestamp, success)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('risk_attempts', None)
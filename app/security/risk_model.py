@@ -0,0 +1,407 @@
+"""
+Risk Model Module for SecureChat
+This module loads the risk model (factor weights, level thresholds and the
+transforms that turn raw inputs into factor values) from a JSON file and
+compiles it once into a RiskModel evaluator.
+
+Raw inputs, one per factor:
+- failed_attempts: failed face verifications in the last 24 hours
+- unusual_location: 'same', 'changed', 'known', 'new', 'new_country', 'anonymizer'
+  or 'blocklisted' (see scoring.location_state)
+- time_risk: local hour of the day, 0-23
+- previous_breaches: whole days since the last login, or None
+- device_risk: 'known', or for a new device 'mobile', 'uncommon' or 'desktop'
+  (see scoring.device_state)
+
+Transforms are 'linear' (min(value / scale, cap)), 'steps' (sorted upper
+bounds, one value per band plus a 'missing' value for None) and 'lookup'
+(category -> value with a default). app/security/risk_model.json is the
+model the app ships with.
+
+The risk_models registry serves the live model to every worker and checks
+the model file for changes every RISK_MODEL_RELOAD_SECONDS, so a new model
+goes live without a restart; a file that fails to load or compile is
+reported and the previous model stays live. An optional shadow model
+(RISK_SHADOW_MODEL_PATH) is evaluated next to the live one on every
+assessment, and only its latency and the decisions it would have changed
+are recorded.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_right
+from collections import Counter
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'risk_model.json')
+
+FACTORS = ('failed_attempts', 'unusual_location', 'time_risk', 'previous_breaches', 'device_risk')
+
+# Security levels
+SECURITY_LEVEL_LOW = 1      # Password only
+SECURITY_LEVEL_MEDIUM = 2   # Password + CAPTCHA
+SECURITY_LEVEL_HIGH = 3     # Password + CAPTCHA + Face Verification
+
+# Defaults; overridden from app.config in init_app
+RELOAD_SECONDS = 5
+
+
+class RiskModelError(ValueError):
+    """Raised when a model definition cannot be loaded or compiled."""
+
+
+def _compile_linear(spec):
+    scale = float(spec['scale'])
+    cap = float(spec.get('cap', 1.0))
+    if scale <= 0:
+        raise RiskModelError('linear transform needs a positive scale')
+
+    def scalar(value):
+        return min(value / scale, cap)
+
+    def vector(values):
+        return np.minimum(np.asarray(values, dtype=float) / scale, cap)
+    return scalar, vector
+
+
+def _compile_steps(spec):
+    bounds = [float(bound) for bound in spec['bounds']]
+    values = [float(value) for value in spec['values']]
+    missing = float(spec.get('missing', values[-1]))
+    if bounds != sorted(bounds) or len(values) != len(bounds) + 1:
+        raise RiskModelError('steps transform needs sorted bounds and one more value than bounds')
+    bound_array, value_array = np.array(bounds), np.array(values)
+
+    def scalar(value):
+        if value is None:
+            return missing
+        return values[bisect_right(bounds, value)]
+
+    def vector(inputs):
+        inputs = np.asarray(inputs, dtype=float)
+        result = value_array[np.searchsorted(bound_array, np.nan_to_num(inputs), side='right')]
+        return np.where(np.isnan(inputs), missing, result)
+    return scalar, vector
+
+
+def _compile_lookup(spec):
+    table = {str(key): float(value) for key, value in spec['values'].items()}
+    default = float(spec.get('default', 0.5))
+
+    def scalar(value):
+        return table.get(value, default)
+
+    def vector(inputs):
+        return np.array([table.get(value, default) for value in inputs], dtype=float)
+    return scalar, vector
+
+
+_TRANSFORMS = {'linear': _compile_linear, 'steps': _compile_steps, 'lookup': _compile_lookup}
+
+
+class RiskModel:
+    """
+    A compiled risk model.
+
+    Args:
+        definition (dict): Parsed model file
+
+    Raises:
+        RiskModelError: If the definition is incomplete or inconsistent
+    """
+
+    def __init__(self, definition):
+        try:
+            self.name = str(definition.get('name', 'unnamed'))
+            self.version = definition.get('version', 0)
+            weights = definition['weights']
+            thresholds = definition['thresholds']
+            transforms = definition['transforms']
+            missing = [factor for factor in FACTORS if factor not in weights or factor not in transforms]
+            if missing:
+                raise RiskModelError(f"model has no weight or transform for {', '.join(missing)}")
+
+            self.weights = {factor: float(weights[factor]) for factor in FACTORS}
+            self.weight_vector = np.array([self.weights[factor] for factor in FACTORS])
+            self.low = float(thresholds['low'])
+            self.high = float(thresholds['high'])
+            if not self.low <= self.high:
+                raise RiskModelError('low threshold must not exceed high threshold')
+
+            self._scalar, self._vector = {}, {}
+            for factor in FACTORS:
+                spec = transforms[factor]
+                compiler = _TRANSFORMS.get(spec.get('type'))
+                if compiler is None:
+                    raise RiskModelError(f"unknown transform type {spec.get('type')!r} for {factor}")
+                self._scalar[factor], self._vector[factor] = compiler(spec)
+        except RiskModelError:
+            raise
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise RiskModelError(f'invalid risk model definition: {e!r}') from e
+        # Everything an evaluation depends on, for cache keys
+        self.fingerprint = (self.name, self.version, hash(json.dumps(definition, sort_keys=True)))
+
+    def __repr__(self):
+        return f'<RiskModel {self.name} v{self.version}>'
+
+    def transform(self, factor, value):
+        """Factor value of one raw input."""
+        return self._scalar[factor](value)
+
+    def factors(self, inputs):
+        """Factor values of a dict of raw inputs keyed by factor."""
+        return {factor: self._scalar[factor](inputs[factor]) for factor in FACTORS}
+
+    def score(self, factors):
+        """Weighted risk score of a dict of factor values."""
+        return float(sum(factors[factor] * self.weights[factor] for factor in FACTORS))
+
+    def level(self, risk_score):
+        """Security level (1=Low, 2=Medium, 3=High) for a risk score."""
+        if risk_score < self.low:
+            return SECURITY_LEVEL_LOW
+        elif risk_score < self.high:
+            return SECURITY_LEVEL_MEDIUM
+        return SECURITY_LEVEL_HIGH
+
+    def evaluate(self, inputs):
+        """
+        Assess one set of raw inputs.
+
+        Returns:
+            tuple: (factor values, risk score, security level)
+        """
+        factors = self.factors(inputs)
+        risk_score = self.score(factors)
+        return factors, risk_score, self.level(risk_score)
+
+    def transform_batch(self, factor, values):
+        """Factor values of an array (or list, for lookups) of raw inputs."""
+        return self._vector[factor](values)
+
+    def score_batch(self, features):
+        """Risk scores of an (n, len(FACTORS)) matrix of factor values."""
+        features = np.asarray(features, dtype=float)
+        if features.ndim != 2 or features.shape[1] != len(FACTORS):
+            raise ValueError(f'Expected an (n, {len(FACTORS)}) feature matrix, got shape {features.shape}')
+        return features @ self.weight_vector
+
+    def levels_batch(self, scores):
+        """Security levels for an array of risk scores."""
+        return np.digitize(scores, [self.low, self.high]) + SECURITY_LEVEL_LOW
+
+
+def load_model(path):
+    """
+    Read and compile a model file.
+
+    Raises:
+        RiskModelError: If the file cannot be read or compiled
+    """
+    try:
+        with open(path) as f:
+            definition = json.load(f)
+    except (OSError, ValueError) as e:
+        raise RiskModelError(f'cannot read risk model {path}: {e}') from e
+    return RiskModel(definition)
+
+
+_default_model = None
+
+
+def default_model():
+    """The model shipped in risk_model.json, compiled once."""
+    global _default_model
+    if _default_model is None:
+        _default_model = load_model(DEFAULT_MODEL_PATH)
+    return _default_model
+
+
+class _ModelFile:
+    """A model file and the model last compiled from it."""
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = None
+        self.model = None
+
+    def refresh(self):
+        """
+        Recompile the model if the file changed.
+
+        Returns:
+            bool: True if a new model was loaded
+        """
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self.mtime:
+            return False
+        model = load_model(self.path)
+        self.model, self.mtime = model, mtime
+        return True
+
+
+class RiskModelRegistry:
+    """
+    The live risk model, an optional shadow model and their metrics.
+
+    Args:
+        clock (callable): Monotonic time source in seconds
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.reload_seconds = RELOAD_SECONDS
+        self._live = None
+        self._shadow = None
+        self._checked_at = None
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self.reloads = 0
+        self.reload_errors = 0
+        self.last_error = None
+        self.evaluations = 0
+        self.live_seconds = 0.0
+        self.live_max_seconds = 0.0
+        self.shadow_evaluations = 0
+        self.shadow_seconds = 0.0
+        self.shadow_max_seconds = 0.0
+        self.shadow_errors = 0
+        self.level_diffs = Counter()   # (live level, shadow level) -> count, for differing decisions
+        self.score_delta_total = 0.0
+        self.score_delta_max = 0.0
+
+    def init_app(self, app):
+        """Load the live and shadow models named in the app config."""
+        self.reload_seconds = app.config.get('RISK_MODEL_RELOAD_SECONDS', RELOAD_SECONDS)
+        self.configure(app.config.get('RISK_MODEL_PATH') or DEFAULT_MODEL_PATH,
+                       app.config.get('RISK_SHADOW_MODEL_PATH'))
+
+    def configure(self, path, shadow_path=None):
+        """
+        Switch to new model files, compiling them now.
+
+        Raises:
+            RiskModelError: If either file cannot be loaded
+        """
+        live = _ModelFile(path)
+        live.refresh()
+        shadow = None
+        if shadow_path:
+            shadow = _ModelFile(shadow_path)
+            shadow.refresh()
+        with self._lock:
+            self._live, self._shadow = live, shadow
+            self._checked_at = self._clock()
+            self._reset_counters()
+
+    def _maybe_reload(self):
+        now = self._clock()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.reload_seconds:
+                return
+            self._checked_at = now
+            files = [model_file for model_file in (self._live, self._shadow) if model_file is not None]
+        for model_file in files:
+            try:
+                if model_file.refresh():
+                    with self._lock:
+                        self.reloads += 1
+                    logger.info('Loaded risk model %r from %s', model_file.model, model_file.path)
+            except (OSError, RiskModelError) as e:
+                with self._lock:
+                    self.reload_errors += 1
+                    self.last_error = str(e)
+                logger.warning('Keeping risk model %r: %s', model_file.model, e)
+
+    def live(self):
+        """The live model, reloaded first if its file changed."""
+        if self._live is None:
+            return default_model()
+        self._maybe_reload()
+        return self._live.model
+
+    def shadow(self):
+        """The shadow model, or None."""
+        if self._shadow is None:
+            return None
+        self._maybe_reload()
+        return self._shadow.model
+
+    def evaluate(self, inputs):
+        """
+        Assess raw inputs with the live model, and with the shadow model if any.
+
+        Only the live result is returned; the shadow result feeds stats().
+
+        Returns:
+            tuple: (factor values, risk score, security level)
+        """
+        live, shadow = self.live(), self.shadow()
+        started = time.perf_counter()
+        result = live.evaluate(inputs)
+        live_elapsed = time.perf_counter() - started
+
+        shadow_result, shadow_elapsed = None, 0.0
+        if shadow is not None:
+            started = time.perf_counter()
+            try:
+                shadow_result = shadow.evaluate(inputs)
+            except Exception as e:
+                logger.warning('Shadow risk model failed: %s', e)
+            shadow_elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self.evaluations += 1
+            self.live_seconds += live_elapsed
+            self.live_max_seconds = max(self.live_max_seconds, live_elapsed)
+            if shadow is not None:
+                self.shadow_evaluations += 1
+                self.shadow_seconds += shadow_elapsed
+                self.shadow_max_seconds = max(self.shadow_max_seconds, shadow_elapsed)
+                if shadow_result is None:
+                    self.shadow_errors += 1
+                else:
+                    delta = abs(shadow_result[1] - result[1])
+                    self.score_delta_total += delta
+                    self.score_delta_max = max(self.score_delta_max, delta)
+                    if shadow_result[2] != result[2]:
+                        self.level_diffs[(result[2], shadow_result[2])] += 1
+        return result
+
+    def stats(self):
+        """Model versions, reloads, latency and live/shadow decision differences."""
+        with self._lock:
+            live = self._live.model if self._live else default_model()
+            shadow = self._shadow.model if self._shadow else None
+            compared = self.shadow_evaluations - self.shadow_errors
+            return {
+                'live_model': f'{live.name} v{live.version}',
+                'shadow_model': f'{shadow.name} v{shadow.version}' if shadow else None,
+                'reloads': self.reloads,
+                'reload_errors': self.reload_errors,
+                'last_error': self.last_error,
+                'evaluations': self.evaluations,
+                'live_avg_us': round(self.live_seconds / self.evaluations * 1e6, 2) if self.evaluations else 0.0,
+                'live_max_us': round(self.live_max_seconds * 1e6, 2),
+                'shadow_evaluations': self.shadow_evaluations,
+                'shadow_errors': self.shadow_errors,
+                'shadow_avg_us': (round(self.shadow_seconds / self.shadow_evaluations * 1e6, 2)
+                                  if self.shadow_evaluations else 0.0),
+                'shadow_max_us': round(self.shadow_max_seconds * 1e6, 2),
+                'decision_diffs': sum(self.level_diffs.values()),
+                'decision_diff_rate': round(sum(self.level_diffs.values()) / compared, 4) if compared else 0.0,
+                'decision_diffs_by_level': {f'{live_level}->{shadow_level}': count
+                                            for (live_level, shadow_level), count in self.level_diffs.items()},
+                'score_delta_avg': round(self.score_delta_total / compared, 4) if compared else 0.0,
+                'score_delta_max': round(self.score_delta_max, 4)
+            }
+
+
+risk_models = RiskModelRegistry()
@@ -1,8 +1,17 @@
-from flask import Blueprint, jsonify, request, session
+import csv
+import io
+import json
+import logging
+from datetime import datetime
+from flask import Blueprint, Response, current_app, jsonify, request, session, stream_with_context
+from flask_login import login_required
+from app.security.audit import audit_log, COLUMNS as AUDIT_COLUMNS, EVENT_TYPES
 from app.security.security_ai import SECURITY_LEVEL_LOW, SECURITY_LEVEL_MEDIUM, SECURITY_LEVEL_HIGH
 
 security_blueprint = Blueprint('security', __name__)
 
+logger = logging.getLogger(__name__)
+
 @security_blueprint.route('/set_security_level_login', methods=['POST'])
 def set_security_level_login():
     """
@@ -41,14 +50,12 @@ def set_security_level_login():
         # Store the manual override in the session
         if level != 'ai':
             session['manual_security_level'] = level_num
-            print(f"[SECURITY] Set manual security level to {level_name} ({level_num})")
+            logger.info('Set manual security level to %s (%s)', level_name, level_num)
         else:
             # Remove manual override
             if 'manual_security_level' in session:
                 session.pop('manual_security_level', None)
-                print("[SECURITY] Removed manual security level, using AI-based assessment")
-            else:
-                print("[SECURITY] Using AI-based security assessment")
+                logger.info('Removed manual security level, using AI-based assessment')
                 
         # Update session with required factors for medium and high levels
         session['captcha_enabled'] = level in ['medium', 'high']
@@ -57,6 +64,12 @@ def set_security_level_login():
         # Force the session to update
         session.modified = True
         
+        # Signed-in tabs show the assessment for the new level
+        from flask_login import current_user
+        if current_user.is_authenticated:
+            from app.security.metrics_push import notify_security_change
+            notify_security_change(current_user.id)
+        
         return jsonify({
             'success': True,
             'level': level,
@@ -65,7 +78,7 @@ def set_security_level_login():
             'requiredFactors': ', '.join(required_factors)
         })
     except Exception as e:
-        print(f"Error setting security level: {str(e)}")
+        logger.exception('Error setting security level')
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @security_blueprint.route('/get_security_metrics', methods=['GET'])
@@ -76,40 +89,188 @@ def get_security_metrics():
     - Face verification accuracy
     """
     from flask_login import current_user
-    from app.security.security_ai import get_risk_details, get_face_verification_accuracy
-    
-    print(f"[DEBUG] get_security_metrics called, authenticated: {current_user.is_authenticated}")
+    from app.security.metrics_push import build_security_metrics
     
     if not current_user.is_authenticated:
-        print("[DEBUG] User not authenticated, returning 401")
         return jsonify({'success': False, 'message': 'Authentication required'}), 401
     
     try:
-        print(f"[DEBUG] Getting risk details for user: {current_user.username}")
-        # Get risk details
-        risk_details = get_risk_details(current_user.username)
-        
-        print(f"[DEBUG] Getting face verification accuracy for user ID: {current_user.id}")
-        # Get face verification accuracy
-        accuracy_metrics = get_face_verification_accuracy(current_user.id)
-        
-        print(f"[DEBUG] Risk details: {risk_details}, Face metrics: {accuracy_metrics}")
-        
-        # Combine and return metrics
-        metrics = {
-            'success': True,
-            'risk': {
-                'score': round(risk_details['risk_score'] * 100, 2),  # Convert to percentage
-                'level': risk_details['security_level'],
-                'factors': risk_details['risk_factors']
-            },
-            'face_verification': accuracy_metrics
-        }
+        # Connected tabs receive these over Socket.IO; this serves one-off requests
+        metrics = build_security_metrics(current_user.id, current_user.username)
         
         return jsonify(metrics)
-    except Exception as e:
-        print(f"Error retrieving security metrics: {str(e)}")
+    except Exception:
+        logger.exception('Error retrieving security metrics for user_%s', current_user.id)
         return jsonify({
             'success': False, 
             'message': 'Error retrieving security metrics'
         }), 500
+
+def _is_security_admin(user):
+    """Whether user may read every user's security events (SECURITY_ADMINS)."""
+    return user.is_authenticated and user.username in current_app.config.get('SECURITY_ADMINS', ())
+
+def _audit_filters():
+    """
+    (user_id, start, end, event_type) from the query string.
+
+    Security admins may pass any user_id (or none for all users); everyone
+    else only sees their own events. Raises ValueError on a malformed value.
+    """
+    from flask_login import current_user
+    user_id = request.args.get('user_id', type=int)
+    if not _is_security_admin(current_user):
+        user_id = current_user.id
+    start = request.args.get('start')
+    end = request.args.get('end')
+    event_type = request.args.get('type')
+    if event_type is not None and event_type not in EVENT_TYPES:
+        raise ValueError(f'Unknown event type: {event_type}')
+    return (user_id,
+            datetime.fromisoformat(start) if start else None,
+            datetime.fromisoformat(end) if end else None,
+            event_type)
+
+@security_blueprint.route('/audit/events', methods=['GET'])
+@login_required
+def audit_events():
+    """
+    One page of security events, newest first.
+
+    Query parameters: user_id (security admins only), start and end (ISO
+    8601, UTC), type, limit (1 to 500) and before (the 'next' value of
+    the previous page).
+    """
+    try:
+        user_id, start, end, event_type = _audit_filters()
+        limit = max(1, min(request.args.get('limit', 100, type=int), 500))
+        before = request.args.get('before')
+        if before:
+            timestamp, event_id = before.rsplit('_', 1)
+            before = (datetime.fromisoformat(timestamp), int(event_id))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    events = audit_log.events(user_id, start, end, event_type, limit=limit, before=before or None)
+    next_page = None
+    if events and len(events) == limit:
+        next_page = f"{events[-1]['timestamp'].isoformat()}_{events[-1]['id']}"
+    for security_event in events:
+        security_event['timestamp'] = security_event['timestamp'].isoformat()
+    return jsonify({'success': True, 'events': events, 'next': next_page})
+
+@security_blueprint.route('/audit/export', methods=['GET'])
+@login_required
+def audit_export():
+    """
+    Stream matching security events, oldest first, as JSON Lines or CSV (format=csv).
+
+    Takes the same filters as /audit/events. Rows are read and written in
+    batches, so the export never holds the whole log in memory.
+    """
+    try:
+        user_id, start, end, event_type = _audit_filters()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    batch_size = current_app.config.get('AUDIT_EXPORT_BATCH_SIZE', 1000)
+    rows = audit_log.iter_events(user_id, start, end, event_type, batch_size=batch_size)
+
+    if request.args.get('format') == 'csv':
+        def generate():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(AUDIT_COLUMNS)
+            for security_event in rows:
+                security_event['details'] = json.dumps(security_event['details']) if security_event['details'] else ''
+                writer.writerow([security_event[column] for column in AUDIT_COLUMNS])
+                if buffer.tell() > 65536:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        mimetype, extension = 'text/csv', 'csv'
+    else:
+        def generate():
+            chunk = []
+            for security_event in rows:
+                chunk.append(json.dumps(security_event, default=str))
+                if len(chunk) == 500:
+                    yield '\n'.join(chunk) + '\n'
+                    chunk = []
+            if chunk:
+                yield '\n'.join(chunk) + '\n'
+        mimetype, extension = 'application/x-ndjson', 'jsonl'
+
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=security_events.{extension}'})
+
+@security_blueprint.route('/metrics', methods=['GET'])
+@login_required
+def metrics():
+    """
+    Per-endpoint and per-event latency histograms, recent slow requests and
+    component counters (security admins only).
+    """
+    from flask_login import current_user
+    if not _is_security_admin(current_user):
+        return jsonify({'success': False, 'message': 'Security admins only'}), 403
+
+    from app.auth.identity import identity_cache
+    from app.messaging.delivery import delivery_queue
+    from app.messaging.ephemeral import ephemeral_channel
+    from app.security.devices import devices
+    from app.security.ip_reputation import ip_reputation
+    from app.security.risk_features import risk_features
+    from app.security.risk_model import risk_models
+    from app.utils.log import log_system
+    from app.utils.profiler import profiler
+    from app.utils.retention import retention_job
+    from app.utils.tracing import tracer
+
+    components = {
+        'tracing': tracer, 'logging': log_system, 'audit_log': audit_log, 'identity_cache': identity_cache,
+        'delivery_queue': delivery_queue, 'ephemeral_channel': ephemeral_channel, 'devices': devices,
+        'ip_reputation': ip_reputation, 'risk_features': risk_features, 'risk_models': risk_models,
+        'retention': retention_job, 'profiler': profiler
+    }
+    return jsonify({
+        'success': True,
+        'endpoints': tracer.endpoints(),
+        'slow': tracer.slow(),
+        'components': {name: component.stats() for name, component in components.items()}
+    })
+
+@security_blueprint.route('/profiler', methods=['GET', 'POST'])
+@login_required
+def profiler_control():
+    """
+    Sampling profiler control (security admins only).
+
+    POST starts a run: JSON {"seconds": 10, "interval_ms": 10, "threads":
+    "active" or "all"}. GET returns the running or last profile's summary,
+    or with format=collapsed its collapsed stacks for flamegraph tools.
+    """
+    from flask_login import current_user
+    from app.utils.profiler import ProfilerError, profiler
+    if not _is_security_admin(current_user):
+        return jsonify({'success': False, 'message': 'Security admins only'}), 403
+
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            profile = profiler.start(float(data.get('seconds', 10)), float(data.get('interval_ms', 10)) / 1000,
+                                     data.get('threads', 'active'))
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        except ProfilerError as e:
+            return jsonify({'success': False, 'message': str(e)}), 409
+        logger.warning('Profiler started by %s', current_user.username, extra={'event': 'profiler_start'})
+        return jsonify({'success': True, 'profile': profile.summary()}), 202
+
+    profile = profiler.current() or profiler.last()
+    if profile is None:
+        return jsonify({'success': False, 'message': 'No profile has been taken'}), 404
+    if request.args.get('format') == 'collapsed':
+        return Response(profile.collapsed(), mimetype='text/plain')
+    return jsonify({'success': True, 'running': profile is profiler.current(),
+                    'profile': profile.summary(request.args.get('top', 25, type=int))})
@@ -0,0 +1,165 @@
+"""
+Risk Scoring Module for SecureChat
+This module scores risk as pure functions over raw inputs, with no Flask
+request or session access, so it can score users offline.
+
+The weights, thresholds and per-factor transforms come from a compiled
+RiskModel (app/security/risk_model.py). Every function takes an optional
+model; without one the model shipped in risk_model.json is used, so
+results are reproducible. The login flow passes the live model instead.
+
+A feature vector has one factor value in [0.0, 1.0] per factor, in FACTORS
+order. score() weights one set of factor values and score_batch() weights a
+whole NumPy matrix of them in one pass.
+"""
+from datetime import datetime
+import numpy as np
+from app.security.risk_model import (
+    FACTORS, SECURITY_LEVEL_LOW, SECURITY_LEVEL_MEDIUM, SECURITY_LEVEL_HIGH, default_model
+)
+
+LEVEL_NAMES = {SECURITY_LEVEL_LOW: 'Low', SECURITY_LEVEL_MEDIUM: 'Medium', SECURITY_LEVEL_HIGH: 'High'}
+
+COMMON_BROWSERS = ('chrome', 'firefox', 'safari', 'edge')
+MOBILE_MARKERS = ('mobile', 'android', 'iphone')
+
+BLOCKLIST_CATEGORIES = frozenset(['blocklist', 'malware', 'botnet', 'spam'])
+ANONYMIZER_CATEGORIES = frozenset(['tor', 'proxy', 'vpn'])
+
+
+def location_state(known_ip, ip, category=None, known_network=False, known_country=None):
+    """
+    Location state of a login for the unusual_location factor.
+
+    'blocklisted' or 'anonymizer' when the IP reputation category says so;
+    otherwise 'same' or 'changed' against the IP the session first saw, and
+    for a new session 'known' (a network the user logged in from before),
+    'new_country' (a country the user never logged in from) or 'new'.
+
+    Args:
+        category (str): IP reputation category of ip, if any
+        known_network (bool): Whether ip is in one of the user's known networks
+        known_country (bool): Whether ip's country is one of the user's; None if either is unknown
+    """
+    if category in BLOCKLIST_CATEGORIES:
+        return 'blocklisted'
+    if category in ANONYMIZER_CATEGORIES:
+        return 'anonymizer'
+    if known_ip is not None:
+        return 'same' if known_ip == ip else 'changed'
+    if known_network:
+        return 'known'
+    if known_country is False:
+        return 'new_country'
+    return 'new'
+
+
+def device_class(user_agent):
+    """'mobile', 'uncommon' (possibly a bot) or 'desktop' for a user agent string."""
+    user_agent = (user_agent or '').lower()
+    if any(marker in user_agent for marker in MOBILE_MARKERS):
+        return 'mobile'
+    if not any(browser in user_agent for browser in COMMON_BROWSERS):
+        return 'uncommon'
+    return 'desktop'
+
+
+def device_state(device_class, known_device=False):
+    """'known' for a device the user logged in with before, otherwise its device class."""
+    return 'known' if known_device else device_class
+
+
+def days_since(last_login, now=None):
+    """Whole days since last_login, or None if the user never logged in."""
+    if not last_login:
+        return None
+    return ((now or datetime.utcnow()) - last_login).days
+
+
+def failed_attempts_risk(failures, model=None):
+    return (model or default_model()).transform('failed_attempts', failures)
+
+
+def location_risk(known_ip, ip, model=None):
+    return (model or default_model()).transform('unusual_location', location_state(known_ip, ip))
+
+
+def time_risk(hour, model=None):
+    return (model or default_model()).transform('time_risk', hour)
+
+
+def breach_risk(last_login, now=None, model=None):
+    return (model or default_model()).transform('previous_breaches', days_since(last_login, now))
+
+
+def device_risk(user_agent, model=None):
+    return (model or default_model()).transform('device_risk', device_class(user_agent))
+
+
+def score(factors, model=None):
+    """
+    Weighted risk score of one set of factor values.
+
+    Args:
+        factors (dict): Value in [0.0, 1.0] for each name in FACTORS
+
+    Returns:
+        float: Risk score between 0.0 and 1.0
+    """
+    return (model or default_model()).score(factors)
+
+
+def security_level(risk_score, model=None):
+    """Security level (1=Low, 2=Medium, 3=High) for a risk score."""
+    return (model or default_model()).level(risk_score)
+
+
+def score_batch(features, model=None):
+    """
+    Risk scores of many feature vectors at once.
+
+    Args:
+        features (ndarray): Shape (n, len(FACTORS)), columns in FACTORS order
+
+    Returns:
+        ndarray: Shape (n,) risk scores
+    """
+    return (model or default_model()).score_batch(features)
+
+
+def security_levels_batch(scores, model=None):
+    """Security levels for an array of risk scores."""
+    return (model or default_model()).levels_batch(scores)
+
+
+def batch_features(failures, days_since_login, hour, location=None, device=None, model=None):
+    """
+    Feature matrix for many users from precomputed inputs.
+
+    Location and device only exist for a live login, so offline scoring
+    passes one value for everyone (by default, a new location and a common
+    desktop browser).
+
+    Args:
+        failures (array): Failed verifications in the last 24 hours, per user
+        days_since_login (array): Days since last login per user; NaN if never
+        hour (int): Hour of day to assess the time factor at
+        location (float or array): unusual_location values
+        device (float or array): device_risk values
+
+    Returns:
+        ndarray: Shape (n, len(FACTORS))
+    """
+    model = model or default_model()
+    failures = np.asarray(failures, dtype=float)
+    n = failures.shape[0]
+
+    columns = {
+        'failed_attempts': model.transform_batch('failed_attempts', failures),
+        'unusual_location': np.broadcast_to(
+            model.transform('unusual_location', 'new') if location is None else location, n),
+        'time_risk': np.full(n, model.transform('time_risk', hour)),
+        'previous_breaches': model.transform_batch('previous_breaches', days_since_login),
+        'device_risk': np.broadcast_to(model.transform('device_risk', 'desktop') if device is None else device, n),
+    }
+    return np.column_stack([columns[factor] for factor in FACTORS])
@@ -1,27 +1,36 @@
 """
 Security AI Module for SecureChat
 This module provides AI-based security level determination for multi-factor authentication.
+
+The risk model itself is loaded by app/security/risk_model.py; the functions
+here gather its inputs from the current request, session and database.
 """
 import time
-from datetime import datetime, timedelta
-import ipaddress
+import copy
+import logging
+from datetime import datetime
 from flask import request, session
-from app.models.models import FaceVerificationLog, User
+from app.models.models import User
+from app.security.risk_features import risk_features
+from app.security.ip_reputation import ip_reputation, known_networks, network_of
+from app.security.devices import devices
+from app.security import scoring
+from app.security.risk_model import risk_models, SECURITY_LEVEL_LOW, SECURITY_LEVEL_MEDIUM, SECURITY_LEVEL_HIGH
 
-# Security levels
-SECURITY_LEVEL_LOW = 1      # Password only
-SECURITY_LEVEL_MEDIUM = 2   # Password + CAPTCHA
-SECURITY_LEVEL_HIGH = 3     # Password + CAPTCHA + Face Verification
+logger = logging.getLogger(__name__)
 
-# Risk factors weights
-WEIGHTS = {
-    'failed_attempts': 0.3,
-    'unusual_location': 0.2,
-    'time_risk': 0.15,
-    'previous_breaches': 0.2,
-    'device_risk': 0.15
+FACTOR_DESCRIPTIONS = {
+    'failed_attempts': 'Failed login attempts',
+    'unusual_location': 'Unusual login location',
+    'time_risk': 'Time of login risk',
+    'previous_breaches': 'Account security history',
+    'device_risk': 'Device type risk'
 }
 
+def _query(model, db_session=None):
+    """Query a model through db_session, or through db.session by default."""
+    return db_session.query(model) if db_session is not None else model.query
+
 def calculate_security_level(username):
     """
     Calculate the security level required for a user based on various risk factors.
@@ -42,12 +51,7 @@ def calculate_security_level(username):
     risk_score = calculate_risk_score(user)
     
     # Determine security level based on risk score
-    if risk_score < 0.3:
-        return SECURITY_LEVEL_LOW
-    elif risk_score < 0.7:
-        return SECURITY_LEVEL_MEDIUM
-    else:
-        return SECURITY_LEVEL_HIGH
+    return risk_models.live().level(risk_score)
     
 def calculate_risk_score(user):
     """
@@ -59,126 +63,116 @@ def calculate_risk_score(user):
     Returns:
         float: Risk score between 0.0 and 1.0
     """
-    risk_factors = {}
-    
     try:
-        # 1. Failed login attempts
-        risk_factors['failed_attempts'] = get_failed_attempts_risk(user)
-        
-        # 2. Unusual location/IP
-        risk_factors['unusual_location'] = get_location_risk()
-        
-        # 3. Time of day risk
-        risk_factors['time_risk'] = get_time_risk()
-        
-        # 4. Previous security breaches
-        risk_factors['previous_breaches'] = get_previous_breaches_risk(user)
-        
-        # 5. Device risk
-        risk_factors['device_risk'] = get_device_risk()
-        
-        # Calculate weighted average
-        weighted_score = sum(risk_factors[factor] * WEIGHTS[factor] for factor in risk_factors)
-        
-        return weighted_score
-    except Exception as e:
-        print(f"Error calculating risk score: {str(e)}")
+        _, risk_score, _ = risk_models.evaluate(get_risk_inputs(user))
+        return risk_score
+    except Exception:
+        logger.exception('Error calculating risk score')
         # Return a moderate risk score as fallback
         return 0.5
 
-def get_failed_attempts_risk(user):
+def get_risk_inputs(user, db_session=None):
+    """
+    Raw risk model inputs for a login by user from the current request.
+
+    Note that this records the client's IP in the session if it has none yet.
+    """
+    return {
+        # Failed face verification attempts in the last 24 hours, from the feature store
+        'failed_attempts': risk_features.failed_attempts(user.id, db_session),
+        'unusual_location': get_location_state(user, db_session),
+        'time_risk': datetime.now().hour,
+        'previous_breaches': scoring.days_since(user.last_login, datetime.utcnow()),
+        'device_risk': get_device_state(user, db_session)
+    }
+
+def get_failed_attempts_risk(user, db_session=None):
     """Calculate risk based on recent failed login attempts"""
-    # Get failed face verification attempts in the last 24 hours
-    one_day_ago = datetime.utcnow() - timedelta(days=1)
-    failed_verifications = FaceVerificationLog.query.filter_by(
-        user_id=user.id, 
-        success=False
-    ).filter(FaceVerificationLog.timestamp >= one_day_ago).count()
-    
-    # Simple scaling: 0 failures = 0.0, 5+ failures = 1.0
-    return min(failed_verifications / 5.0, 1.0)
+    failed_verifications = risk_features.failed_attempts(user.id, db_session)
+    return risk_models.live().transform('failed_attempts', failed_verifications)
 
-def get_location_risk():
-    """Calculate risk based on IP address/location"""
+def get_location_state(user=None, db_session=None):
+    """
+    Location state of the client's IP (see scoring.location_state): its
+    reputation, the IP this session first saw and the user's known networks
+    """
     # Store a session fingerprint of IP
     ip = request.remote_addr
+    known_ip = session.get('known_ip')
     
-    # Check if this is a new IP for this user session
-    if 'known_ip' not in session:
+    # Remember the first IP seen in this session
+    if known_ip is None:
         session['known_ip'] = ip
-        # New IP is moderate risk
-        return 0.5
     
-    # If IP changed during session, high risk
-    if session['known_ip'] != ip:
-        return 0.9
+    reputation = ip_reputation.lookup(ip)
+    known_network, known_country = False, None
+    if user is not None and known_ip is None:
+        networks = known_networks(user.id, db_session)
+        known_network = network_of(ip) in networks
+        countries = {country for country in networks.values() if country}
+        if reputation is not None and reputation.country and countries:
+            known_country = reputation.country in countries
     
-    # Known IP from session, lower risk
-    return 0.1
+    return scoring.location_state(known_ip, ip, reputation.category if reputation else None,
+                                  known_network, known_country)
+
+def get_location_risk():
+    """Calculate risk based on IP address/location"""
+    return risk_models.live().transform('unusual_location', get_location_state())
 
 def get_time_risk():
     """Calculate risk based on time of day"""
-    current_hour = datetime.now().hour
-    
-    # Business hours (9 AM to 6 PM) considered lower risk
-    if 9 <= current_hour <= 18:
-        return 0.2
-    # Early morning (5 AM to 9 AM) or evening (6 PM to 11 PM) is medium risk
-    elif 5 <= current_hour < 9 or 18 < current_hour <= 23:
-        return 0.5
-    # Late night/early morning (11 PM to 5 AM) is higher risk
-    else:
-        return 0.8
+    return risk_models.live().transform('time_risk', datetime.now().hour)
 
 def get_previous_breaches_risk(user):
     """Calculate risk based on previous account security incidents"""
     # For demo, we'll use last_login as a simple proxy
-    # If user has never logged in before, moderate risk
-    if not user.last_login:
-        return 0.5
-    
-    # If user hasn't logged in for 30+ days, higher risk
-    days_since_login = (datetime.utcnow() - user.last_login).days if user.last_login else 0
-    if days_since_login > 30:
-        return 0.8
-    elif days_since_login > 7:
-        return 0.5
-    else:
-        return 0.2
+    return risk_models.live().transform('previous_breaches', scoring.days_since(user.last_login, datetime.utcnow()))
+
+def current_device():
+    """DeviceFingerprint of the current request's user agent"""
+    return devices.parse(request.user_agent.string)
+
+def get_device_state(user=None, db_session=None):
+    """'known' if the user logged in from this device before, otherwise its device class"""
+    fingerprint = current_device()
+    known_device = user is not None and devices.is_known(user.id, fingerprint, db_session)
+    return scoring.device_state(fingerprint.device_class, known_device)
 
 def get_device_risk():
     """Calculate risk based on device fingerprint"""
-    # Simple user agent based analysis
-    user_agent = request.user_agent.string.lower()
-    
-    # Check for mobile devices (generally higher risk than desktops)
-    if 'mobile' in user_agent or 'android' in user_agent or 'iphone' in user_agent:
-        return 0.6
-    
-    # Check for uncommon browsers (might be bots or unusual clients)
-    common_browsers = ['chrome', 'firefox', 'safari', 'edge']
-    if not any(browser in user_agent for browser in common_browsers):
-        return 0.7
-        
-    # Default for common desktop browsers
-    return 0.3
+    return risk_models.live().transform('device_risk', get_device_state())
 
-def get_risk_details(username):
+def get_risk_details(username, db_session=None):
     """
     Get detailed risk assessment information for a user
     
     Args:
         username (str): The username to assess
+        db_session (Session): Session to read with, e.g. a read_session(); defaults to db.session
         
     Returns:
         dict: Dictionary containing risk assessment details
     """
     try:
-        user = User.query.filter_by(username=username).first()
+        # Everything the assessment depends on besides stored user data
+        manual_security_level = request.environ.get('HTTP_X_MANUAL_SECURITY_LEVEL')
+        cache_key = (username, manual_security_level, session.get('known_ip'), request.remote_addr,
+                     datetime.now().hour, current_device().id, risk_models.live().fingerprint)
+        cached = risk_features.cached_assessment(cache_key)
+        if cached is not None:
+            known_user, details = cached
+            if known_user:
+                # Keep the session side effect of a fresh assessment
+                get_location_state()
+            # Callers adjust the returned dict, so hand out a copy
+            return copy.deepcopy(details)
+
+        user = _query(User, db_session).filter_by(username=username).first()
         
         if not user:
             # Ensure all values are JSON-serializable
-            return {
+            details = {
                 'security_level': 'Medium',
                 'security_level_num': SECURITY_LEVEL_MEDIUM,
                 'risk_score': 0.5,
@@ -191,22 +185,18 @@ def get_risk_details(username):
                 },
                 'required_factors': ['Password', 'CAPTCHA']
             }
+            risk_features.store_assessment(cache_key, (False, details))
+            return copy.deepcopy(details)
+
+        # Calculate risk factors and the overall score with the live model (and any shadow model)
+        factor_scores, risk_score, assessed_level = risk_models.evaluate(get_risk_inputs(user, db_session))
 
-        # Calculate risk factors and scores - ensure all are JSON serializable (float values)
+        # Ensure all are JSON serializable (float values)
         risk_factors = {
-            'failed_attempts': {'score': float(get_failed_attempts_risk(user)), 'description': 'Failed login attempts'},
-            'unusual_location': {'score': float(get_location_risk()), 'description': 'Unusual login location'},
-            'time_risk': {'score': float(get_time_risk()), 'description': 'Time of login risk'},
-            'previous_breaches': {'score': float(get_previous_breaches_risk(user)), 'description': 'Account security history'},
-            'device_risk': {'score': float(get_device_risk()), 'description': 'Device type risk'}
+            factor: {'score': float(factor_scores[factor]), 'description': FACTOR_DESCRIPTIONS[factor]}
+            for factor in scoring.FACTORS
         }
 
-        # Calculate overall risk score
-        risk_score = float(sum(risk_factors[factor]['score'] * WEIGHTS[factor] for factor in risk_factors))
-
-        # Check if there's a manual security level override in the session
-        manual_security_level = request.environ.get('HTTP_X_MANUAL_SECURITY_LEVEL')
-        
         # Determine security level
         if manual_security_level:
             try:
@@ -228,11 +218,11 @@ def get_risk_details(username):
         
         # If no manual override, use AI-based assessment
         if not manual_security_level:
-            if risk_score < 0.3:
+            if assessed_level == SECURITY_LEVEL_LOW:
                 security_level = 'Low'
                 security_level_num = SECURITY_LEVEL_LOW
                 required_factors = ['Password']
-            elif risk_score < 0.7:
+            elif assessed_level == SECURITY_LEVEL_MEDIUM:
                 security_level = 'Medium'
                 security_level_num = SECURITY_LEVEL_MEDIUM
                 required_factors = ['Password', 'CAPTCHA']
@@ -241,16 +231,18 @@ def get_risk_details(username):
                 security_level_num = SECURITY_LEVEL_HIGH
                 required_factors = ['Password', 'CAPTCHA', 'Face Verification']
 
-        return {
+        details = {
             'security_level': security_level,
             'security_level_num': security_level_num,
             'risk_score': risk_score,
             'risk_factors': risk_factors,
             'required_factors': required_factors
         }
+        risk_features.store_assessment(cache_key, (True, details), user.id)
+        return copy.deepcopy(details)
 
-    except Exception as e:
-        print(f"Error in get_risk_details: {str(e)}")
+    except Exception:
+        logger.exception('Error in get_risk_details')
         # Return a default medium security level
         return {
             'security_level': 'Medium',
@@ -307,34 +299,30 @@ def get_breach_description(user):
 
 def get_device_description():
     """Get human-readable description of device risk"""
-    user_agent = request.user_agent.string.lower()
+    device_class = current_device().device_class
     
-    if 'mobile' in user_agent or 'android' in user_agent or 'iphone' in user_agent:
+    if device_class == 'mobile':
         return "Login from mobile device"
     
-    common_browsers = ['chrome', 'firefox', 'safari', 'edge']
-    if not any(browser in user_agent for browser in common_browsers):
+    if device_class == 'uncommon':
         return "Login from uncommon browser"
         
     return "Login from desktop with common browser"
 
-def get_face_verification_accuracy(user_id):
+def get_face_verification_accuracy(user_id, db_session=None):
     """
     Calculate the face verification accuracy based on historical verification attempts
     
     Args:
         user_id: The ID of the user to calculate accuracy for
+        db_session (Session): Session to read with; defaults to db.session
         
     Returns:
         dict: Dictionary containing accuracy metrics
     """
     try:
-        from app.models.models import FaceVerificationLog
-        
-        # Get total verifications in the last 30 days
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        total_verifications = FaceVerificationLog.query.filter_by(user_id=user_id)\
-            .filter(FaceVerificationLog.timestamp >= thirty_days_ago).count()
+        # Verifications in the last 30 days, from the feature store
+        total_verifications, successful_verifications = risk_features.verification_counts(user_id, db_session)
         
         if total_verifications == 0:
             return {
@@ -345,12 +333,6 @@ def get_face_verification_accuracy(user_id):
                 'confidence': 'No data'
             }
         
-        # Get successful verifications
-        successful_verifications = FaceVerificationLog.query.filter_by(
-            user_id=user_id,
-            success=True
-        ).filter(FaceVerificationLog.timestamp >= thirty_days_ago).count()
-        
         # Calculate accuracy
         accuracy = (successful_verifications / total_verifications) * 100
         
@@ -369,8 +351,8 @@ def get_face_verification_accuracy(user_id):
             'failed_attempts': total_verifications - successful_verifications,
             'confidence': confidence
         }
-    except Exception as e:
-        print(f"Error calculating face verification accuracy: {str(e)}")
+    except Exception:
+        logger.exception('Error calculating face verification accuracy')
         return {
             'accuracy': 0,
             'total_attempts': 0,
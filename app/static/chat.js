@@ -30,11 +30,26 @@ document.addEventListener('DOMContentLoaded', function () {
     const fileNameDisplay = document.getElementById('fileNameDisplay');
     const faceLockedCheckbox = document.getElementById('faceLocked'); // Get the checkbox
     const currentUserId = document.body.dataset.userId;
+    const newGroupButton = document.getElementById('newGroupButton');
+    const unreadCounts = {}; // conversation key (peer user id or 'group:<id>') -> unread message count
+    const groups = {}; // group conversation id -> {title, lastMessageId}
+    const typingIndicator = document.getElementById('typingIndicator');
+    const typingUsers = {}; // conversation key -> {username: expiry timer}
+    const readMarkers = {}; // conversation key -> "Seen by ..." text
+    const TYPING_REFRESH_MS = 2000; // Re-announce typing at most this often
+    const TYPING_IDLE_MS = 3000; // Stop typing after this long without input
+    const TYPING_EXPIRY_MS = 5000; // Hide a peer's indicator if no update arrives
+    let typingSentAt = 0;
+    let typingTarget = null; // select value the typing indicator was sent to
+    let typingStopTimer = null;
+    const renderedMessageIds = new Set();
     
     let socket;
 
     try {
         socket = io({
+            // Offer compact binary message events; the server falls back to JSON
+            auth: { encodings: EventCodec.supported() },
             reconnection: true,
             reconnectionAttempts: Infinity,
             reconnectionDelay: 1000,
@@ -42,8 +57,21 @@ document.addEventListener('DOMContentLoaded', function () {
             randomizationFactor: 0.5
         });
 
+        // Show cached history immediately; the server fills in the gap on connect
+        const cacheReady = MessageCache.open(currentUserId)
+            .then(() => MessageCache.getRecent(50))
+            .then(messages => messages.forEach(renderStoredMessage))
+            .catch(error => console.warn("Local message cache unavailable:", error));
+
         socket.on('connect', function () {
             console.log('Connected to server with SID:', socket.id);
+            fetchConversationSummaries();
+            cacheReady.then(syncMessages);
+        });
+
+        socket.on('encoding', function (info) {
+            console.log('Message event encoding:', info.encoding);
+            EventCodec.configure(info);
         });
 
         socket.on('disconnect', function (reason) {
@@ -66,23 +94,79 @@ document.addEventListener('DOMContentLoaded', function () {
                     if (String(user.id) !== String(currentUserId)) {
                         const option = document.createElement('option');
                         option.value = user.id;
-                        option.textContent = user.username;
+                        option.dataset.username = user.username;
+                        option.textContent = formatRecipientLabel(user.id, user.username);
                         if (String(user.id) === currentRecipient) {
                             option.selected = true;
                         }
                         recipientInput.appendChild(option);
                     }
                 });
+                renderGroupOptions(currentRecipient);
                 console.log('Recipient dropdown updated');
             } else {
                 console.error("Recipient select element not found.");
             }
         });
 
+        // Per-conversation summary deltas pushed by the server on send/read
+        socket.on('conversation_update', function (summary) {
+            const key = conversationKey(summary);
+            if (summary.is_group && summary.unread_count === null) {
+                // Shared group update: count new messages from others unless the group is open
+                const group = rememberGroup(summary);
+                const last = summary.last_message;
+                if (last && last.id > group.lastMessageId) {
+                    group.lastMessageId = last.id;
+                    if (String(last.sender_id) !== String(currentUserId) && (!recipientInput || recipientInput.value !== key)) {
+                        unreadCounts[key] = (unreadCounts[key] || 0) + 1;
+                    }
+                }
+            } else {
+                if (summary.is_group) rememberGroup(summary);
+                unreadCounts[key] = summary.unread_count;
+            }
+            refreshRecipientLabels();
+        });
+
+        // Typing and read indicators; never stored, coalesced by the server
+        socket.on('ephemeral', function (event) {
+            if (String(event.sender_id) === String(currentUserId)) return;
+            const key = event.conversation_id ? `group:${event.conversation_id}` : String(event.sender_id);
+            if (event.kind === 'typing') {
+                const users = typingUsers[key] = typingUsers[key] || {};
+                clearTimeout(users[event.sender_username]);
+                if (event.state) {
+                    users[event.sender_username] = setTimeout(() => {
+                        delete users[event.sender_username];
+                        renderIndicator();
+                    }, TYPING_EXPIRY_MS);
+                } else {
+                    delete users[event.sender_username];
+                }
+            } else if (event.kind === 'read') {
+                readMarkers[key] = `Seen by ${event.sender_username}`;
+            }
+            renderIndicator();
+        });
+
+        socket.on('conversation_removed', function (data) {
+            delete groups[data.conversation_id];
+            delete unreadCounts[`group:${data.conversation_id}`];
+            renderGroupOptions(recipientInput ? recipientInput.value : '');
+        });
+
         socket.on('new_message', function (data) {
+            data = EventCodec.decode(data);
             console.log("[DEBUG] Received new_message event with data:", data);
             const isCurrentUserSender = String(data.sender_id) === String(currentUserId);
-            if (isCurrentUserSender || String(data.recipient_id) === String(currentUserId)) {
+            if (!isCurrentUserSender && Number.isInteger(data.id)) {
+                // Confirm receipt so the server stops retrying; retries may repeat a message
+                socket.emit('ack', { ids: [data.id] });
+                if (renderedMessageIds.has(data.id)) return;
+            }
+            const isGroupMessage = data.recipient_id === null;
+            if (isCurrentUserSender || isGroupMessage || String(data.recipient_id) === String(currentUserId)) {
                 console.log("[DEBUG] Processing new_message event:", data);
                 // --- MODIFICATION: Check for is_face_locked ---
                 if (data.is_face_locked && !isCurrentUserSender) { // Only show locked for recipient
@@ -95,19 +179,37 @@ document.addEventListener('DOMContentLoaded', function () {
                 } else {
                     addMessageToUI(data.content, data.sender_username, isCurrentUserSender, data.is_face_locked);
                 }
+                rememberMessage(data);
+                // Reading the open conversation keeps its unread counter at zero
+                if (!isCurrentUserSender && recipientInput) {
+                    const key = isGroupMessage ? `group:${data.conversation_id}` : String(data.sender_id);
+                    if (key === recipientInput.value) {
+                        socket.emit('mark_read', Object.assign(conversationTarget(key), { message_id: data.id }));
+                    }
+                }
             }
         });
 
         socket.on('new_file', function (data) {
+            data = EventCodec.decode(data);
             console.log("[DEBUG] Received new_file event with data:", data);
             const isCurrentUserSender = String(data.sender_id) === String(currentUserId);
-            if (isCurrentUserSender || String(data.recipient_id) === String(currentUserId)) {
+            if (!isCurrentUserSender && Number.isInteger(data.id)) {
+                // Confirm receipt so the server stops retrying; retries may repeat a message
+                socket.emit('ack', { ids: [data.id] });
+                if (renderedMessageIds.has(data.id)) return;
+            }
+            if (isCurrentUserSender || data.recipient_id === null || String(data.recipient_id) === String(currentUserId)) {
                 // --- MODIFICATION: Check for is_face_locked ---
                 if (data.is_face_locked && !isCurrentUserSender) { // Only show locked for recipient
                     addLockedItemToUI('file', data.sender_username, data);
                 } else {
                     addFileToUI(data.file_url, data.file_name, data.sender_username, isCurrentUserSender, data.is_face_locked);
                 }
+                rememberMessage(Object.assign({}, data, {
+                    content: `Shared file: ${data.file_name}`,
+                    file_path: data.file_url
+                }));
             }
         });
 
@@ -134,6 +236,14 @@ document.addEventListener('DOMContentLoaded', function () {
             }
         });
 
+        // Sent once on connect, then whenever the server sees a risk input change
+        socket.on('security_metrics', function (data) {
+            if (data.success) {
+                updateSecurityDisplay(data);
+            }
+            document.dispatchEvent(new CustomEvent('securitymetrics', { detail: data }));
+        });
+
         // --- NEW: Add this listener for intruder alerts ---
         socket.on('intruder_alert', function (data) {
             console.log("[INTRUDER-ALERT] Received intruder alert:", data);
@@ -157,17 +267,72 @@ document.addEventListener('DOMContentLoaded', function () {
                     return;
                 }
                 console.log("[DEBUG] Emitting send_message event with:", { content, recipient_id: recipientId, face_locked: isFaceLocked });
-                socket.emit('send_message', {
+                socket.emit('send_message', Object.assign(conversationTarget(recipientId), {
                     content: content,
-                    recipient_id: recipientId,
                     face_locked: isFaceLocked // --- MODIFICATION: Send status ---
+                }), function (result) {
+                    // Only group sends reply; face-locked group messages are refused
+                    if (result && !result.success) showCustomAlert(result.message);
                 });
                 messageInput.value = '';
+                stopTyping();
+                // A new message has not been seen yet
+                delete readMarkers[recipientId];
+                renderIndicator();
+            });
+
+            messageInput.addEventListener('input', function () {
+                if (!recipientInput.value) return;
+                const now = Date.now();
+                if (now - typingSentAt > TYPING_REFRESH_MS || typingTarget !== recipientInput.value) {
+                    typingSentAt = now;
+                    typingTarget = recipientInput.value;
+                    sendTyping(typingTarget, true);
+                }
+                clearTimeout(typingStopTimer);
+                typingStopTimer = setTimeout(stopTyping, TYPING_IDLE_MS);
             });
         } else {
             console.error("Message form not found.");
         }
 
+        function sendTyping(target, state) {
+            socket.emit('ephemeral', Object.assign(conversationTarget(target), {
+                kind: 'typing',
+                state: state
+            }));
+        }
+
+        function stopTyping() {
+            clearTimeout(typingStopTimer);
+            if (typingTarget) sendTyping(typingTarget, false);
+            typingSentAt = 0;
+            typingTarget = null;
+        }
+
+        function renderIndicator() {
+            if (!typingIndicator || !recipientInput) return;
+            const key = recipientInput.value;
+            const names = Object.keys(typingUsers[key] || {});
+            if (names.length > 0) {
+                typingIndicator.textContent = names.length === 1
+                    ? `${names[0]} is typing...`
+                    : `${names.join(', ')} are typing...`;
+            } else {
+                typingIndicator.textContent = readMarkers[key] || '';
+            }
+        }
+
+        if (recipientInput) {
+            recipientInput.addEventListener('change', function () {
+                stopTyping();
+                renderIndicator();
+                if (recipientInput.value && unreadCounts[recipientInput.value]) {
+                    socket.emit('mark_read', conversationTarget(recipientInput.value));
+                }
+            });
+        }
+
         if (fileInput && fileNameDisplay) {
             fileInput.addEventListener('change', () => {
                 if (fileInput.files.length > 0) {
@@ -196,7 +361,8 @@ document.addEventListener('DOMContentLoaded', function () {
                 sendFileButton.disabled = true;
                 const formData = new FormData();
                 formData.append('file', file);
-                formData.append('recipient_id', recipientId);
+                const target = conversationTarget(recipientId);
+                Object.keys(target).forEach(name => formData.append(name, target[name]));
                 // --- MODIFICATION: Send face_locked status with FormData for the HTTP request if needed by /upload_file ---
                 // Note: For SocketIO, we'll pass it after successful upload.
                 // If /upload_file endpoint itself needs to know, you'd add it here:
@@ -231,11 +397,12 @@ document.addEventListener('DOMContentLoaded', function () {
                         // --- MODIFICATION: Emit new_file with face_locked status ---
                         // The server's /upload_file should return file_url and file_name
                         // Then the client emits this info via SocketIO
-                        socket.emit('new_file', {
+                        socket.emit('new_file', Object.assign(conversationTarget(recipientId), {
                             file_url: data.file_url,
                             file_name: data.file_name,
-                            recipient_id: recipientId,
                             face_locked: isFaceLocked // Send status here
+                        }), function (result) {
+                            if (result && !result.success) showCustomAlert(result.message);
                         });
                         console.log("File uploaded, server will emit event via SocketIO.");
                     } else {
@@ -256,6 +423,160 @@ document.addEventListener('DOMContentLoaded', function () {
             console.error("Send file button not found.");
         }
 
+        // Normalize live and synced payloads into one cached record shape
+        function toCachedMessage(data) {
+            const senderUsername = data.sender_username || (data.sender && data.sender.username);
+            const lockedForMe = data.is_face_locked && String(data.sender_id) !== String(currentUserId);
+            return {
+                id: data.id,
+                conversation_id: data.conversation_id,
+                sender_id: data.sender_id,
+                sender_username: senderUsername,
+                recipient_id: data.recipient_id,
+                // Locked content must be unlocked by face each time, never cached
+                content: lockedForMe ? null : data.content,
+                file_path: data.file_path || data.file_url || null,
+                is_face_locked: !!data.is_face_locked,
+                timestamp: data.timestamp || null
+            };
+        }
+
+        function rememberMessage(data) {
+            if (!Number.isInteger(data.id)) return;
+            renderedMessageIds.add(data.id);
+            MessageCache.putMessages([toCachedMessage(data)])
+                .catch(error => console.warn("Failed to cache message:", error));
+        }
+
+        function renderStoredMessage(msg) {
+            if (renderedMessageIds.has(msg.id)) return;
+            renderedMessageIds.add(msg.id);
+            const isCurrentUserSender = String(msg.sender_id) === String(currentUserId);
+            if (msg.is_face_locked && !isCurrentUserSender) {
+                addLockedItemToUI(msg.file_path ? 'file' : 'message', msg.sender_username, msg);
+            } else if (msg.file_path) {
+                addFileToUI(msg.file_path, msg.content.replace(/^Shared file: /, ''),
+                    msg.sender_username, isCurrentUserSender, msg.is_face_locked);
+            } else {
+                addMessageToUI(msg.content, msg.sender_username, isCurrentUserSender, msg.is_face_locked);
+            }
+        }
+
+        // Ask the server only for messages newer than what is cached locally
+        function syncMessages() {
+            MessageCache.getCursors().then(cursors => {
+                socket.emit('sync', { cursors: cursors }, function (result) {
+                    if (!result || !result.success) return;
+                    let needsMore = false;
+                    const updates = result.conversations.map(conversation => {
+                        const messages = conversation.messages.map(toCachedMessage);
+                        const reset = conversation.reset
+                            ? MessageCache.resetConversation(conversation.conversation_id)
+                            : Promise.resolve();
+                        needsMore = needsMore || conversation.has_more;
+                        messages.forEach(renderStoredMessage);
+                        return reset.then(() => MessageCache.putMessages(messages));
+                    });
+                    Promise.all(updates)
+                        .then(() => { if (needsMore) syncMessages(); })
+                        .catch(error => console.warn("Failed to store synced messages:", error));
+                });
+            });
+        }
+
+        function fetchConversationSummaries() {
+            fetch('/conversations', { credentials: 'same-origin' })
+                .then(response => response.json())
+                .then(data => {
+                    if (!data.success) return;
+                    data.conversations.forEach(summary => {
+                        if (summary.is_group) rememberGroup(summary);
+                        unreadCounts[conversationKey(summary)] = summary.unread_count;
+                    });
+                    renderGroupOptions(recipientInput ? recipientInput.value : '');
+                })
+                .catch(error => console.error("Error fetching conversation summaries:", error));
+        }
+
+        // Select values are peer user ids for direct chats and 'group:<id>' for groups
+        function conversationKey(summary) {
+            return summary.is_group ? `group:${summary.conversation_id}` : String(summary.peer.id);
+        }
+
+        function conversationTarget(selectValue) {
+            return String(selectValue).startsWith('group:')
+                ? { conversation_id: Number(String(selectValue).slice(6)) }
+                : { recipient_id: selectValue };
+        }
+
+        function rememberGroup(summary) {
+            const group = groups[summary.conversation_id] || { lastMessageId: 0 };
+            group.title = summary.title;
+            if (!groups[summary.conversation_id]) {
+                groups[summary.conversation_id] = group;
+                if (summary.last_message) group.lastMessageId = summary.last_message.id;
+                renderGroupOptions(recipientInput ? recipientInput.value : '');
+            }
+            return group;
+        }
+
+        function renderGroupOptions(currentValue) {
+            if (!recipientInput) return;
+            const existing = recipientInput.querySelector('optgroup[data-groups]');
+            if (existing) existing.remove();
+            const ids = Object.keys(groups);
+            if (ids.length === 0) return;
+            const optgroup = document.createElement('optgroup');
+            optgroup.label = 'Groups';
+            optgroup.dataset.groups = 'true';
+            ids.forEach(id => {
+                const option = document.createElement('option');
+                option.value = `group:${id}`;
+                option.dataset.username = groups[id].title;
+                option.textContent = formatRecipientLabel(option.value, groups[id].title);
+                option.selected = option.value === currentValue;
+                optgroup.appendChild(option);
+            });
+            recipientInput.appendChild(optgroup);
+        }
+
+        if (newGroupButton) {
+            newGroupButton.addEventListener('click', function () {
+                const title = prompt('Group name:');
+                if (!title) return;
+                const names = (prompt('Members (comma-separated usernames of online users):') || '')
+                    .split(',').map(name => name.trim()).filter(Boolean);
+                const memberIds = [];
+                recipientInput.querySelectorAll('option[data-username]').forEach(option => {
+                    if (!option.value.startsWith('group:') && names.includes(option.dataset.username)) {
+                        memberIds.push(Number(option.value));
+                    }
+                });
+                const csrfToken = document.querySelector('meta[name="csrf-token"]').getAttribute('content');
+                fetch('/groups', {
+                    method: 'POST',
+                    credentials: 'same-origin',
+                    headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken },
+                    body: JSON.stringify({ title: title, member_ids: memberIds })
+                })
+                    .then(response => response.json())
+                    .then(data => { if (!data.success) showCustomAlert(data.message); })
+                    .catch(error => console.error("Error creating group:", error));
+            });
+        }
+
+        function formatRecipientLabel(userId, username) {
+            const unread = unreadCounts[userId] || 0;
+            return unread > 0 ? `${username} (${unread})` : username;
+        }
+
+        function refreshRecipientLabels() {
+            if (!recipientInput) return;
+            recipientInput.querySelectorAll('option[data-username]').forEach(option => {
+                option.textContent = formatRecipientLabel(option.value, option.dataset.username);
+            });
+        }
+
         function addMessageToUI(content, senderUsername, isCurrentUserSender, isLockedForSender = false) {
             // For face-locked messages that need to be unlocked
             if (isLockedForSender && !isCurrentUserSender) {
@@ -512,46 +833,6 @@ document.addEventListener('DOMContentLoaded', function () {
         });
     }
     
-    // Fetch security metrics
-    function fetchSecurityMetrics() {
-        // Get CSRF token
-        const csrfTokenMeta = document.querySelector('meta[name="csrf-token"]');
-        const csrfToken = csrfTokenMeta ? csrfTokenMeta.getAttribute('content') : null;
-        
-        if (!csrfToken) {
-            console.error("CSRF token not found.");
-            return;
-        }
-        
-        console.log("Fetching security metrics from: /security/get_security_metrics");
-        fetch('/security/get_security_metrics', {
-            method: 'GET',
-            headers: {
-                'X-CSRFToken': csrfToken,
-                'Content-Type': 'application/json'
-            },
-            credentials: 'same-origin' // Add credentials to ensure cookies are sent
-        })
-        .then(response => {
-            console.log("Security metrics response status:", response.status);
-            if (!response.ok) {
-                throw new Error(`HTTP error! Status: ${response.status}`);
-            }
-            return response.json();
-        })
-        .then(data => {
-            console.log("Security metrics data received:", JSON.stringify(data, null, 2));
-            if (data.success) {
-                updateSecurityDisplay(data);
-            } else {
-                console.error("Failed to get security metrics:", data.message);
-            }
-        })
-        .catch(error => {
-            console.error("Error fetching security metrics:", error);
-        });
-    }
-    
     // Update security display
     function updateSecurityDisplay(data) {
         const risk = data.risk;
@@ -657,14 +938,6 @@ document.addEventListener('DOMContentLoaded', function () {
             .join(' ');
     }
     
-    // Initial fetch
-    if (securityRisk || faceAccuracy) {
-        fetchSecurityMetrics();
-        
-        // Refresh metrics every 60 seconds
-        setInterval(fetchSecurityMetrics, 60000);
-    }
-    
     // Risk level indicator update
     function updateRiskLevelIndicator(riskData) {
         const riskIndicatorDot = document.getElementById('riskIndicatorDot');
@@ -0,0 +1,111 @@
+// event_codec.js
+// Decoder for SecureChat message events.
+// The server sends 'new_message'/'new_file' either as a JSON object or, when
+// negotiated at connect, as a MessagePack array [version, ...fields] whose
+// field order arrives in the 'encoding' event.
+const EventCodec = (function () {
+    const SUPPORTED = ('TextDecoder' in window) ? ['msgpack', 'json'] : ['json'];
+    const textDecoder = SUPPORTED.length > 1 ? new TextDecoder() : null;
+    const fieldsByVersion = {};
+
+    function supported() {
+        return SUPPORTED.slice();
+    }
+
+    // Called with the server's negotiation result: {encoding, version, fields}
+    function configure(info) {
+        if (info && Array.isArray(info.fields)) {
+            fieldsByVersion[info.version] = info.fields;
+        }
+    }
+
+    function decode(data) {
+        if (!(data instanceof ArrayBuffer) && !ArrayBuffer.isView(data)) {
+            return data;
+        }
+        const values = unpack(data);
+        const fields = fieldsByVersion[values[0]];
+        if (!fields) {
+            throw new Error(`Unknown message event version: ${values[0]}`);
+        }
+        const event = { v: values[0] };
+        fields.forEach((field, i) => { event[field] = values[i + 1]; });
+        return event;
+    }
+
+    // Minimal MessagePack reader: nil, bool, ints, floats, str, bin, array, map
+    function unpack(buffer) {
+        const bytes = buffer instanceof ArrayBuffer
+            ? new Uint8Array(buffer)
+            : new Uint8Array(buffer.buffer, buffer.byteOffset, buffer.byteLength);
+        const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+        let offset = 0;
+
+        function str(length) {
+            const value = textDecoder.decode(bytes.subarray(offset, offset + length));
+            offset += length;
+            return value;
+        }
+
+        function bin(length) {
+            const value = bytes.slice(offset, offset + length);
+            offset += length;
+            return value;
+        }
+
+        function array(length) {
+            const value = new Array(length);
+            for (let i = 0; i < length; i++) value[i] = read();
+            return value;
+        }
+
+        function map(length) {
+            const value = {};
+            for (let i = 0; i < length; i++) {
+                const key = read();
+                value[key] = read();
+            }
+            return value;
+        }
+
+        function read() {
+            const type = bytes[offset++];
+            let value;
+            if (type <= 0x7f) return type;
+            if (type >= 0xe0) return type - 0x100;
+            if ((type & 0xe0) === 0xa0) return str(type & 0x1f);
+            if ((type & 0xf0) === 0x90) return array(type & 0x0f);
+            if ((type & 0xf0) === 0x80) return map(type & 0x0f);
+            switch (type) {
+                case 0xc0: return null;
+                case 0xc2: return false;
+                case 0xc3: return true;
+                case 0xc4: value = view.getUint8(offset); offset += 1; return bin(value);
+                case 0xc5: value = view.getUint16(offset); offset += 2; return bin(value);
+                case 0xc6: value = view.getUint32(offset); offset += 4; return bin(value);
+                case 0xca: value = view.getFloat32(offset); offset += 4; return value;
+                case 0xcb: value = view.getFloat64(offset); offset += 8; return value;
+                case 0xcc: value = view.getUint8(offset); offset += 1; return value;
+                case 0xcd: value = view.getUint16(offset); offset += 2; return value;
+                case 0xce: value = view.getUint32(offset); offset += 4; return value;
+                case 0xcf: value = Number(view.getBigUint64(offset)); offset += 8; return value;
+                case 0xd0: value = view.getInt8(offset); offset += 1; return value;
+                case 0xd1: value = view.getInt16(offset); offset += 2; return value;
+                case 0xd2: value = view.getInt32(offset); offset += 4; return value;
+                case 0xd3: value = Number(view.getBigInt64(offset)); offset += 8; return value;
+                case 0xd9: value = view.getUint8(offset); offset += 1; return str(value);
+                case 0xda: value = view.getUint16(offset); offset += 2; return str(value);
+                case 0xdb: value = view.getUint32(offset); offset += 4; return str(value);
+                case 0xdc: value = view.getUint16(offset); offset += 2; return array(value);
+                case 0xdd: value = view.getUint32(offset); offset += 4; return array(value);
+                case 0xde: value = view.getUint16(offset); offset += 2; return map(value);
+                case 0xdf: value = view.getUint32(offset); offset += 4; return map(value);
+                default: throw new Error(`Unsupported MessagePack type 0x${type.toString(16)}`);
+            }
+        }
+
+        return read();
+    }
+
+    return { supported, configure, decode };
+})();
@@ -0,0 +1,105 @@
+// message_cache.js
+// Local message cache for SecureChat backed by IndexedDB.
+// Keeps received messages per conversation plus the highest message id seen,
+// so a reconnect only asks the server for what arrived in between.
+const MessageCache = (function () {
+    const DB_NAME = 'securechat-messages';
+    const DB_VERSION = 1;
+    const MESSAGE_STORE = 'messages';
+    const CURSOR_STORE = 'cursors';
+
+    let dbPromise = null;
+
+    function open(userId) {
+        if (!('indexedDB' in window)) {
+            return Promise.reject(new Error('IndexedDB not available'));
+        }
+        if (dbPromise) return dbPromise;
+
+        dbPromise = new Promise((resolve, reject) => {
+            // One database per user so shared browsers never mix histories
+            const request = indexedDB.open(`${DB_NAME}-${userId}`, DB_VERSION);
+            request.onupgradeneeded = function () {
+                const db = request.result;
+                const messages = db.createObjectStore(MESSAGE_STORE, { keyPath: 'id' });
+                messages.createIndex('conversation_id', 'conversation_id', { unique: false });
+                db.createObjectStore(CURSOR_STORE, { keyPath: 'conversation_id' });
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => {
+                dbPromise = null;
+                reject(request.error);
+            };
+        });
+        return dbPromise;
+    }
+
+    function transactionDone(tx) {
+        return new Promise((resolve, reject) => {
+            tx.oncomplete = () => resolve();
+            tx.onerror = () => reject(tx.error);
+            tx.onabort = () => reject(tx.error);
+        });
+    }
+
+    function requestResult(request) {
+        return new Promise((resolve, reject) => {
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    // Store messages and advance the per-conversation cursor
+    async function putMessages(messages) {
+        const cacheable = messages.filter(msg => Number.isInteger(msg.id) && msg.conversation_id);
+        if (!cacheable.length || !dbPromise) return;
+
+        const db = await dbPromise;
+        const tx = db.transaction([MESSAGE_STORE, CURSOR_STORE], 'readwrite');
+        const cursorStore = tx.objectStore(CURSOR_STORE);
+        const highest = {};
+        cacheable.forEach(msg => {
+            tx.objectStore(MESSAGE_STORE).put(msg);
+            highest[msg.conversation_id] = Math.max(highest[msg.conversation_id] || 0, msg.id);
+        });
+        for (const [conversationId, lastId] of Object.entries(highest)) {
+            const current = await requestResult(cursorStore.get(Number(conversationId)));
+            if (!current || current.last_id < lastId) {
+                cursorStore.put({ conversation_id: Number(conversationId), last_id: lastId });
+            }
+        }
+        return transactionDone(tx);
+    }
+
+    // Drop everything cached for a conversation (server asked for a reset)
+    async function resetConversation(conversationId) {
+        if (!dbPromise) return;
+        const db = await dbPromise;
+        const tx = db.transaction([MESSAGE_STORE, CURSOR_STORE], 'readwrite');
+        const index = tx.objectStore(MESSAGE_STORE).index('conversation_id');
+        const keys = await requestResult(index.getAllKeys(conversationId));
+        keys.forEach(key => tx.objectStore(MESSAGE_STORE).delete(key));
+        tx.objectStore(CURSOR_STORE).delete(conversationId);
+        return transactionDone(tx);
+    }
+
+    // {conversation_id: highest cached message id}
+    async function getCursors() {
+        if (!dbPromise) return {};
+        const db = await dbPromise;
+        const rows = await requestResult(db.transaction(CURSOR_STORE).objectStore(CURSOR_STORE).getAll());
+        const cursors = {};
+        rows.forEach(row => { cursors[row.conversation_id] = row.last_id; });
+        return cursors;
+    }
+
+    // Most recent cached messages across all conversations, oldest first
+    async function getRecent(limit) {
+        if (!dbPromise) return [];
+        const db = await dbPromise;
+        const rows = await requestResult(db.transaction(MESSAGE_STORE).objectStore(MESSAGE_STORE).getAll());
+        return rows.sort((a, b) => a.id - b.id).slice(-limit);
+    }
+
+    return { open, putMessages, resetConversation, getCursors, getRecent };
+})();
@@ -60,46 +60,6 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
-    // Fetch security metrics
-    function fetchSecurityMetrics() {
-        // Get CSRF token
-        const csrfTokenMeta = document.querySelector('meta[name="csrf-token"]');
-        const csrfToken = csrfTokenMeta ? csrfTokenMeta.getAttribute('content') : null;
-        
-        if (!csrfToken) {
-            console.error("CSRF token not found.");
-            return;
-        }
-        
-        console.log("Fetching security metrics from: /security/get_security_metrics");
-        fetch('/security/get_security_metrics', {
-            method: 'GET',
-            headers: {
-                'X-CSRFToken': csrfToken,
-                'Content-Type': 'application/json'
-            },
-            credentials: 'same-origin' // Add credentials to ensure cookies are sent
-        })
-        .then(response => {
-            console.log("Security metrics response status:", response.status);
-            if (!response.ok) {
-                throw new Error(`HTTP error! Status: ${response.status}`);
-            }
-            return response.json();
-        })
-        .then(data => {
-            console.log("Security metrics data received:", data);
-            if (data.success) {
-                updateSecurityDisplay(data);
-            } else {
-                console.error("Failed to get security metrics:", data.message);
-            }
-        })
-        .catch(error => {
-            console.error("Error fetching security metrics:", error);
-        });
-    }
-    
     // Update security display
     function updateSecurityDisplay(data) {
         const risk = data.risk;
@@ -234,14 +194,17 @@ document.addEventListener('DOMContentLoaded', function() {
         riskIndicatorDot.className = 'risk-indicator-dot ' + riskClass;
     }
     
-    // Initial fetch
+    // chat.js relays the metrics the server pushes over Socket.IO
     if (securityRisk || faceAccuracy || riskLevelIndicator) {
-        console.log("Initializing security metrics fetch");
-        fetchSecurityMetrics();
-        
-        // Refresh metrics every 60 seconds
-        setInterval(fetchSecurityMetrics, 60000);
+        document.addEventListener('securitymetrics', function(e) {
+            console.log("Security metrics received:", e.detail);
+            if (e.detail.success) {
+                updateSecurityDisplay(e.detail);
+            } else {
+                console.error("Failed to get security metrics:", e.detail.message);
+            }
+        });
     } else {
-        console.warn("No security UI elements found - skipping security metrics fetching");
+        console.warn("No security UI elements found - skipping security metrics updates");
     }
 });
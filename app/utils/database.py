@@ -0,0 +1,192 @@
+"""
+Database Engine Module for SecureChat
+This module tunes the SQLAlchemy engines for the threaded Socket.IO server.
+
+The primary database comes from DATABASE_URL (SQLite under instance/ when
+unset); server databases such as PostgreSQL get a pre-pinged, recycled
+QueuePool. DATABASE_REPLICA_URL optionally points read_session() at a read
+replica for history and metrics reads.
+
+File-backed SQLite databases are opened in WAL mode with synchronous=NORMAL,
+so readers no longer wait for a writer and commits no longer fsync the main
+file. Every new connection also gets a busy timeout (writers queue instead
+of failing with "database is locked"), a memory-mapped read window and a
+larger page cache.
+
+Connections come from a bounded QueuePool sized for the server's handler
+threads. Read-only work can use read_session(), which draws from a second
+pool of query_only connections so long reads never hold a writer's
+connection. In-memory databases (tests) keep Flask-SQLAlchemy's
+single-connection StaticPool and skip the file-only pragmas.
+"""
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from app import db
+
+# Defaults; overridden from app.config
+JOURNAL_MODE = 'WAL'
+SYNCHRONOUS = 'NORMAL'
+BUSY_TIMEOUT_MS = 5000
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KB = 16 * 1024
+POOL_SIZE = 10
+MAX_OVERFLOW = 20
+POOL_TIMEOUT = 30
+POOL_RECYCLE = 1800
+READ_POOL_SIZE = 10
+
+_READ_ENGINE_KEY = 'securechat_read_engine'
+
+
+def normalize_database_url(url):
+    """Accept the postgres:// scheme that hosting providers hand out."""
+    if url and url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def is_sqlite(url):
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def is_sqlite_memory(url):
+    url = make_url(url)
+    return is_sqlite(url) and (url.database in (None, '', ':memory:') or url.query.get('mode') == 'memory')
+
+
+def engine_options(config, url):
+    """
+    Pool and driver options for an engine on url.
+
+    Values already in SQLALCHEMY_ENGINE_OPTIONS take precedence.
+
+    Returns:
+        dict: Keyword arguments for create_engine
+    """
+    options = {}
+    if not is_sqlite_memory(url):
+        options.update(
+            pool_size=config.get('DATABASE_POOL_SIZE', POOL_SIZE),
+            max_overflow=config.get('DATABASE_MAX_OVERFLOW', MAX_OVERFLOW),
+            pool_timeout=config.get('DATABASE_POOL_TIMEOUT', POOL_TIMEOUT)
+        )
+        if is_sqlite(url):
+            # Pooled connections move between handler threads; the driver
+            # timeout matches busy_timeout so both wait the same time
+            options['connect_args'] = {
+                'check_same_thread': False,
+                'timeout': config.get('SQLITE_BUSY_TIMEOUT_MS', BUSY_TIMEOUT_MS) / 1000
+            }
+        else:
+            # Server connections can be dropped by the server or a proxy
+            options['pool_pre_ping'] = config.get('DATABASE_POOL_PRE_PING', True)
+            options['pool_recycle'] = config.get('DATABASE_POOL_RECYCLE', POOL_RECYCLE)
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+def sqlite_pragmas(config, url, read_only=False):
+    """
+    PRAGMA statements run on every new SQLite connection.
+
+    Returns:
+        list: Statements, in the order they are applied
+    """
+    pragmas = [f"PRAGMA busy_timeout = {int(config.get('SQLITE_BUSY_TIMEOUT_MS', BUSY_TIMEOUT_MS))}"]
+    if not is_sqlite_memory(url):
+        pragmas += [
+            f"PRAGMA journal_mode = {config.get('SQLITE_JOURNAL_MODE', JOURNAL_MODE)}",
+            f"PRAGMA synchronous = {config.get('SQLITE_SYNCHRONOUS', SYNCHRONOUS)}",
+            f"PRAGMA mmap_size = {int(config.get('SQLITE_MMAP_SIZE', MMAP_SIZE))}",
+        ]
+    # A negative cache_size is in KiB rather than pages
+    pragmas.append(f"PRAGMA cache_size = -{int(config.get('SQLITE_CACHE_SIZE_KB', CACHE_SIZE_KB))}")
+    if read_only:
+        pragmas.append("PRAGMA query_only = ON")
+    return pragmas
+
+
+def install_pragmas(engine, pragmas):
+    """Run pragmas on each new DBAPI connection of engine."""
+    @event.listens_for(engine, 'connect')
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+    return engine
+
+
+def configure_engine(app):
+    """Set SQLALCHEMY_ENGINE_OPTIONS; called before db.init_app(app)."""
+    url = normalize_database_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config, url)
+
+
+def init_app(app):
+    """Install connection pragmas on the app's engine; called after db.init_app(app)."""
+    with app.app_context():
+        engine = db.engine
+    if is_sqlite(engine.url):
+        install_pragmas(engine, sqlite_pragmas(app.config, engine.url))
+    app.extensions.pop(_READ_ENGINE_KEY, None)
+
+
+def _create_read_engine(config, url):
+    config = dict(config, DATABASE_POOL_SIZE=config.get('DATABASE_READ_POOL_SIZE', READ_POOL_SIZE))
+    config.pop('SQLALCHEMY_ENGINE_OPTIONS', None)
+    engine = create_engine(url, **engine_options(config, url))
+    if is_sqlite(url):
+        install_pragmas(engine, sqlite_pragmas(config, url, read_only=True))
+    return engine
+
+
+def read_engine(app=None):
+    """
+    Engine for read-only queries on the current app's database.
+
+    DATABASE_REPLICA_URL, when set, is used as is. Otherwise file-backed
+    SQLite gets its own pool of query_only connections, and other databases
+    (and in-memory SQLite, which cannot be shared) use db.engine.
+    """
+    from flask import current_app
+    app = app or current_app._get_current_object()
+    engine = app.extensions.get(_READ_ENGINE_KEY)
+    if engine is None:
+        primary = db.engine
+        replica_url = normalize_database_url(app.config.get('DATABASE_REPLICA_URL'))
+        if replica_url:
+            engine = _create_read_engine(app.config, replica_url)
+        elif is_sqlite(primary.url) and not is_sqlite_memory(primary.url):
+            engine = _create_read_engine(app.config, primary.url)
+        else:
+            engine = primary
+        app.extensions[_READ_ENGINE_KEY] = engine
+    return engine
+
+
+def uses_replica(app=None):
+    """True when reads go to a separate replica that may lag the primary."""
+    from flask import current_app
+    app = app or current_app._get_current_object()
+    return bool(app.config.get('DATABASE_REPLICA_URL'))
+
+
+@contextmanager
+def read_session():
+    """
+    A short-lived ORM session on the read engine.
+
+    Objects loaded here are detached when the block ends; writes are
+    rejected by SQLite (query_only) on the dedicated read pool.
+    """
+    session = Session(bind=read_engine(), expire_on_commit=False)
+    try:
+        yield session
+    finally:
+        session.close()
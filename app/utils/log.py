@@ -0,0 +1,226 @@
+"""
+Logging Module for SecureChat
+This module configures the 'app' logger that every module logs through
+with logging.getLogger(__name__).
+
+Records are handed to a bounded queue in the calling thread and written
+by a listener thread, so a slow stdout or log file never blocks a request
+or a socket handler; if the queue is full the record is dropped and
+counted instead. Levels are set per module (LOG_LEVEL for the app, and
+LOG_LEVELS for any module or package under it), and modules log with
+%-style arguments, so a disabled debug call costs one level check and
+never formats anything.
+
+Output is one JSON object per line (LOG_FORMAT = 'json') or plain text.
+Structured fields go in extra=, e.g.
+
+    logger.info('Message sent', extra={'event': 'message_sent', 'sender_id': 1})
+
+and records with an 'event' listed in LOG_SAMPLE_RATES are sampled: for a
+rate of 0.1 only every 10th such record is written, tagged with
+sampled=10. Warnings and errors are never sampled.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+
+ROOT_LOGGER = 'app'
+
+# Defaults; overridden from app.config in init_app
+LOG_LEVEL = 'INFO'
+LOG_FORMAT = 'json'
+LOG_QUEUE_SIZE = 10000
+
+# Attributes every LogRecord has; anything else on a record came from extra=
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def _fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message and any extra fields."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        entry.update(_fields(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """'time level logger: message key=value ...' lines."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            extra = ' '.join(f'{key}={value}' for key, value in fields.items())
+            first, newline, rest = line.partition('\n')
+            line = f'{first} {extra}{newline}{rest}'
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep one in every 1/rate records per sampled event; the kept record carries sampled=N.
+
+    Args:
+        rates (dict): event name -> fraction of records to keep, 0 < rate <= 1
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self._every = {event: max(1, round(1 / rate)) for event, rate in rates.items() if rate > 0}
+        self._dropped = {event for event, rate in rates.items() if rate <= 0}
+        self._counts = {}
+        self._lock = threading.Lock()
+        self.sampled_out = 0
+
+    def filter(self, record):
+        event = getattr(record, 'event', None)
+        if event is None or record.levelno >= logging.WARNING:
+            return True
+        if event in self._dropped:
+            self.sampled_out += 1
+            return False
+        every = self._every.get(event)
+        if every is None or every == 1:
+            return True
+        with self._lock:
+            count = self._counts.get(event, 0)
+            self._counts[event] = count + 1
+        if count % every:
+            self.sampled_out += 1
+            return False
+        record.sampled = every
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops (and counts) records when the queue is full instead of blocking."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._exception_formatter = logging.Formatter()
+
+    def prepare(self, record):
+        # Render the message now (its arguments may change once we return)
+        # but keep the extra fields for the formatter on the listener thread
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogSystem:
+    """The queue, listener and handlers behind the 'app' logger."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listener = None
+        self._queue_handler = None
+        self._sampling = None
+        self._levels = {}
+        self._exit_hook = False
+
+    def init_app(self, app):
+        """(Re)configure the 'app' logger from the app config and start the listener thread."""
+        fmt = app.config.get('LOG_FORMAT', LOG_FORMAT)
+        formatter = JsonFormatter() if fmt == 'json' else TextFormatter()
+        handlers = [logging.StreamHandler(app.config.get('LOG_STREAM') or sys.stderr)]
+        log_file = app.config.get('LOG_FILE')
+        if log_file:
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+            handlers.append(logging.handlers.WatchedFileHandler(log_file))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.Queue(app.config.get('LOG_QUEUE_SIZE', LOG_QUEUE_SIZE))
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        sampling = SamplingFilter(app.config.get('LOG_SAMPLE_RATES') or {})
+        queue_handler.addFilter(sampling)
+        listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=False)
+
+        with self._lock:
+            self.shutdown()
+            root = logging.getLogger(ROOT_LOGGER)
+            root.setLevel(app.config.get('LOG_LEVEL', LOG_LEVEL))
+            root.addHandler(queue_handler)
+            root.propagate = False
+            for name in self._levels:
+                logging.getLogger(name).setLevel(logging.NOTSET)
+            levels = app.config.get('LOG_LEVELS') or {}
+            self._levels = parse_levels(levels) if isinstance(levels, str) else dict(levels)
+            for name, level in self._levels.items():
+                logging.getLogger(name).setLevel(level)
+            self._queue_handler, self._sampling, self._listener = queue_handler, sampling, listener
+            listener.start()
+            if not self._exit_hook:
+                atexit.register(self.shutdown)
+                self._exit_hook = True
+
+    def shutdown(self):
+        """Write out queued records and detach the handlers."""
+        if self._listener is not None:
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+            logging.getLogger(ROOT_LOGGER).removeHandler(self._queue_handler)
+            self._listener = None
+
+    def flush(self):
+        """Block until every record queued so far has been written (for tests and shutdown)."""
+        if self._queue_handler is not None:
+            self._queue_handler.queue.join()
+
+    def stats(self):
+        """Queue depth, records dropped on a full queue and records sampled out."""
+        handler = self._queue_handler
+        return {
+            'queued': handler.queue.qsize() if handler else 0,
+            'dropped': handler.dropped if handler else 0,
+            'sampled_out': self._sampling.sampled_out if self._sampling else 0
+        }
+
+
+log_system = LogSystem()
+
+
+def parse_levels(spec):
+    """{'app.routes': 'WARNING', ...} from 'app.routes=WARNING,app.security=DEBUG'."""
+    levels = {}
+    for item in (spec or '').split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
@@ -0,0 +1,292 @@
+"""
+Profiler Module for SecureChat
+This module is an on-demand sampling profiler for a running server. It is
+off until a security admin starts it (POST /security/profiler) or the
+process receives PROFILER_SIGNAL, and then runs for a bounded number of
+seconds.
+
+While running, one background thread wakes every interval, reads the
+current frame of each thread from sys._current_frames() and counts the
+stack, so the profiled code is never instrumented or slowed beyond the
+GIL hand-off. By default only threads busy with a traced request or
+Socket.IO event are sampled (see app.utils.tracing); threads='all'
+includes idle workers and background loops.
+
+Each stack is tagged by the innermost frame that belongs to a known
+subsystem: face (face_recognition, dlib, OpenCV and the face routes), db
+(SQLAlchemy and sqlite3), json and emit (Socket.IO / Engine.IO). The tag
+is the root frame of the collapsed stack, so flamegraph.pl and speedscope
+show it as a top-level split.
+
+Results are collapsed stacks ('[db];app.py:wsgi_app;...;base.py:execute 12'),
+a top-N summary of functions by self and total samples, and samples per
+tag. Runs are capped at PROFILER_MAX_SECONDS and PROFILER_MAX_STACKS
+distinct stacks, and only one runs at a time.
+"""
+import logging
+import math
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from app import socketio
+from app.utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Defaults; overridden from app.config in init_app
+MAX_SECONDS = 60
+INTERVAL_SECONDS = 0.01
+MAX_STACKS = 10000
+MAX_DEPTH = 64
+TOP_N = 25
+
+# (tag, path fragments), checked against each frame's filename and function, innermost frame first
+TAGS = (
+    ('face', ('face_recognition', 'dlib', 'cv2', 'routes_face', 'verify_user_face', 'face_api_models')),
+    ('db', ('sqlalchemy', 'sqlite3', 'flask_sqlalchemy')),
+    ('json', ('json',)),
+    ('emit', ('socketio', 'engineio'))
+)
+UNTAGGED = 'other'
+TRUNCATED = '[truncated]'
+
+
+class ProfilerError(RuntimeError):
+    """Raised when a profile is started while another is running."""
+
+
+def _frame_name(code):
+    return f'{os.path.basename(code.co_filename)}:{code.co_name}'
+
+
+def _tag(codes):
+    for code in codes:
+        where = f'{code.co_filename}:{code.co_name}'
+        for tag, fragments in TAGS:
+            if any(fragment in where for fragment in fragments):
+                return tag
+    return UNTAGGED
+
+
+def sample_stack(frame, max_depth=MAX_DEPTH):
+    """
+    (tag, frame names outermost first) for a thread's current frame.
+
+    Only code objects are read, never source lines, so a sample costs one
+    walk up the frame chain.
+    """
+    codes = []
+    while frame is not None and len(codes) < max_depth:
+        codes.append(frame.f_code)
+        frame = frame.f_back
+    return _tag(codes), [_frame_name(code) for code in reversed(codes)]
+
+
+class Profile:
+    """Stack counts of one profiling run."""
+
+    def __init__(self, seconds, interval, threads, max_stacks, started_at):
+        self.seconds = seconds
+        self.interval = interval
+        self.threads = threads
+        self.max_stacks = max_stacks
+        self.started_at = started_at
+        self.finished_at = None
+        self.stacks = Counter()
+        self.tags = Counter()
+        self.samples = 0
+        self.ticks = 0
+        self.truncated = 0
+        # Read by request threads while the sampler adds to it
+        self._lock = threading.Lock()
+
+    def add(self, tag, frames):
+        key = ';'.join([f'[{tag}]'] + frames)
+        with self._lock:
+            if key not in self.stacks and len(self.stacks) >= self.max_stacks:
+                key = TRUNCATED
+                self.truncated += 1
+            self.stacks[key] += 1
+            self.tags[tag] += 1
+            self.samples += 1
+
+    def _counts(self):
+        with self._lock:
+            return Counter(self.stacks), Counter(self.tags)
+
+    def collapsed(self):
+        """Flamegraph input: one 'frame;frame;... count' line per distinct stack."""
+        stacks, _ = self._counts()
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+    def top(self, n=TOP_N):
+        """The n functions with the most samples on top of the stack (self) and anywhere in it (total)."""
+        stacks, _ = self._counts()
+        own, total = Counter(), Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(';')[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for name in set(frames):
+                total[name] += count
+        return {
+            'self': [{'function': name, 'samples': count} for name, count in own.most_common(n)],
+            'total': [{'function': name, 'samples': count} for name, count in total.most_common(n)]
+        }
+
+    def summary(self, n=TOP_N):
+        stacks, tags = self._counts()
+        return {
+            'started_at': self.started_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'seconds': self.seconds,
+            'interval_ms': round(self.interval * 1000, 3),
+            'threads': self.threads,
+            'ticks': self.ticks,
+            'samples': self.samples,
+            'distinct_stacks': len(stacks),
+            'truncated_samples': self.truncated,
+            'tags': dict(tags.most_common()),
+            'top': self.top(n)
+        }
+
+
+class SamplingProfiler:
+    """
+    Runs one bounded sampling profile at a time and keeps the last result.
+
+    Args:
+        clock (callable): Monotonic time source, in seconds
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._current = None
+        self._last = None
+        self._stop = threading.Event()
+        self.app = None
+        self.max_seconds = MAX_SECONDS
+        self.max_stacks = MAX_STACKS
+        self.output_dir = None
+        self.runs = 0
+
+    def init_app(self, app):
+        """Read the limits from the app config and install the PROFILER_SIGNAL handler."""
+        self.app = app
+        self.max_seconds = app.config.get('PROFILER_MAX_SECONDS', MAX_SECONDS)
+        self.max_stacks = app.config.get('PROFILER_MAX_STACKS', MAX_STACKS)
+        self.output_dir = app.config.get('PROFILER_OUTPUT_DIR') or os.path.join(app.instance_path, 'profiles')
+
+        signal_name = app.config.get('PROFILER_SIGNAL')
+        if signal_name and not app.config.get('TESTING') and threading.current_thread() is threading.main_thread():
+            signal.signal(getattr(signal, signal_name), self._on_signal)
+
+    def start(self, seconds, interval=INTERVAL_SECONDS, threads='active', on_finish=None):
+        """
+        Start profiling in a background thread.
+
+        Args:
+            seconds (float): Run time, at most PROFILER_MAX_SECONDS
+            interval (float): Seconds between samples, from 1 ms up to seconds
+            threads (str): 'active' (threads handling a traced request or event) or 'all'
+            on_finish (callable): Called with the Profile when the run ends
+
+        Returns:
+            Profile: The run, filled in as samples arrive
+        """
+        if threads not in ('active', 'all'):
+            raise ValueError("threads must be 'active' or 'all'")
+        if not (math.isfinite(seconds) and 0 < seconds <= self.max_seconds):
+            raise ValueError(f'seconds must be between 0 and {self.max_seconds}')
+        # NaN compares false both ways, so check it explicitly
+        if not (math.isfinite(interval) and 0.001 <= interval <= seconds):
+            raise ValueError('interval must be between 1 ms and the run time')
+        with self._lock:
+            if self._current is not None:
+                raise ProfilerError('A profile is already running')
+            profile = Profile(seconds, interval, threads, self.max_stacks, datetime.utcnow())
+            self._current = profile
+            self._stop.clear()
+            self.runs += 1
+        logger.info('Profiling %s threads for %ss every %.0f ms', threads, seconds, interval * 1000,
+                    extra={'event': 'profiler_start'})
+        socketio.start_background_task(self._run, profile, on_finish)
+        return profile
+
+    def stop(self):
+        """End the running profile early."""
+        self._stop.set()
+
+    def sample(self, profile, skip=()):
+        """Take one sample of every profiled thread into profile."""
+        frames = sys._current_frames()
+        if profile.threads == 'active':
+            thread_ids = tracer.active_threads()
+        else:
+            thread_ids = frames.keys()
+        for thread_id in thread_ids:
+            frame = frames.get(thread_id)
+            if frame is None or thread_id in skip:
+                continue
+            profile.add(*sample_stack(frame))
+        profile.ticks += 1
+
+    def _run(self, profile, on_finish):
+        own = {threading.get_ident()}
+        deadline = self._clock() + profile.seconds
+        try:
+            while not self._stop.is_set() and self._clock() < deadline:
+                self.sample(profile, skip=own)
+                # Never sleep past the deadline, so seconds stays a hard cap
+                self._stop.wait(min(profile.interval, max(deadline - self._clock(), 0)))
+        except Exception:
+            logger.exception('Sampling profiler failed')
+        finally:
+            profile.finished_at = datetime.utcnow()
+            with self._lock:
+                self._current = None
+                self._last = profile
+        logger.info('Profile finished: %d samples, %d distinct stacks', profile.samples, len(profile.stacks),
+                    extra={'event': 'profiler_finish', 'tags': dict(profile._counts()[1])})
+        if on_finish is not None:
+            try:
+                on_finish(profile)
+            except Exception:
+                logger.exception('Profile callback failed')
+
+    def _on_signal(self, signum, frame):
+        seconds = self.app.config.get('PROFILER_SIGNAL_SECONDS', 30)
+        try:
+            # The handler runs on the main thread between bytecodes; leave the work to the sampler thread
+            self.start(min(seconds, self.max_seconds), threads='all', on_finish=self.write)
+        except (ProfilerError, ValueError) as e:
+            logger.warning('Profiler signal ignored: %s', e)
+
+    def write(self, profile):
+        """Write a profile's collapsed stacks to PROFILER_OUTPUT_DIR; returns the path."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f'profile-{os.getpid()}-{profile.started_at:%Y%m%dT%H%M%S}.collapsed')
+        with open(path, 'w') as f:
+            f.write(profile.collapsed())
+        logger.info('Wrote profile to %s', path)
+        return path
+
+    def current(self):
+        return self._current
+
+    def last(self):
+        return self._last
+
+    def stats(self):
+        with self._lock:
+            return {'running': self._current is not None, 'runs': self.runs,
+                    'last_samples': self._last.samples if self._last else 0}
+
+
+profiler = SamplingProfiler()
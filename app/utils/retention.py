@@ -0,0 +1,350 @@
+"""
+Retention Module for SecureChat
+This module keeps the message and face verification tables from growing forever.
+
+A retention run:
+- moves messages older than RETENTION_MESSAGE_DAYS into MessageArchive
+  rows (zlib-compressed JSON, one row per conversation per batch), or into
+  gzipped JSON Lines files when RETENTION_ARCHIVE_DIR is set
+- folds FaceVerificationLog rows older than FACE_LOG_RETENTION_DAYS into
+  per-user daily counts (FaceVerificationDaily) and deletes them
+- reclaims free pages with an incremental vacuum and refreshes planner
+  statistics with a bounded ANALYZE
+
+Every batch is its own transaction, so writers are never blocked for long.
+A dry run reports what would be done without writing anything.
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import func, text
+from app import db, socketio
+from app.models.models import (Conversation, FaceVerificationDaily, FaceVerificationLog, Membership, Message,
+                               MessageArchive)
+from app.messaging.search import unindex_messages
+
+logger = logging.getLogger(__name__)
+
+# Defaults; overridden from app.config in init_app
+MESSAGE_DAYS = None
+FACE_LOG_DAYS = 90
+BATCH_SIZE = 500
+VACUUM_PAGES = 1000
+ANALYSIS_LIMIT = 1000
+
+# security_ai reads up to 30 days of raw verification logs
+MIN_FACE_LOG_DAYS = 30
+
+_AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+_ARCHIVED_COLUMNS = ('id', 'conversation_id', 'sender_id', 'recipient_id', 'content', 'timestamp',
+                     'is_face_locked', 'file_path', 'unlock_attempts', 'is_replaced')
+
+
+def _message_record(message):
+    record = {name: getattr(message, name) for name in _ARCHIVED_COLUMNS}
+    record['timestamp'] = message.timestamp.isoformat() if message.timestamp else None
+    return record
+
+
+def read_archive(archive):
+    """
+    Load the messages stored in a MessageArchive.
+
+    Returns:
+        list: Message dicts with the archived columns, oldest first
+    """
+    if archive.payload is not None:
+        return json.loads(zlib.decompress(archive.payload).decode('utf-8'))
+    with gzip.open(archive.file_path, 'rt', encoding='utf-8') as archive_file:
+        return [json.loads(line) for line in archive_file if line.strip()]
+
+
+def _store_archive(conversation_id, messages, archive_dir):
+    records = [_message_record(message) for message in messages]
+    archive = MessageArchive(
+        conversation_id=conversation_id,
+        first_message_id=messages[0].id,
+        last_message_id=messages[-1].id,
+        first_timestamp=messages[0].timestamp,
+        last_timestamp=messages[-1].timestamp,
+        message_count=len(messages)
+    )
+    if archive_dir:
+        os.makedirs(archive_dir, exist_ok=True)
+        archive.file_path = os.path.join(
+            archive_dir, f'messages-{conversation_id or "none"}-{messages[0].id}-{messages[-1].id}.jsonl.gz')
+        with gzip.open(archive.file_path, 'wt', encoding='utf-8') as archive_file:
+            for record in records:
+                archive_file.write(json.dumps(record, separators=(',', ':')) + '\n')
+    else:
+        archive.payload = zlib.compress(json.dumps(records, separators=(',', ':')).encode('utf-8'), 9)
+    db.session.add(archive)
+    return archive
+
+
+def _repoint_summaries(ids):
+    """
+    Move conversation and read-marker pointers off messages being archived.
+
+    A conversation's last message becomes its newest remaining message (or
+    none); last_message_at is kept so the conversation list keeps its order.
+    Read markers fall back to the newest remaining message at or before
+    them, which leaves every unread count as it was.
+    """
+    newest = Message.query.with_entities(Message.id)\
+        .filter(Message.conversation_id == Conversation.id, Message.id.notin_(ids))\
+        .order_by(Message.timestamp.desc(), Message.id.desc()).limit(1).scalar_subquery()
+    Conversation.query.filter(Conversation.last_message_id.in_(ids))\
+        .update({Conversation.last_message_id: newest}, synchronize_session=False)
+
+    read_up_to = db.session.query(func.max(Message.id)).filter(
+        Message.conversation_id == Membership.conversation_id,
+        Message.id <= Membership.last_read_message_id,
+        Message.id.notin_(ids)
+    ).scalar_subquery()
+    Membership.query.filter(Membership.last_read_message_id.in_(ids))\
+        .update({Membership.last_read_message_id: read_up_to}, synchronize_session=False)
+
+
+def archive_messages(cutoff, batch_size=BATCH_SIZE, archive_dir=None, dry_run=False):
+    """
+    Move messages sent before cutoff into archives.
+
+    Args:
+        cutoff (datetime): Messages with an older timestamp are archived
+        batch_size (int): Messages moved per transaction
+        archive_dir (str): Write .jsonl.gz files here instead of MessageArchive payloads
+        dry_run (bool): Only count what would be archived
+
+    Returns:
+        dict: Counts for the report
+    """
+    old = Message.query.filter(Message.timestamp < cutoff)
+    if dry_run:
+        eligible, conversations, oldest = db.session.query(
+            func.count(Message.id), func.count(func.distinct(Message.conversation_id)), func.min(Message.timestamp)
+        ).filter(Message.timestamp < cutoff).one()
+        return {'cutoff': cutoff.isoformat(), 'eligible': eligible, 'conversations': conversations,
+                'oldest': oldest.isoformat() if oldest else None}
+
+    archived = archives = 0
+    while True:
+        batch = old.order_by(Message.id).limit(batch_size).all()
+        if not batch:
+            break
+        by_conversation = defaultdict(list)
+        for message in batch:
+            by_conversation[message.conversation_id].append(message)
+        for conversation_id, messages in by_conversation.items():
+            _store_archive(conversation_id, messages, archive_dir)
+            archives += 1
+
+        ids = [message.id for message in batch]
+        _repoint_summaries(ids)
+        # Bulk delete skips the mapper events, so drop them from the search index here
+        unindex_messages(ids)
+        db.session.query(Message).filter(Message.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        for message in batch:
+            db.session.expunge(message)
+        archived += len(ids)
+    return {'cutoff': cutoff.isoformat(), 'archived': archived, 'archives': archives}
+
+
+def prune_face_logs(cutoff, batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Fold verification logs from before cutoff into daily counts and delete them.
+
+    Returns:
+        dict: Counts for the report
+    """
+    if dry_run:
+        eligible, users = db.session.query(
+            func.count(FaceVerificationLog.id), func.count(func.distinct(FaceVerificationLog.user_id))
+        ).filter(FaceVerificationLog.timestamp < cutoff).one()
+        return {'cutoff': cutoff.isoformat(), 'eligible': eligible, 'users': users}
+
+    pruned = 0
+    while True:
+        rows = db.session.query(
+            FaceVerificationLog.id, FaceVerificationLog.user_id, FaceVerificationLog.timestamp,
+            FaceVerificationLog.success
+        ).filter(FaceVerificationLog.timestamp < cutoff).order_by(FaceVerificationLog.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        counts = defaultdict(lambda: [0, 0])
+        for _, user_id, timestamp, success in rows:
+            totals = counts[(user_id, timestamp.date())]
+            totals[0] += 1
+            totals[1] += 1 if success else 0
+
+        existing = {
+            (daily.user_id, daily.day): daily
+            for daily in FaceVerificationDaily.query.filter(
+                FaceVerificationDaily.user_id.in_({user_id for user_id, _ in counts}),
+                FaceVerificationDaily.day.in_({day for _, day in counts})
+            )
+        }
+        for (user_id, day), (attempts, successes) in counts.items():
+            daily = existing.get((user_id, day))
+            if daily is None:
+                db.session.add(FaceVerificationDaily(user_id=user_id, day=day, attempts=attempts,
+                                                     successes=successes))
+            else:
+                daily.attempts += attempts
+                daily.successes += successes
+
+        ids = [row[0] for row in rows]
+        db.session.query(FaceVerificationLog).filter(FaceVerificationLog.id.in_(ids))\
+            .delete(synchronize_session=False)
+        db.session.commit()
+        pruned += len(ids)
+    return {'cutoff': cutoff.isoformat(), 'pruned': pruned}
+
+
+def compact(vacuum_pages=VACUUM_PAGES, analysis_limit=ANALYSIS_LIMIT, full=False, dry_run=False):
+    """
+    Reclaim free pages and refresh planner statistics.
+
+    On SQLite an incremental vacuum releases up to vacuum_pages free pages
+    per run; this needs auto_vacuum=INCREMENTAL, which full=True switches
+    on with a one-off full VACUUM (that rewrites the whole file, so it is
+    never done by the scheduled job). ANALYZE is bounded by analysis_limit
+    rows per index.
+
+    Returns:
+        dict: Page counts before and after
+    """
+    engine = db.engine
+    # VACUUM cannot run inside a transaction, and SQLite shares one connection in tests
+    db.session.commit()
+    if engine.dialect.name != 'sqlite':
+        if not dry_run:
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                connection.execute(text('ANALYZE'))
+        return {'analyzed': not dry_run}
+
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        def pragma(name):
+            return connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+
+        page_size = pragma('page_size')
+        report = {
+            'auto_vacuum': _AUTO_VACUUM_MODES.get(pragma('auto_vacuum'), 'unknown'),
+            'free_pages': pragma('freelist_count'),
+            'page_count': pragma('page_count')
+        }
+        report['reclaimable_bytes'] = report['free_pages'] * page_size
+        if dry_run:
+            return report
+
+        if full:
+            connection.exec_driver_sql('PRAGMA auto_vacuum=INCREMENTAL')
+            connection.exec_driver_sql('VACUUM')
+        elif report['auto_vacuum'] == 'incremental':
+            # Run as a script so every page is stepped, not just the first
+            connection.connection.driver_connection.executescript(
+                f'PRAGMA incremental_vacuum({int(vacuum_pages)});')
+        connection.exec_driver_sql(f'PRAGMA analysis_limit={int(analysis_limit)}')
+        connection.exec_driver_sql('ANALYZE')
+
+        report['auto_vacuum'] = _AUTO_VACUUM_MODES.get(pragma('auto_vacuum'), 'unknown')
+        report['free_pages_after'] = pragma('freelist_count')
+        report['page_count_after'] = pragma('page_count')
+        report['analyzed'] = True
+    return report
+
+
+class RetentionJob:
+    """
+    Scheduled retention runs.
+
+    Args:
+        clock (callable): Source of the current UTC time, used for cutoffs
+    """
+
+    def __init__(self, clock=datetime.utcnow):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._task = None
+        self.app = None
+        self.last_report = None
+        self.runs = 0
+
+        self.message_days = MESSAGE_DAYS
+        self.face_log_days = FACE_LOG_DAYS
+        self.batch_size = BATCH_SIZE
+        self.archive_dir = None
+        self.vacuum_pages = VACUUM_PAGES
+        self.analysis_limit = ANALYSIS_LIMIT
+        self.interval = None
+
+    def init_app(self, app):
+        """Read the horizons from the app config and start the schedule."""
+        self.app = app
+        self.message_days = app.config.get('RETENTION_MESSAGE_DAYS', MESSAGE_DAYS)
+        self.face_log_days = app.config.get('FACE_LOG_RETENTION_DAYS', FACE_LOG_DAYS)
+        self.batch_size = app.config.get('RETENTION_BATCH_SIZE', BATCH_SIZE)
+        self.archive_dir = app.config.get('RETENTION_ARCHIVE_DIR')
+        self.vacuum_pages = app.config.get('RETENTION_VACUUM_PAGES', VACUUM_PAGES)
+        self.analysis_limit = app.config.get('RETENTION_ANALYSIS_LIMIT', ANALYSIS_LIMIT)
+        self.interval = app.config.get('RETENTION_INTERVAL_SECONDS')
+
+        self._check_horizons()
+
+        if self.interval and not app.config.get('TESTING') and self._task is None:
+            self._task = socketio.start_background_task(self._loop)
+
+    def _check_horizons(self):
+        if self.face_log_days is not None and self.face_log_days < MIN_FACE_LOG_DAYS:
+            raise ValueError(f'FACE_LOG_RETENTION_DAYS must be at least {MIN_FACE_LOG_DAYS}')
+
+    def run(self, dry_run=False, full_vacuum=False):
+        """
+        Run one retention pass in the current app context.
+
+        Returns:
+            dict: Report with 'messages', 'face_logs' and 'compaction' sections,
+                or None if another run is in progress
+        """
+        self._check_horizons()
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            now = self._clock()
+            report = {'dry_run': dry_run, 'started_at': now.isoformat(), 'messages': None, 'face_logs': None}
+            if self.message_days is not None:
+                report['messages'] = archive_messages(now - timedelta(days=self.message_days), self.batch_size,
+                                                      self.archive_dir, dry_run)
+            if self.face_log_days is not None:
+                report['face_logs'] = prune_face_logs(now - timedelta(days=self.face_log_days), self.batch_size,
+                                                      dry_run)
+            report['compaction'] = compact(self.vacuum_pages, self.analysis_limit, full_vacuum, dry_run)
+            if not dry_run:
+                self.last_report = report
+                self.runs += 1
+            return report
+        finally:
+            self._lock.release()
+
+    def _loop(self):
+        while True:
+            socketio.sleep(self.interval)
+            try:
+                with self.app.app_context():
+                    self.run()
+            except Exception:
+                logger.exception('Retention run failed')
+
+    def stats(self):
+        """Run count and the last report for monitoring."""
+        return {'runs': self.runs, 'last_report': self.last_report}
+
+
+retention_job = RetentionJob()
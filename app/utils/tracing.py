@@ -0,0 +1,367 @@
+"""
+Tracing Module for SecureChat
+This module times every HTTP request and traced Socket.IO event and keeps
+per-endpoint histograms in process, served by /security/metrics.
+
+For each request ('GET /chat', keyed by URL rule) and each event wrapped
+with tracer.event() ('socket send_message') it records:
+- duration, in milliseconds
+- database queries and the time spent in them, counted by engine
+  listeners on the handler's thread
+- payload size: request and response bytes, or the event's JSON size
+
+Histograms have fixed buckets, so recording is a bisect and a few
+increments under a lock, and memory does not grow with traffic;
+percentiles are read from the buckets (the bucket's upper bound).
+
+When TRACE_SLOW_MS is set, a sampler snapshots the stack of every request
+or event that has been running longer than that, every
+TRACE_SAMPLE_SECONDS. Those that finish slow are logged with their
+collapsed stack samples and kept (the last TRACE_SLOW_KEPT) for the
+metrics endpoint.
+"""
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from collections import Counter, deque
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import socketio
+
+logger = logging.getLogger(__name__)
+
+# Defaults; overridden from app.config in init_app
+SLOW_MS = None
+SAMPLE_SECONDS = 0.05
+SLOW_KEPT = 50
+STACK_SAMPLES = 20
+STACK_DEPTH = 30
+
+# Histogram bucket upper bounds; anything larger goes in a final overflow bucket
+DURATION_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+_UNMATCHED = '<unmatched>'
+
+
+class Histogram:
+    """
+    Counts of values per fixed bucket, plus count, sum and max.
+
+    Not locked; Tracer records under its own lock.
+    """
+
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'max')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of values (max for the overflow bucket)."""
+        if not self.count:
+            return 0
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 3) if self.count else 0,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'max': round(self.max, 3),
+            'buckets': {('+Inf' if i == len(self.bounds) else str(self.bounds[i])): count
+                        for i, count in enumerate(self.counts) if count}
+        }
+
+
+class EndpointStats:
+    """Histograms for one endpoint or event."""
+
+    __slots__ = ('duration_ms', 'db_queries', 'db_ms', 'bytes_in', 'bytes_out', 'errors')
+
+    def __init__(self):
+        self.duration_ms = Histogram(DURATION_BUCKETS_MS)
+        self.db_queries = Histogram(COUNT_BUCKETS)
+        self.db_ms = Histogram(DURATION_BUCKETS_MS)
+        self.bytes_in = Histogram(SIZE_BUCKETS)
+        self.bytes_out = Histogram(SIZE_BUCKETS)
+        self.errors = 0
+
+    def snapshot(self):
+        return {
+            'duration_ms': self.duration_ms.snapshot(),
+            'db_queries': self.db_queries.snapshot(),
+            'db_ms': self.db_ms.snapshot(),
+            'bytes_in': self.bytes_in.snapshot(),
+            'bytes_out': self.bytes_out.snapshot(),
+            'errors': self.errors
+        }
+
+
+class Trace:
+    """One request or event in progress on a thread."""
+
+    __slots__ = ('name', 'started', 'db_queries', 'db_seconds', 'bytes_in', 'bytes_out', 'error', 'stacks',
+                 'samples')
+
+    def __init__(self, name, started, bytes_in=None):
+        self.name = name
+        self.started = started
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.bytes_in = bytes_in
+        self.bytes_out = None
+        self.error = False
+        self.stacks = None
+        self.samples = 0
+
+
+def collapse_stack(frame, depth=STACK_DEPTH):
+    """'file:function:line;...' for the innermost depth frames, outermost first."""
+    frames = traceback.extract_stack(frame)[-depth:]
+    return ';'.join(f'{os.path.basename(f.filename)}:{f.name}:{f.lineno}' for f in frames)
+
+
+class Tracer:
+    """
+    Per-endpoint latency, query and payload histograms, and the slow log.
+
+    Args:
+        clock (callable): Monotonic time source, in seconds
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._active = {}
+        self._endpoints = {}
+        self._slow = deque(maxlen=SLOW_KEPT)
+        self._sampler = None
+        self.slow_ms = SLOW_MS
+        self.sample_seconds = SAMPLE_SECONDS
+        self.stack_samples = STACK_SAMPLES
+        self.traced = 0
+
+    def init_app(self, app):
+        """Register the request hooks and, with TRACE_SLOW_MS set, start the stack sampler."""
+        self.slow_ms = app.config.get('TRACE_SLOW_MS', SLOW_MS)
+        self.sample_seconds = app.config.get('TRACE_SAMPLE_SECONDS', SAMPLE_SECONDS)
+        self.stack_samples = app.config.get('TRACE_STACK_SAMPLES', STACK_SAMPLES)
+        with self._lock:
+            self._slow = deque(self._slow, maxlen=app.config.get('TRACE_SLOW_KEPT', SLOW_KEPT))
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+        if self.slow_ms and not app.config.get('TESTING') and self._sampler is None:
+            self._sampler = socketio.start_background_task(self._sample_loop)
+
+    # HTTP requests
+
+    def _before_request(self):
+        rule = request.url_rule.rule if request.url_rule is not None else _UNMATCHED
+        self._start(f'{request.method} {rule}', request.content_length)
+
+    def _after_request(self, response):
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            # None for streamed responses
+            trace.bytes_out = response.calculate_content_length()
+            trace.error = response.status_code >= 500
+        return response
+
+    def _teardown_request(self, exc):
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace.error = trace.error or exc is not None
+            self._finish(trace)
+
+    # Socket.IO events
+
+    def event(self, name):
+        """
+        Decorator tracing a Socket.IO handler as 'socket <name>'; apply it under @socketio.on.
+
+        The event's payload size is the JSON size of its first argument.
+        """
+        def decorator(handler):
+            @functools.wraps(handler)
+            def wrapper(*args, **kwargs):
+                trace = self._start(f'socket {name}', _payload_size(args[0]) if args else None)
+                try:
+                    return handler(*args, **kwargs)
+                except Exception:
+                    trace.error = True
+                    raise
+                finally:
+                    self._finish(trace)
+            return wrapper
+        return decorator
+
+    # Recording
+
+    def _start(self, name, bytes_in=None):
+        trace = Trace(name, self._clock(), bytes_in)
+        self._local.trace = trace
+        with self._lock:
+            self._active[threading.get_ident()] = trace
+        return trace
+
+    def _finish(self, trace):
+        elapsed_ms = (self._clock() - trace.started) * 1000
+        self._local.trace = None
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+            stats = self._endpoints.get(trace.name)
+            if stats is None:
+                stats = self._endpoints[trace.name] = EndpointStats()
+            stats.duration_ms.record(elapsed_ms)
+            stats.db_queries.record(trace.db_queries)
+            stats.db_ms.record(trace.db_seconds * 1000)
+            if trace.bytes_in is not None:
+                stats.bytes_in.record(trace.bytes_in)
+            if trace.bytes_out is not None:
+                stats.bytes_out.record(trace.bytes_out)
+            stats.errors += trace.error
+            self.traced += 1
+
+        if self.slow_ms and elapsed_ms >= self.slow_ms:
+            entry = {
+                'name': trace.name,
+                'duration_ms': round(elapsed_ms, 2),
+                'db_queries': trace.db_queries,
+                'db_ms': round(trace.db_seconds * 1000, 2),
+                'error': trace.error,
+                'stacks': [{'stack': stack, 'samples': count} for stack, count in trace.stacks.most_common()]
+                if trace.stacks else []
+            }
+            with self._lock:
+                self._slow.append(entry)
+            logger.warning('Slow %s took %.0f ms (%d queries, %.0f ms in the database)', trace.name, elapsed_ms,
+                           trace.db_queries, trace.db_seconds * 1000,
+                           extra={'event': 'slow_trace', 'trace': trace.name, 'duration_ms': entry['duration_ms'],
+                                  'db_queries': trace.db_queries, 'stacks': entry['stacks']})
+
+    def query_started(self, conn):
+        if getattr(self._local, 'trace', None) is not None:
+            conn.info['trace_query_started'] = self._clock()
+
+    def query_finished(self, conn):
+        trace = getattr(self._local, 'trace', None)
+        started = conn.info.pop('trace_query_started', None)
+        if trace is not None and started is not None:
+            trace.db_queries += 1
+            trace.db_seconds += self._clock() - started
+
+    # Slow log
+
+    def sample_stacks(self):
+        """Add a stack sample to each trace that has been running longer than TRACE_SLOW_MS."""
+        if not self.slow_ms:
+            return 0
+        threshold = self._clock() - self.slow_ms / 1000
+        with self._lock:
+            running = [(thread_id, trace) for thread_id, trace in self._active.items()
+                       if trace.started <= threshold and trace.samples < self.stack_samples]
+        if not running:
+            return 0
+        frames = sys._current_frames()
+        sampled = 0
+        for thread_id, trace in running:
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+            if trace.stacks is None:
+                trace.stacks = Counter()
+            trace.stacks[collapse_stack(frame)] += 1
+            trace.samples += 1
+            sampled += 1
+        return sampled
+
+    def _sample_loop(self):
+        while True:
+            socketio.sleep(self.sample_seconds)
+            try:
+                self.sample_stacks()
+            except Exception:
+                logger.exception('Stack sampling failed')
+
+    # Reading
+
+    def active_threads(self):
+        """Ids of the threads handling a traced request or event right now."""
+        with self._lock:
+            return list(self._active)
+
+    def endpoints(self):
+        """Histogram snapshots per endpoint and event."""
+        with self._lock:
+            return {name: stats.snapshot() for name, stats in sorted(self._endpoints.items())}
+
+    def slow(self):
+        """The most recent slow traces, newest last."""
+        with self._lock:
+            return list(self._slow)
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self._slow.clear()
+            self.traced = 0
+
+    def stats(self):
+        with self._lock:
+            return {'traced': self.traced, 'active': len(self._active), 'endpoints': len(self._endpoints),
+                    'slow': len(self._slow)}
+
+
+def _payload_size(payload):
+    if payload is None:
+        return None
+    if isinstance(payload, (bytes, str)):
+        return len(payload)
+    try:
+        return len(json.dumps(payload, default=str))
+    except (TypeError, ValueError):
+        return None
+
+
+tracer = Tracer()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    tracer.query_started(conn)
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    tracer.query_finished(conn)
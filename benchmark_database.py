@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmark for SQLite reader/writer concurrency in SecureChat
+This script compares the stock SQLite setup (rollback journal, one shared
+pool) with the tuned engine setup from app/utils/database.py (WAL, pragmas,
+separate read-only pool).
+
+Writer threads insert messages one transaction at a time while reader
+threads page through a conversation's history, against a temporary
+database file:
+
+    python benchmark_database.py --writers 4 --readers 8 --seconds 5
+"""
+import sys
+import os
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.exc import OperationalError
+
+# Add the parent directory to the Python path for imports
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import db
+from app.models.models import Message
+from app.utils.database import engine_options, install_pragmas, sqlite_pragmas
+from config import Config
+
+SEED_MESSAGES = 5000
+CONVERSATIONS = 20
+PAGE_SIZE = 50
+
+
+def stock_engines(url):
+    engine = create_engine(url, connect_args={'check_same_thread': False})
+    return engine, engine
+
+
+def tuned_engines(url):
+    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+    config.pop('SQLALCHEMY_ENGINE_OPTIONS', None)
+    writer = install_pragmas(create_engine(url, **engine_options(config, url)), sqlite_pragmas(config, url))
+    read_config = dict(config, DATABASE_POOL_SIZE=config['DATABASE_READ_POOL_SIZE'])
+    reader = install_pragmas(create_engine(url, **engine_options(read_config, url)),
+                             sqlite_pragmas(config, url, read_only=True))
+    return writer, reader
+
+
+def seed(engine):
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(Message.__table__), [
+            {'sender_id': 1, 'recipient_id': 2, 'conversation_id': i % CONVERSATIONS + 1,
+             'content': f'seed message {i}', 'timestamp': datetime.utcnow()}
+            for i in range(SEED_MESSAGES)
+        ])
+
+
+def run(label, make_engines, writers, readers, seconds):
+    directory = tempfile.mkdtemp()
+    url = 'sqlite:///' + os.path.join(directory, 'bench.db')
+    writer_engine, reader_engine = make_engines(url)
+    seed(writer_engine)
+
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+    history = select(Message.__table__).order_by(Message.timestamp.desc(), Message.id.desc()).limit(PAGE_SIZE)
+
+    def count(key):
+        with lock:
+            counts[key] += 1
+
+    def write_loop(worker):
+        i = 0
+        while time.perf_counter() < deadline:
+            try:
+                with writer_engine.begin() as connection:
+                    connection.execute(insert(Message.__table__).values(
+                        sender_id=worker, recipient_id=2, conversation_id=i % CONVERSATIONS + 1,
+                        content=f'bench {worker}/{i}', timestamp=datetime.utcnow()))
+                count('writes')
+            except OperationalError:
+                count('errors')
+            i += 1
+
+    def read_loop(worker):
+        i = 0
+        while time.perf_counter() < deadline:
+            try:
+                with reader_engine.connect() as connection:
+                    connection.execute(history.where(Message.conversation_id == i % CONVERSATIONS + 1)).fetchall()
+                count('reads')
+            except OperationalError:
+                count('errors')
+            i += 1
+
+    threads = [threading.Thread(target=write_loop, args=(n,)) for n in range(writers)]
+    threads += [threading.Thread(target=read_loop, args=(n,)) for n in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    writer_engine.dispose()
+    reader_engine.dispose()
+    shutil.rmtree(directory)
+
+    print(f"{label:<8} writes/s {counts['writes'] / seconds:9.1f}   reads/s {counts['reads'] / seconds:9.1f}   "
+          f"errors {counts['errors']}")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark SQLite reader/writer throughput')
+    parser.add_argument('--writers', type=int, default=4, help='Writer threads')
+    parser.add_argument('--readers', type=int, default=8, help='Reader threads')
+    parser.add_argument('--seconds', type=float, default=5, help='Duration of each phase')
+    args = parser.parse_args()
+
+    print(f"Writers: {args.writers}, readers: {args.readers}, {args.seconds:g}s per phase")
+    stock = run('stock', stock_engines, args.writers, args.readers, args.seconds)
+    tuned = run('tuned', tuned_engines, args.writers, args.readers, args.seconds)
+    print(f"Throughput gain: writes {tuned['writes'] / max(stock['writes'], 1):.1f}x, "
+          f"reads {tuned['reads'] / max(stock['reads'], 1):.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark for ephemeral (typing) events in SecureChat
+This script measures how typing bursts affect chat message latency and how
+much the server-side coalescing cuts down the emitted events.
+
+It runs against an in-memory database with Socket.IO test clients, so it
+measures server handling time only (no network):
+
+    python benchmark_ephemeral.py --messages 200 --keystrokes 20
+"""
+import sys
+import os
+import argparse
+import statistics
+import time
+from flask import g
+
+# Add the parent directory to the Python path for imports
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db, socketio
+from app.models.models import User
+from app.messaging.ephemeral import ephemeral_channel
+from config import TestConfig
+
+
+def connect(app, user):
+    # The benchmark shares one app context, so drop Flask-Login's cached user
+    g.pop('_login_user', None)
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user.id)
+        sess['_fresh'] = True
+    return socketio.test_client(app, flask_test_client=client)
+
+
+def emit(socket_client, *args):
+    g.pop('_login_user', None)
+    socket_client.emit(*args)
+
+
+def send_latencies(alice, bob, bob_id, messages, keystrokes):
+    """Time send_message handling, with `keystrokes` typing events before each send."""
+    latencies = []
+    for i in range(messages):
+        for _ in range(keystrokes):
+            emit(alice, 'ephemeral', {'recipient_id': bob_id, 'kind': 'typing', 'state': True})
+        start = time.perf_counter()
+        emit(alice, 'send_message', {'recipient_id': bob_id, 'content': f'message {i}'})
+        latencies.append((time.perf_counter() - start) * 1000)
+        bob.get_received()
+        alice.get_received()
+    return latencies
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(label, latencies):
+    print(f"{label:<28} p50 {statistics.median(latencies):7.3f} ms   "
+          f"p95 {percentile(latencies, 95):7.3f} ms   max {max(latencies):7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark typing indicators against message latency')
+    parser.add_argument('--messages', type=int, default=200, help='Messages sent per phase')
+    parser.add_argument('--keystrokes', type=int, default=20, help='Typing events sent before each message')
+    args = parser.parse_args()
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        alice = User(username='bench_alice', password_hash='x')
+        bob = User(username='bench_bob', password_hash='x')
+        db.session.add_all([alice, bob])
+        db.session.commit()
+        bob_id = bob.id
+
+        alice_client = connect(app, alice)
+        bob_client = connect(app, bob)
+
+        # Warm up caches and the conversation row
+        send_latencies(alice_client, bob_client, bob_id, 10, 0)
+
+        baseline = send_latencies(alice_client, bob_client, bob_id, args.messages, 0)
+        before = ephemeral_channel.stats()
+        start = time.perf_counter()
+        with_typing = send_latencies(alice_client, bob_client, bob_id, args.messages, args.keystrokes)
+        elapsed = time.perf_counter() - start
+        ephemeral_channel.flush_due()
+        after = ephemeral_channel.stats()
+
+    received = after['received'] - before['received']
+    emitted = after['emitted'] - before['emitted']
+    print(f"Messages per phase: {args.messages}, typing events per message: {args.keystrokes}")
+    report('send_message (baseline)', baseline)
+    report('send_message (with typing)', with_typing)
+    print(f"Typing events received: {received}, emitted: {emitted} "
+          f"({received / max(emitted, 1):.1f}x fewer emits, {elapsed:.2f}s phase)")
+
+
+if __name__ == '__main__':
+    main()
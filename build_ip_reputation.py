@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Script to build the IP reputation index from CSV datasets.
+
+Each dataset has network,category,asn,country rows; where networks nest the
+most specific one wins, and for the same network the later file wins. The
+index file is replaced atomically, and running servers switch to it within
+IP_REPUTATION_RELOAD_SECONDS.
+
+    python build_ip_reputation.py geo.csv blocklist.csv
+    python build_ip_reputation.py tor_exits.csv --output /srv/securechat/ip_reputation.idx
+"""
+import sys
+import os
+import argparse
+
+# Add the parent directory to the Python path for imports
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app.security.ip_reputation import IPReputationError, build_index, read_sources
+from config import Config
+
+DEFAULT_OUTPUT = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'ip_reputation.idx')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the IP reputation index')
+    parser.add_argument('sources', nargs='+', help='CSV datasets (network,category,asn,country)')
+    parser.add_argument('--output', default=Config.IP_REPUTATION_PATH or DEFAULT_OUTPUT,
+                        help='Index file to write (default: IP_REPUTATION_PATH)')
+    args = parser.parse_args()
+
+    try:
+        count = build_index(read_sources(args.sources), args.output)
+    except (OSError, IPReputationError) as e:
+        sys.exit(f'Could not build the IP reputation index: {e}')
+    print(f'IP reputation index written to {args.output}: {count} ranges')
+
+
+if __name__ == '__main__':
+    main()
@@ -10,7 +10,110 @@ class Config:
     BASE_DIR = os.path.abspath(os.path.dirname(__file__))
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or f'sqlite:///{os.path.abspath(os.path.join(BASE_DIR, "instance", "db.db"))}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Optional read replica for history and metrics reads (same schema as the primary)
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+
+    # Database engine tuning (see app/utils/database.py)
+    DATABASE_POOL_SIZE = 10  # Pooled connections kept open for handler threads
+    DATABASE_MAX_OVERFLOW = 20  # Extra connections allowed under bursts
+    DATABASE_POOL_TIMEOUT = 30  # Seconds to wait for a free connection
+    DATABASE_READ_POOL_SIZE = 10  # Separate pool for read-only sessions
+    DATABASE_POOL_PRE_PING = True  # Server databases: test connections before use
+    DATABASE_POOL_RECYCLE = 1800  # Server databases: reopen connections older than this
+    SQLITE_JOURNAL_MODE = 'WAL'  # Readers do not block on the writer
+    SQLITE_SYNCHRONOUS = 'NORMAL'  # Safe with WAL; fsync at checkpoints only
+    SQLITE_BUSY_TIMEOUT_MS = 5000  # Wait for the write lock instead of failing
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024  # Bytes of the file read through mmap
+    SQLITE_CACHE_SIZE_KB = 16 * 1024  # Page cache per connection
+    
+    # Message history paging
+    MESSAGE_PAGE_SIZE = 50  # Default number of messages per history page
+    MESSAGE_PAGE_SIZE_MAX = 200  # Upper bound a client may request
     
+    # Message delivery (at-least-once, acked by the client)
+    DELIVERY_MAX_PENDING_PER_USER = 200  # Oldest unacked events are dropped past this
+    DELIVERY_MAX_PENDING_TOTAL = 10000  # Server-wide cap on buffered events
+    DELIVERY_MAX_ATTEMPTS = 5  # Sends per event before leaving it to sync
+    DELIVERY_RETRY_BASE_SECONDS = 2  # First retry delay, doubled per attempt
+    DELIVERY_RETRY_MAX_SECONDS = 60  # Cap on the retry delay
+
+    # Group conversations
+    GROUP_MAX_MEMBERS = 500
+    GROUP_MEMBERSHIP_CACHE_TTL = 60  # Seconds a cached member list is trusted
+    GROUP_MEMBERSHIP_CACHE_SIZE = 1024  # Groups kept in the member cache
+
+    # Ephemeral events (typing/read indicators, never persisted)
+    EPHEMERAL_INTERVAL_SECONDS = 0.5  # At most one emit per user and conversation per interval
+    EPHEMERAL_STALE_SECONDS = 3  # Coalesced events older than this are dropped
+    EPHEMERAL_MAX_PENDING = 10000  # Cap on coalesced events waiting to go out
+
+    # Retention (archive old messages, prune face verification logs, compact)
+    RETENTION_MESSAGE_DAYS = None  # Archive messages older than this; None keeps all history live
+    FACE_LOG_RETENTION_DAYS = 90  # Older verification logs become daily counts (minimum 30)
+    RETENTION_ARCHIVE_DIR = None  # Write archives as .jsonl.gz files here instead of the database
+    RETENTION_BATCH_SIZE = 500  # Rows moved per transaction
+    RETENTION_VACUUM_PAGES = 1000  # Free pages released per run (needs incremental auto_vacuum)
+    RETENTION_ANALYSIS_LIMIT = 1000  # Rows sampled per index by ANALYZE
+    RETENTION_INTERVAL_SECONDS = 24 * 60 * 60  # None disables the scheduled run
+    
+    # Identity cache behind Flask-Login's user loader
+    IDENTITY_CACHE_TTL = 300  # Seconds a user snapshot is trusted (changes invalidate it sooner)
+    IDENTITY_CACHE_SIZE = 4096  # Users kept in the cache
+
+    # Risk feature store behind the security assessment
+    RISK_FEATURE_TTL = 300  # Seconds before a user's verification history is reloaded
+    RISK_FEATURE_USERS = 4096  # Users whose features are kept in memory
+    RISK_ASSESSMENT_TTL = 30  # Seconds a finished risk assessment is reused
+    RISK_ASSESSMENT_SIZE = 4096  # Cached assessments
+
+    # Risk model (weights, thresholds and transforms) loaded from JSON
+    RISK_MODEL_PATH = os.environ.get('RISK_MODEL_PATH')  # None uses app/security/risk_model.json
+    RISK_SHADOW_MODEL_PATH = os.environ.get('RISK_SHADOW_MODEL_PATH')  # Evaluated alongside, never enforced
+    RISK_MODEL_RELOAD_SECONDS = 5  # How often the model files are checked for changes
+
+    # IP reputation index (build with build_ip_reputation.py) and per-user login networks
+    IP_REPUTATION_PATH = os.environ.get('IP_REPUTATION_PATH')  # None disables reputation lookups
+    IP_REPUTATION_RELOAD_SECONDS = 60  # How often the index file is checked for replacement
+    KNOWN_NETWORKS_PER_USER = 50  # Most recently used login networks kept per user
+
+    # Device fingerprints parsed from user agents, and per-user known devices
+    DEVICE_PARSE_CACHE_SIZE = 1024  # Distinct user agents kept parsed
+    KNOWN_DEVICES_PER_USER = 20  # Most recently used devices kept per user
+
+    # Security audit log (append-only, written in batches off the request path)
+    AUDIT_FLUSH_SECONDS = 1.0  # How often queued events are written
+    AUDIT_BATCH_SIZE = 500  # Rows per insert
+    AUDIT_MAX_PENDING = 10000  # Queued events kept if writes fall behind (oldest dropped first)
+    AUDIT_EXPORT_BATCH_SIZE = 1000  # Rows read per query by /security/audit/export
+    SECURITY_ADMINS = [name for name in os.environ.get('SECURITY_ADMINS', '').split(',') if name]  # May read all events
+
+    # Logging (the 'app' logger; records are written by a background thread)
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_LEVELS = os.environ.get('LOG_LEVELS', '')  # Per module, e.g. 'app.routes=WARNING,app.security=DEBUG'
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')  # 'json' (one object per line) or 'text'
+    LOG_FILE = os.environ.get('LOG_FILE')  # Also write to this file; stderr only when unset
+    LOG_QUEUE_SIZE = 10000  # Records waiting to be written (newer ones are dropped when full)
+    LOG_SAMPLE_RATES = {  # Fraction of records kept for high-frequency events
+        'message_sent': 0.1,
+        'socket_connect': 0.1,
+        'socket_disconnect': 0.1,
+        'typing': 0.01
+    }
+
+    # Request and Socket.IO event tracing (histograms served by /security/metrics)
+    TRACE_SLOW_MS = int(os.environ['TRACE_SLOW_MS']) if os.environ.get('TRACE_SLOW_MS') else None  # Slow log threshold; None disables
+    TRACE_SAMPLE_SECONDS = 0.05  # Stack sampling interval for requests past the threshold
+    TRACE_STACK_SAMPLES = 20  # Stack samples kept per slow request
+    TRACE_SLOW_KEPT = 50  # Recent slow requests kept for the metrics endpoint
+
+    # On-demand sampling profiler (POST /security/profiler, security admins only)
+    PROFILER_MAX_SECONDS = 60  # Longest run allowed
+    PROFILER_MAX_STACKS = 10000  # Distinct stacks kept per run (further ones are counted as truncated)
+    PROFILER_SIGNAL = os.environ.get('PROFILER_SIGNAL')  # e.g. 'SIGUSR2' to start a run with kill -USR2 <pid>
+    PROFILER_SIGNAL_SECONDS = 30  # Length of a signal-started run
+    PROFILER_OUTPUT_DIR = os.environ.get('PROFILER_OUTPUT_DIR')  # Collapsed stacks of signal runs; instance/profiles when unset
+
     # Session
     PERMANENT_SESSION_LIFETIME = timedelta(days=1)
     
@@ -36,3 +139,9 @@ class Config:
     # reCAPTCHA
     RECAPTCHA_PUBLIC_KEY = '6Lf7B1QrAAAAAFTql56niE4sxjNxNkOnxG9SSgue'
     RECAPTCHA_PRIVATE_KEY = '6Lf7B1QrAAAAAFKobCrR5zmgZDlvAd0qlze0fdC0'
+
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'  # In-memory database
+    WTF_CSRF_ENABLED = False
@@ -3,7 +3,7 @@
 Script to create a test message for the face unlock feature
 """
 from app import create_app, db
-from app.models.models import Message, User
+from app.models.models import Message, User, Conversation
 from datetime import datetime
 
 app = create_app()
@@ -19,6 +19,7 @@ with app.app_context():
     message = Message(
         sender_id=user.id,
         recipient_id=user.id,
+        conversation_id=Conversation.get_or_create(user.id, user.id).id,
         content="This is a face-locked test message",
         timestamp=datetime.utcnow(),
         face_locked=True,
@@ -1,7 +1,21 @@
+import sqlalchemy as sa
+from flask_migrate import stamp
 from app import create_app, db
+from app.utils.database import normalize_database_url
+from config import Config
+
+# create_app() creates any missing tables, so look before it runs: a brand-new
+# database gets the current schema and is stamped at the latest migration,
+# while an existing one is left for `flask db upgrade`
+engine = sa.create_engine(normalize_database_url(Config.SQLALCHEMY_DATABASE_URI))
+fresh = not sa.inspect(engine).get_table_names()
+engine.dispose()
 
 app = create_app()
 
 with app.app_context():
     db.create_all()
+    if fresh:
+        stamp()
+        print(" New database created at the latest migration.")
     print(" Database initialized.")
@@ -0,0 +1,39 @@
+"""Add known network table
+
+Revision ID: 2c8e4f7a9b15
+Revises: 9d3f6b1e2c47
+Create Date: 2026-10-19 19:02:47.551208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c8e4f7a9b15'
+down_revision = '9d3f6b1e2c47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have created it
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'known_network' not in tables:
+        op.create_table('known_network',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('network', sa.String(length=43), nullable=False),
+            sa.Column('country', sa.String(length=2), nullable=True),
+            sa.Column('first_seen', sa.DateTime(), nullable=True),
+            sa.Column('last_seen', sa.DateTime(), nullable=True),
+            sa.Column('logins', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_id', 'network', name='uq_known_network_user_network')
+        )
+
+
+def downgrade():
+    op.drop_table('known_network')
@@ -0,0 +1,69 @@
+"""Add conversation table and message.conversation_id for keyset paging
+
+Revision ID: 3f9a1c2d7b4e
+Revises: 1ab6e9a617a3
+Create Date: 2026-10-19 09:12:41.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c2d7b4e'
+down_revision = '1ab6e9a617a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have made the table
+    if not sa.inspect(op.get_bind()).has_table('conversation'):
+        op.create_table('conversation',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_low_id', sa.Integer(), nullable=False),
+        sa.Column('user_high_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_low_id'], ['user.id'], ),
+        sa.ForeignKeyConstraint(['user_high_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_low_id', 'user_high_id', name='uq_conversation_pair')
+        )
+
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('conversation_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_message_conversation_id', 'conversation', ['conversation_id'], ['id'])
+        batch_op.create_index('ix_message_conversation_ts', ['conversation_id', 'timestamp', 'id'], unique=False)
+
+    # Backfill: one conversation per unordered sender/recipient pair, then point
+    # every existing message at it. CASE keeps this portable across backends.
+    op.execute("""
+        INSERT INTO conversation (user_low_id, user_high_id, created_at)
+        SELECT low, high, MIN(first_ts) FROM (
+            SELECT CASE WHEN sender_id < recipient_id THEN sender_id ELSE recipient_id END AS low,
+                   CASE WHEN sender_id < recipient_id THEN recipient_id ELSE sender_id END AS high,
+                   timestamp AS first_ts
+            FROM message
+            WHERE sender_id IS NOT NULL AND recipient_id IS NOT NULL
+        ) AS pairs
+        GROUP BY low, high
+    """)
+    op.execute("""
+        UPDATE message SET conversation_id = (
+            SELECT conversation.id FROM conversation
+            WHERE conversation.user_low_id = CASE WHEN message.sender_id < message.recipient_id
+                                                  THEN message.sender_id ELSE message.recipient_id END
+              AND conversation.user_high_id = CASE WHEN message.sender_id < message.recipient_id
+                                                   THEN message.recipient_id ELSE message.sender_id END
+        )
+        WHERE conversation_id IS NULL
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_conversation_ts')
+        batch_op.drop_constraint('fk_message_conversation_id', type_='foreignkey')
+        batch_op.drop_column('conversation_id')
+
+    op.drop_table('conversation')
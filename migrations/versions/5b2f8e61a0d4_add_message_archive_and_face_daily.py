@@ -0,0 +1,56 @@
+"""Add message archive and face verification daily counts
+
+Revision ID: 5b2f8e61a0d4
+Revises: e4a7c9d21b63
+Create Date: 2026-10-19 15:20:12.418330
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b2f8e61a0d4'
+down_revision = 'e4a7c9d21b63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have created these
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'message_archive' not in tables:
+        op.create_table('message_archive',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('conversation_id', sa.Integer(), nullable=True),
+            sa.Column('first_message_id', sa.Integer(), nullable=False),
+            sa.Column('last_message_id', sa.Integer(), nullable=False),
+            sa.Column('first_timestamp', sa.DateTime(), nullable=True),
+            sa.Column('last_timestamp', sa.DateTime(), nullable=True),
+            sa.Column('message_count', sa.Integer(), nullable=False),
+            sa.Column('payload', sa.LargeBinary(), nullable=True),
+            sa.Column('file_path', sa.String(length=256), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_message_archive_conversation', 'message_archive',
+                        ['conversation_id', 'last_message_id'], unique=False)
+
+    if 'face_verification_daily' not in tables:
+        op.create_table('face_verification_daily',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('attempts', sa.Integer(), nullable=False),
+            sa.Column('successes', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_id', 'day', name='uq_face_verification_daily_user_day')
+        )
+
+
+def downgrade():
+    op.drop_table('face_verification_daily')
+    op.drop_index('ix_message_archive_conversation', table_name='message_archive')
+    op.drop_table('message_archive')
@@ -0,0 +1,41 @@
+"""Add known device table
+
+Revision ID: 7a3d5c9e1f62
+Revises: 2c8e4f7a9b15
+Create Date: 2026-10-19 19:48:13.270944
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a3d5c9e1f62'
+down_revision = '2c8e4f7a9b15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have created it
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'known_device' not in tables:
+        op.create_table('known_device',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('fingerprint', sa.String(length=16), nullable=False),
+            sa.Column('device_class', sa.String(length=16), nullable=False),
+            sa.Column('browser', sa.String(length=32), nullable=True),
+            sa.Column('os', sa.String(length=32), nullable=True),
+            sa.Column('first_seen', sa.DateTime(), nullable=True),
+            sa.Column('last_seen', sa.DateTime(), nullable=True),
+            sa.Column('logins', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_id', 'fingerprint', name='uq_known_device_user_fingerprint')
+        )
+
+
+def downgrade():
+    op.drop_table('known_device')
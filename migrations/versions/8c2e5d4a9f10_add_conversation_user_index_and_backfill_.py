@@ -0,0 +1,61 @@
+"""Add conversation user index and backfill message conversations
+
+Revision ID: 8c2e5d4a9f10
+Revises: 3f9a1c2d7b4e
+Create Date: 2026-10-19 10:03:17.551902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c2e5d4a9f10'
+down_revision = '3f9a1c2d7b4e'
+branch_labels = None
+depends_on = None
+
+
+def _has_index(table, name):
+    return name in {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    # db.create_all() already builds this index when it creates the table
+    if not _has_index('conversation', 'ix_conversation_user_high'):
+        with op.batch_alter_table('conversation', schema=None) as batch_op:
+            batch_op.create_index('ix_conversation_user_high', ['user_high_id'], unique=False)
+
+    # Messages written by workers still running the pre-conversation code
+    # during a rolling deploy have no conversation yet
+    op.execute("""
+        INSERT INTO conversation (user_low_id, user_high_id, created_at)
+        SELECT DISTINCT
+               CASE WHEN sender_id < recipient_id THEN sender_id ELSE recipient_id END,
+               CASE WHEN sender_id < recipient_id THEN recipient_id ELSE sender_id END,
+               NULL
+        FROM message
+        WHERE conversation_id IS NULL AND sender_id IS NOT NULL AND recipient_id IS NOT NULL
+          AND NOT EXISTS (
+              SELECT 1 FROM conversation c
+              WHERE c.user_low_id = CASE WHEN message.sender_id < message.recipient_id
+                                         THEN message.sender_id ELSE message.recipient_id END
+                AND c.user_high_id = CASE WHEN message.sender_id < message.recipient_id
+                                          THEN message.recipient_id ELSE message.sender_id END
+          )
+    """)
+    op.execute("""
+        UPDATE message SET conversation_id = (
+            SELECT conversation.id FROM conversation
+            WHERE conversation.user_low_id = CASE WHEN message.sender_id < message.recipient_id
+                                                  THEN message.sender_id ELSE message.recipient_id END
+              AND conversation.user_high_id = CASE WHEN message.sender_id < message.recipient_id
+                                                   THEN message.recipient_id ELSE message.sender_id END
+        )
+        WHERE conversation_id IS NULL
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.drop_index('ix_conversation_user_high')
@@ -0,0 +1,28 @@
+"""Add face verification log user/timestamp index
+
+Revision ID: 9d3f6b1e2c47
+Revises: 5b2f8e61a0d4
+Create Date: 2026-10-19 17:41:06.283519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3f6b1e2c47'
+down_revision = '5b2f8e61a0d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have created it
+    indexes = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('face_verification_log')}
+    if 'ix_face_verification_log_user_ts' not in indexes:
+        op.create_index('ix_face_verification_log_user_ts', 'face_verification_log',
+                        ['user_id', 'timestamp', 'success'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_face_verification_log_user_ts', table_name='face_verification_log')
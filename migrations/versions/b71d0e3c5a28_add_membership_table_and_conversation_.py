@@ -0,0 +1,77 @@
+"""Add membership table and conversation last-message summary columns
+
+Revision ID: b71d0e3c5a28
+Revises: 8c2e5d4a9f10
+Create Date: 2026-10-19 11:26:52.318440
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b71d0e3c5a28'
+down_revision = '8c2e5d4a9f10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    # create_app() runs db.create_all(), which may already have made the table
+    if not inspector.has_table('membership'):
+        op.create_table('membership',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('conversation_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('unread_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_read_message_id', sa.Integer(), nullable=True),
+        sa.Column('last_read_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['conversation_id'], ['conversation.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('conversation_id', 'user_id', name='uq_membership_conversation_user')
+        )
+        with op.batch_alter_table('membership', schema=None) as batch_op:
+            batch_op.create_index('ix_membership_user', ['user_id'], unique=False)
+
+    conversation_columns = {column['name'] for column in inspector.get_columns('conversation')}
+    if 'last_message_id' not in conversation_columns:
+        with op.batch_alter_table('conversation', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('last_message_id', sa.Integer(), nullable=True))
+            batch_op.add_column(sa.Column('last_message_at', sa.DateTime(), nullable=True))
+
+    # Point every conversation at its newest message
+    op.execute("""
+        UPDATE conversation SET last_message_id = (
+            SELECT m.id FROM message m
+            WHERE m.conversation_id = conversation.id
+            ORDER BY m.timestamp DESC, m.id DESC
+            LIMIT 1
+        )
+    """)
+    op.execute("""
+        UPDATE conversation SET last_message_at = (
+            SELECT m.timestamp FROM message m WHERE m.id = conversation.last_message_id
+        )
+    """)
+
+    # One membership per participant. Existing history counts as already read.
+    for column in ('user_low_id', 'user_high_id'):
+        op.execute(f"""
+            INSERT INTO membership (conversation_id, user_id, unread_count, last_read_message_id)
+            SELECT c.id, c.{column}, 0, c.last_message_id FROM conversation c
+            WHERE NOT EXISTS (
+                SELECT 1 FROM membership mb
+                WHERE mb.conversation_id = c.id AND mb.user_id = c.{column}
+            )
+        """)
+
+
+def downgrade():
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.drop_column('last_message_at')
+        batch_op.drop_column('last_message_id')
+
+    op.drop_table('membership')
@@ -18,7 +18,9 @@ depends_on = None
 
 def upgrade():
     # ### commands auto generated by Alembic - please adjust! ###
-    op.drop_table('_alembic_tmp_user')
+    # Leftover from an interrupted SQLite batch migration; absent elsewhere
+    if sa.inspect(op.get_bind()).has_table('_alembic_tmp_user'):
+        op.drop_table('_alembic_tmp_user')
     with op.batch_alter_table('face_verification_log', schema=None) as batch_op:
         batch_op.add_column(sa.Column('success', sa.Boolean(), nullable=True))
 
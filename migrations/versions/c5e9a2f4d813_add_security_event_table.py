@@ -0,0 +1,51 @@
+"""Add security event table
+
+Revision ID: c5e9a2f4d813
+Revises: 7a3d5c9e1f62
+Create Date: 2026-10-19 20:31:55.804127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e9a2f4d813'
+down_revision = '7a3d5c9e1f62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have created it
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'security_event' not in tables:
+        op.create_table('security_event',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('timestamp', sa.DateTime(), nullable=False),
+            sa.Column('event_type', sa.String(length=32), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('username', sa.String(length=64), nullable=True),
+            sa.Column('ip', sa.String(length=45), nullable=True),
+            sa.Column('device', sa.String(length=16), nullable=True),
+            sa.Column('security_level', sa.Integer(), nullable=True),
+            sa.Column('risk_score', sa.Float(), nullable=True),
+            sa.Column('details', sa.Text(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_security_event_user_ts', 'security_event', ['user_id', 'timestamp'], unique=False)
+        op.create_index('ix_security_event_ts', 'security_event', ['timestamp'], unique=False)
+
+        # The audit log is append-only
+        if op.get_bind().dialect.name == 'sqlite':
+            op.execute("CREATE TRIGGER security_event_no_update BEFORE UPDATE ON security_event "
+                       "BEGIN SELECT RAISE(ABORT, 'security_event is append-only'); END")
+            op.execute("CREATE TRIGGER security_event_no_delete BEFORE DELETE ON security_event "
+                       "BEGIN SELECT RAISE(ABORT, 'security_event is append-only'); END")
+
+
+def downgrade():
+    op.drop_index('ix_security_event_ts', table_name='security_event')
+    op.drop_index('ix_security_event_user_ts', table_name='security_event')
+    op.drop_table('security_event')
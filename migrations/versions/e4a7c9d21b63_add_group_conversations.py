@@ -0,0 +1,51 @@
+"""Add group conversations
+
+Revision ID: e4a7c9d21b63
+Revises: b71d0e3c5a28
+Create Date: 2026-10-19 13:02:41.907215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a7c9d21b63'
+down_revision = 'b71d0e3c5a28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    conversation_columns = {column['name'] for column in inspector.get_columns('conversation')}
+
+    # Groups have no participant pair, so the pair columns become nullable.
+    # create_app() runs db.create_all(), which may already have added the rest.
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.alter_column('user_low_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.alter_column('user_high_id', existing_type=sa.Integer(), nullable=True)
+        if 'is_group' not in conversation_columns:
+            batch_op.add_column(sa.Column('is_group', sa.Boolean(), nullable=False, server_default=sa.false()))
+            batch_op.add_column(sa.Column('title', sa.String(length=128), nullable=True))
+            batch_op.add_column(sa.Column('created_by_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key('fk_conversation_created_by_id_user', 'user', ['created_by_id'], ['id'])
+
+
+def downgrade():
+    # Group conversations cannot be represented without these columns.
+    # TRUE works on both SQLite (3.23+) and PostgreSQL booleans.
+    op.execute("DELETE FROM membership WHERE conversation_id IN (SELECT id FROM conversation WHERE is_group = TRUE)")
+    op.execute("UPDATE message SET conversation_id = NULL WHERE conversation_id IN (SELECT id FROM conversation WHERE is_group = TRUE)")
+    op.execute("DELETE FROM conversation WHERE is_group = TRUE")
+
+    # The foreign key is unnamed when db.create_all() added the column
+    foreign_keys = {key['name'] for key in sa.inspect(op.get_bind()).get_foreign_keys('conversation')}
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        if 'fk_conversation_created_by_id_user' in foreign_keys:
+            batch_op.drop_constraint('fk_conversation_created_by_id_user', type_='foreignkey')
+        batch_op.drop_column('created_by_id')
+        batch_op.drop_column('title')
+        batch_op.drop_column('is_group')
+        batch_op.alter_column('user_high_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('user_low_id', existing_type=sa.Integer(), nullable=False)
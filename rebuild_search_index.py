@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+"""
+Script to rebuild the message search index from existing messages
+"""
+from app import create_app
+from app.messaging.search import rebuild_search_index, ensure_search_index
+
+app = create_app()
+
+with app.app_context():
+    backend = ensure_search_index()
+    count = rebuild_search_index()
+    print(f'Search index rebuilt ({backend}): {count} messages indexed')
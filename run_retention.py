@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Script to run the retention job once: archive old messages, prune face
+verification logs into daily counts, and compact the database.
+
+    python run_retention.py --dry-run
+    python run_retention.py --message-days 365 --archive-dir archives
+    python run_retention.py --full-vacuum   # one-off switch to incremental auto_vacuum
+"""
+import sys
+import os
+import argparse
+import json
+
+# Add the parent directory to the Python path for imports
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app
+from app.utils.retention import retention_job
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive old messages and prune face verification logs')
+    parser.add_argument('--dry-run', action='store_true', help='Report what would be done without writing')
+    parser.add_argument('--message-days', type=int, help='Override RETENTION_MESSAGE_DAYS')
+    parser.add_argument('--face-log-days', type=int, help='Override FACE_LOG_RETENTION_DAYS')
+    parser.add_argument('--archive-dir', help='Write message archives as .jsonl.gz files here')
+    parser.add_argument('--full-vacuum', action='store_true',
+                        help='Rewrite the database file and enable incremental auto_vacuum')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.message_days is not None:
+            retention_job.message_days = args.message_days
+        if args.face_log_days is not None:
+            retention_job.face_log_days = args.face_log_days
+        if args.archive_dir:
+            retention_job.archive_dir = os.path.abspath(args.archive_dir)
+        report = retention_job.run(dry_run=args.dry_run, full_vacuum=args.full_vacuum)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Tests for the append-only security audit log, its batched writer and export
+"""
+import sys
+import os
+import csv
+import io
+import json
+import unittest
+from datetime import datetime, timedelta
+from flask import g
+from sqlalchemy import event, exc, text
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models.models import User, SecurityEvent
+from app.security.audit import AuditError, AuditLog, audit_log
+from config import TestConfig
+from testing_utils import FakeClock
+
+NOW = datetime(2026, 3, 1, 12, 0)
+
+
+class AuditTestConfig(TestConfig):
+    AUDIT_BATCH_SIZE = 4
+    AUDIT_EXPORT_BATCH_SIZE = 3
+    SECURITY_ADMINS = ['admin']
+
+
+def record_statements(statements):
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    return record
+
+
+class AuditLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(AuditTestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.log = AuditLog(clock=FakeClock(NOW, step=timedelta(seconds=1)))
+        self.log.init_app(self.app)
+
+    def tearDown(self):
+        audit_log.flush()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_events_are_written_in_batches_on_flush(self):
+        for i in range(10):
+            self.log.record('login_failure', user_id=i % 2, username=f'user{i % 2}', reason='bad_password')
+        self.assertEqual(SecurityEvent.query.count(), 0)
+
+        statements = []
+        listener = record_statements(statements)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            self.assertEqual(self.log.flush(), 10)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(len([statement for statement in statements if statement.startswith('INSERT')]), 3)
+        self.assertEqual(SecurityEvent.query.count(), 10)
+        self.assertEqual(self.log.stats()['written'], 10)
+        self.assertEqual(self.log.flush(), 0)
+
+    def test_queue_drops_oldest_events_when_full(self):
+        self.log.max_pending = 3
+        for i in range(5):
+            self.log.record('logout', user_id=i)
+        self.log.flush()
+
+        self.assertEqual([row.user_id for row in SecurityEvent.query.order_by(SecurityEvent.id)], [2, 3, 4])
+        self.assertEqual(self.log.stats()['dropped'], 2)
+
+    def test_query_by_user_and_time_range(self):
+        for i in range(6):
+            self.log.record('risk_assessment', user_id=1 + i % 2, security_level=2, risk_score=0.5,
+                            factors={'time_risk': 0.2})
+        # Reads see events still queued in this process
+        events = self.log.events(user_id=1)
+        self.assertEqual([e['timestamp'] for e in events],
+                         [NOW + timedelta(seconds=5), NOW + timedelta(seconds=3), NOW + timedelta(seconds=1)])
+        self.assertEqual(events[0]['details'], {'factors': {'time_risk': 0.2}})
+
+        page = self.log.events(user_id=1, limit=2)
+        rest = self.log.events(user_id=1, limit=2, before=(page[-1]['timestamp'], page[-1]['id']))
+        self.assertEqual([e['id'] for e in page + rest], [e['id'] for e in events])
+
+        window = self.log.events(start=NOW + timedelta(seconds=2), end=NOW + timedelta(seconds=5))
+        self.assertEqual([e['user_id'] for e in window], [2, 1, 2])
+        self.assertEqual(len(list(self.log.iter_events(user_id=2, batch_size=2))), 3)
+
+    def test_events_are_append_only(self):
+        self.log.record('logout', user_id=1)
+        self.log.flush()
+        security_event = SecurityEvent.query.one()
+
+        security_event.user_id = 2
+        with self.assertRaises(AuditError):
+            db.session.commit()
+        db.session.rollback()
+        db.session.delete(SecurityEvent.query.one())
+        with self.assertRaises(AuditError):
+            db.session.commit()
+        db.session.rollback()
+
+        for statement in ('UPDATE security_event SET user_id = 2', 'DELETE FROM security_event'):
+            with self.assertRaises(exc.DatabaseError):
+                db.session.execute(text(statement))
+            db.session.rollback()
+        self.assertEqual(SecurityEvent.query.one().user_id, 1)
+
+
+class AuditEndpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(AuditTestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.alice = User(username='alice', password_hash='hashed_password')
+        self.admin = User(username='admin', password_hash='hashed_password')
+        self.alice.set_password('correct-horse')
+        db.session.add_all([self.alice, self.admin])
+        db.session.commit()
+        self.alice_id, self.admin_id = self.alice.id, self.admin.id
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        audit_log.flush()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def log_in(self, user_id):
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+            sess['_fresh'] = True
+
+    def post_login(self, password):
+        g.pop('_login_user', None)
+        with self.client.session_transaction() as sess:
+            sess['manual_security_level'] = 1
+        return self.client.post('/auth/login', data={'username': 'alice', 'password': password})
+
+    def test_login_outcomes_are_recorded(self):
+        self.post_login('wrong')
+        self.post_login('correct-horse')
+
+        events = audit_log.events(user_id=self.alice_id)
+        self.assertEqual([e['event_type'] for e in reversed(events)],
+                         ['risk_assessment', 'login_failure', 'risk_assessment', 'login_success'])
+        failure = events[2]
+        self.assertEqual((failure['username'], failure['details']['reason']), ('alice', 'bad_password'))
+        self.assertEqual(events[1]['security_level'], 1)
+        self.assertEqual(events[0]['ip'], '127.0.0.1')
+        self.assertIsNotNone(events[0]['device'])
+
+    def test_export_streams_in_batches(self):
+        for i in range(7):
+            audit_log.record('logout', user_id=self.alice_id if i % 2 else self.admin_id)
+        audit_log.flush()
+
+        statements = []
+        listener = record_statements(statements)
+        self.log_in(self.alice_id)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            response = self.client.get('/security/audit/export?user_id=' + str(self.admin_id))
+            self.assertTrue(response.is_streamed)
+            lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        # Non-admins only get their own events, whatever user_id says
+        self.assertEqual([line['user_id'] for line in lines], [self.alice_id] * 3)
+        self.assertEqual(len([s for s in statements if 'FROM security_event' in s]), 2)
+
+        g.pop('_login_user', None)
+        self.log_in(self.admin_id)
+        response = self.client.get('/security/audit/export?format=csv')
+        records = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual(len(records), 7)
+        self.assertEqual(records[0]['event_type'], 'logout')
+
+        g.pop('_login_user', None)
+        page = self.client.get('/security/audit/events?limit=5').get_json()
+        self.assertEqual(len(page['events']), 5)
+        rest = self.client.get('/security/audit/events?limit=5&before=' + page['next']).get_json()
+        self.assertEqual(len(rest['events']), 2)
+        self.assertIsNone(rest['next'])
+        self.assertEqual(self.client.get('/security/audit/events?type=nope').status_code, 400)
+
+        # Out-of-range limits are clamped to one event rather than failing or lifting the cap
+        for limit in (0, -1):
+            response = self.client.get(f'/security/audit/events?limit={limit}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.get_json()['events']), 1)
+        empty = self.client.get('/security/audit/events?type=logout&end=2000-01-01T00:00:00').get_json()
+        self.assertEqual((empty['events'], empty['next']), ([], None))
+
+
+if __name__ == '__main__':
+    unittest.main()
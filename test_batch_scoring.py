@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Tests for the pure risk scorer, its NumPy batch mode and the scoring CLI
+"""
+import sys
+import os
+import io
+import csv
+import json
+import unittest
+from datetime import datetime, timedelta
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models.models import User, FaceVerificationLog
+from app.security import scoring
+from score_users import iter_scores, write_scores
+from config import TestConfig
+
+NOW = datetime(2026, 3, 1, 12, 0)
+
+
+class ScoringTestCase(unittest.TestCase):
+    def test_batch_matches_single_scores(self):
+        rng = np.random.default_rng(7)
+        features = rng.random((1000, len(scoring.FACTORS)))
+        scores = scoring.score_batch(features)
+        levels = scoring.security_levels_batch(scores)
+        for vector, batch_score, level in zip(features[:50], scores, levels):
+            single = scoring.score(dict(zip(scoring.FACTORS, vector)))
+            self.assertAlmostEqual(batch_score, single)
+            self.assertEqual(level, scoring.security_level(single))
+
+        self.assertEqual(list(scoring.security_levels_batch(np.array([0.0, 0.3, 0.69, 0.7]))), [1, 2, 2, 3])
+        with self.assertRaises(ValueError):
+            scoring.score_batch(np.zeros((3, 4)))
+
+    def test_batch_features_match_factor_functions(self):
+        failures = [0, 1, 4, 5, 9]
+        last_logins = [None, NOW - timedelta(days=2), NOW - timedelta(days=8), NOW - timedelta(days=31),
+                       NOW - timedelta(days=30, hours=23)]
+        days = [(NOW - login).days if login else np.nan for login in last_logins]
+
+        features = scoring.batch_features(failures, days, hour=3)
+        for row, failure_count, last_login in zip(features, failures, last_logins):
+            expected = {
+                'failed_attempts': scoring.failed_attempts_risk(failure_count),
+                'unusual_location': scoring.location_risk(None, '10.0.0.1'),
+                'time_risk': scoring.time_risk(3),
+                'previous_breaches': scoring.breach_risk(last_login, NOW),
+                'device_risk': scoring.device_risk('Mozilla/5.0 Chrome/120.0'),
+            }
+            self.assertEqual(dict(zip(scoring.FACTORS, row)), expected)
+
+
+class ScoreUsersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        users = [User(username=f'user{i}', password_hash='hashed_password', last_login=NOW - timedelta(days=i * 10))
+                 for i in range(5)]
+        db.session.add_all(users)
+        db.session.commit()
+        for _ in range(3):
+            db.session.add(FaceVerificationLog(user_id=users[1].id, success=False, timestamp=NOW - timedelta(hours=2)))
+        db.session.add(FaceVerificationLog(user_id=users[1].id, success=False, timestamp=NOW - timedelta(days=3)))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_all_users_are_scored_in_batches(self):
+        rows = list(iter_scores(now=NOW, hour=10, batch_size=2))
+        self.assertEqual([row['username'] for row in rows], [f'user{i}' for i in range(5)])
+
+        user1 = rows[1]
+        self.assertEqual(user1['failed_attempts'], 0.6)
+        self.assertEqual(user1['previous_breaches'], 0.5)
+        self.assertAlmostEqual(user1['risk_score'], scoring.score({factor: user1[factor] for factor in scoring.FACTORS}),
+                               places=4)
+        self.assertEqual(rows[4]['previous_breaches'], 0.8)
+        self.assertEqual(rows[4]['security_level'], 'Medium')
+
+    def test_csv_and_jsonl_output(self):
+        out = io.StringIO()
+        self.assertEqual(write_scores(iter_scores(now=NOW, hour=10), out, 'csv'), 5)
+        records = list(csv.DictReader(io.StringIO(out.getvalue())))
+        self.assertEqual(len(records), 5)
+        self.assertEqual(set(records[0]), set(('user_id', 'username', 'risk_score', 'security_level') + scoring.FACTORS))
+
+        out = io.StringIO()
+        write_scores(iter_scores(now=NOW, hour=10), out, 'jsonl')
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([line['user_id'] for line in lines], [int(record['user_id']) for record in records])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Tests for incremental conversation summaries and unread counters
+"""
+import sys
+import os
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models.models import User, Message, Conversation, Membership
+from app.messaging.summary import record_message, mark_read, get_conversation_summaries
+from config import TestConfig
+
+
+class ConversationSummaryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.alice = User(username='alice', password_hash='hashed_password')
+        self.bob = User(username='bob', password_hash='hashed_password')
+        self.carol = User(username='carol', password_hash='hashed_password')
+        db.session.add_all([self.alice, self.bob, self.carol])
+        db.session.commit()
+        self.clock = datetime(2025, 1, 1)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def send(self, sender, recipient, content, face_locked=False):
+        self.clock += timedelta(minutes=1)
+        conversation = Conversation.get_or_create(sender.id, recipient.id)
+        message = Message(sender_id=sender.id, recipient_id=recipient.id,
+                          conversation_id=conversation.id, content=content,
+                          is_face_locked=face_locked, timestamp=self.clock)
+        db.session.add(message)
+        db.session.flush()
+        record_message(message)
+        db.session.commit()
+        return message
+
+    def unread(self, user, peer):
+        conversation = Conversation.find(user.id, peer.id)
+        return Membership.query.filter_by(conversation_id=conversation.id, user_id=user.id).one().unread_count
+
+    def test_unread_counts_follow_sends(self):
+        self.send(self.alice, self.bob, 'hi')
+        self.send(self.alice, self.bob, 'there')
+        self.send(self.bob, self.alice, 'hello')
+        self.assertEqual(self.unread(self.bob, self.alice), 2)
+        self.assertEqual(self.unread(self.alice, self.bob), 1)
+
+    def test_mark_read_resets_or_recounts(self):
+        first = self.send(self.alice, self.bob, 'one')
+        self.send(self.alice, self.bob, 'two')
+        self.send(self.bob, self.alice, 'reply')
+        self.send(self.alice, self.bob, 'three')
+        conversation = Conversation.find(self.alice.id, self.bob.id)
+
+        membership = mark_read(self.bob.id, conversation.id, first.id)
+        self.assertEqual(membership.unread_count, 2)
+
+        # Moving the marker backward is ignored
+        membership = mark_read(self.bob.id, conversation.id, first.id - 1)
+        self.assertEqual(membership.unread_count, 2)
+
+        membership = mark_read(self.bob.id, conversation.id)
+        self.assertEqual(membership.unread_count, 0)
+        self.assertEqual(membership.last_read_message_id, conversation.last_message_id)
+
+    def test_summaries_newest_first_in_one_query(self):
+        self.send(self.alice, self.bob, 'to bob')
+        self.send(self.carol, self.alice, 'secret', face_locked=True)
+
+        summaries = get_conversation_summaries(self.alice.id)
+        self.assertEqual([s['peer']['username'] for s in summaries], ['carol', 'bob'])
+        self.assertEqual(summaries[0]['unread_count'], 1)
+        self.assertIsNone(summaries[0]['last_message']['content'])
+        self.assertEqual(summaries[1]['last_message']['content'], 'to bob')
+        self.assertEqual(summaries[1]['unread_count'], 0)
+
+    def test_conversations_endpoint(self):
+        self.send(self.bob, self.alice, 'ping')
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(self.alice.id)
+            sess['_fresh'] = True
+
+        data = client.get('/conversations').get_json()
+        self.assertEqual(data['conversations'][0]['unread_count'], 1)
+
+        response = client.post('/mark_read', json={'recipient_id': self.bob.id})
+        self.assertEqual(response.get_json()['unread_count'], 0)
+
+    def test_chat_page_leaves_summaries_to_the_client(self):
+        self.send(self.bob, self.alice, 'ping')
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(self.alice.id)
+            sess['_fresh'] = True
+
+        statements = []
+        record = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            self.assertEqual(client.get('/chat').status_code, 200)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertFalse(any('membership' in statement for statement in statements))
+
+
+if __name__ == '__main__':
+    unittest.main()
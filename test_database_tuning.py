@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Tests for the SQLite engine tuning layer (WAL, pragmas, pools, read sessions)
+"""
+import sys
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool, StaticPool
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models.models import User
+from app.utils.database import read_engine, read_session, sqlite_pragmas
+from config import TestConfig
+
+
+class FileDatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        class FileConfig(TestConfig):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(self.directory, 'tuning.db')
+            DATABASE_POOL_SIZE = 4
+            DATABASE_READ_POOL_SIZE = 2
+
+        self.app = create_app(FileConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add(User(username='alice', password_hash='hashed_password'))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        read_engine().dispose()
+        db.engine.dispose()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def pragma(self, connection, name):
+        return connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+
+    def test_connections_are_tuned(self):
+        self.assertIsInstance(db.engine.pool, QueuePool)
+        self.assertEqual(db.engine.pool.size(), 4)
+        with db.engine.connect() as connection:
+            self.assertEqual(self.pragma(connection, 'journal_mode'), 'wal')
+            self.assertEqual(self.pragma(connection, 'synchronous'), 1)  # NORMAL
+            self.assertEqual(self.pragma(connection, 'busy_timeout'), 5000)
+            self.assertEqual(self.pragma(connection, 'cache_size'), -16 * 1024)
+            self.assertEqual(self.pragma(connection, 'query_only'), 0)
+
+    def test_read_session_uses_its_own_query_only_pool(self):
+        engine = read_engine()
+        self.assertIsNot(engine, db.engine)
+        self.assertEqual(engine.pool.size(), 2)
+
+        with read_session() as session:
+            self.assertEqual(session.scalars(select(User.username)).all(), ['alice'])
+            with self.assertRaises(OperationalError):
+                session.execute(text("UPDATE user SET username = 'mallory'"))
+
+    def test_readers_are_not_blocked_by_an_open_write(self):
+        writer = db.engine.connect()
+        transaction = writer.begin()
+        writer.execute(text("INSERT INTO user (username, password_hash) VALUES ('bob', 'x')"))
+
+        seen = []
+
+        def read():
+            with self.app.app_context(), read_session() as session:
+                seen.append(session.scalar(text('SELECT count(*) FROM user')))
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join(timeout=2)
+        # WAL readers see the last committed state instead of waiting
+        self.assertEqual(seen, [1])
+        transaction.commit()
+        writer.close()
+
+        with read_session() as session:
+            self.assertEqual(session.scalar(text('SELECT count(*) FROM user')), 2)
+
+
+class MemoryDatabaseTestCase(unittest.TestCase):
+    def test_in_memory_database_keeps_a_single_connection(self):
+        app = create_app(TestConfig)
+        with app.app_context():
+            self.assertIsInstance(db.engine.pool, StaticPool)
+            self.assertIs(read_engine(), db.engine)
+            self.assertFalse(any('journal_mode' in pragma
+                                 for pragma in sqlite_pragmas(app.config, db.engine.url)))
+
+
+if __name__ == '__main__':
+    unittest.main()
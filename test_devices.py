@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Tests for device fingerprints, their parse cache and per-user known devices
+"""
+import sys
+import os
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models.models import User, KnownDevice
+from app.security.devices import DeviceRegistry, devices, parse_user_agent
+from app.security.logins import record_login
+from app.security.security_ai import get_device_state, get_risk_details
+from config import TestConfig
+
+NOW = datetime(2026, 3, 1, 12, 0)
+
+FIREFOX_120 = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:120.0) Gecko/20100101 Firefox/120.0'
+FIREFOX_121 = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0'
+IPHONE = ('Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 '
+          '(KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1')
+EDGE = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+        'Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0')
+
+
+class FingerprintTestCase(unittest.TestCase):
+    def test_user_agents_are_normalized(self):
+        firefox = parse_user_agent(FIREFOX_120)
+        self.assertEqual(firefox[1:], ('desktop', 'Firefox', 'Windows'))
+        # Versions are not part of the fingerprint
+        self.assertEqual(parse_user_agent(FIREFOX_121), firefox)
+        self.assertEqual(parse_user_agent(IPHONE)[1:], ('mobile', 'Safari', 'iOS'))
+        self.assertEqual(parse_user_agent(EDGE)[1:], ('desktop', 'Edge', 'Windows'))
+        self.assertEqual(parse_user_agent('curl/8.0')[1:], ('uncommon', 'curl', 'Other'))
+        self.assertEqual(parse_user_agent('')[1:], ('uncommon', 'Other', 'Other'))
+        self.assertNotEqual(parse_user_agent(EDGE).id, firefox.id)
+
+    def test_parse_cache_is_bounded(self):
+        registry = DeviceRegistry(parse_cache_size=2)
+        for user_agent in (FIREFOX_120, FIREFOX_120, IPHONE, EDGE, FIREFOX_120):
+            registry.parse(user_agent)
+
+        stats = registry.stats()
+        self.assertEqual((stats['parse_hits'], stats['parse_misses']), (1, 4))
+        self.assertEqual(stats['parse_cache_size'], 2)
+
+
+class KnownDeviceTestCase(unittest.TestCase):
+    def setUp(self):
+        class DeviceConfig(TestConfig):
+            KNOWN_DEVICES_PER_USER = 2
+
+        self.app = create_app(DeviceConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = User(username='alice', password_hash='hashed_password')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def device_state(self, user_agent):
+        with self.app.test_request_context(headers={'User-Agent': user_agent}):
+            return get_device_state(self.user)
+
+    def device_risk(self, user_agent):
+        with self.app.test_request_context(headers={'User-Agent': user_agent}):
+            return get_risk_details('alice')['risk_factors']['device_risk']['score']
+
+    def test_known_device_lowers_device_risk(self):
+        self.assertEqual(self.device_risk(FIREFOX_120), 0.3)
+        self.assertEqual(self.device_risk(IPHONE), 0.6)
+
+        self.assertEqual(record_login(self.user.id, '10.0.0.1', IPHONE).device_class, 'mobile')
+        # The cached assessment was dropped with the new device
+        self.assertEqual(self.device_risk(IPHONE), 0.2)
+        self.assertEqual(self.device_state(FIREFOX_120), 'desktop')
+
+        record_login(self.user.id, '10.0.0.1', FIREFOX_120)
+        self.assertEqual(self.device_state(FIREFOX_121), 'known')
+
+    def test_devices_are_kept_per_user_most_recent_first(self):
+        for minute, user_agent in enumerate((FIREFOX_120, IPHONE, FIREFOX_121, EDGE)):
+            record_login(self.user.id, '10.0.0.1', user_agent, now=NOW + timedelta(minutes=minute))
+
+        known = devices.known_devices(self.user.id)
+        self.assertEqual([(device.browser, device.logins) for device in known], [('Edge', 1), ('Firefox', 2)])
+        self.assertEqual(KnownDevice.query.count(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
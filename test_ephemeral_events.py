@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Tests for ephemeral typing/read events and their server-side coalescing
+"""
+import sys
+import os
+import unittest
+from sqlalchemy import event
+from flask import g
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db, socketio
+from app.models.models import User, Message
+from app.messaging.ephemeral import EphemeralChannel, ephemeral_channel
+from config import TestConfig
+from testing_utils import FakeClock
+
+
+class EphemeralChannelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        self.clock = FakeClock()
+        self.channel = EphemeralChannel(emit=lambda event, payload, room: self.sent.append((room, payload)),
+                                        clock=self.clock)
+        self.channel.interval = 0.5
+        self.channel.stale_after = 3
+
+    def test_burst_is_coalesced_to_latest_state(self):
+        key = (1, 'user_2', 'typing')
+        self.assertTrue(self.channel.publish(key, 'user_2', {'state': True}))
+        for i in range(50):
+            self.clock.now += 0.005
+            self.assertFalse(self.channel.publish(key, 'user_2', {'state': i % 2 == 0}))
+        self.assertEqual(len(self.sent), 1)
+
+        # Nothing goes out before the interval ends, then only the latest state
+        self.assertEqual(self.channel.flush_due(), 0)
+        self.clock.now = 1000.5
+        self.assertEqual(self.channel.flush_due(), 1)
+        self.assertEqual(self.sent[-1], ('user_2', {'state': False}))
+
+        stats = self.channel.stats()
+        self.assertEqual((stats['received'], stats['emitted'], stats['coalesced']), (51, 2, 49))
+
+    def test_keys_are_throttled_independently(self):
+        self.channel.publish((1, 'user_2', 'typing'), 'user_2', {'state': True})
+        self.channel.publish((1, 'conv_9', 'typing'), 'conv_9', {'state': True})
+        self.channel.publish((3, 'user_2', 'typing'), 'user_2', {'state': True})
+        self.assertEqual(len(self.sent), 3)
+
+    def test_stale_events_are_dropped(self):
+        key = (1, 'user_2', 'typing')
+        self.channel.publish(key, 'user_2', {'state': True})
+        self.clock.now += 0.1
+        self.channel.publish(key, 'user_2', {'state': False})
+        # The flush loop stalled past the stale limit
+        self.clock.now += 5
+        self.assertEqual(self.channel.flush_due(), 0)
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(self.channel.stats()['dropped_stale'], 1)
+        self.assertEqual(self.channel.stats()['tracked_keys'], 0)
+
+    def test_pending_is_bounded(self):
+        self.channel.max_pending = 2
+        for user_id in range(5):
+            self.channel.publish((user_id, 'r', 'typing'), 'r', {})
+            self.channel.publish((user_id, 'r', 'typing'), 'r', {})
+        stats = self.channel.stats()
+        self.assertEqual(stats['pending'], 2)
+        self.assertEqual(stats['dropped_overflow'], 3)
+
+
+class EphemeralSocketTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.alice = User(username='alice', password_hash='hashed_password')
+        self.bob = User(username='bob', password_hash='hashed_password')
+        db.session.add_all([self.alice, self.bob])
+        db.session.commit()
+        # The channel is shared by every app in the process
+        ephemeral_channel._last_emit.clear()
+        ephemeral_channel._pending.clear()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def connect(self, user):
+        g.pop('_login_user', None)
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user.id)
+            sess['_fresh'] = True
+        return socketio.test_client(self.app, flask_test_client=client)
+
+    def emit(self, socket_client, *args):
+        # Socket handlers run in the test's app context
+        g.pop('_login_user', None)
+        socket_client.emit(*args)
+
+    def received(self, socket_client):
+        return [packet['args'][0] for packet in socket_client.get_received() if packet['name'] == 'ephemeral']
+
+    def test_typing_reaches_peer_without_touching_the_database(self):
+        alice, bob = self.connect(self.alice), self.connect(self.bob)
+        bob.get_received()
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            for _ in range(20):
+                self.emit(alice, 'ephemeral', {'recipient_id': self.bob.id, 'kind': 'typing', 'state': True})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        events = self.received(bob)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['sender_username'], 'alice')
+        self.assertTrue(events[0]['state'])
+        self.assertFalse([s for s in statements if not s.lstrip().upper().startswith('SELECT')])
+        self.assertEqual(Message.query.count(), 0)
+
+        # Clients cannot forge read indicators or unknown kinds
+        self.emit(alice, 'ephemeral', {'recipient_id': self.bob.id, 'kind': 'read', 'state': 5})
+        self.emit(alice, 'ephemeral', {'recipient_id': self.bob.id, 'kind': 'shout'})
+        ephemeral_channel.flush_due()
+        self.assertEqual(self.received(bob), [])
+
+    def test_mark_read_publishes_read_indicator(self):
+        alice, bob = self.connect(self.alice), self.connect(self.bob)
+        self.emit(alice, 'send_message', {'recipient_id': self.bob.id, 'content': 'hello'})
+        alice.get_received()
+
+        self.emit(bob, 'mark_read', {'recipient_id': self.alice.id})
+        events = self.received(alice)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['kind'], 'read')
+        self.assertEqual(events[0]['state'], Message.query.one().id)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Tests for group conversations and their room fan-out
+"""
+import sys
+import os
+import io
+import re
+import unittest
+from contextlib import contextmanager
+from sqlalchemy import event
+from flask import g
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db, socketio
+from app.models.models import User, Message, Membership
+from app.messaging.groups import membership_cache, create_group
+from config import TestConfig
+
+
+@contextmanager
+def count_queries():
+    """Count the SQL statements executed inside the block"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+class GroupConversationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.users = [User(username=f'user{i}', password_hash='hashed_password') for i in range(60)]
+        db.session.add_all(self.users)
+        db.session.commit()
+        self.alice, self.bob, self.carol, self.dave = self.users[:4]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self, user):
+        # Requests share the test's app context, so drop Flask-Login's cached user
+        g.pop('_login_user', None)
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user.id)
+            sess['_fresh'] = True
+        return client
+
+    def connect(self, user):
+        return socketio.test_client(self.app, flask_test_client=self.login(user))
+
+    def emit(self, socket_client, *args, **kwargs):
+        # Socket handlers also run in the test's app context
+        g.pop('_login_user', None)
+        return socket_client.emit(*args, **kwargs)
+
+    def received(self, socket_client, name):
+        return [packet['args'][0] for packet in socket_client.get_received() if packet['name'] == name]
+
+    def new_group(self, members, title='team'):
+        response = self.login(self.alice).post('/groups', json={
+            'title': title, 'member_ids': [user.id for user in members]
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.get_json()['conversation_id']
+
+    def test_create_group_adds_creator_and_skips_unknown_users(self):
+        group = create_group(self.alice.id, ' team ', [self.bob.id, self.carol.id, 9999])
+        db.session.commit()
+        self.assertTrue(group.is_group)
+        self.assertEqual(group.title, 'team')
+        self.assertIsNone(group.user_low_id)
+        self.assertEqual(membership_cache.members(group.id), {self.alice.id, self.bob.id, self.carol.id})
+
+        response = self.login(self.alice).post('/groups', json={'title': '', 'member_ids': []})
+        self.assertEqual(response.status_code, 400)
+
+    def test_group_message_is_emitted_once_to_members(self):
+        group_id = self.new_group([self.bob, self.carol])
+        alice, bob, dave = self.connect(self.alice), self.connect(self.bob), self.connect(self.dave)
+        for client in (alice, bob, dave):
+            client.get_received()
+
+        ack = self.emit(alice, 'send_message', {'conversation_id': group_id, 'content': 'hi team'}, callback=True)
+        self.assertTrue(ack['success'])
+
+        for client in (alice, bob):
+            messages = self.received(client, 'new_message')
+            self.assertEqual([m['content'] for m in messages], ['hi team'])
+            self.assertIsNone(messages[0]['recipient_id'])
+        self.assertEqual(self.received(dave, 'new_message'), [])
+
+        # Non-members and face-locked group messages are refused
+        ack = self.emit(dave, 'send_message', {'conversation_id': group_id, 'content': 'let me in'}, callback=True)
+        self.assertFalse(ack['success'])
+        ack = self.emit(bob, 'send_message', {'conversation_id': group_id, 'content': 'secret', 'face_locked': True},
+                        callback=True)
+        self.assertFalse(ack['success'])
+        self.assertEqual(Message.query.filter_by(conversation_id=group_id).count(), 1)
+
+    def test_send_cost_does_not_grow_with_group_size(self):
+        bob_id = self.bob.id
+        small = self.new_group(self.users[1:3], title='small')
+        large = self.new_group(self.users[1:], title='large')
+        alice = self.connect(self.alice)
+
+        counts = []
+        for group_id in (small, large):
+            # Warm the member cache so both sends take the cached path
+            self.emit(alice, 'send_message', {'conversation_id': group_id, 'content': 'warm up'}, callback=True)
+            db.session.remove()
+            with count_queries() as statements:
+                self.emit(alice, 'send_message', {'conversation_id': group_id, 'content': 'hello'}, callback=True)
+            counts.append(len(statements))
+            self.assertFalse(any('SELECT membership.user_id' in statement for statement in statements))
+
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(Membership.query.filter_by(conversation_id=large, user_id=bob_id).one().unread_count, 2)
+
+    def test_shared_summary_update_and_per_member_unread(self):
+        group_id = self.new_group([self.bob])
+        bob = self.connect(self.bob)
+        bob.get_received()
+        self.emit(self.connect(self.alice), 'send_message', {'conversation_id': group_id, 'content': 'one'})
+
+        updates = self.received(bob, 'conversation_update')
+        self.assertEqual(len(updates), 1)
+        self.assertTrue(updates[0]['is_group'])
+        self.assertIsNone(updates[0]['unread_count'])
+        self.assertIsNone(updates[0]['peer'])
+
+        summaries = self.login(self.bob).get('/conversations').get_json()['conversations']
+        self.assertEqual(summaries[0]['title'], 'team')
+        self.assertEqual(summaries[0]['unread_count'], 1)
+
+        response = self.login(self.bob).post('/mark_read', json={'conversation_id': group_id})
+        self.assertEqual(response.get_json()['unread_count'], 0)
+
+    def test_history_is_limited_to_members(self):
+        group_id = self.new_group([self.bob])
+        alice = self.connect(self.alice)
+        for i in range(5):
+            self.emit(alice, 'send_message', {'conversation_id': group_id, 'content': f'msg {i}'})
+
+        data = self.login(self.bob).get(f'/get_messages?conversation_id={group_id}&limit=3').get_json()
+        self.assertEqual([m['content'] for m in data['messages']], ['msg 2', 'msg 3', 'msg 4'])
+        self.assertTrue(data['has_more'])
+
+        response = self.login(self.dave).get(f'/get_messages?conversation_id={group_id}')
+        self.assertEqual(response.status_code, 404)
+
+    def test_added_members_join_the_room_and_leavers_drop_out(self):
+        group_id = self.new_group([self.bob])
+        alice, carol = self.connect(self.alice), self.connect(self.carol)
+
+        response = self.login(self.alice).post(f'/groups/{group_id}/members',
+                                               json={'user_ids': [self.carol.id, self.bob.id]})
+        self.assertEqual(response.get_json()['added'], [self.carol.id])
+        carol.get_received()
+        self.emit(alice, 'send_message', {'conversation_id': group_id, 'content': 'welcome'})
+        self.assertEqual([m['content'] for m in self.received(carol, 'new_message')], ['welcome'])
+
+        self.assertTrue(self.login(self.carol).post(f'/groups/{group_id}/leave').get_json()['success'])
+        self.assertEqual(len(self.received(carol, 'conversation_removed')), 1)
+        self.emit(alice, 'send_message', {'conversation_id': group_id, 'content': 'bye'})
+        self.assertEqual(self.received(carol, 'new_message'), [])
+        self.assertNotIn(self.carol.id, membership_cache.members(group_id))
+
+    def test_chat_page_token_creates_a_group(self):
+        # What the New Group button does: read the chat page's csrf-token meta tag and post it back
+        self.app.config['WTF_CSRF_ENABLED'] = True
+        client = self.login(self.alice)
+        page = client.get('/chat').get_data(as_text=True)
+        token = re.search(r'<meta name="csrf-token" content="([^"]+)"', page).group(1)
+
+        g.pop('_login_user', None)
+        response = client.post('/groups', json={'title': 'team', 'member_ids': [self.bob.id]})
+        self.assertEqual(response.status_code, 400)
+        g.pop('_login_user', None)
+        response = client.post('/groups', json={'title': 'team', 'member_ids': [self.bob.id]},
+                               headers={'X-CSRFToken': token})
+        self.assertEqual(response.status_code, 201)
+
+    def test_non_numeric_conversation_ids_are_rejected(self):
+        for payload in ({'conversation_id': 'abc'}, {'recipient_id': 'abc'}):
+            response = self.login(self.alice).post('/mark_read', json=payload)
+            self.assertEqual(response.status_code, 400)
+
+        response = self.login(self.alice).post('/upload_file', data={
+            'conversation_id': 'abc', 'file': (io.BytesIO(b'data'), 'notes.txt')
+        })
+        self.assertEqual(response.status_code, 400)
+
+        alice = self.connect(self.alice)
+        ack = self.emit(alice, 'mark_read', {'conversation_id': 'abc'}, callback=True)
+        self.assertFalse(ack['success'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Tests for the cached Flask-Login user loader and per-socket identities
+"""
+import sys
+import os
+import unittest
+from contextlib import contextmanager
+from sqlalchemy import event
+from flask import g
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db, socketio
+from app.models.models import User
+from app.auth.identity import IdentityCache, UserSnapshot, identity_cache
+from config import TestConfig
+from testing_utils import FakeClock
+
+
+@contextmanager
+def count_user_queries():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM "user"' in statement or 'FROM user' in statement:
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+class IdentityCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.alice = User(username='alice', password_hash='hashed_password')
+        self.bob = User(username='bob', password_hash='hashed_password')
+        db.session.add_all([self.alice, self.bob])
+        db.session.commit()
+        self.alice_id, self.bob_id = self.alice.id, self.bob.id
+        # Start from an empty identity map so loads have to hit the database
+        db.session.remove()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def client_for(self, user_id):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+            sess['_fresh'] = True
+        return client
+
+    def get(self, client, url):
+        # Requests share the test's app context, so drop Flask-Login's per-request user
+        g.pop('_login_user', None)
+        return client.get(url)
+
+    def test_requests_reuse_the_cached_snapshot(self):
+        client = self.client_for(self.alice_id)
+        with count_user_queries() as statements:
+            for _ in range(5):
+                self.assertEqual(self.get(client, '/conversations').status_code, 200)
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(identity_cache.stats()['hits'], 4)
+
+    def test_user_changes_and_logout_invalidate(self):
+        client = self.client_for(self.alice_id)
+        self.assertIn(b'Welcome, alice', self.get(client, '/chat').data)
+
+        user = db.session.get(User, self.alice_id)
+        user.username = 'alice_renamed'
+        db.session.commit()
+        self.assertIn(b'Welcome, alice_renamed', self.get(client, '/chat').data)
+
+        self.get(client, '/logout')
+        self.assertNotIn(self.alice_id, identity_cache._entries)
+
+    def test_socket_events_reuse_the_connection_identity(self):
+        g.pop('_login_user', None)
+        socket_client = socketio.test_client(self.app, flask_test_client=self.client_for(self.alice_id))
+        with count_user_queries() as statements:
+            for _ in range(10):
+                g.pop('_login_user', None)
+                socket_client.emit('ephemeral', {'recipient_id': self.bob_id, 'kind': 'typing', 'state': True})
+        self.assertEqual(statements, [])
+        self.assertGreaterEqual(identity_cache.stats()['connection_hits'], 10)
+
+        # A change to the user is picked up on the next event
+        db.session.get(User, self.alice_id).username = 'alice2'
+        db.session.commit()
+        self.assertEqual(identity_cache.stats()['connections'], 0)
+        g.pop('_login_user', None)
+        socket_client.emit('ephemeral', {'recipient_id': self.bob_id, 'kind': 'typing', 'state': False})
+        self.assertEqual(identity_cache.stats()['connections'], 1)
+
+        g.pop('_login_user', None)
+        socket_client.disconnect()
+        self.assertEqual(identity_cache.stats()['connections'], 0)
+
+    def test_ttl_and_lru_bounds(self):
+        clock = FakeClock()
+        cache = IdentityCache(ttl=10, max_entries=1, clock=clock)
+        self.assertEqual(cache.get(self.alice_id).username, 'alice')
+        self.assertIs(cache.get(self.alice_id), cache.get(self.alice_id))
+
+        clock.now += 11
+        cache.get(self.alice_id)
+        self.assertEqual(cache.misses, 2)
+
+        cache.get(self.bob_id)
+        self.assertEqual(list(cache._entries), [self.bob_id])
+        self.assertIsNone(cache.get(999))
+
+    def test_snapshot_is_read_only(self):
+        snapshot = UserSnapshot.from_user(self.alice)
+        self.assertEqual(snapshot.get_id(), str(self.alice_id))
+        self.assertTrue(snapshot.is_authenticated)
+        with self.assertRaises(AttributeError):
+            snapshot.face_verification_enabled = True
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Tests for the IP reputation index, its atomic refresh and per-user login networks
+"""
+import sys
+import os
+import ipaddress
+import random
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models.models import User, KnownNetwork
+from app.security.ip_reputation import (
+    IPReputation, IPReputationError, Reputation, build_index, read_sources, ReputationIndex,
+    ip_reputation, known_networks
+)
+from app.security.logins import record_login
+from app.security.security_ai import get_location_state, get_risk_details
+from config import TestConfig
+from testing_utils import FakeClock
+
+NOW = datetime(2026, 3, 1, 12, 0)
+
+DATASET = """network,category,asn,country
+# Country and ASN ranges
+10.0.0.0/8,,64500,us
+10.1.0.0/16,tor,64501,US
+10.1.2.3/32,blocklist,64501,US
+10.2.0.0/16,,64502,DE
+2001:db8::/32,,64510,FR
+2001:db8:ff::/48,proxy,64511,FR
+"""
+
+
+class ReputationIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.source = self.write_source('dataset.csv', DATASET)
+        self.path = os.path.join(self.tmp, 'ip_reputation.idx')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write_source(self, name, text):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_most_specific_network_wins(self):
+        build_index(read_sources([self.source]), self.path)
+        index = ReputationIndex(self.path)
+
+        self.assertEqual(index.lookup('10.0.0.0'), Reputation(None, 64500, 'US'))
+        self.assertEqual(index.lookup('10.1.2.2'), Reputation('tor', 64501, 'US'))
+        self.assertEqual(index.lookup('10.1.2.3'), Reputation('blocklist', 64501, 'US'))
+        self.assertEqual(index.lookup('10.1.2.4'), Reputation('tor', 64501, 'US'))
+        self.assertEqual(index.lookup('10.2.255.255'), Reputation(None, 64502, 'DE'))
+        self.assertEqual(index.lookup('10.255.255.255'), Reputation(None, 64500, 'US'))
+        self.assertEqual(index.lookup('2001:db8:ff:1::5'), Reputation('proxy', 64511, 'FR'))
+        self.assertEqual(index.lookup('2001:db8:1::5'), Reputation(None, 64510, 'FR'))
+        self.assertIsNone(index.lookup('11.0.0.0'))
+        self.assertIsNone(index.lookup('9.255.255.255'))
+        self.assertIsNone(index.lookup('::1'))
+        self.assertIsNone(index.lookup('not an address'))
+
+    def test_lookups_match_a_linear_scan(self):
+        rng = random.Random(45)
+        networks = []
+        for i in range(300):
+            prefix = rng.randint(8, 32)
+            address = ipaddress.IPv4Address(rng.getrandbits(8) << 24 | rng.getrandbits(24) & 0x00ff0000)
+            networks.append((ipaddress.ip_network(f'{address}/{prefix}', strict=False),
+                             Reputation(rng.choice(['tor', 'blocklist', None]), i, None)))
+        build_index(networks, self.path)
+        index = ReputationIndex(self.path)
+
+        for _ in range(2000):
+            address = ipaddress.IPv4Address(rng.choice(networks)[0].network_address + rng.randint(-2, 300))
+            covering = [(network.prefixlen, i) for i, (network, _) in enumerate(networks) if address in network]
+            expected = networks[max(covering)[1]][1] if covering else None
+            self.assertEqual(index.lookup(str(address)), expected, str(address))
+
+    def test_malformed_rows_are_rejected(self):
+        source = self.write_source('broken.csv', '10.0.0.0/8,,64500,US\n10.0.0.300/32,tor,,\n')
+        with self.assertRaises(IPReputationError):
+            build_index(read_sources([source]), self.path)
+
+    def test_replaced_index_is_picked_up_atomically(self):
+        build_index(read_sources([self.source]), self.path)
+        clock = FakeClock()
+        reputation = IPReputation(clock=clock)
+        reputation.configure(self.path)
+        self.assertEqual(reputation.lookup('10.3.0.1').country, 'US')
+
+        override = self.write_source('override.csv', '10.3.0.0/16,blocklist,,NL\n')
+        self.assertEqual(reputation.refresh([self.source, override]), 10)
+        self.assertEqual(reputation.lookup('10.3.0.1'), Reputation('blocklist', None, 'NL'))
+
+        # A file that is not an index is reported and the current one kept
+        with open(self.path + '.tmp', 'wb') as f:
+            f.write(b'garbage')
+        os.replace(self.path + '.tmp', self.path)
+        clock.now += reputation.reload_seconds
+        self.assertEqual(reputation.lookup('10.3.0.1'), Reputation('blocklist', None, 'NL'))
+
+        stats = reputation.stats()
+        self.assertEqual(stats['reloads'], 2)
+        self.assertEqual(stats['reload_errors'], 1)
+        self.assertEqual(stats['ranges'], 10)
+        self.assertEqual(stats['lookups'], 3)
+        self.assertEqual(stats['hits'], 3)
+
+
+class LocationRiskTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        source = os.path.join(self.tmp, 'dataset.csv')
+        with open(source, 'w') as f:
+            f.write(DATASET)
+        path = os.path.join(self.tmp, 'ip_reputation.idx')
+        build_index(read_sources([source]), path)
+
+        class ReputationConfig(TestConfig):
+            IP_REPUTATION_PATH = path
+            KNOWN_NETWORKS_PER_USER = 3
+
+        self.app = create_app(ReputationConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = User(username='alice', password_hash='hashed_password')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        ip_reputation.configure(None)
+        shutil.rmtree(self.tmp)
+
+    def location_risk(self, ip):
+        with self.app.test_request_context(environ_base={'REMOTE_ADDR': ip}):
+            return get_risk_details('alice')['risk_factors']['unusual_location']['score']
+
+    def location_state(self, ip):
+        with self.app.test_request_context(environ_base={'REMOTE_ADDR': ip}):
+            return get_location_state(self.user)
+
+    def test_reputation_and_history_set_location_risk(self):
+        self.assertEqual(self.location_risk('10.1.2.3'), 1.0)
+        self.assertEqual(self.location_risk('10.1.9.9'), 0.8)
+        self.assertEqual(self.location_risk('10.0.0.7'), 0.5)
+
+        record_login(self.user.id, '10.0.0.7', 'Mozilla/5.0 Firefox/120.0')
+        self.assertEqual(known_networks(self.user.id), {'10.0.0.0/24': 'US'})
+        # The cached assessment was dropped with the new login network
+        self.assertEqual(self.location_risk('10.0.0.7'), 0.2)
+        self.assertEqual(self.location_state('10.0.0.200'), 'known')
+        self.assertEqual(self.location_state('10.0.1.1'), 'new')
+        self.assertEqual(self.location_state('10.2.0.1'), 'new_country')
+        self.assertEqual(self.location_state('192.168.0.1'), 'new')
+
+    def test_history_keeps_most_recent_networks(self):
+        for minute, ip in enumerate(('10.0.1.1', '10.0.2.1', '10.0.1.2', '10.0.3.1', '10.0.4.1')):
+            record_login(self.user.id, ip, 'Mozilla/5.0 Firefox/120.0', now=NOW + timedelta(minutes=minute))
+
+        self.assertEqual(set(known_networks(self.user.id)), {'10.0.1.0/24', '10.0.3.0/24', '10.0.4.0/24'})
+        self.assertEqual(KnownNetwork.query.filter_by(network='10.0.1.0/24').one().logins, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
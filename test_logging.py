@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Tests for the queued, leveled JSON logging of the 'app' logger
+"""
+import sys
+import os
+import io
+import json
+import logging
+import queue
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app
+from app.utils.log import NonBlockingQueueHandler, SamplingFilter, log_system, parse_levels
+from config import TestConfig
+
+
+class LoggingTestConfig(TestConfig):
+    LOG_LEVEL = 'INFO'
+    LOG_LEVELS = 'app.routes=WARNING,app.security.audit=DEBUG'
+    LOG_FORMAT = 'json'
+    LOG_SAMPLE_RATES = {'message_sent': 0.25}
+
+
+class Expensive:
+    """An argument that records whether it was ever formatted."""
+
+    def __init__(self):
+        self.formatted = False
+
+    def __str__(self):
+        self.formatted = True
+        return 'expensive'
+
+
+class LoggingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+
+        class Config(LoggingTestConfig):
+            LOG_STREAM = self.stream
+
+        self.app = create_app(Config)
+        # Only what the test itself logs
+        log_system.flush()
+        self.stream.seek(0)
+        self.stream.truncate()
+
+    def tearDown(self):
+        log_system.shutdown()
+
+    def lines(self):
+        log_system.flush()
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_records_are_json_with_extra_fields(self):
+        logger = logging.getLogger('app.messaging.delivery')
+        logger.info('Delivered %d events to user_%s', 3, 7, extra={'event': 'delivered', 'user_id': 7})
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            logger.exception('Delivery failed')
+
+        delivered, failed = self.lines()
+        self.assertEqual(delivered['message'], 'Delivered 3 events to user_7')
+        self.assertEqual((delivered['level'], delivered['logger']), ('INFO', 'app.messaging.delivery'))
+        self.assertEqual((delivered['event'], delivered['user_id']), ('delivered', 7))
+        self.assertIn('ValueError: boom', failed['exception'])
+
+    def test_disabled_levels_are_never_formatted(self):
+        argument = Expensive()
+        logging.getLogger('app.messaging.delivery').debug('Queued %s', argument)
+        logging.getLogger('app.routes.socket_events').info('Connected %s', argument)
+        self.assertEqual(self.lines(), [])
+        self.assertFalse(argument.formatted)
+
+        logging.getLogger('app.security.audit').debug('Flushed %s', argument)
+        self.assertEqual([line['message'] for line in self.lines()], ['Flushed expensive'])
+        self.assertEqual(parse_levels(' app.routes = warning ,bad'), {'app.routes': 'WARNING'})
+
+    def test_high_frequency_events_are_sampled(self):
+        logger = logging.getLogger('app.routes.socket_events')
+        for i in range(8):
+            logger.warning('Message %d sent', i, extra={'event': 'message_sent'})
+        logger = logging.getLogger('app.messaging.summary')
+        for i in range(8):
+            logger.info('Message %d sent', i, extra={'event': 'message_sent'})
+
+        lines = self.lines()
+        # Warnings are always kept; one in four of the rest
+        self.assertEqual(len(lines), 10)
+        self.assertEqual([line['message'] for line in lines[8:]], ['Message 0 sent', 'Message 4 sent'])
+        self.assertEqual(lines[8]['sampled'], 4)
+        self.assertEqual(log_system.stats()['sampled_out'], 6)
+
+
+class QueueHandlerTestCase(unittest.TestCase):
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = NonBlockingQueueHandler(queue.Queue(2))
+        logger = logging.Logger('queue-test')
+        logger.addHandler(handler)
+        arguments = [1]
+        for i in range(5):
+            logger.info('Record %s', arguments)
+            arguments.append(i)
+
+        self.assertEqual(handler.dropped, 3)
+        # Messages are rendered when logged, not when written
+        self.assertEqual(handler.queue.get_nowait().getMessage(), 'Record [1]')
+
+    def test_sampling_rate_of_zero_drops_all(self):
+        sampling = SamplingFilter({'typing': 0})
+        record = logging.LogRecord('app', logging.INFO, __file__, 1, 'Typing', (), None)
+        record.event = 'typing'
+        self.assertFalse(sampling.filter(record))
+        self.assertEqual(sampling.sampled_out, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
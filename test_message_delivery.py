@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for the at-least-once message delivery queue
+"""
+import sys
+import os
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app.messaging.delivery import DeliveryQueue
+from testing_utils import FakeClock
+
+
+class DeliveryQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        self.clock = FakeClock()
+        self.queue = DeliveryQueue(emit=lambda event, payload, room: self.sent.append((event, payload['id'], room)),
+                                   clock=self.clock)
+        self.queue.retry_base = 2
+        self.queue.retry_max = 8
+        self.queue.max_attempts = 3
+
+    def test_online_delivery_until_ack(self):
+        self.queue.connected(7)
+        self.queue.deliver(7, 'new_message', {'id': 1})
+        self.assertEqual(self.sent, [('new_message', 1, 'user_7')])
+
+        # Nothing is due before the first backoff expires
+        self.clock.now += 1
+        self.assertEqual(self.queue.retry_due(), 0)
+        self.clock.now += 1
+        self.assertEqual(self.queue.retry_due(), 1)
+
+        self.assertEqual(self.queue.ack(7, [1]), 1)
+        self.clock.now += 100
+        self.assertEqual(self.queue.retry_due(), 0)
+        self.assertEqual(self.queue.stats()['pending_total'], 0)
+
+    def test_backoff_and_retry_limit(self):
+        self.queue.connected(7)
+        self.queue.deliver(7, 'new_message', {'id': 1})
+        resent_at = []
+        for _ in range(30):
+            self.clock.now += 1
+            if self.queue.retry_due():
+                resent_at.append(self.clock.now)
+        # Sent at t=1000, retried after 2s then 4s, then dropped on the third check
+        self.assertEqual(resent_at, [1002.0, 1006.0])
+        stats = self.queue.stats()
+        self.assertEqual(stats['pending_total'], 0)
+        self.assertEqual(stats['dropped_retries'], 1)
+
+    def test_offline_inbox_is_flushed_on_connect(self):
+        self.queue.deliver(7, 'new_message', {'id': 1})
+        self.queue.deliver(7, 'new_file', {'id': 2})
+        self.assertEqual(self.sent, [])
+        self.clock.now += 100
+        self.assertEqual(self.queue.retry_due(), 0)
+
+        self.assertEqual(self.queue.connected(7), 2)
+        self.assertEqual(self.sent, [('new_message', 1, 'user_7'), ('new_file', 2, 'user_7')])
+
+        self.queue.disconnected(7)
+        self.assertFalse(self.queue.is_online(7))
+
+    def test_queues_are_bounded(self):
+        self.queue.max_pending_per_user = 3
+        self.queue.max_pending_total = 5
+        for message_id in range(10):
+            self.queue.deliver(1, 'new_message', {'id': message_id})
+        self.assertEqual(self.queue.stats()['pending_total'], 3)
+
+        for message_id in range(3):
+            self.queue.deliver(2, 'new_message', {'id': message_id})
+        stats = self.queue.stats()
+        self.assertEqual(stats['pending_total'], 5)
+        self.assertEqual(stats['max_user_depth'], 3)
+        self.assertEqual(stats['dropped_overflow'], 8)
+
+        # The oldest events are the ones dropped
+        self.queue.connected(1)
+        self.assertEqual([message_id for _, message_id, _ in self.sent], [8, 9])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Tests for the message event schema and its negotiated wire encodings
+"""
+import sys
+import os
+import json
+import unittest
+from datetime import datetime
+from flask import g
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db, socketio
+from app.models.models import User, Message, Conversation, Membership
+from app.messaging import events
+from app.messaging.events import (
+    MESSAGE_EVENT_FIELDS, SCHEMA_VERSION, message_event, encode_event, decode_event, negotiate_encoding
+)
+from config import TestConfig
+
+
+def sample_event():
+    return message_event(id=42, sender_id=1, sender_username='alice', recipient_id='2',
+                         conversation_id=7, content='hello bob', timestamp=datetime(2025, 1, 1, 12, 30))
+
+
+class MessageEventCodecTestCase(unittest.TestCase):
+    def test_schema_has_every_field(self):
+        event = sample_event()
+        self.assertEqual(event['v'], SCHEMA_VERSION)
+        self.assertEqual(set(event) - {'v'}, set(MESSAGE_EVENT_FIELDS))
+        self.assertEqual(event['recipient_id'], 2)
+        self.assertEqual(event['timestamp'], '2025-01-01T12:30:00')
+
+    def test_json_encoding_is_the_event(self):
+        event = sample_event()
+        self.assertIs(encode_event(event, events.JSON), event)
+
+    @unittest.skipUnless(events.msgpack, 'msgpack not installed')
+    def test_msgpack_round_trip_is_smaller(self):
+        event = sample_event()
+        packed = encode_event(event, events.MSGPACK)
+        self.assertIsInstance(packed, bytes)
+        self.assertEqual(decode_event(packed), event)
+        self.assertLess(len(packed), len(json.dumps(event)) // 2)
+
+    def test_negotiation_falls_back_to_json(self):
+        self.assertEqual(negotiate_encoding(None), 'json')
+        self.assertEqual(negotiate_encoding({'encodings': ['cbor']}), 'json')
+        self.assertEqual(negotiate_encoding({'encodings': 'msgpack'}), 'json')
+        expected = 'msgpack' if events.msgpack else 'json'
+        self.assertEqual(negotiate_encoding({'encodings': ['msgpack', 'json']}), expected)
+
+
+class MessageEventSocketTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.alice = User(username='alice', password_hash='hashed_password')
+        self.bob = User(username='bob', password_hash='hashed_password')
+        db.session.add_all([self.alice, self.bob])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self, user):
+        # Requests share the test's app context, so drop Flask-Login's cached user
+        g.pop('_login_user', None)
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user.id)
+            sess['_fresh'] = True
+        return client
+
+    def connect(self, user, auth=None):
+        client = self.login(user)
+        return socketio.test_client(self.app, flask_test_client=client, auth=auth)
+
+    def received(self, socket_client, name):
+        return [packet['args'][0] for packet in socket_client.get_received() if packet['name'] == name]
+
+    @unittest.skipUnless(events.msgpack, 'msgpack not installed')
+    def test_each_socket_gets_its_negotiated_encoding(self):
+        bob_binary = self.connect(self.bob, auth={'encodings': ['msgpack', 'json']})
+        bob_json = self.connect(self.bob)
+        self.assertEqual(self.received(bob_binary, 'encoding')[0]['encoding'], 'msgpack')
+        self.assertEqual(self.received(bob_json, 'encoding')[0]['fields'], list(MESSAGE_EVENT_FIELDS))
+
+        client = self.login(self.alice)
+        response = client.post('/send_message', data={'recipient_id': self.bob.id, 'content': 'hi'})
+        self.assertTrue(response.get_json()['success'])
+
+        packed = self.received(bob_binary, 'new_message')
+        plain = self.received(bob_json, 'new_message')
+        self.assertEqual(len(packed), 1)
+        self.assertEqual(len(plain), 1)
+        self.assertIsInstance(packed[0], bytes)
+        self.assertEqual(decode_event(packed[0]), plain[0])
+        self.assertEqual(plain[0]['content'], 'hi')
+        self.assertEqual(plain[0]['sender_username'], 'alice')
+
+    def test_socket_and_http_payloads_share_the_schema(self):
+        alice = self.connect(self.alice)
+        alice.emit('send_message', {'recipient_id': self.bob.id, 'content': 'over socket'})
+        socket_event = self.received(alice, 'new_message')[0]
+
+        client = self.login(self.alice)
+        client.post('/send_message', data={'recipient_id': self.bob.id, 'content': 'over http'})
+        http_event = self.received(alice, 'new_message')[0]
+
+        self.assertEqual(set(socket_event), set(http_event))
+        self.assertEqual(http_event['conversation_id'], socket_event['conversation_id'])
+        self.assertEqual((socket_event['content'], http_event['content']), ('over socket', 'over http'))
+
+    def test_unknown_or_malformed_recipients_are_rejected(self):
+        alice = self.connect(self.alice)
+        alice.get_received()
+        for recipient_id in ('abc', '999', 999):
+            g.pop('_login_user', None)
+            ack = alice.emit('send_message', {'recipient_id': recipient_id, 'content': 'hi'}, callback=True)
+            self.assertEqual(ack, {'success': False, 'message': 'Recipient not found'})
+            g.pop('_login_user', None)
+            ack = alice.emit('new_file', {'recipient_id': recipient_id, 'file_url': '/static/uploads/a.txt',
+                                          'file_name': 'a.txt'}, callback=True)
+            self.assertFalse(ack['success'])
+        self.assertEqual(alice.get_received(), [])
+        self.assertEqual(Conversation.query.count(), 0)
+        self.assertEqual(Membership.query.count(), 0)
+
+        # A numeric string naming a real user still goes through, stored as the user's id
+        g.pop('_login_user', None)
+        alice.emit('send_message', {'recipient_id': str(self.bob.id), 'content': 'by string id'})
+        response = self.login(self.alice).post('/send_message', data={'recipient_id': f'{self.bob.id}.0',
+                                                                     'content': 'by float id'})
+        self.assertTrue(response.get_json()['success'])
+        self.assertEqual([(m.recipient_id, m.content) for m in Message.query.order_by(Message.id)],
+                         [(self.bob.id, 'by string id'), (self.bob.id, 'by float id')])
+        self.assertEqual(Conversation.query.count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Tests for cursor-based message history paging
+"""
+import sys
+import os
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from flask import g
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db, socketio
+from app.models.models import User, Message, Conversation
+from app.messaging.history import get_conversation_page, get_messages_since, decode_cursor, InvalidCursor
+from app.messaging.summary import record_message
+from app.auth.identity import identity_cache
+from config import TestConfig
+
+
+@contextmanager
+def count_queries():
+    """Count the SQL statements executed inside the block"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+class MessageHistoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.alice = User(username='alice', password_hash='hashed_password')
+        self.bob = User(username='bob', password_hash='hashed_password')
+        self.carol = User(username='carol', password_hash='hashed_password')
+        db.session.add_all([self.alice, self.bob, self.carol])
+        db.session.commit()
+
+        self.conversation = Conversation.get_or_create(self.bob.id, self.alice.id)
+        other = Conversation.get_or_create(self.alice.id, self.carol.id)
+        start = datetime(2025, 1, 1)
+        for i in range(25):
+            sender, recipient = (self.alice, self.bob) if i % 2 else (self.bob, self.alice)
+            for message in (Message(sender_id=sender.id, recipient_id=recipient.id,
+                                    conversation_id=self.conversation.id,
+                                    content=f'msg {i}', timestamp=start + timedelta(minutes=i)),
+                            Message(sender_id=self.alice.id, recipient_id=self.carol.id,
+                                    conversation_id=other.id,
+                                    content=f'other {i}', timestamp=start + timedelta(minutes=i))):
+                db.session.add(message)
+                db.session.flush()
+                record_message(message)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_conversation_pair_is_normalized(self):
+        self.assertEqual(Conversation.get_or_create(self.alice.id, self.bob.id).id, self.conversation.id)
+        self.assertEqual(Conversation.pair(5, 2), (2, 5))
+
+    def test_latest_page_then_walk_backward(self):
+        page = get_conversation_page(self.conversation.id, limit=10)
+        self.assertEqual([m.content for m in page['messages']], [f'msg {i}' for i in range(15, 25)])
+        self.assertTrue(page['has_more'])
+
+        seen = [m.content for m in page['messages']]
+        while page['has_more']:
+            page = get_conversation_page(self.conversation.id, before=page['before_cursor'], limit=10)
+            seen = [m.content for m in page['messages']] + seen
+        self.assertEqual(seen, [f'msg {i}' for i in range(25)])
+
+    def test_after_cursor_returns_newer_messages(self):
+        page = get_conversation_page(self.conversation.id, limit=5)
+        older = get_conversation_page(self.conversation.id, before=page['before_cursor'], limit=5)
+        newer = get_conversation_page(self.conversation.id, after=older['after_cursor'], limit=5)
+        self.assertEqual([m.id for m in newer['messages']], [m.id for m in page['messages']])
+        self.assertFalse(newer['has_more'])
+
+    def test_equal_timestamps_are_ordered_by_id(self):
+        same = datetime(2025, 2, 1)
+        ids = []
+        for i in range(4):
+            message = Message(sender_id=self.alice.id, recipient_id=self.bob.id,
+                              conversation_id=self.conversation.id, content=f'tie {i}', timestamp=same)
+            db.session.add(message)
+            db.session.commit()
+            ids.append(message.id)
+
+        first = get_conversation_page(self.conversation.id, limit=2)
+        second = get_conversation_page(self.conversation.id, before=first['before_cursor'], limit=2)
+        self.assertEqual([m.id for m in second['messages'] + first['messages']], ids)
+
+    def test_page_size_is_clamped(self):
+        self.app.config['MESSAGE_PAGE_SIZE_MAX'] = 7
+        page = get_conversation_page(self.conversation.id, limit=1000)
+        self.assertEqual(len(page['messages']), 7)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            decode_cursor('not-a-cursor')
+        with self.assertRaises(InvalidCursor):
+            get_conversation_page(self.conversation.id, before='a', after='b')
+
+    def test_get_messages_endpoint(self):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(self.alice.id)
+            sess['_fresh'] = True
+
+        response = client.get(f'/get_messages?recipient_id={self.bob.id}&limit=20')
+        data = response.get_json()
+        self.assertTrue(data['success'])
+        self.assertEqual(len(data['messages']), 20)
+        self.assertTrue(data['has_more'])
+
+        response = client.get(f"/get_messages?recipient_id={self.bob.id}&before={data['before_cursor']}")
+        self.assertEqual([m['content'] for m in response.get_json()['messages']],
+                         [f'msg {i}' for i in range(5)])
+
+        response = client.get(f'/get_messages?recipient_id={self.bob.id}&before=garbage')
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_messages_query_count_does_not_grow_with_page_size(self):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(self.alice.id)
+            sess['_fresh'] = True
+
+        bob_id = self.bob.id
+        counts = []
+        for limit in (2, 25):
+            # Requests share the test's app context, so drop Flask-Login's cached user;
+            # the identity cache is cleared so both requests load the user the same way
+            g.pop('_login_user', None)
+            identity_cache.clear()
+            db.session.remove()
+            with count_queries() as statements:
+                response = client.get(f'/get_messages?recipient_id={bob_id}&limit={limit}')
+            self.assertEqual(len(response.get_json()['messages']), limit)
+            counts.append(len(statements))
+
+        self.assertEqual(counts[0], counts[1])
+        # user loader, conversation lookup, page, usernames
+        self.assertLessEqual(counts[1], 4)
+        self.assertEqual(response.get_json()['messages'][0]['sender']['username'], 'bob')
+
+    def test_messages_since_returns_only_newer(self):
+        latest = get_conversation_page(self.conversation.id, limit=3)
+        since_id = latest['messages'][0].id
+        page = get_messages_since(self.conversation.id, since_id)
+        self.assertFalse(page['reset'])
+        self.assertEqual([m.content for m in page['messages']], ['msg 23', 'msg 24'])
+
+        # An id from another conversation cannot be resolved, so the client resets
+        foreign = Message.query.filter(Message.conversation_id != self.conversation.id).first()
+        page = get_messages_since(self.conversation.id, foreign.id, limit=5)
+        self.assertTrue(page['reset'])
+        self.assertEqual(page['messages'][-1].content, 'msg 24')
+
+    def test_socket_sync_sends_only_deltas(self):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(self.bob.id)
+            sess['_fresh'] = True
+        socket_client = socketio.test_client(self.app, flask_test_client=client)
+        self.assertTrue(socket_client.is_connected())
+
+        latest = get_conversation_page(self.conversation.id, limit=2)
+        cursors = {str(self.conversation.id): latest['messages'][0].id}
+        result = socket_client.emit('sync', {'cursors': cursors}, callback=True)
+        self.assertTrue(result['success'])
+        self.assertEqual(len(result['conversations']), 1)
+        synced = result['conversations'][0]
+        self.assertEqual([m['content'] for m in synced['messages']], ['msg 24'])
+        self.assertEqual(synced['peer']['username'], 'alice')
+
+        cursors = {str(self.conversation.id): synced['messages'][-1]['id']}
+        result = socket_client.emit('sync', {'cursors': cursors}, callback=True)
+        self.assertEqual(result['conversations'], [])
+        socket_client.disconnect()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Query-plan tests for message lookups
+Checks with EXPLAIN QUERY PLAN that message queries are served from indexes
+instead of scanning the message table.
+"""
+import sys
+import os
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models.models import Message
+from app.messaging.history import conversation_page_query, encode_cursor
+from app.messaging.summary import summary_query
+from config import TestConfig
+
+
+def explain(query):
+    """Return the EXPLAIN QUERY PLAN detail lines for an ORM query"""
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = db.session.connection().exec_driver_sql(
+        'EXPLAIN QUERY PLAN ' + str(compiled), params
+    ).fetchall()
+    return [row[-1] for row in rows]
+
+
+class MessageIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.cursor = encode_cursor(Message(id=10, timestamp=datetime(2025, 1, 1)))
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def assertNoTableScan(self, plan):
+        for line in plan:
+            self.assertFalse(line.startswith('SCAN message'), f"full scan in plan: {plan}")
+            self.assertFalse(line.startswith('SCAN conversation'), f"full scan in plan: {plan}")
+
+    def test_latest_page_uses_conversation_index(self):
+        plan = explain(conversation_page_query(1))
+        self.assertIn('USING INDEX ix_message_conversation_ts (conversation_id=?)', plan[0])
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_cursor_pages_seek_into_conversation_index(self):
+        for query in (conversation_page_query(1, before=self.cursor),
+                      conversation_page_query(1, after=self.cursor)):
+            plan = explain(query)
+            self.assertIn('ix_message_conversation_ts (conversation_id=? AND timestamp', plan[0])
+            self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_conversation_summaries_use_indexes(self):
+        plan = explain(summary_query(1))
+        self.assertNoTableScan(plan)
+        self.assertTrue(any('ix_membership_user' in line for line in plan))
+
+
+if __name__ == '__main__':
+    unittest.main()
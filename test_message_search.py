@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Tests for full-text message search and its incremental index
+"""
+import sys
+import os
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from flask import g
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models.models import User, Message, Conversation
+from app.messaging import search
+from app.messaging.search import search_messages, rebuild_search_index, InvertedIndex
+from config import TestConfig
+
+
+class MessageSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.alice = User(username='alice', password_hash='hashed_password')
+        self.bob = User(username='bob', password_hash='hashed_password')
+        self.carol = User(username='carol', password_hash='hashed_password')
+        db.session.add_all([self.alice, self.bob, self.carol])
+        db.session.commit()
+
+        self.with_bob = Conversation.get_or_create(self.alice.id, self.bob.id)
+        self.with_carol = Conversation.get_or_create(self.bob.id, self.carol.id)
+        self.start = datetime(2025, 1, 1)
+        self.add(self.alice, self.bob, self.with_bob, 'Lunch at the Noodle bar?')
+        self.add(self.bob, self.alice, self.with_bob, 'noodles sound great')
+        self.add(self.alice, self.bob, self.with_bob, 'secret noodle recipe', is_face_locked=True)
+        self.add(self.bob, self.carol, self.with_carol, 'noodle party without alice')
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add(self, sender, recipient, conversation, content, **kwargs):
+        message = Message(sender_id=sender.id, recipient_id=recipient.id, conversation_id=conversation.id,
+                          content=content, timestamp=self.start + timedelta(minutes=Message.query.count()),
+                          **kwargs)
+        db.session.add(message)
+        db.session.flush()
+        return message
+
+    def contents(self, results):
+        return [message.content for message in results['messages']]
+
+    def test_prefix_terms_within_own_conversations(self):
+        self.assertEqual(self.contents(search_messages(self.alice.id, 'NOODLE')),
+                         ['noodles sound great', 'Lunch at the Noodle bar?'])
+        self.assertEqual(self.contents(search_messages(self.alice.id, 'noodle bar')),
+                         ['Lunch at the Noodle bar?'])
+        self.assertEqual(self.contents(search_messages(self.carol.id, 'noodle')), ['noodle party without alice'])
+        self.assertEqual(self.contents(search_messages(self.alice.id, 'recipe')), [])
+
+    def test_query_syntax_is_not_passed_through(self):
+        for query in ('"noodle', 'noodle AND (', 'NEAR(noodle', '*', '---'):
+            search_messages(self.alice.id, query)
+        self.assertEqual(self.contents(search_messages(self.alice.id, 'lunch OR zzz')), [])
+
+    def test_pagination(self):
+        for i in range(5):
+            self.add(self.alice, self.bob, self.with_bob, f'ramen number {i}')
+        db.session.commit()
+
+        page = search_messages(self.alice.id, 'ramen', limit=2)
+        seen = self.contents(page)
+        while page['has_more']:
+            page = search_messages(self.alice.id, 'ramen', limit=2, before_id=page['next_before_id'])
+            seen += self.contents(page)
+        self.assertEqual(seen, [f'ramen number {i}' for i in reversed(range(5))])
+
+    def test_deleted_by_unlock_flow_leaves_the_index(self):
+        message = self.add(self.bob, self.alice, self.with_bob, 'self destructing dumpling', is_face_locked=False)
+        db.session.commit()
+        self.assertEqual(self.contents(search_messages(self.alice.id, 'dumpling')), ['self destructing dumpling'])
+
+        g.pop('_login_user', None)
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(self.alice.id)
+            sess['_fresh'] = True
+        for _ in range(3):
+            client.post('/face/unlock_item', json={'itemId': message.id, 'itemType': 'message', 'cancelled': True})
+
+        self.assertEqual(db.session.get(Message, message.id).content, 'MESSAGE DELETED')
+        self.assertEqual(self.contents(search_messages(self.alice.id, 'dumpling')), [])
+        self.assertEqual(self.contents(search_messages(self.alice.id, 'deleted')), [])
+
+    def test_rebuild_restores_a_lost_index(self):
+        db.session.execute(text('DELETE FROM message_fts'))
+        db.session.commit()
+        self.assertEqual(self.contents(search_messages(self.alice.id, 'noodles')), [])
+
+        self.assertEqual(rebuild_search_index(), 3)
+        self.assertEqual(self.contents(search_messages(self.alice.id, 'noodles')), ['noodles sound great'])
+
+    def test_search_endpoint(self):
+        g.pop('_login_user', None)
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(self.alice.id)
+            sess['_fresh'] = True
+
+        data = client.get(f'/search?q=noodle&recipient_id={self.bob.id}&limit=1').get_json()
+        self.assertEqual([m['content'] for m in data['messages']], ['noodles sound great'])
+        self.assertTrue(data['has_more'])
+        self.assertEqual(client.get('/search?q=').status_code, 400)
+
+    def test_in_process_fallback_matches_fts(self):
+        expected = self.contents(search_messages(self.alice.id, 'noodle'))
+        search._backends[db.engine] = 'memory'
+        search.memory_index.clear()
+        search.memory_index.loaded = False
+        try:
+            self.assertEqual(self.contents(search_messages(self.alice.id, 'noodle')), expected)
+            # Maintained incrementally once loaded
+            self.add(self.bob, self.alice, self.with_bob, 'more noodles please')
+            db.session.commit()
+            self.assertEqual(self.contents(search_messages(self.alice.id, 'noodle'))[0], 'more noodles please')
+        finally:
+            search._backends[db.engine] = 'fts5'
+            search.memory_index.clear()
+            search.memory_index.loaded = False
+
+
+class InvertedIndexTestCase(unittest.TestCase):
+    def test_prefix_and_removal(self):
+        index = InvertedIndex()
+        index.add(1, 'Hello world')
+        index.add(2, 'help wanted')
+        self.assertEqual(index.match(['hel']), {1, 2})
+        self.assertEqual(index.match(['hel', 'wor']), {1})
+        index.add(1, 'goodbye')
+        self.assertEqual(index.match(['hel']), {2})
+        index.remove(2)
+        self.assertEqual(index.match(['hel']), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Tests for the on-demand sampling profiler and its admin endpoint
+"""
+import sys
+import os
+import threading
+import time
+import unittest
+from flask import g
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models.models import User
+from app.utils.profiler import Profile, profiler, sample_stack
+from config import TestConfig
+
+
+class ProfilerTestConfig(TestConfig):
+    SECURITY_ADMINS = ['admin']
+    PROFILER_MAX_SECONDS = 5
+
+
+def wait_for_profile(timeout=5):
+    deadline = time.monotonic() + timeout
+    while profiler.current() is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return profiler.last()
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class ProfileTestCase(unittest.TestCase):
+    def test_stacks_are_tagged_by_innermost_subsystem(self):
+        # A function whose code claims to live in SQLAlchemy
+        namespace = {}
+        exec(compile('def execute(callback):\n    return callback()\n',
+                     '/venv/site-packages/sqlalchemy/engine/base.py', 'exec'), namespace)
+        tag, frames = namespace['execute'](lambda: sample_stack(sys._getframe()))
+        self.assertEqual(tag, 'db')
+        self.assertEqual(frames[-2:], ['base.py:execute', 'test_profiler.py:<lambda>'])
+
+        tag, frames = sample_stack(sys._getframe())
+        self.assertEqual((tag, frames[-1]), ('other', 'test_profiler.py:test_stacks_are_tagged_by_innermost_subsystem'))
+
+    def test_collapsed_stacks_and_top_functions(self):
+        profile = Profile(1, 0.01, 'all', 3, None)
+        for _ in range(3):
+            profile.add('db', ['app.py:wsgi_app', 'routes.py:chat', 'base.py:execute'])
+        profile.add('json', ['app.py:wsgi_app', 'routes.py:chat', 'encoder.py:encode'])
+        profile.add('other', ['app.py:wsgi_app', 'routes.py:index'])
+        profile.add('other', ['app.py:wsgi_app', 'routes.py:search'])
+
+        self.assertEqual(profile.collapsed().splitlines()[0], '[db];app.py:wsgi_app;routes.py:chat;base.py:execute 3')
+        # Distinct stacks are capped; the rest are counted as truncated
+        self.assertEqual((len(profile.stacks), profile.truncated), (4, 1))
+        top = profile.top(2)
+        self.assertEqual(top['self'][0], {'function': 'base.py:execute', 'samples': 3})
+        self.assertEqual([entry['function'] for entry in top['total']], ['app.py:wsgi_app', 'routes.py:chat'])
+        self.assertEqual(profile.tags, {'db': 3, 'json': 1, 'other': 2})
+
+
+class ProfilerEndpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(ProfilerTestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.alice = User(username='alice', password_hash='hashed_password')
+        self.admin = User(username='admin', password_hash='hashed_password')
+        db.session.add_all([self.alice, self.admin])
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        profiler.stop()
+        wait_for_profile()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def log_in(self, user):
+        g.pop('_login_user', None)
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(user.id)
+            sess['_fresh'] = True
+
+    def test_profile_samples_running_threads(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_loop, args=(stop,))
+        worker.start()
+        try:
+            profiler.start(0.2, interval=0.005, threads='all')
+            profile = wait_for_profile()
+        finally:
+            stop.set()
+            worker.join()
+
+        self.assertGreater(profile.ticks, 5)
+        self.assertIsNotNone(profile.finished_at)
+        functions = [entry['function'] for entry in profile.top(50)['total']]
+        self.assertIn('test_profiler.py:busy_loop', functions)
+
+    def test_intervals_are_bounded_by_the_run(self):
+        for interval in (float('nan'), float('inf'), 0.0005, 2):
+            with self.assertRaises(ValueError):
+                profiler.start(1, interval=interval)
+
+        # The last wait is cut short at the deadline instead of sleeping a full interval past it
+        started = time.monotonic()
+        profiler.start(0.5, interval=0.4, threads='all')
+        profile = wait_for_profile()
+        self.assertLess(time.monotonic() - started, 0.75)
+        self.assertEqual(profile.ticks, 2)
+
+    def test_only_admins_control_the_profiler(self):
+        self.log_in(self.alice)
+        self.assertEqual(self.client.post('/security/profiler', json={'seconds': 1}).status_code, 403)
+
+        self.log_in(self.admin)
+        self.assertEqual(self.client.post('/security/profiler', json={'seconds': 60}).status_code, 400)
+        for interval_ms in (3600000, 'nan'):
+            g.pop('_login_user', None)
+            response = self.client.post('/security/profiler', json={'seconds': 1, 'interval_ms': interval_ms})
+            self.assertEqual(response.status_code, 400)
+        g.pop('_login_user', None)
+        response = self.client.post('/security/profiler', json={'seconds': 2, 'interval_ms': 5, 'threads': 'all'})
+        self.assertEqual(response.status_code, 202)
+        g.pop('_login_user', None)
+        # One run at a time
+        self.assertEqual(self.client.post('/security/profiler', json={'seconds': 1}).status_code, 409)
+
+        profiler.stop()
+        wait_for_profile()
+        g.pop('_login_user', None)
+        body = self.client.get('/security/profiler').get_json()
+        self.assertFalse(body['running'])
+        self.assertEqual(body['profile']['threads'], 'all')
+        g.pop('_login_user', None)
+        collapsed = self.client.get('/security/profiler?format=collapsed').get_data(as_text=True)
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in collapsed.splitlines()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Tests for the retention job: message archival, face log pruning and compaction
+"""
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models.models import (User, Message, Conversation, FaceVerificationLog, FaceVerificationDaily,
+                               MessageArchive)
+from app.messaging.search import search_messages
+from app.messaging.summary import record_message, mark_read, get_conversation_summaries
+from app.utils.retention import RetentionJob, read_archive
+from config import TestConfig
+
+NOW = datetime(2025, 6, 1, 12, 0)
+
+
+class RetentionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.alice = User(username='alice', password_hash='hashed_password')
+        self.bob = User(username='bob', password_hash='hashed_password')
+        self.carol = User(username='carol', password_hash='hashed_password')
+        db.session.add_all([self.alice, self.bob, self.carol])
+        db.session.commit()
+        self.alice_id, self.bob_id = self.alice.id, self.bob.id
+
+        self.job = RetentionJob(clock=lambda: NOW)
+        self.job.init_app(self.app)
+        self.job.message_days = 30
+        self.job.batch_size = 3
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_messages(self):
+        with_bob = Conversation.get_or_create(self.alice.id, self.bob.id)
+        with_carol = Conversation.get_or_create(self.alice.id, self.carol.id)
+        for days_ago in (90, 80, 70, 60, 50, 5, 1):
+            for conversation, peer in ((with_bob, self.bob), (with_carol, self.carol)):
+                db.session.add(Message(sender_id=self.alice.id, recipient_id=peer.id,
+                                       conversation_id=conversation.id, content=f'archived pickle {days_ago}',
+                                       timestamp=NOW - timedelta(days=days_ago)))
+        db.session.commit()
+        return with_bob.id, with_carol.id
+
+    def add_face_logs(self, days_ago, successes, failures, user=None):
+        user = user or self.alice
+        for i in range(successes + failures):
+            db.session.add(FaceVerificationLog(user_id=user.id, success=i < successes,
+                                               timestamp=NOW - timedelta(days=days_ago, minutes=i)))
+        db.session.commit()
+
+    def test_old_messages_move_to_compressed_archives(self):
+        with_bob, with_carol = self.add_messages()
+        report = self.job.run()
+
+        self.assertEqual(report['messages']['archived'], 10)
+        self.assertEqual(Message.query.count(), 4)
+        self.assertFalse(Message.query.filter(Message.timestamp < NOW - timedelta(days=30)).count())
+
+        archives = MessageArchive.query.filter_by(conversation_id=with_bob).order_by(MessageArchive.id).all()
+        records = [record for archive in archives for record in read_archive(archive)]
+        self.assertEqual([record['content'] for record in records],
+                         [f'archived pickle {days}' for days in (90, 80, 70, 60, 50)])
+        self.assertEqual(sum(archive.message_count for archive in archives), 5)
+        self.assertTrue(all(archive.payload and archive.file_path is None for archive in archives))
+
+        # Archived messages are gone from search, recent ones are still found
+        found = search_messages(self.alice_id, 'pickle')['messages']
+        self.assertEqual(sorted(message.content for message in found), ['archived pickle 1'] * 2 + ['archived pickle 5'] * 2)
+        self.assertEqual(db.session.execute(text('SELECT count(*) FROM message_fts')).scalar(), 4)
+
+    def test_archives_to_files(self):
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir)
+        self.job.archive_dir = archive_dir
+        self.add_messages()
+        self.job.run()
+
+        archives = MessageArchive.query.all()
+        self.assertTrue(archives)
+        self.assertTrue(all(archive.payload is None and os.path.exists(archive.file_path) for archive in archives))
+        self.assertEqual(sum(len(read_archive(archive)) for archive in archives), 10)
+
+    def test_archiving_a_conversations_latest_message_keeps_its_summary(self):
+        def send(sender, peer, days_ago):
+            conversation = Conversation.get_or_create(sender.id, peer.id)
+            message = Message(sender_id=sender.id, recipient_id=peer.id, conversation_id=conversation.id,
+                              content=f'sent {days_ago} days ago', timestamp=NOW - timedelta(days=days_ago))
+            db.session.add(message)
+            db.session.flush()
+            record_message(message)
+            db.session.commit()
+            return message
+
+        send(self.alice, self.bob, 90)
+        read = send(self.alice, self.bob, 80)
+        latest = send(self.alice, self.bob, 5)
+        send(self.alice, self.carol, 70)
+        send(self.alice, self.carol, 60)
+        mark_read(self.bob_id, read.conversation_id, read.id)
+        mark_read(self.carol.id, Conversation.find(self.alice_id, self.carol.id).id)
+        self.job.run()
+
+        summaries = get_conversation_summaries(self.alice_id)
+        self.assertEqual([summary['peer']['username'] for summary in summaries], ['bob', 'carol'])
+        self.assertEqual(summaries[0]['last_message']['id'], latest.id)
+        # Every message with carol was archived; the conversation stays listed without a preview
+        self.assertIsNone(summaries[1]['last_message'])
+        with_carol = Conversation.find(self.alice_id, self.carol.id)
+        self.assertIsNone(with_carol.last_message_id)
+        self.assertEqual(with_carol.last_message_at, NOW - timedelta(days=60))
+
+        bob_view = get_conversation_summaries(self.bob_id)[0]
+        self.assertIsNone(bob_view['last_read_message_id'])
+        self.assertEqual(bob_view['unread_count'], 1)
+        self.assertEqual(mark_read(self.bob_id, latest.conversation_id).unread_count, 0)
+
+    def test_face_logs_become_daily_counts(self):
+        self.add_face_logs(120, successes=2, failures=3)
+        self.add_face_logs(100, successes=1, failures=0)
+        self.add_face_logs(10, successes=4, failures=1)
+        self.add_face_logs(120, successes=0, failures=2, user=self.bob)
+
+        report = self.job.run()
+        self.assertEqual(report['face_logs']['pruned'], 8)
+        self.assertEqual(FaceVerificationLog.query.count(), 5)
+
+        daily = {(row.user_id, row.day): (row.attempts, row.successes) for row in FaceVerificationDaily.query}
+        day_120 = (NOW - timedelta(days=120)).date()
+        self.assertEqual(daily, {
+            (self.alice_id, day_120): (5, 2),
+            (self.alice_id, (NOW - timedelta(days=100)).date()): (1, 1),
+            (self.bob_id, day_120): (2, 0),
+        })
+
+        # A later run adds to an existing day instead of duplicating it
+        self.add_face_logs(120, successes=1, failures=0)
+        self.job.run()
+        row = FaceVerificationDaily.query.filter_by(user_id=self.alice_id, day=day_120).one()
+        self.assertEqual((row.attempts, row.successes), (6, 3))
+
+    def test_dry_run_reports_without_writing(self):
+        self.add_messages()
+        self.add_face_logs(120, successes=1, failures=1)
+
+        report = self.job.run(dry_run=True)
+        self.assertEqual(report['messages']['eligible'], 10)
+        self.assertEqual(report['messages']['conversations'], 2)
+        self.assertEqual(report['face_logs']['eligible'], 2)
+        self.assertIn('reclaimable_bytes', report['compaction'])
+        self.assertEqual(Message.query.count(), 14)
+        self.assertEqual(FaceVerificationLog.query.count(), 2)
+        self.assertEqual(MessageArchive.query.count() + FaceVerificationDaily.query.count(), 0)
+        self.assertEqual(self.job.stats()['runs'], 0)
+
+    def test_compaction_enables_incremental_vacuum(self):
+        report = self.job.run(full_vacuum=True)
+        self.assertEqual(report['compaction']['auto_vacuum'], 'incremental')
+        self.assertTrue(report['compaction']['analyzed'])
+
+        self.add_messages()
+        report = self.job.run()
+        self.assertEqual(report['compaction']['auto_vacuum'], 'incremental')
+        self.assertLessEqual(report['compaction']['free_pages_after'], report['compaction']['free_pages'])
+        self.assertEqual(User.query.count(), 3)
+
+    def test_face_log_horizon_has_a_floor(self):
+        self.job.face_log_days = 7
+        with self.assertRaises(ValueError):
+            self.job.run()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Tests for the risk feature store and the cached risk assessment
+"""
+import sys
+import os
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models.models import User, FaceVerificationLog
+from app.security.risk_features import RiskFeatureStore, risk_features
+from app.security.security_ai import get_failed_attempts_risk, get_face_verification_accuracy, get_risk_details
+from config import TestConfig
+from testing_utils import FakeClock
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+class RiskFeatureTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(username='alice', password_hash='hashed_password',
+                         last_login=datetime.utcnow() - timedelta(hours=1))
+        db.session.add(self.user)
+        db.session.commit()
+
+        self.request_context = self.app.test_request_context(headers={'User-Agent': 'Mozilla/5.0 Firefox/120.0'})
+        self.request_context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.request_context.pop()
+        self.app_context.pop()
+
+    def log_attempts(self, count, success=False, hours_ago=1):
+        for _ in range(count):
+            db.session.add(FaceVerificationLog(user_id=self.user.id, success=success,
+                                               timestamp=datetime.utcnow() - timedelta(hours=hours_ago)))
+        db.session.commit()
+
+    def test_committed_attempts_update_loaded_features(self):
+        self.log_attempts(2)
+        self.log_attempts(1, hours_ago=30)
+        self.assertEqual(get_failed_attempts_risk(self.user), 0.4)
+        self.assertEqual(risk_features.stats()['loads'], 1)
+
+        self.log_attempts(3)
+        db.session.add(FaceVerificationLog(user_id=self.user.id, success=False, timestamp=datetime.utcnow()))
+        db.session.flush()
+        db.session.rollback()
+
+        user_id = self.user.id
+        with count_queries() as statements:
+            self.assertEqual(get_failed_attempts_risk(self.user), 1.0)
+            accuracy = get_face_verification_accuracy(user_id)
+        self.assertEqual(statements, [])
+        self.assertEqual(accuracy['total_attempts'], 6)
+        self.assertEqual(accuracy['failed_attempts'], 6)
+
+    def test_features_load_with_one_aggregate_query(self):
+        for days_ago in range(0, 60, 2):
+            self.log_attempts(3, success=True, hours_ago=days_ago * 24 + 30)
+        self.log_attempts(1, hours_ago=40)
+
+        user_id = self.user.id
+        executed = []
+        record = lambda conn, cursor, statement, parameters, context, many: executed.append((statement, parameters))
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            self.assertEqual(risk_features.verification_counts(user_id), (46, 45))
+            self.assertEqual(risk_features.failed_attempts(user_id), 0)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(len(executed), 1)
+        statement, parameters = executed[0]
+        self.assertIn('GROUP BY', statement)
+
+        plan = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+        self.assertIn('COVERING INDEX ix_face_verification_log_user_ts', ' '.join(row[-1] for row in plan))
+
+    def test_windows_slide_and_features_reload(self):
+        clock = FakeClock(datetime(2026, 1, 1, 12, 0))
+        store = RiskFeatureStore(feature_ttl=3 * 24 * 3600, clock=clock)
+        store.failed_attempts(self.user.id)
+        store.record_attempt(self.user.id, clock.now - timedelta(hours=23), False)
+        store.record_attempt(self.user.id, clock.now - timedelta(days=29), True)
+        self.assertEqual(store.failed_attempts(self.user.id), 1)
+        self.assertEqual(store.verification_counts(self.user.id), (2, 1))
+
+        clock.now += timedelta(hours=2)
+        self.assertEqual(store.failed_attempts(self.user.id), 0)
+        self.assertEqual(store.verification_counts(self.user.id), (2, 1))
+
+        # The accuracy window moves a day at a time
+        clock.now += timedelta(days=1)
+        self.assertEqual(store.verification_counts(self.user.id), (2, 1))
+        clock.now += timedelta(days=1)
+        self.assertEqual(store.verification_counts(self.user.id), (1, 0))
+
+        # After the TTL the features are reloaded from the (empty) log table
+        clock.now += timedelta(days=1)
+        self.assertEqual(store.verification_counts(self.user.id), (0, 0))
+        self.assertEqual(store.stats()['loads'], 2)
+
+    def test_assessment_is_cached_until_the_user_changes(self):
+        first = get_risk_details('alice')
+        first['security_level'] = 'Changed by caller'
+
+        with count_queries() as statements:
+            second = get_risk_details('alice')
+        self.assertEqual(statements, [])
+        self.assertNotEqual(second['security_level'], 'Changed by caller')
+        self.assertEqual(risk_features.stats()['assessment_hits'], 1)
+
+        self.log_attempts(5)
+        third = get_risk_details('alice')
+        self.assertEqual(third['risk_factors']['failed_attempts']['score'], 1.0)
+        self.assertGreater(third['risk_score'], second['risk_score'])
+
+        self.user.last_login = datetime.utcnow() - timedelta(days=40)
+        db.session.commit()
+        fourth = get_risk_details('alice')
+        self.assertEqual(fourth['risk_factors']['previous_breaches']['score'], 0.8)
+
+    def test_assessment_depends_on_the_request(self):
+        get_risk_details('alice')
+        with self.app.test_request_context(headers={'User-Agent': 'curl/8.0'}):
+            details = get_risk_details('alice')
+        self.assertEqual(details['risk_factors']['device_risk']['score'], 0.7)
+        self.assertEqual(risk_features.stats()['assessment_hits'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
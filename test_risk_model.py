@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Tests for the file-backed risk model, its hot reload and shadow evaluation
+"""
+import sys
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app
+from app.security.risk_model import (
+    RiskModel, RiskModelError, RiskModelRegistry, DEFAULT_MODEL_PATH, default_model, risk_models,
+    SECURITY_LEVEL_LOW, SECURITY_LEVEL_MEDIUM, SECURITY_LEVEL_HIGH
+)
+from config import TestConfig
+from testing_utils import FakeClock
+
+INPUTS = {'failed_attempts': 2, 'unusual_location': 'changed', 'time_risk': 3,
+          'previous_breaches': 40, 'device_risk': 'uncommon'}
+
+
+def load_definition():
+    with open(DEFAULT_MODEL_PATH) as f:
+        return json.load(f)
+
+
+class RiskModelTestCase(unittest.TestCase):
+    def test_default_model_matches_original_rules(self):
+        model = default_model()
+        self.assertEqual(model.transform('failed_attempts', 2), 0.4)
+        self.assertEqual(model.transform('failed_attempts', 9), 1.0)
+        self.assertEqual([model.transform('unusual_location', state) for state in ('new', 'same', 'changed')],
+                         [0.5, 0.1, 0.9])
+        self.assertEqual([model.transform('time_risk', hour) for hour in (0, 5, 8, 9, 18, 19, 23)],
+                         [0.8, 0.5, 0.5, 0.2, 0.2, 0.5, 0.5])
+        self.assertEqual([model.transform('previous_breaches', days) for days in (None, 0, 7, 8, 30, 31)],
+                         [0.5, 0.2, 0.2, 0.5, 0.5, 0.8])
+        self.assertEqual([model.transform('device_risk', device) for device in ('mobile', 'uncommon', 'desktop')],
+                         [0.6, 0.7, 0.3])
+
+        factors, score, level = model.evaluate(INPUTS)
+        self.assertAlmostEqual(score, 0.3 * 0.4 + 0.2 * 0.9 + 0.15 * 0.8 + 0.2 * 0.8 + 0.15 * 0.7)
+        self.assertEqual(level, SECURITY_LEVEL_MEDIUM)
+        self.assertEqual([model.level(s) for s in (0.29, 0.3, 0.69, 0.7)],
+                         [SECURITY_LEVEL_LOW, SECURITY_LEVEL_MEDIUM, SECURITY_LEVEL_MEDIUM, SECURITY_LEVEL_HIGH])
+
+    def test_invalid_definitions_are_rejected(self):
+        broken = []
+        definition = load_definition()
+        del definition['weights']['device_risk']
+        broken.append(definition)
+        definition = load_definition()
+        definition['thresholds'] = {'low': 0.8, 'high': 0.2}
+        broken.append(definition)
+        definition = load_definition()
+        definition['transforms']['time_risk']['values'] = [0.1]
+        broken.append(definition)
+        definition = load_definition()
+        definition['transforms']['failed_attempts'] = {'type': 'cubic'}
+        broken.append(definition)
+        for definition in broken:
+            with self.assertRaises(RiskModelError):
+                RiskModel(definition)
+
+
+class RiskModelRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.live_path = os.path.join(self.tmp, 'live.json')
+        self.shadow_path = os.path.join(self.tmp, 'shadow.json')
+        shutil.copy(DEFAULT_MODEL_PATH, self.live_path)
+        self.clock = FakeClock()
+        self.registry = RiskModelRegistry(clock=self.clock)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write_model(self, path, definition, mtime):
+        with open(path, 'w') as f:
+            f.write(definition if isinstance(definition, str) else json.dumps(definition))
+        os.utime(path, (mtime, mtime))
+
+    def test_model_file_is_reloaded_when_it_changes(self):
+        self.registry.configure(self.live_path)
+        self.assertEqual(self.registry.live().level(0.5), SECURITY_LEVEL_MEDIUM)
+
+        definition = load_definition()
+        version = definition['version']
+        definition['version'] = version + 1
+        definition['thresholds'] = {'low': 0.6, 'high': 0.9}
+        self.write_model(self.live_path, definition, mtime=2000000000)
+
+        # Not checked again until the reload interval has passed
+        self.assertEqual(self.registry.live().version, version)
+        self.clock.now += self.registry.reload_seconds
+        self.assertEqual(self.registry.live().version, version + 1)
+        self.assertEqual(self.registry.live().level(0.5), SECURITY_LEVEL_LOW)
+        self.assertEqual(self.registry.stats()['reloads'], 1)
+
+    def test_broken_model_file_keeps_previous_model(self):
+        self.registry.configure(self.live_path)
+        self.write_model(self.live_path, '{"weights": ', mtime=2000000000)
+        self.clock.now += self.registry.reload_seconds
+
+        self.assertEqual(self.registry.live().version, load_definition()['version'])
+        stats = self.registry.stats()
+        self.assertEqual(stats['reload_errors'], 1)
+        self.assertIsNotNone(stats['last_error'])
+
+        with self.assertRaises(RiskModelError):
+            self.registry.configure(self.live_path)
+
+    def test_shadow_model_is_compared_but_never_enforced(self):
+        definition = load_definition()
+        definition['name'] = 'strict'
+        definition['thresholds'] = {'low': 0.1, 'high': 0.5}
+        self.write_model(self.shadow_path, definition, mtime=2000000000)
+        self.registry.configure(self.live_path, self.shadow_path)
+
+        _, score, level = self.registry.evaluate(INPUTS)
+        self.assertEqual(level, SECURITY_LEVEL_MEDIUM)
+        self.registry.evaluate(dict(INPUTS, failed_attempts=0, unusual_location='same', time_risk=12,
+                                    previous_breaches=1, device_risk='desktop'))
+
+        stats = self.registry.stats()
+        self.assertEqual(stats['live_model'], f"default v{definition['version']}")
+        self.assertEqual(stats['shadow_model'], f"strict v{definition['version']}")
+        self.assertEqual(stats['evaluations'], 2)
+        self.assertEqual(stats['shadow_evaluations'], 2)
+        self.assertEqual(stats['decision_diffs'], 2)
+        self.assertEqual(stats['decision_diffs_by_level'], {'2->3': 1, '1->2': 1})
+        self.assertEqual(stats['score_delta_max'], 0.0)
+        self.assertGreater(stats['shadow_avg_us'], 0.0)
+
+    def test_app_config_selects_model_files(self):
+        definition = load_definition()
+        definition['name'] = 'configured'
+        self.write_model(self.live_path, definition, mtime=2000000000)
+
+        class ModelConfig(TestConfig):
+            RISK_MODEL_PATH = self.live_path
+
+        create_app(ModelConfig)
+        try:
+            self.assertEqual(risk_models.live().name, 'configured')
+        finally:
+            create_app(TestConfig)
+        self.assertEqual(risk_models.live().name, 'default')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Tests for pushing security metrics over Socket.IO
+"""
+import sys
+import os
+import unittest
+from datetime import datetime
+from flask import g
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db, socketio
+from app.models.models import User, FaceVerificationLog
+from app.security.logins import record_login
+from app.security.metrics_push import push_security_metrics
+from config import TestConfig
+
+
+class SecurityMetricsPushTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.alice = User(username='alice', password_hash='hashed_password')
+        self.bob = User(username='bob', password_hash='hashed_password')
+        db.session.add_all([self.alice, self.bob])
+        db.session.commit()
+        self.alice_id, self.bob_id = self.alice.id, self.bob.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def connect(self, user_id):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+            sess['_fresh'] = True
+        g.pop('_login_user', None)
+        return client, socketio.test_client(self.app, flask_test_client=client)
+
+    def metrics_events(self, socket_client):
+        return [event['args'][0] for event in socket_client.get_received() if event['name'] == 'security_metrics']
+
+    def log_attempt(self, user_id, success=False):
+        db.session.add(FaceVerificationLog(user_id=user_id, success=success, timestamp=datetime.utcnow()))
+        db.session.commit()
+
+    def test_connect_sends_one_snapshot(self):
+        _, socket_client = self.connect(self.alice_id)
+        events = self.metrics_events(socket_client)
+        self.assertEqual(len(events), 1)
+        self.assertTrue(events[0]['success'])
+        self.assertEqual(events[0]['face_verification']['total_attempts'], 0)
+        self.assertEqual(self.metrics_events(socket_client), [])
+
+    def test_changes_in_a_request_are_pushed_once_afterwards(self):
+        _, alice_socket = self.connect(self.alice_id)
+        _, bob_socket = self.connect(self.bob_id)
+        self.metrics_events(alice_socket)
+        self.metrics_events(bob_socket)
+
+        with self.app.test_request_context('/'):
+            self.log_attempt(self.alice_id)
+            self.log_attempt(self.alice_id, success=True)
+            # Nothing goes out until the request finishes
+            self.assertEqual(self.metrics_events(alice_socket), [])
+            self.app.process_response(self.app.response_class())
+
+        events = self.metrics_events(alice_socket)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['face_verification']['total_attempts'], 2)
+        self.assertEqual(self.metrics_events(bob_socket), [])
+
+    def test_security_level_change_is_pushed(self):
+        client, socket_client = self.connect(self.alice_id)
+        self.metrics_events(socket_client)
+        g.pop('_login_user', None)
+        response = client.post('/security/set_security_level_login', json={'level': 'high'})
+        self.assertTrue(response.get_json()['success'])
+        self.assertEqual(len(self.metrics_events(socket_client)), 1)
+
+    def test_recorded_login_is_pushed(self):
+        _, socket_client = self.connect(self.alice_id)
+        self.metrics_events(socket_client)
+
+        with self.app.test_request_context('/', headers={'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64)'}):
+            record_login(self.alice_id)
+            self.assertEqual(self.metrics_events(socket_client), [])
+            self.app.process_response(self.app.response_class())
+        self.assertEqual(len(self.metrics_events(socket_client)), 1)
+
+    def test_users_without_sockets_are_skipped(self):
+        with self.app.test_request_context('/'):
+            self.assertFalse(push_security_metrics(self.bob_id))
+            self.log_attempt(self.bob_id)
+            self.app.process_response(self.app.response_class())
+
+
+if __name__ == '__main__':
+    unittest.main()
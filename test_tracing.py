@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Tests for request and Socket.IO event tracing, its histograms and the slow log
+"""
+import sys
+import os
+import time
+import unittest
+from flask import g
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db, socketio
+from app.models.models import User
+from app.utils.tracing import Histogram, tracer
+from config import TestConfig
+
+
+class TracingTestConfig(TestConfig):
+    SECURITY_ADMINS = ['admin']
+    TRACE_SLOW_MS = 5
+
+
+class HistogramTestCase(unittest.TestCase):
+    def test_percentiles_come_from_bucket_bounds(self):
+        histogram = Histogram((1, 10, 100))
+        for value in (0.5, 3, 4, 8, 9, 50, 70, 80, 90, 250):
+            histogram.record(value)
+
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['count'], 10)
+        self.assertEqual((snapshot['p50'], snapshot['p95']), (10, 250))
+        self.assertEqual(snapshot['buckets'], {'1': 1, '10': 4, '100': 4, '+Inf': 1})
+        self.assertEqual(Histogram((1,)).snapshot()['p99'], 0)
+
+
+class TracingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TracingTestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.alice = User(username='alice', password_hash='hashed_password')
+        self.bob = User(username='bob', password_hash='hashed_password')
+        self.admin = User(username='admin', password_hash='hashed_password')
+        db.session.add_all([self.alice, self.bob, self.admin])
+        db.session.commit()
+        self.client = self.app.test_client()
+        tracer.reset()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def log_in(self, user, client=None):
+        g.pop('_login_user', None)
+        with (client or self.client).session_transaction() as sess:
+            sess['_user_id'] = str(user.id)
+            sess['_fresh'] = True
+
+    def test_requests_are_traced_per_url_rule(self):
+        self.log_in(self.alice)
+        for _ in range(3):
+            g.pop('_login_user', None)
+            self.assertEqual(self.client.get('/security/get_security_metrics').status_code, 200)
+        g.pop('_login_user', None)
+        self.client.get('/no/such/page')
+
+        endpoints = tracer.endpoints()
+        metrics = endpoints['GET /security/get_security_metrics']
+        self.assertEqual(metrics['duration_ms']['count'], 3)
+        self.assertGreater(metrics['db_queries']['max'], 0)
+        self.assertGreater(metrics['bytes_out']['mean'], 0)
+        self.assertEqual(endpoints['GET <unmatched>']['duration_ms']['count'], 1)
+
+        g.pop('_login_user', None)
+        self.assertEqual(self.client.get('/security/metrics').status_code, 403)
+        self.log_in(self.admin)
+        body = self.client.get('/security/metrics').get_json()
+        self.assertIn('GET /security/get_security_metrics', body['endpoints'])
+        self.assertIn('audit_log', body['components'])
+        self.assertEqual(body['components']['tracing']['active'], 1)
+
+    def test_socket_events_are_traced(self):
+        client = self.app.test_client()
+        self.log_in(self.alice, client)
+        socket_client = socketio.test_client(self.app, flask_test_client=client)
+        g.pop('_login_user', None)
+        socket_client.emit('send_message', {'recipient_id': self.bob.id, 'content': 'hello bob'})
+
+        endpoints = tracer.endpoints()
+        self.assertEqual(endpoints['socket connect']['duration_ms']['count'], 1)
+        sent = endpoints['socket send_message']
+        self.assertEqual(sent['duration_ms']['count'], 1)
+        self.assertGreater(sent['db_queries']['max'], 0)
+        self.assertEqual(sent['bytes_in']['max'], len('{"recipient_id": 2, "content": "hello bob"}'))
+
+    def test_slow_requests_are_logged_with_stack_samples(self):
+        def slow_page():
+            time.sleep(0.01)
+            # The background sampler is not started in tests
+            tracer.sample_stacks()
+            return 'done'
+        self.app.add_url_rule('/slow', 'slow_page', slow_page)
+
+        self.assertEqual(self.client.get('/slow').status_code, 200)
+        slow = [entry for entry in tracer.slow() if entry['name'] == 'GET /slow']
+        self.assertEqual(len(slow), 1)
+        self.assertGreaterEqual(slow[0]['duration_ms'], 5)
+        self.assertEqual(slow[0]['stacks'][0]['samples'], 1)
+        self.assertIn('test_tracing.py:slow_page', slow[0]['stacks'][0]['stack'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Helpers shared by the test modules
+"""
+
+
+class FakeClock:
+    """
+    Clock to inject in place of time.monotonic or datetime.utcnow.
+
+    Tests move it by assigning or adding to now. With step set, every call
+    first advances it by step, so each reading is distinct.
+    """
+
+    def __init__(self, now=1000.0, step=None):
+        self.now = now
+        self.step = step
+
+    def __call__(self):
+        if self.step is not None:
+            self.now += self.step
+        return self.now